@@ -4,15 +4,15 @@
 """
 
 from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy import select, func, text, desc
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
-import pandas as pd
-from io import StringIO
 
 from app.core.database import get_async_db
 from app.models.analysis import AnalysisRecord, DetectionResult, BehaviorEvent
+from app.services.export_service import stream_statement
 
 # 創建專用的資料查詢路由器
 data_router = APIRouter(prefix="/api/v1/data", tags=["資料查詢"])
@@ -414,108 +414,79 @@ async def search_data(
 async def export_csv_data(
     table: str = Query(..., description="資料表名稱: analyses, detections, events"),
     analysis_id: Optional[int] = Query(None, description="特定分析ID"),
-    limit: Optional[int] = Query(1000, ge=1, le=5000, description="限制筆數"),
-    db: AsyncSession = Depends(get_async_db)
+    limit: Optional[int] = Query(None, ge=1, description="限制筆數（未指定時匯出全部）"),
+    gzip: bool = Query(False, description="以 gzip 壓縮輸出"),
 ):
-    """匯出資料為 CSV 格式"""
+    """匯出資料為 CSV 格式（以伺服器端游標串流輸出）"""
     try:
         if table == "analyses":
-            query = select(AnalysisRecord).order_by(desc(AnalysisRecord.created_at)).limit(limit)
-            result = await db.execute(query)
-            data = result.scalars().all()
-            
-            csv_data = []
-            for item in data:
-                csv_data.append({
-                    "ID": item.id,
-                    "影片名稱": item.video_name,
-                    "分析類型": item.analysis_type,
-                    "狀態": item.status,
-                    "影片長度": item.duration,
-                    "幀率": item.fps,
-                    "總幀數": item.total_frames,
-                    "總檢測數": item.total_detections,
-                    "唯一物件": item.unique_objects,
-                    "分析耗時": item.analysis_duration,
-                    "建立時間": item.created_at
-                })
+            query = select(
+                AnalysisRecord.id.label("ID"),
+                AnalysisRecord.video_name.label("影片名稱"),
+                AnalysisRecord.analysis_type.label("分析類型"),
+                AnalysisRecord.status.label("狀態"),
+                AnalysisRecord.duration.label("影片長度"),
+                AnalysisRecord.fps.label("幀率"),
+                AnalysisRecord.total_frames.label("總幀數"),
+                AnalysisRecord.total_detections.label("總檢測數"),
+                AnalysisRecord.unique_objects.label("唯一物件"),
+                AnalysisRecord.analysis_duration.label("分析耗時"),
+                AnalysisRecord.created_at.label("建立時間"),
+            ).order_by(desc(AnalysisRecord.created_at))
                 
         elif table == "detections":
-            query = select(DetectionResult).order_by(DetectionResult.analysis_id, DetectionResult.frame_number)
+            query = select(
+                DetectionResult.analysis_id.label("分析ID"),
+                DetectionResult.frame_number.label("幀編號"),
+                DetectionResult.frame_time.label("時間點"),
+                DetectionResult.object_type.label("物件類型"),
+                DetectionResult.object_chinese.label("物件中文"),
+                DetectionResult.confidence.label("信心度"),
+                DetectionResult.center_x.label("中心X"),
+                DetectionResult.center_y.label("中心Y"),
+                DetectionResult.width.label("寬度"),
+                DetectionResult.height.label("高度"),
+                DetectionResult.zone.label("區域"),
+                DetectionResult.zone_chinese.label("區域中文"),
+                DetectionResult.created_at.label("檢測時間"),
+            ).order_by(DetectionResult.analysis_id, DetectionResult.frame_number)
             if analysis_id:
                 query = query.where(DetectionResult.analysis_id == analysis_id)
-            query = query.limit(limit)
-            
-            result = await db.execute(query)
-            data = result.scalars().all()
-            
-            csv_data = []
-            for item in data:
-                csv_data.append({
-                    "分析ID": item.analysis_id,
-                    "幀編號": item.frame_number,
-                    "時間點": item.frame_time,
-                    "物件類型": item.object_type,
-                    "物件中文": item.object_chinese,
-                    "信心度": item.confidence,
-                    "中心X": item.center_x,
-                    "中心Y": item.center_y,
-                    "寬度": item.width,
-                    "高度": item.height,
-                    "區域": item.zone,
-                    "區域中文": item.zone_chinese,
-                    "檢測時間": item.created_at
-                })
                 
         elif table == "events":
-            query = select(BehaviorEvent).order_by(desc(BehaviorEvent.created_at)).limit(limit)
-            result = await db.execute(query)
-            data = result.scalars().all()
-            
-            csv_data = []
-            for item in data:
-                csv_data.append({
-                    "分析ID": item.analysis_id,
-                    "時間戳": item.timestamp,
-                    "事件類型": item.event_type,
-                    "事件中文": item.event_chinese,
-                    "物件類型": item.object_type,
-                    "物件中文": item.object_chinese,
-                    "持續時間": item.duration,
-                    "嚴重程度": item.severity,
-                    "嚴重程度中文": item.severity_chinese,
-                    "嚴重程度": item.severity,
-                    "描述": item.description,
-                    "區域": item.zone,
-                    "區域中文": item.zone_chinese,
-                    "發生時間": item.created_at
-                })
+            query = select(
+                BehaviorEvent.analysis_id.label("分析ID"),
+                BehaviorEvent.timestamp.label("時間戳"),
+                BehaviorEvent.event_type.label("事件類型"),
+                BehaviorEvent.event_chinese.label("事件中文"),
+                BehaviorEvent.object_type.label("物件類型"),
+                BehaviorEvent.object_chinese.label("物件中文"),
+                BehaviorEvent.duration.label("持續時間"),
+                BehaviorEvent.severity.label("嚴重程度"),
+                BehaviorEvent.severity_chinese.label("嚴重程度中文"),
+                BehaviorEvent.description.label("描述"),
+                BehaviorEvent.zone.label("區域"),
+                BehaviorEvent.zone_chinese.label("區域中文"),
+                BehaviorEvent.created_at.label("發生時間"),
+            ).order_by(desc(BehaviorEvent.created_at))
         else:
             raise HTTPException(status_code=400, detail="不支援的資料表類型")
-        
-        # 轉換為 CSV
-        if csv_data:
-            df = pd.DataFrame(csv_data)
-            csv_buffer = StringIO()
-            df.to_csv(csv_buffer, index=False, encoding='utf-8-sig')
-            csv_content = csv_buffer.getvalue()
-            
-            return {
-                "table": table,
-                "analysis_id": analysis_id,
-                "record_count": len(csv_data),
-                "csv_content": csv_content,
-                "filename": f"{table}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-            }
-        else:
-            return {
-                "table": table,
-                "analysis_id": analysis_id,
-                "record_count": 0,
-                "csv_content": "",
-                "message": "沒有找到符合條件的資料"
-            }
-            
+
+        if limit:
+            query = query.limit(limit)
+
+        filename = f"{table}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        if gzip:
+            filename += ".gz"
+        # utf-8 BOM 讓 Excel 正確辨識中文標題
+        return StreamingResponse(
+            stream_statement(query, "csv", gzip=gzip, bom=True),
+            media_type="application/gzip" if gzip else "text/csv; charset=utf-8",
+            headers={"Content-Disposition": f"attachment; filename*=UTF-8''{filename}"},
+        )
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"匯出失敗: {str(e)}")
 
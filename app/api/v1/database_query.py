@@ -10,6 +10,7 @@ from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
 
 from app.core.database import get_async_db
+from app.utils.pagination import InvalidCursorError, paginate
 from app.models.database import (
     AnalysisTask,
     DetectionResult,
@@ -45,6 +46,12 @@ def _parse_datetime(value: Optional[str], field_name: str) -> Optional[datetime]
 async def get_analysis_tasks(
     limit: int = Query(50, ge=1, le=10000, description="限制筆數"),
     offset: int = Query(0, ge=0, description="偏移量"),
+    pagination: str = Query("offset", pattern="^(offset|cursor)$", description="分頁模式：offset / cursor（keyset）"),
+    cursor: Optional[str] = Query(None, description="續頁標記（上一頁回傳的 next_cursor，帶入即使用 keyset 分頁）"),
+    total_mode: Optional[str] = Query(
+        None, alias="total", pattern="^(exact|estimated|none)$",
+        description="總筆數：exact / estimated / none（預設 offset 分頁為 exact、keyset 分頁為 estimated）",
+    ),
     task_type: Optional[str] = Query(None, description="任務類型過濾 (realtime_camera/video_file)"),
     status: Optional[str] = Query(None, description="狀態過濾 (pending/running/completed/failed)"),
     start_date: Optional[str] = Query(None, description="開始日期過濾 (YYYY-MM-DD)"),
@@ -56,6 +63,8 @@ async def get_analysis_tasks(
     
     - **limit**: 每頁顯示筆數 (1-200)
     - **offset**: 偏移量，用於分頁
+    - **pagination** / **cursor**: keyset 分頁，依 pagination.next_cursor 取下一頁（深頁不需掃過前面的資料）
+    - **total**: 總筆數計算方式 (exact/estimated/none)
     - **task_type**: 過濾任務類型
     - **status**: 過濾任務狀態
     - **start_date**: 開始日期過濾
@@ -64,7 +73,6 @@ async def get_analysis_tasks(
     try:
         # 建立基本查詢
         query = select(AnalysisTask)
-        count_query = select(func.count(AnalysisTask.id))
         
         # 建立過濾條件
         filters = []
@@ -92,16 +100,19 @@ async def get_analysis_tasks(
         # 應用過濾條件
         if filters:
             query = query.where(and_(*filters))
-            count_query = count_query.where(and_(*filters))
         
-        # 執行計數查詢
-        total_result = await db.execute(count_query)
-        total_count = total_result.scalar()
-        
-        # 執行主查詢
-        query = query.order_by(desc(AnalysisTask.created_at)).limit(limit).offset(offset)
-        result = await db.execute(query)
-        tasks = result.scalars().all()
+        page = await paginate(
+            db,
+            query,
+            (AnalysisTask.created_at, AnalysisTask.id),
+            scope="analysis_tasks",
+            limit=limit,
+            offset=offset,
+            cursor=cursor,
+            mode=pagination,
+            total=total_mode,
+        )
+        tasks = page.items
         
         # 轉換為字典
         tasks_data = [task.to_dict() for task in tasks]
@@ -109,13 +120,7 @@ async def get_analysis_tasks(
         return {
             "success": True,
             "data": tasks_data,
-            "pagination": {
-                "total": total_count,
-                "limit": limit,
-                "offset": offset,
-                "has_next": offset + limit < total_count,
-                "has_prev": offset > 0
-            },
+            "pagination": page.pagination,
             "filters": {
                 "task_type": task_type,
                 "status": status,
@@ -125,6 +130,10 @@ async def get_analysis_tasks(
             "timestamp": datetime.now().isoformat()
         }
         
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"查詢分析任務失敗: {str(e)}")
 
@@ -132,6 +141,12 @@ async def get_analysis_tasks(
 async def get_detection_results(
     limit: int = Query(100, ge=1, le=10000, description="限制筆數"),
     offset: int = Query(0, ge=0, description="偏移量"),
+    pagination: str = Query("offset", pattern="^(offset|cursor)$", description="分頁模式：offset / cursor（keyset）"),
+    cursor: Optional[str] = Query(None, description="續頁標記（上一頁回傳的 next_cursor，帶入即使用 keyset 分頁）"),
+    total_mode: Optional[str] = Query(
+        None, alias="total", pattern="^(exact|estimated|none)$",
+        description="總筆數：exact / estimated / none（預設 offset 分頁為 exact、keyset 分頁為 estimated）",
+    ),
     task_id: Optional[int] = Query(None, description="特定任務ID過濾"),
     object_type: Optional[str] = Query(None, description="物件類型過濾"),
     min_confidence: Optional[float] = Query(None, ge=0.0, le=1.0, description="最小信心度過濾"),
@@ -144,6 +159,8 @@ async def get_detection_results(
     
     - **limit**: 每頁顯示筆數 (1-10000)
     - **offset**: 偏移量，用於分頁
+    - **pagination** / **cursor**: keyset 分頁，依 pagination.next_cursor 取下一頁（深頁不需掃過前面的資料）
+    - **total**: 總筆數計算方式 (exact/estimated/none)
     - **task_id**: 過濾特定任務的檢測結果
     - **object_type**: 過濾物件類型 (person, car, bike 等)
     - **min_confidence**: 最小信心度閾值
@@ -153,7 +170,6 @@ async def get_detection_results(
     try:
         # 建立基本查詢
         query = select(DetectionResult)
-        count_query = select(func.count(DetectionResult.id))
         
         # 建立過濾條件
         filters = []
@@ -184,16 +200,19 @@ async def get_detection_results(
         # 應用過濾條件
         if filters:
             query = query.where(and_(*filters))
-            count_query = count_query.where(and_(*filters))
-        
-        # 執行計數查詢
-        total_result = await db.execute(count_query)
-        total_count = total_result.scalar()
         
-        # 執行主查詢
-        query = query.order_by(desc(DetectionResult.frame_timestamp)).limit(limit).offset(offset)
-        result = await db.execute(query)
-        detections = result.scalars().all()
+        page = await paginate(
+            db,
+            query,
+            (DetectionResult.frame_timestamp, DetectionResult.id),
+            scope="detection_results",
+            limit=limit,
+            offset=offset,
+            cursor=cursor,
+            mode=pagination,
+            total=total_mode,
+        )
+        detections = page.items
         
         # 轉換為字典
         detections_data = [detection.to_dict() for detection in detections]
@@ -201,13 +220,7 @@ async def get_detection_results(
         return {
             "success": True,
             "data": detections_data,
-            "pagination": {
-                "total": total_count,
-                "limit": limit,
-                "offset": offset,
-                "has_next": offset + limit < total_count,
-                "has_prev": offset > 0
-            },
+            "pagination": page.pagination,
             "filters": {
                 "task_id": task_id,
                 "object_type": object_type,
@@ -218,6 +231,10 @@ async def get_detection_results(
             "timestamp": datetime.now().isoformat()
         }
         
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"查詢檢測結果失敗: {str(e)}")
 
@@ -356,6 +373,12 @@ async def get_database_stats(db: AsyncSession = Depends(get_async_db)):
 async def get_data_sources(
     limit: int = Query(50, ge=1, le=1000, description="限制筆數"),
     offset: int = Query(0, ge=0, description="偏移量"),
+    pagination: str = Query("offset", pattern="^(offset|cursor)$", description="分頁模式：offset / cursor（keyset）"),
+    cursor: Optional[str] = Query(None, description="續頁標記（上一頁回傳的 next_cursor，帶入即使用 keyset 分頁）"),
+    total_mode: Optional[str] = Query(
+        None, alias="total", pattern="^(exact|estimated|none)$",
+        description="總筆數：exact / estimated / none（預設 offset 分頁為 exact、keyset 分頁為 estimated）",
+    ),
     source_type: Optional[str] = Query(None, description="來源類型 (camera/video_file)"),
     status: Optional[str] = Query(None, description="狀態 (active/inactive/error)"),
     keyword: Optional[str] = Query(None, description="依名稱模糊搜尋"),
@@ -364,7 +387,6 @@ async def get_data_sources(
     """列出 data_sources 內容。"""
     try:
         query = select(DataSource)
-        count_query = select(func.count(DataSource.id))
         filters = []
 
         if source_type:
@@ -377,25 +399,24 @@ async def get_data_sources(
 
         if filters:
             query = query.where(and_(*filters))
-            count_query = count_query.where(and_(*filters))
 
-        total = (await db.execute(count_query)).scalar()
-        result = await db.execute(
-            query.order_by(desc(DataSource.created_at)).limit(limit).offset(offset)
+        page = await paginate(
+            db,
+            query,
+            (DataSource.created_at, DataSource.id),
+            scope="data_sources",
+            limit=limit,
+            offset=offset,
+            cursor=cursor,
+            mode=pagination,
+            total=total_mode,
         )
-
-        sources = [source.to_dict() for source in result.scalars().all()]
+        sources = [source.to_dict() for source in page.items]
 
         return {
             "success": True,
             "data": sources,
-            "pagination": {
-                "total": total,
-                "limit": limit,
-                "offset": offset,
-                "has_next": offset + limit < total,
-                "has_prev": offset > 0,
-            },
+            "pagination": page.pagination,
             "filters": {
                 "source_type": source_type,
                 "status": status,
@@ -403,6 +424,10 @@ async def get_data_sources(
             },
             "timestamp": datetime.now().isoformat(),
         }
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"查詢資料來源失敗: {str(e)}")
 
@@ -411,6 +436,12 @@ async def get_data_sources(
 async def get_line_events(
     limit: int = Query(100, ge=1, le=5000, description="限制筆數"),
     offset: int = Query(0, ge=0, description="偏移量"),
+    pagination: str = Query("offset", pattern="^(offset|cursor)$", description="分頁模式：offset / cursor（keyset）"),
+    cursor: Optional[str] = Query(None, description="續頁標記（上一頁回傳的 next_cursor，帶入即使用 keyset 分頁）"),
+    total_mode: Optional[str] = Query(
+        None, alias="total", pattern="^(exact|estimated|none)$",
+        description="總筆數：exact / estimated / none（預設 offset 分頁為 exact、keyset 分頁為 estimated）",
+    ),
     task_id: Optional[int] = Query(None, description="任務 ID"),
     line_id: Optional[str] = Query(None, description="線段識別碼"),
     start_time: Optional[str] = Query(None, description="起始時間 (ISO8601/日期)"),
@@ -420,7 +451,6 @@ async def get_line_events(
     """列出 line_crossing_events 內容。"""
     try:
         query = select(LineCrossingEvent)
-        count_query = select(func.count(LineCrossingEvent.id))
         filters = []
 
         if task_id is not None:
@@ -437,26 +467,24 @@ async def get_line_events(
 
         if filters:
             query = query.where(and_(*filters))
-            count_query = count_query.where(and_(*filters))
 
-        total = (await db.execute(count_query)).scalar()
-        result = await db.execute(
-            query.order_by(desc(LineCrossingEvent.frame_timestamp))
-            .limit(limit)
-            .offset(offset)
+        page = await paginate(
+            db,
+            query,
+            (LineCrossingEvent.frame_timestamp, LineCrossingEvent.id),
+            scope="line_events",
+            limit=limit,
+            offset=offset,
+            cursor=cursor,
+            mode=pagination,
+            total=total_mode,
         )
-        events = [event.to_dict() for event in result.scalars().all()]
+        events = [event.to_dict() for event in page.items]
 
         return {
             "success": True,
             "data": events,
-            "pagination": {
-                "total": total,
-                "limit": limit,
-                "offset": offset,
-                "has_next": offset + limit < total,
-                "has_prev": offset > 0,
-            },
+            "pagination": page.pagination,
             "filters": {
                 "task_id": task_id,
                 "line_id": line_id,
@@ -465,6 +493,8 @@ async def get_line_events(
             },
             "timestamp": datetime.now().isoformat(),
         }
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except HTTPException:
         raise
     except Exception as e:
@@ -475,6 +505,12 @@ async def get_line_events(
 async def get_zone_events(
     limit: int = Query(100, ge=1, le=5000, description="限制筆數"),
     offset: int = Query(0, ge=0, description="偏移量"),
+    pagination: str = Query("offset", pattern="^(offset|cursor)$", description="分頁模式：offset / cursor（keyset）"),
+    cursor: Optional[str] = Query(None, description="續頁標記（上一頁回傳的 next_cursor，帶入即使用 keyset 分頁）"),
+    total_mode: Optional[str] = Query(
+        None, alias="total", pattern="^(exact|estimated|none)$",
+        description="總筆數：exact / estimated / none（預設 offset 分頁為 exact、keyset 分頁為 estimated）",
+    ),
     task_id: Optional[int] = Query(None, description="任務 ID"),
     zone_id: Optional[str] = Query(None, description="區域識別碼"),
     start_time: Optional[str] = Query(None, description="起始時間 (ISO8601/日期)"),
@@ -484,7 +520,6 @@ async def get_zone_events(
     """列出 zone_dwell_events 內容。"""
     try:
         query = select(ZoneDwellEvent)
-        count_query = select(func.count(ZoneDwellEvent.id))
         filters = []
 
         if task_id is not None:
@@ -501,26 +536,24 @@ async def get_zone_events(
 
         if filters:
             query = query.where(and_(*filters))
-            count_query = count_query.where(and_(*filters))
 
-        total = (await db.execute(count_query)).scalar()
-        result = await db.execute(
-            query.order_by(desc(ZoneDwellEvent.event_timestamp))
-            .limit(limit)
-            .offset(offset)
+        page = await paginate(
+            db,
+            query,
+            (ZoneDwellEvent.event_timestamp, ZoneDwellEvent.id),
+            scope="zone_events",
+            limit=limit,
+            offset=offset,
+            cursor=cursor,
+            mode=pagination,
+            total=total_mode,
         )
-        events = [event.to_dict() for event in result.scalars().all()]
+        events = [event.to_dict() for event in page.items]
 
         return {
             "success": True,
             "data": events,
-            "pagination": {
-                "total": total,
-                "limit": limit,
-                "offset": offset,
-                "has_next": offset + limit < total,
-                "has_prev": offset > 0,
-            },
+            "pagination": page.pagination,
             "filters": {
                 "task_id": task_id,
                 "zone_id": zone_id,
@@ -529,6 +562,8 @@ async def get_zone_events(
             },
             "timestamp": datetime.now().isoformat(),
         }
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except HTTPException:
         raise
     except Exception as e:
@@ -539,6 +574,12 @@ async def get_zone_events(
 async def get_speed_events(
     limit: int = Query(100, ge=1, le=5000, description="限制筆數"),
     offset: int = Query(0, ge=0, description="偏移量"),
+    pagination: str = Query("offset", pattern="^(offset|cursor)$", description="分頁模式：offset / cursor（keyset）"),
+    cursor: Optional[str] = Query(None, description="續頁標記（上一頁回傳的 next_cursor，帶入即使用 keyset 分頁）"),
+    total_mode: Optional[str] = Query(
+        None, alias="total", pattern="^(exact|estimated|none)$",
+        description="總筆數：exact / estimated / none（預設 offset 分頁為 exact、keyset 分頁為 estimated）",
+    ),
     task_id: Optional[int] = Query(None, description="任務 ID"),
     min_speed: Optional[float] = Query(None, ge=0, description="最低 speed_max 過濾"),
     start_time: Optional[str] = Query(None, description="起始時間 (ISO8601/日期)"),
@@ -548,7 +589,6 @@ async def get_speed_events(
     """列出 speed_events 內容。"""
     try:
         query = select(SpeedEvent)
-        count_query = select(func.count(SpeedEvent.id))
         filters = []
 
         if task_id is not None:
@@ -566,24 +606,24 @@ async def get_speed_events(
 
         if filters:
             query = query.where(and_(*filters))
-            count_query = count_query.where(and_(*filters))
 
-        total = (await db.execute(count_query)).scalar()
-        result = await db.execute(
-            query.order_by(desc(SpeedEvent.event_timestamp)).limit(limit).offset(offset)
+        page = await paginate(
+            db,
+            query,
+            (SpeedEvent.event_timestamp, SpeedEvent.id),
+            scope="speed_events",
+            limit=limit,
+            offset=offset,
+            cursor=cursor,
+            mode=pagination,
+            total=total_mode,
         )
-        events = [event.to_dict() for event in result.scalars().all()]
+        events = [event.to_dict() for event in page.items]
 
         return {
             "success": True,
             "data": events,
-            "pagination": {
-                "total": total,
-                "limit": limit,
-                "offset": offset,
-                "has_next": offset + limit < total,
-                "has_prev": offset > 0,
-            },
+            "pagination": page.pagination,
             "filters": {
                 "task_id": task_id,
                 "min_speed": min_speed,
@@ -592,6 +632,8 @@ async def get_speed_events(
             },
             "timestamp": datetime.now().isoformat(),
         }
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except HTTPException:
         raise
     except Exception as e:
@@ -602,6 +644,12 @@ async def get_speed_events(
 async def get_system_config(
     limit: int = Query(100, ge=1, le=1000, description="限制筆數"),
     offset: int = Query(0, ge=0, description="偏移量"),
+    pagination: str = Query("offset", pattern="^(offset|cursor)$", description="分頁模式：offset / cursor（keyset）"),
+    cursor: Optional[str] = Query(None, description="續頁標記（上一頁回傳的 next_cursor，帶入即使用 keyset 分頁）"),
+    total_mode: Optional[str] = Query(
+        None, alias="total", pattern="^(exact|estimated|none)$",
+        description="總筆數：exact / estimated / none（預設 offset 分頁為 exact、keyset 分頁為 estimated）",
+    ),
     key: Optional[str] = Query(None, description="依 config_key 過濾"),
     config_type: str = Query("kv", description="配置類型"),
     db: AsyncSession = Depends(get_async_db),
@@ -609,33 +657,33 @@ async def get_system_config(
     """列出 system_config 內容。"""
     try:
         query = select(SystemConfig).where(SystemConfig.config_type == config_type)
-        count_query = select(func.count(SystemConfig.id)).where(
-            SystemConfig.config_type == config_type
-        )
         if key:
             query = query.where(SystemConfig.config_key == key)
-            count_query = count_query.where(SystemConfig.config_key == key)
 
-        total = (await db.execute(count_query)).scalar()
-        result = await db.execute(
-            query.order_by(desc(SystemConfig.updated_at)).limit(limit).offset(offset)
+        page = await paginate(
+            db,
+            query,
+            (SystemConfig.updated_at, SystemConfig.id),
+            scope="system_config",
+            limit=limit,
+            offset=offset,
+            cursor=cursor,
+            mode=pagination,
+            total=total_mode,
         )
-
-        configs = [config.to_dict() for config in result.scalars().all()]
+        configs = [config.to_dict() for config in page.items]
 
         return {
             "success": True,
             "data": configs,
-            "pagination": {
-                "total": total,
-                "limit": limit,
-                "offset": offset,
-                "has_next": offset + limit < total,
-                "has_prev": offset > 0,
-            },
+            "pagination": page.pagination,
             "filters": {"key": key, "config_type": config_type},
             "timestamp": datetime.now().isoformat(),
         }
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"查詢系統設定失敗: {str(e)}")
 
@@ -644,38 +692,46 @@ async def get_system_config(
 async def get_task_statistics(
     limit: int = Query(100, ge=1, le=2000, description="限制筆數"),
     offset: int = Query(0, ge=0, description="偏移量"),
+    pagination: str = Query("offset", pattern="^(offset|cursor)$", description="分頁模式：offset / cursor（keyset）"),
+    cursor: Optional[str] = Query(None, description="續頁標記（上一頁回傳的 next_cursor，帶入即使用 keyset 分頁）"),
+    total_mode: Optional[str] = Query(
+        None, alias="total", pattern="^(exact|estimated|none)$",
+        description="總筆數：exact / estimated / none（預設 offset 分頁為 exact、keyset 分頁為 estimated）",
+    ),
     task_id: Optional[int] = Query(None, description="特定任務 ID"),
     db: AsyncSession = Depends(get_async_db),
 ):
     """列出 task_statistics 內容。"""
     try:
         query = select(TaskStatistics)
-        count_query = select(func.count(TaskStatistics.task_id))
 
         if task_id is not None:
             query = query.where(TaskStatistics.task_id == task_id)
-            count_query = count_query.where(TaskStatistics.task_id == task_id)
 
-        total = (await db.execute(count_query)).scalar()
-        result = await db.execute(
-            query.order_by(desc(TaskStatistics.updated_at)).limit(limit).offset(offset)
+        page = await paginate(
+            db,
+            query,
+            (TaskStatistics.updated_at, TaskStatistics.task_id),
+            scope="task_statistics",
+            limit=limit,
+            offset=offset,
+            cursor=cursor,
+            mode=pagination,
+            total=total_mode,
         )
-
-        stats = [stat.to_dict() for stat in result.scalars().all()]
+        stats = [stat.to_dict() for stat in page.items]
 
         return {
             "success": True,
             "data": stats,
-            "pagination": {
-                "total": total,
-                "limit": limit,
-                "offset": offset,
-                "has_next": offset + limit < total,
-                "has_prev": offset > 0,
-            },
+            "pagination": page.pagination,
             "filters": {"task_id": task_id},
             "timestamp": datetime.now().isoformat(),
         }
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"查詢任務統計失敗: {str(e)}")
 
@@ -684,6 +740,12 @@ async def get_task_statistics(
 async def get_users(
     limit: int = Query(100, ge=1, le=1000, description="限制筆數"),
     offset: int = Query(0, ge=0, description="偏移量"),
+    pagination: str = Query("offset", pattern="^(offset|cursor)$", description="分頁模式：offset / cursor（keyset）"),
+    cursor: Optional[str] = Query(None, description="續頁標記（上一頁回傳的 next_cursor，帶入即使用 keyset 分頁）"),
+    total_mode: Optional[str] = Query(
+        None, alias="total", pattern="^(exact|estimated|none)$",
+        description="總筆數：exact / estimated / none（預設 offset 分頁為 exact、keyset 分頁為 estimated）",
+    ),
     role: Optional[str] = Query(None, description="依角色過濾"),
     is_active: Optional[bool] = Query(None, description="是否啟用"),
     db: AsyncSession = Depends(get_async_db),
@@ -691,7 +753,6 @@ async def get_users(
     """列出 users 內容（不包含密碼雜湊）。"""
     try:
         query = select(User)
-        count_query = select(func.count(User.id))
         filters = []
 
         if role:
@@ -701,27 +762,30 @@ async def get_users(
 
         if filters:
             query = query.where(and_(*filters))
-            count_query = count_query.where(and_(*filters))
 
-        total = (await db.execute(count_query)).scalar()
-        result = await db.execute(
-            query.order_by(desc(User.created_at)).limit(limit).offset(offset)
+        page = await paginate(
+            db,
+            query,
+            (User.created_at, User.id),
+            scope="users",
+            limit=limit,
+            offset=offset,
+            cursor=cursor,
+            mode=pagination,
+            total=total_mode,
         )
-
-        users = [user.to_dict() for user in result.scalars().all()]
+        users = [user.to_dict() for user in page.items]
 
         return {
             "success": True,
             "data": users,
-            "pagination": {
-                "total": total,
-                "limit": limit,
-                "offset": offset,
-                "has_next": offset + limit < total,
-                "has_prev": offset > 0,
-            },
+            "pagination": page.pagination,
             "filters": {"role": role, "is_active": is_active},
             "timestamp": datetime.now().isoformat(),
         }
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"查詢使用者失敗: {str(e)}")
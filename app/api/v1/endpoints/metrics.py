@@ -0,0 +1,34 @@
+"""
+YOLOv11 數位雙生分析系統 - 效能量測 API 端點
+"""
+
+from fastapi import APIRouter, Query, Request
+from fastapi.responses import PlainTextResponse
+
+from app.core.metrics import get_metrics_registry
+
+router = APIRouter()
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@router.get("/metrics")
+async def get_metrics(format: str = Query("prometheus", pattern="^(prometheus|json)$")):
+    """
+    各處理階段耗時直方圖
+
+    預設輸出 Prometheus 文字格式；format=json 回傳 p50/p95/p99 與次數摘要。
+    """
+    registry = get_metrics_registry()
+    if format == "json":
+        return registry.snapshot()
+    return PlainTextResponse(registry.render_prometheus(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@router.get("/metrics/queues")
+async def get_queue_metrics(request: Request):
+    """非同步隊列（WebSocket 推送 / 資料庫保存）的深度、等待時間、吞吐量與丟棄統計"""
+    queue_manager = getattr(request.app.state, "queue_manager", None)
+    if queue_manager is None:
+        return {"running": False}
+    return queue_manager.get_queue_stats()
@@ -25,9 +25,10 @@ from fastapi import (
     WebSocketDisconnect,
     Request,
 )
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import update, delete, select, text, func, desc, or_
+from sqlalchemy import update, delete, select, text, func, desc, or_, and_, exists, tuple_
+from sqlalchemy.orm import aliased
 from pydantic import BaseModel, Field
 
 from app.core.database import get_db, AsyncSessionLocal, get_async_db
@@ -37,7 +38,27 @@ from app.core.paths import get_base_dir
 # from app.services.yolo_service import get_yolo_service  # 暫時註解
 from app.services.camera_service import CameraService
 from app.services.task_service import TaskService, get_task_service
+from app.services.task_status_cache import get_task_status_cache
 from app.services.analytics_service import AnalyticsService
+from app.services.analytics_cache import get_analytics_cache, notify_task_changed
+from app.services.rollup_service import fetch_detection_summary
+from app.services.export_service import ExportRequest, get_export_service, parse_export_time
+from app.services.preview_encoder import (
+    DEFAULT_TIER,
+    PREVIEW_TIERS,
+    PreviewSubscription,
+    get_preview_encoder_service,
+    resolve_tier,
+)
+from app.services.upload_service import (
+    ALLOWED_VIDEO_EXTENSIONS,
+    UploadError,
+    get_upload_service,
+    register_video_source,
+    video_target_path,
+)
+from app.utils.media_info import probe_video
+from app.utils.pagination import InvalidCursorError, count_rows, paginate
 from app.services.new_database_service import DatabaseService
 from app.services.camera_status_monitor import get_camera_monitor
 from app.services.realtime_detection_service import realtime_detection_service
@@ -894,6 +915,14 @@ class ModelConfigUpdate(BaseModel):
     iou_threshold: Optional[float] = Field(None, description="IoU閾值")
     image_size: Optional[int] = Field(None, description="輸入圖像大小")
 
+class ModelExportRequest(BaseModel):
+    """模型匯出請求模型"""
+    model_name: Optional[str] = Field(None, description="要匯出的 .pt 檔名；留空則匯出全部")
+    format: Literal["onnx"] = Field("onnx", description="匯出格式（openvino 後端同樣使用 ONNX 產物）")
+    image_size: Optional[int] = Field(None, description="匯出輸入尺寸，預設 ONNX_IMGSZ")
+    half: bool = Field(False, description="是否匯出 FP16")
+    force: bool = Field(False, description="忽略快取強制重新匯出")
+
 class AnalyticsData(BaseModel):
     """分析數據模型"""
     detection_counts: Dict[str, int]
@@ -1055,6 +1084,63 @@ async def list_yolo_models():
         api_logger.error(f"列出模型檔案時發生錯誤: {str(e)}")
         raise HTTPException(status_code=500, detail=f"無法取得模型清單: {str(e)}")
 
+@router.post("/models/export")
+async def export_yolo_models(request: ModelExportRequest):
+    """將 `uploads/models` 下的 .pt 匯出為 ONNX 並快取"""
+    from app.services.inference_backends import export_model
+
+    model_dir = find_models_directory()
+    if not model_dir or not model_dir.exists():
+        raise HTTPException(status_code=404, detail="模型資料夾不存在")
+
+    if request.model_name:
+        # 只接受 models 目錄下的檔名，拒絕 ../ 等路徑
+        if Path(request.model_name).name != request.model_name:
+            raise HTTPException(status_code=400, detail="模型名稱不可包含路徑")
+        target = model_dir / request.model_name
+        if target.suffix != '.pt' or not target.is_file():
+            raise HTTPException(status_code=404, detail=f"找不到模型檔案: {request.model_name}")
+        targets = [target]
+    else:
+        targets = sorted(p for p in model_dir.iterdir() if p.suffix == '.pt' and p.is_file())
+
+    loop = asyncio.get_running_loop()
+    exported, errors = [], []
+    for target in targets:
+        try:
+            # 匯出會跑數十秒，放到執行器避免阻塞事件迴圈
+            result = await loop.run_in_executor(
+                None,
+                lambda t=target: export_model(
+                    str(t),
+                    fmt=request.format,
+                    imgsz=request.image_size,
+                    half=request.half,
+                    force=request.force,
+                ),
+            )
+            exported.append(result)
+        except Exception as e:
+            api_logger.error(f"匯出模型失敗 {target.name}: {e}")
+            errors.append({"model": target.name, "error": str(e)})
+
+    if errors and not exported:
+        raise HTTPException(status_code=500, detail={"message": "模型匯出失敗", "errors": errors})
+
+    return {"exported": exported, "errors": errors}
+
+
+@router.get("/models/exports")
+async def list_model_exports():
+    """列出已快取的模型匯出產物"""
+    from app.services.inference_backends import list_exported_artifacts
+
+    try:
+        return {"artifacts": list_exported_artifacts()}
+    except Exception as e:
+        api_logger.error(f"列出匯出產物失敗: {e}")
+        raise HTTPException(status_code=500, detail=f"無法取得匯出清單: {str(e)}")
+
 # ===== 模型狀態管理 API =====
 
 # 全域變數來儲存模型狀態（實際專案中應該使用資料庫）
@@ -1633,6 +1719,9 @@ async def toggle_task_status(task_id: str, db: AsyncSession = Depends(get_db)):
             .values(status=new_status)
         )
         await db.commit()
+        # 即時檢測從快取讀取狀態，暫停 / 恢復立即生效
+        get_task_status_cache().set(task_id, new_status)
+        notify_task_changed(task_id)
         
         return {
             "message": message,
@@ -1849,6 +1938,8 @@ async def start_realtime_analysis(
         analysis_task.status = "running"
         analysis_task.start_time = datetime.utcnow()
         await db.commit()
+        get_task_status_cache().set(task_id, "running")
+        notify_task_changed(task_id)
 
         api_logger.info(f"即時分析任務 {task_id} 已啟動")
 
@@ -1974,11 +2065,19 @@ async def update_task_alert_config(
 # ===== 攝影機管理 API =====
 @router.websocket("/analysis/live-person-camera/{task_id}/ws")
 async def live_person_camera_websocket(websocket: WebSocket, task_id: str):
-    """Live Person Camera 即時預覽 WebSocket"""
-    await realtime_detection_service.register_preview_client(task_id, websocket)
+    """
+    Live Person Camera 即時預覽 WebSocket
+
+    預設送出 JSON 文字訊息（影像為 base64）；帶 ?format=binary 或送出
+    {"type": "set_format", "format": "binary"} 後改為二進位訊框（見 app/utils/preview_codec.py）
+    """
+    await realtime_detection_service.register_preview_client(
+        task_id, websocket, websocket.query_params.get("format", "json")
+    )
     try:
         while True:
-            await websocket.receive_text()
+            message = await websocket.receive_text()
+            await realtime_detection_service.handle_preview_message(task_id, websocket, message)
     except WebSocketDisconnect:
         await realtime_detection_service.unregister_preview_client(task_id, websocket)
     except Exception:
@@ -2380,13 +2479,19 @@ async def scan_cameras(
         raise HTTPException(status_code=500, detail=f"攝影機掃描失敗: {str(e)}")
 
 @router.get("/cameras/{camera_index}/preview")
-async def get_camera_preview(camera_index: int):
-    """獲取攝影機即時預覽影像（JPEG格式）- 使用共享視訊流"""
+async def get_camera_preview(
+    camera_index: int,
+    quality: str = Query(DEFAULT_TIER, description=f"畫質等級: {', '.join(PREVIEW_TIERS)}"),
+):
+    """獲取攝影機即時預覽影像（JPEG格式）- 使用共享視訊流，同一幀由預覽編碼服務只編碼一次"""
     try:
         from fastapi.responses import Response
         from app.services.camera_stream_manager import camera_stream_manager
-        import cv2
         
+        try:
+            resolve_tier(quality)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
         camera_id = f"camera_{camera_index}"
         
         # 確保攝影機流正在運行
@@ -2396,16 +2501,13 @@ async def get_camera_preview(camera_index: int):
             if not success:
                 raise HTTPException(status_code=404, detail=f"攝影機 {camera_index} 無法開啟")
         
-        # 獲取最新幀
-        latest_frame = camera_stream_manager.get_latest_frame(camera_id)
-        if latest_frame is None:
+        # 獲取最新幀的 JPEG（與 MJPEG / WebSocket 觀看者共用快取）
+        jpeg = await asyncio.to_thread(get_preview_encoder_service().latest_camera_jpeg, camera_id, quality)
+        if jpeg is None:
             raise HTTPException(status_code=500, detail=f"攝影機 {camera_index} 無法讀取影格")
         
-        # 轉換為JPEG
-        _, jpeg_buffer = cv2.imencode('.jpg', latest_frame.frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-        
         return Response(
-            content=jpeg_buffer.tobytes(),
+            content=jpeg,
             media_type="image/jpeg",
             headers={
                 "Cache-Control": "no-cache, no-store, must-revalidate",
@@ -2421,16 +2523,19 @@ async def get_camera_preview(camera_index: int):
         raise HTTPException(status_code=500, detail=f"預覽獲取失敗: {str(e)}")
 
 @router.get("/cameras/{camera_index}/stream")
-async def camera_stream(camera_index: int):
-    """攝影機即時串流（MJPEG格式）- 使用共享視訊流"""
+async def camera_stream(
+    camera_index: int,
+    quality: str = Query(DEFAULT_TIER, description=f"畫質等級: {', '.join(PREVIEW_TIERS)}"),
+):
+    """攝影機即時串流（MJPEG格式）- 使用共享視訊流，所有觀看者共用同一份 JPEG 編碼"""
     try:
         from fastapi.responses import StreamingResponse
-        from app.services.camera_stream_manager import camera_stream_manager, StreamConsumer, FrameData
-        import cv2
-        import asyncio
-        import threading
-        import queue
+        from app.services.camera_stream_manager import camera_stream_manager
         
+        try:
+            resolve_tier(quality)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
         camera_id = f"camera_{camera_index}"
         
         # 檢查攝影機流狀態並記錄調試信息
@@ -2447,60 +2552,21 @@ async def camera_stream(camera_index: int):
         else:
             api_logger.info(f"使用現有攝影機流: {camera_id}")
         
-        # 使用同步佇列來避免事件循環問題
-        import queue
-        frame_queue = queue.Queue(maxsize=5)
-        
-        def frame_callback(frame_data: FrameData):
-            """接收新幀的回調函數"""
-            try:
-                # 使用同步佇列，非阻塞方式放入
-                if not frame_queue.full():
-                    frame_queue.put_nowait(frame_data)
-            except queue.Full:
-                # 如果佇列滿了，移除最舊的幀再放入新的
-                try:
-                    frame_queue.get_nowait()
-                    frame_queue.put_nowait(frame_data)
-                except queue.Empty:
-                    pass
-            except Exception as e:
-                api_logger.error(f"幀回調錯誤: {e}")
-        
-        # 建立消費者
-        consumer_id = f"stream_{camera_index}_{id(frame_callback)}"
-        consumer = StreamConsumer(consumer_id, frame_callback)
-        
-        # 註冊消費者
-        camera_stream_manager.add_consumer(camera_id, consumer)
+        # 非同步訂閱：消費者執行緒取得（共用的）JPEG 後通知事件迴圈，產生器只 await 新影格
+        subscription = PreviewSubscription(camera_id, quality, name=f"stream_{camera_index}")
+        if not subscription.start():
+            raise HTTPException(status_code=404, detail=f"攝影機 {camera_index} 無法開啟")
         
         async def generate_frames():
             try:
-                while True:
-                    try:
-                        # 從同步佇列獲取幀，使用短超時避免阻塞
-                        try:
-                            frame_data = frame_queue.get(timeout=0.1)
-                        except queue.Empty:
-                            # 如果沒有新幀，等待一小段時間再繼續
-                            await asyncio.sleep(0.03)  # 約30FPS
-                            continue
-                        
-                        # 編碼為JPEG
-                        _, jpeg_buffer = cv2.imencode('.jpg', frame_data.frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-                        
-                        # MJPEG串流格式
-                        yield (b'--frame\r\n'
-                               b'Content-Type: image/jpeg\r\n\r\n' +
-                               jpeg_buffer.tobytes() + b'\r\n')
-                        
-                    except Exception as e:
-                        api_logger.error(f"幀生成錯誤: {e}")
-                        break
-                        
+                async for jpeg in subscription:
+                    # MJPEG串流格式（JPEG 已由預覽編碼服務產生）
+                    yield (b'--frame\r\n'
+                           b'Content-Type: image/jpeg\r\n\r\n' +
+                           jpeg + b'\r\n')
             finally:
                 # 清理：移除消費者
-                camera_stream_manager.remove_consumer(camera_id, consumer_id)
+                subscription.close()
                 api_logger.info(f"攝影機串流 {camera_index} 已清理")
         
         return StreamingResponse(
@@ -2522,139 +2588,162 @@ async def camera_stream(camera_index: int):
 
         raise HTTPException(status_code=500, detail=f"攝影機掃描失敗: {str(e)}")
 
+
+@router.get("/cameras/preview-encoder/stats")
+async def get_preview_encoder_stats():
+    """預覽編碼快取統計（各來源的編碼次數、命中數與快取大小）"""
+    return get_preview_encoder_service().get_stats()
+
 # ===== 分析統計 API =====
 
-@router.get(
-    "/analytics/camera-performance",
-    response_model=List[CameraPerformanceItem],
-)
-async def get_camera_performance(
-    days: int = Query(7, ge=1, le=90, description="統計回溯天數"),
-    limit: int = Query(5, ge=1, le=50, description="回傳的攝影機數量"),
-    db: AsyncSession = Depends(get_db),
-):
-    """依據歷史偵測結果與任務資料輸出攝影機效能指標"""
-    try:
-        now = datetime.utcnow()
-        start_time = now - timedelta(days=days)
+async def _load_camera_performance(
+    db: AsyncSession, days: int, limit: int
+) -> List[CameraPerformanceItem]:
+    """彙總攝影機效能指標（由分析快取呼叫）"""
+    now = datetime.utcnow()
+    start_time = now - timedelta(days=days)
 
-        detection_stmt = (
-            select(
-                AnalysisTask.camera_name.label("camera_name"),
-                AnalysisTask.camera_id.label("camera_id"),
-                func.count(DetectionResult.id).label("detections"),
-                func.max(DetectionResult.frame_timestamp).label("last_detection"),
-            )
-            .join(DetectionResult, DetectionResult.task_id == AnalysisTask.id)
-            .where(
-                AnalysisTask.camera_name.isnot(None),
-                DetectionResult.frame_timestamp >= start_time,
-            )
-            .group_by(AnalysisTask.camera_name, AnalysisTask.camera_id)
-        )
+    # 各任務偵測數量讀彙總表（最近一分鐘讀明細表），再依任務對應到攝影機
+    task_totals = await fetch_detection_summary(db, start_time, now, group_by=("task_id",))
+    task_totals = [row for row in task_totals if row["count"]]
+    metrics: Dict[str, Dict[str, Any]] = {}
 
-        detection_rows = (await db.execute(detection_stmt)).all()
-        metrics: Dict[str, Dict[str, Any]] = {}
+    if task_totals:
+        camera_rows = (
+            await db.execute(
+                select(AnalysisTask.id, AnalysisTask.camera_name, AnalysisTask.camera_id).where(
+                    AnalysisTask.id.in_([row["task_id"] for row in task_totals]),
+                    AnalysisTask.camera_name.isnot(None),
+                )
+            )
+        ).all()
+        cameras = {row.id: row for row in camera_rows}
 
-        for row in detection_rows:
-            key = row.camera_id or row.camera_name
+        for total in task_totals:
+            camera = cameras.get(total["task_id"])
+            if camera is None:
+                continue
+            key = camera.camera_id or camera.camera_name
             if not key:
                 continue
-            metrics[key] = {
+            last_detection = _normalize_datetime_input(total["last_seen"])
+            metric = metrics.get(key)
+            if metric is None:
+                metrics[key] = {
+                    "camera_name": camera.camera_name or "未命名攝影機",
+                    "camera_id": camera.camera_id,
+                    "detections": total["count"],
+                    "runtime_seconds": 0.0,
+                    "status": None,
+                    "last_active": last_detection,
+                }
+                continue
+            metric["detections"] += total["count"]
+            if last_detection and (metric["last_active"] is None or last_detection > metric["last_active"]):
+                metric["last_active"] = last_detection
+
+    task_stmt = (
+        select(
+            AnalysisTask.camera_name,
+            AnalysisTask.camera_id,
+            AnalysisTask.start_time,
+            AnalysisTask.end_time,
+            AnalysisTask.created_at,
+            AnalysisTask.status,
+        )
+        .where(
+            AnalysisTask.camera_name.isnot(None),
+            or_(
+                AnalysisTask.end_time.is_(None),
+                AnalysisTask.end_time >= start_time,
+                AnalysisTask.start_time >= start_time,
+                AnalysisTask.created_at >= start_time,
+            ),
+        )
+    )
+
+    task_rows = (await db.execute(task_stmt)).all()
+
+    for row in task_rows:
+        key = row.camera_id or row.camera_name
+        if not key:
+            continue
+
+        metric = metrics.get(key)
+        if metric is None:
+            metric = {
                 "camera_name": row.camera_name or "未命名攝影機",
                 "camera_id": row.camera_id,
-                "detections": int(row.detections or 0),
+                "detections": 0,
                 "runtime_seconds": 0.0,
                 "status": None,
-                "last_active": _normalize_datetime_input(row.last_detection),
+                "last_active": None,
             }
+            metrics[key] = metric
 
-        task_stmt = (
-            select(
-                AnalysisTask.camera_name,
-                AnalysisTask.camera_id,
-                AnalysisTask.start_time,
-                AnalysisTask.end_time,
-                AnalysisTask.created_at,
-                AnalysisTask.status,
-            )
-            .where(
-                AnalysisTask.camera_name.isnot(None),
-                or_(
-                    AnalysisTask.end_time.is_(None),
-                    AnalysisTask.end_time >= start_time,
-                    AnalysisTask.start_time >= start_time,
-                    AnalysisTask.created_at >= start_time,
-                ),
-            )
+        start_candidate = (
+            _normalize_datetime_input(row.start_time)
+            or _normalize_datetime_input(row.created_at)
         )
+        if not start_candidate:
+            continue
 
-        task_rows = (await db.execute(task_stmt)).all()
-
-        for row in task_rows:
-            key = row.camera_id or row.camera_name
-            if not key:
-                continue
+        effective_start = max(start_candidate, start_time)
+        end_candidate = _normalize_datetime_input(row.end_time) or now
+        if end_candidate <= start_time or end_candidate <= effective_start:
+            continue
 
-            metric = metrics.get(key)
-            if metric is None:
-                metric = {
-                    "camera_name": row.camera_name or "未命名攝影機",
-                    "camera_id": row.camera_id,
-                    "detections": 0,
-                    "runtime_seconds": 0.0,
-                    "status": None,
-                    "last_active": None,
-                }
-                metrics[key] = metric
+        metric["runtime_seconds"] += max(
+            0.0, (end_candidate - effective_start).total_seconds()
+        )
+        metric["status"] = metric["status"] or row.status
 
-            start_candidate = (
-                _normalize_datetime_input(row.start_time)
-                or _normalize_datetime_input(row.created_at)
-            )
-            if not start_candidate:
-                continue
+        latest_point = _normalize_datetime_input(row.end_time) or now
+        if metric["last_active"] is None or (
+            latest_point and latest_point > metric["last_active"]
+        ):
+            metric["last_active"] = latest_point
 
-            effective_start = max(start_candidate, start_time)
-            end_candidate = _normalize_datetime_input(row.end_time) or now
-            if end_candidate <= start_time or end_candidate <= effective_start:
-                continue
+    if not metrics:
+        return []
 
-            metric["runtime_seconds"] += max(
-                0.0, (end_candidate - effective_start).total_seconds()
+    performance_items: List[CameraPerformanceItem] = []
+    for payload in metrics.values():
+        runtime_hours = round(payload["runtime_seconds"] / 3600, 1)
+        performance_items.append(
+            CameraPerformanceItem(
+                camera_name=payload["camera_name"],
+                camera_id=payload["camera_id"],
+                detections=payload["detections"],
+                runtime_hours=runtime_hours,
+                status=payload["status"],
+                last_active=payload["last_active"],
             )
-            metric["status"] = metric["status"] or row.status
+        )
 
-            latest_point = _normalize_datetime_input(row.end_time) or now
-            if metric["last_active"] is None or (
-                latest_point and latest_point > metric["last_active"]
-            ):
-                metric["last_active"] = latest_point
+    performance_items.sort(
+        key=lambda item: (item.detections, item.runtime_hours),
+        reverse=True,
+    )
 
-        if not metrics:
-            return []
+    return performance_items[:limit]
 
-        performance_items: List[CameraPerformanceItem] = []
-        for payload in metrics.values():
-            runtime_hours = round(payload["runtime_seconds"] / 3600, 1)
-            performance_items.append(
-                CameraPerformanceItem(
-                    camera_name=payload["camera_name"],
-                    camera_id=payload["camera_id"],
-                    detections=payload["detections"],
-                    runtime_hours=runtime_hours,
-                    status=payload["status"],
-                    last_active=payload["last_active"],
-                )
-            )
 
-        performance_items.sort(
-            key=lambda item: (item.detections, item.runtime_hours),
-            reverse=True,
+@router.get(
+    "/analytics/camera-performance",
+    response_model=List[CameraPerformanceItem],
+)
+async def get_camera_performance(
+    days: int = Query(7, ge=1, le=90, description="統計回溯天數"),
+    limit: int = Query(5, ge=1, le=50, description="回傳的攝影機數量"),
+    db: AsyncSession = Depends(get_db),
+):
+    """依據歷史偵測結果與任務資料輸出攝影機效能指標"""
+    try:
+        return await get_analytics_cache().get_or_load(
+            f"camera-performance:{days}:{limit}",
+            lambda: _load_camera_performance(db, days, limit),
         )
-
-        return performance_items[:limit]
-
     except Exception as exc:
         api_logger.error(f"獲取攝影機效能數據失敗: {exc}")
         raise HTTPException(status_code=500, detail="無法取得攝影機效能數據")
@@ -2766,12 +2855,33 @@ async def get_analytics(
         api_logger.error(f"獲取分析數據失敗: {e}")
         raise HTTPException(status_code=500, detail=f"分析數據獲取失敗: {str(e)}")
 
+@router.get("/analytics/cache-stats")
+async def get_analytics_cache_stats():
+    """分析查詢快取的命中率、合併查詢與淘汰統計"""
+    return get_analytics_cache().get_stats()
+
 @router.get("/analytics/heatmap")
-async def get_heatmap_data(db: AsyncSession = Depends(get_db)):
+async def get_heatmap_data(
+    start_time: Optional[datetime] = Query(None, description="開始時間（預設為結束時間前 24 小時）"),
+    end_time: Optional[datetime] = Query(None, description="結束時間（預設為現在）"),
+    task_id: Optional[int] = Query(None, description="僅統計指定任務"),
+    camera_id: Optional[str] = Query(None, description="僅統計指定攝影機"),
+    grid_size: Optional[int] = Query(None, ge=1, le=1024, description="每邊網格數（不超過 HEATMAP_GRID_SIZE）"),
+    gaussian_sigma: Optional[float] = Query(None, ge=0.0, le=10.0, description="高斯平滑標準差（網格單位，0 = 不平滑）"),
+    db: AsyncSession = Depends(get_db),
+):
     """獲取熱點圖數據"""
     try:
         analytics_service = AnalyticsService()
-        heatmap_data = await analytics_service.get_heatmap_data(db=db)
+        heatmap_data = await analytics_service.get_heatmap_data(
+            db=db,
+            start_time=_normalize_datetime_input(start_time),
+            end_time=_normalize_datetime_input(end_time),
+            task_id=task_id,
+            camera_id=camera_id,
+            grid_size=grid_size,
+            gaussian_sigma=gaussian_sigma,
+        )
         
         return heatmap_data
         
@@ -2784,6 +2894,12 @@ async def get_detection_results(
     request: Request,
     page: int = Query(1, ge=1),
     limit: int = Query(50, ge=1, le=500),
+    pagination: str = Query("offset", pattern="^(offset|cursor)$", description="分頁模式：offset / cursor（keyset）"),
+    cursor: Optional[str] = Query(None, description="續頁標記（上一頁回傳的 next_cursor，帶入即使用 keyset 分頁）"),
+    total_mode: Optional[str] = Query(
+        None, alias="total", pattern="^(exact|estimated|none)$",
+        description="總筆數：exact / estimated / none（預設 offset 分頁為 exact、keyset 分頁為 estimated）",
+    ),
     search: Optional[str] = Query(None, description="關鍵字，匹配任務名稱/攝影機/物件"),
     camera_name: Optional[str] = Query(None, description="攝影機名稱"),
     camera_id: Optional[str] = Query(None, description="攝影機 ID"),
@@ -2799,115 +2915,165 @@ async def get_detection_results(
     取得偵測記錄列表：
     - 同一個追蹤 ID (tracker_id) 只會顯示一次
     - start_time / end_time 分別對應首次出現與最後一次出現的時間
+    - offset 分頁以視窗函數去重；keyset 分頁（cursor）只取每個追蹤目標的最後一筆，
+      以 (最後出現時間, id) 接續，深頁不必重算整段資料
     """
     try:
         offset = (page - 1) * limit
         normalized_start = _normalize_datetime_input(start_time)
         normalized_end = _normalize_datetime_input(end_time)
+        use_cursor = pagination == "cursor" or bool(cursor)
+        if total_mode is None:
+            total_mode = "estimated" if use_cursor else "exact"
 
-        tracker_group = func.coalesce(DetectionResult.tracker_id, DetectionResult.id)
-        partition_key = (DetectionResult.task_id, tracker_group)
+        def _build_filters(model) -> List[Any]:
+            """篩選條件（model 為 DetectionResult 或其別名，任務欄位一律對應外層的 AnalysisTask）"""
+            filters = []
 
-        start_time_col = func.min(DetectionResult.frame_timestamp).over(
-            partition_by=partition_key
-        ).label("start_time")
+            if task_id is not None:
+                filters.append(model.task_id == task_id)
 
-        end_time_col = func.max(DetectionResult.frame_timestamp).over(
-            partition_by=partition_key
-        ).label("end_time")
-
-        row_rank_col = func.row_number().over(
-            partition_by=partition_key,
-            order_by=DetectionResult.frame_timestamp.desc(),
-        ).label("row_rank")
+            if object_type:
+                filters.append(model.object_type.ilike(f"%{object_type}%"))
 
-        base_stmt = (
-            select(
-                DetectionResult.id.label("id"),
-                DetectionResult.task_id.label("task_id"),
-                DetectionResult.tracker_id.label("tracker_id"),
-                DetectionResult.frame_timestamp.label("frame_timestamp"),
-                DetectionResult.object_type.label("object_type"),
-                DetectionResult.confidence.label("confidence"),
-                DetectionResult.bbox_x1.label("bbox_x1"),
-                DetectionResult.bbox_y1.label("bbox_y1"),
-                DetectionResult.bbox_x2.label("bbox_x2"),
-                DetectionResult.bbox_y2.label("bbox_y2"),
-                DetectionResult.center_x.label("center_x"),
-                DetectionResult.center_y.label("center_y"),
-                DetectionResult.thumbnail_path.label("thumbnail_path"),
-                AnalysisTask.task_name.label("task_name"),
-                AnalysisTask.task_type.label("task_type"),
-                AnalysisTask.camera_name.label("camera_name"),
-                AnalysisTask.camera_id.label("camera_id"),
-                AnalysisTask.id.label("analysis_task_id"),
-                start_time_col,
-                end_time_col,
-                row_rank_col,
-            )
-            .outerjoin(AnalysisTask, DetectionResult.task_id == AnalysisTask.id)
-        )
+            if camera_name:
+                filters.append(AnalysisTask.camera_name.ilike(f"%{camera_name}%"))
 
-        filters = []
+            if camera_id:
+                filters.append(AnalysisTask.camera_id == camera_id)
 
-        if task_id is not None:
-            filters.append(DetectionResult.task_id == task_id)
+            if normalized_start:
+                filters.append(model.frame_timestamp >= normalized_start)
 
-        if object_type:
-            filters.append(DetectionResult.object_type.ilike(f"%{object_type}%"))
+            if normalized_end:
+                filters.append(model.frame_timestamp <= normalized_end)
 
-        if camera_name:
-            filters.append(AnalysisTask.camera_name.ilike(f"%{camera_name}%"))
+            if min_confidence is not None:
+                filters.append(model.confidence >= min_confidence)
 
-        if camera_id:
-            filters.append(AnalysisTask.camera_id == camera_id)
+            if max_confidence is not None:
+                filters.append(model.confidence <= max_confidence)
 
-        if normalized_start:
-            filters.append(DetectionResult.frame_timestamp >= normalized_start)
+            if search:
+                keyword = f"%{search}%"
+                filters.append(
+                    or_(
+                        model.object_type.ilike(keyword),
+                        AnalysisTask.task_name.ilike(keyword),
+                        AnalysisTask.camera_name.ilike(keyword),
+                    )
+                )
+            return filters
 
-        if normalized_end:
-            filters.append(DetectionResult.frame_timestamp <= normalized_end)
+        tracker_group = func.coalesce(DetectionResult.tracker_id, DetectionResult.id)
+        partition_key = (DetectionResult.task_id, tracker_group)
 
-        if min_confidence is not None:
-            filters.append(DetectionResult.confidence >= min_confidence)
+        detection_columns = [
+            DetectionResult.id.label("id"),
+            DetectionResult.task_id.label("task_id"),
+            DetectionResult.tracker_id.label("tracker_id"),
+            DetectionResult.frame_timestamp.label("frame_timestamp"),
+            DetectionResult.object_type.label("object_type"),
+            DetectionResult.confidence.label("confidence"),
+            DetectionResult.bbox_x1.label("bbox_x1"),
+            DetectionResult.bbox_y1.label("bbox_y1"),
+            DetectionResult.bbox_x2.label("bbox_x2"),
+            DetectionResult.bbox_y2.label("bbox_y2"),
+            DetectionResult.center_x.label("center_x"),
+            DetectionResult.center_y.label("center_y"),
+            DetectionResult.thumbnail_path.label("thumbnail_path"),
+            AnalysisTask.task_name.label("task_name"),
+            AnalysisTask.task_type.label("task_type"),
+            AnalysisTask.camera_name.label("camera_name"),
+            AnalysisTask.camera_id.label("camera_id"),
+            AnalysisTask.id.label("analysis_task_id"),
+        ]
 
-        if max_confidence is not None:
-            filters.append(DetectionResult.confidence <= max_confidence)
+        next_cursor = None
+        if use_cursor:
+            # 每個追蹤目標的最後一筆：同組內沒有更晚（時間相同時 id 較大）的偵測，
+            # 由 idx_detection_results_task_track_group_ts 逐筆探測
+            def _same_group(other):
+                return and_(
+                    other.task_id == DetectionResult.task_id,
+                    func.coalesce(other.tracker_id, other.id) == tracker_group,
+                )
 
-        if search:
-            keyword = f"%{search}%"
-            filters.append(
-                or_(
-                    DetectionResult.object_type.ilike(keyword),
-                    AnalysisTask.task_name.ilike(keyword),
-                    AnalysisTask.camera_name.ilike(keyword),
+            later = aliased(DetectionResult)
+            newer_exists = exists().where(
+                _same_group(later),
+                later.frame_timestamp >= DetectionResult.frame_timestamp,
+                tuple_(later.frame_timestamp, later.id) > tuple_(DetectionResult.frame_timestamp, DetectionResult.id),
+                *_build_filters(later),
+            )
+            earlier = aliased(DetectionResult)
+            first_seen = (
+                select(func.min(earlier.frame_timestamp))
+                .where(_same_group(earlier), *_build_filters(earlier))
+                .scalar_subquery()
+            )
+            latest_stmt = (
+                select(
+                    *detection_columns,
+                    first_seen.label("start_time"),
+                    DetectionResult.frame_timestamp.label("end_time"),
                 )
+                .outerjoin(AnalysisTask, DetectionResult.task_id == AnalysisTask.id)
+                .where(*_build_filters(DetectionResult), ~newer_exists)
+            )
+            page_result = await paginate(
+                db,
+                latest_stmt,
+                (DetectionResult.frame_timestamp, DetectionResult.id),
+                scope="frontend_detection_results",
+                limit=limit,
+                cursor=cursor,
+                mode="cursor",
+                total=total_mode,
+                scalars=False,
+            )
+            detection_rows = page_result.items
+            total = page_result.pagination["total"]
+            has_next = page_result.pagination["has_next"]
+            next_cursor = page_result.next_cursor
+        else:
+            start_time_col = func.min(DetectionResult.frame_timestamp).over(
+                partition_by=partition_key
+            ).label("start_time")
+
+            end_time_col = func.max(DetectionResult.frame_timestamp).over(
+                partition_by=partition_key
+            ).label("end_time")
+
+            row_rank_col = func.row_number().over(
+                partition_by=partition_key,
+                order_by=DetectionResult.frame_timestamp.desc(),
+            ).label("row_rank")
+
+            base_stmt = (
+                select(*detection_columns, start_time_col, end_time_col, row_rank_col)
+                .outerjoin(AnalysisTask, DetectionResult.task_id == AnalysisTask.id)
             )
 
-        if filters:
-            base_stmt = base_stmt.where(*filters)
-
-        ranked_cte = base_stmt.cte("ranked_detections")
+            filters = _build_filters(DetectionResult)
+            if filters:
+                base_stmt = base_stmt.where(*filters)
 
-        deduplicated_stmt = (
-            select(ranked_cte)
-            .where(ranked_cte.c.row_rank == 1)
-            .order_by(desc(ranked_cte.c.end_time))
-            .offset(offset)
-            .limit(limit)
-        )
+            ranked_cte = base_stmt.cte("ranked_detections")
 
-        count_stmt = (
-            select(func.count())
-            .select_from(ranked_cte)
-            .where(ranked_cte.c.row_rank == 1)
-        )
+            deduplicated_stmt = select(ranked_cte).where(ranked_cte.c.row_rank == 1)
 
-        result = await db.execute(deduplicated_stmt)
-        detection_rows = result.fetchall()
+            result = await db.execute(
+                deduplicated_stmt
+                .order_by(desc(ranked_cte.c.end_time))
+                .offset(offset)
+                .limit(limit + 1)
+            )
+            detection_rows = result.fetchall()
+            has_next = len(detection_rows) > limit
+            detection_rows = detection_rows[:limit]
 
-        count_result = await db.execute(count_stmt)
-        total = count_result.scalar_one_or_none() or 0
+            total = await count_rows(db, deduplicated_stmt, total_mode)
 
         results = []
         for row in detection_rows:
@@ -2959,11 +3125,16 @@ async def get_detection_results(
         return {
             "results": results,
             "total": total,
+            "total_is_estimate": total_mode == "estimated",
             "page": page,
             "limit": limit,
-            "total_pages": (total + limit - 1) // limit,
+            "total_pages": (total + limit - 1) // limit if total is not None else None,
+            "has_next": has_next,
+            "next_cursor": next_cursor,
         }
 
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         api_logger.error(f"獲取檢測結果失敗: {e}")
         raise HTTPException(status_code=500, detail=f"檢測結果獲取失敗: {str(e)}")
@@ -3647,16 +3818,16 @@ async def get_video_files(directory: Optional[str] = None):
 
 @router.post("/data-sources/upload/video")
 async def upload_video_file(file: UploadFile = File(...)):
-    """上傳影片檔案"""
+    """上傳影片檔案（單次上傳；大型檔案請改用 /data-sources/uploads 分段上傳）"""
+    file_path: Optional[Path] = None
     try:
         # 檢查檔案類型
-        allowed_extensions = ['.mp4', '.avi', '.mov', '.mkv', '.wmv', '.flv', '.webm']
         file_ext = os.path.splitext(file.filename)[1].lower()
         
-        if file_ext not in allowed_extensions:
+        if file_ext not in ALLOWED_VIDEO_EXTENSIONS:
             raise HTTPException(
                 status_code=400, 
-                detail=f"不支援的檔案格式。支援的格式: {', '.join(allowed_extensions)}"
+                detail=f"不支援的檔案格式。支援的格式: {', '.join(ALLOWED_VIDEO_EXTENSIONS)}"
             )
         
         # 檢查檔案大小 (限制為 500MB)
@@ -3667,97 +3838,138 @@ async def upload_video_file(file: UploadFile = File(...)):
                 detail=f"檔案太大。最大支援 500MB，您的檔案為 {file.size / 1024 / 1024:.1f}MB"
             )
         
-        # 創建上傳目錄（uploads/videos）
-        videos_dir = find_videos_directory() or (Path("uploads") / "videos")
-        upload_dir = str(videos_dir)
-        os.makedirs(upload_dir, exist_ok=True)
-        
-        # 生成唯一檔案名
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        safe_filename = f"{timestamp}_{file.filename}"
-        file_path = os.path.join(upload_dir, safe_filename)
-        
-        # 保存檔案
+        # 分塊寫入 uploads/videos，寫檔在工作執行緒，不把整個檔案讀進記憶體
+        file_path = video_target_path(file.filename)
         with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+            while True:
+                chunk = await file.read(1024 * 1024)
+                if not chunk:
+                    break
+                await asyncio.to_thread(buffer.write, chunk)
         
-        # 驗證影片檔案
-        try:
-            import cv2
-            cap = cv2.VideoCapture(file_path)
-            if not cap.isOpened():
-                os.remove(file_path)  # 刪除無效檔案
-                raise HTTPException(status_code=400, detail="無效的影片檔案")
-            
-            # 獲取影片資訊
-            frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            fps = cap.get(cv2.CAP_PROP_FPS)
-            duration = frame_count / fps if fps > 0 else 0
-            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-            cap.release()
-            
-        except Exception as e:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            raise HTTPException(status_code=400, detail=f"影片檔案驗證失敗: {str(e)}")
+        # 驗證影片檔案（cv2 開檔可能耗時，移到工作執行緒）
+        video_info = await asyncio.to_thread(probe_video, str(file_path))
+        if video_info is None:
+            raise HTTPException(status_code=400, detail="無效的影片檔案")
         
         # 創建資料來源記錄
-        async with AsyncSessionLocal() as db:
-            db_service = DatabaseService()
-            
-            # 創建資料來源配置
-            video_config = {
-                "path": file_path,  # 使用 "path" 符合模型期望
-                "file_path": file_path,  # 保留向後相容性
-                "original_name": file.filename,
-                "file_size": os.path.getsize(file_path),
-                "duration": round(duration, 2),
-                "fps": round(fps, 2),
-                "resolution": f"{width}x{height}",
-                "frame_count": frame_count,
-                "upload_time": datetime.now().isoformat()
-            }
-            
-            # 創建資料來源記錄
-            source_data = {
-                "source_type": "video_file",  # 使用 "video_file" 符合資料庫約束
-                "name": file.filename,
-                "config": video_config,
-                "status": "active"
-            }
-            
-            created_source = await db_service.create_data_source(db, source_data)
-            
-            return {
-                "message": f"影片檔案 {file.filename} 上傳成功",
-                "source_id": created_source.id,
-                "file_path": file_path,
-                "original_name": file.filename,
-                "size": os.path.getsize(file_path),
-                "video_info": {
-                    "duration": round(duration, 2),
-                    "fps": round(fps, 2),
-                    "resolution": f"{width}x{height}",
-                    "frame_count": frame_count
-                }
+        created_source = await register_video_source(file_path, file.filename, video_info)
+        file_path_str = str(file_path)
+        file_path = None  # 已成功建立資料來源，不再清除檔案
+        
+        return {
+            "message": f"影片檔案 {file.filename} 上傳成功",
+            "source_id": created_source.id,
+            "file_path": file_path_str,
+            "original_name": file.filename,
+            "size": os.path.getsize(file_path_str),
+            "video_info": {
+                "duration": video_info["duration"],
+                "fps": video_info["fps"],
+                "resolution": f"{video_info['width']}x{video_info['height']}",
+                "frame_count": video_info["frame_count"]
             }
+        }
         
     except HTTPException:
         raise
     except Exception as e:
         api_logger.error(f"上傳影片檔案失敗: {e}")
         raise HTTPException(status_code=500, detail=f"上傳影片檔案失敗: {str(e)}")
+    finally:
+        if file_path is not None and file_path.exists():
+            file_path.unlink(missing_ok=True)  # 刪除無效或未完成的檔案
+
+
+class UploadInitRequest(BaseModel):
+    filename: str
+    size: int = Field(..., gt=0, description="檔案大小（bytes）")
+    part_size: Optional[int] = Field(None, gt=0, description="分段大小（bytes），未指定時使用 UPLOAD_PART_SIZE_MB")
+    sha256: Optional[str] = Field(None, description="整檔 SHA-256，完成時驗證")
+
+
+class UploadCompleteRequest(BaseModel):
+    sha256: Optional[str] = Field(None, description="整檔 SHA-256（覆寫建立時提供的值）")
+
+
+def _upload_http_error(exc: UploadError) -> HTTPException:
+    return HTTPException(status_code=exc.status_code, detail=str(exc))
+
+
+@router.post("/data-sources/uploads", status_code=201)
+async def create_video_upload(request: UploadInitRequest):
+    """建立分段上傳，回傳 upload_id 與分段大小"""
+    try:
+        return await get_upload_service().initiate(
+            request.filename, request.size, request.part_size, request.sha256
+        )
+    except UploadError as exc:
+        raise _upload_http_error(exc)
+
+
+@router.get("/data-sources/uploads/{upload_id}")
+async def get_video_upload(upload_id: str):
+    """查詢分段上傳狀態（已收到 / 缺少的分段；完成後含資料來源資訊），用於續傳"""
+    try:
+        return get_upload_service().status(upload_id)
+    except UploadError as exc:
+        raise _upload_http_error(exc)
+
+
+@router.put("/data-sources/uploads/{upload_id}/parts/{part_number}")
+async def upload_video_part(upload_id: str, part_number: int, request: Request):
+    """
+    上傳一個分段（1 起算），請求本文為分段的原始位元組
+
+    標頭 X-Content-SHA256 為此分段的 SHA-256；同一分段可重傳覆蓋
+    """
+    try:
+        return await get_upload_service().write_part(
+            upload_id, part_number, request.stream(), request.headers.get("x-content-sha256")
+        )
+    except UploadError as exc:
+        raise _upload_http_error(exc)
+
+
+@router.post("/data-sources/uploads/{upload_id}/complete", status_code=202)
+async def complete_video_upload(upload_id: str, request: Optional[UploadCompleteRequest] = None):
+    """完成分段上傳：背景組合檔案、驗證影片並建立資料來源，以 GET 查詢結果"""
+    try:
+        return await get_upload_service().complete(upload_id, request.sha256 if request else None)
+    except UploadError as exc:
+        raise _upload_http_error(exc)
+
+
+@router.delete("/data-sources/uploads/{upload_id}")
+async def abort_video_upload(upload_id: str):
+    """取消分段上傳並刪除暫存檔"""
+    try:
+        await get_upload_service().abort(upload_id)
+    except UploadError as exc:
+        raise _upload_http_error(exc)
+    return {"upload_id": upload_id, "status": "aborted"}
+
 
 @router.get("/data-sources/upload/video/progress/{task_id}")
 async def get_upload_progress(task_id: str):
-    """獲取上傳進度（未來功能）"""
+    """獲取上傳進度（task_id 為分段上傳的 upload_id）"""
+    try:
+        upload = get_upload_service().status(task_id)
+    except UploadError as exc:
+        raise _upload_http_error(exc)
+    messages = {
+        "uploading": "上傳中",
+        "processing": "處理中",
+        "completed": "上傳完成",
+        "failed": "上傳失敗",
+    }
     return {
         "task_id": task_id,
-        "progress": 100,
-        "status": "completed",
-        "message": "上傳完成"
+        "progress": round(upload["bytes_received"] * 100 / upload["size"], 1),
+        "status": upload["status"],
+        "message": upload["error"] or messages.get(upload["status"], upload["status"]),
+        "missing_parts": upload["missing_parts"],
+        "result": upload["result"],
     }
 
 # ===== 數據管理 API =====
@@ -3815,168 +4027,152 @@ async def get_storage_analysis():
         api_logger.error(f"獲取儲存分析失敗: {e}")
         raise HTTPException(status_code=500, detail=f"獲取儲存分析失敗: {str(e)}")
 
+async def _load_quick_stats() -> Dict[str, Any]:
+    """彙總快速統計（由分析快取呼叫）"""
+    async with AsyncSessionLocal() as db:
+        # 讀每分鐘 / 每小時彙總表，尚未彙總的最近一分鐘由明細表補上
+        now = datetime.now()
+        today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        today_rows = await fetch_detection_summary(db, today_start, now)
+        today_detections = sum(row["count"] for row in today_rows)
+
+        rows = await fetch_detection_summary(db, None, now, group_by=("hour_of_day", "object_type"))
+        total = sum(row["count"] for row in rows)
+
+        # 平均信心度
+        avg_confidence = sum(row["confidence_sum"] for row in rows) / total if total else 0
+
+        # 最常見物件
+        object_counts: Dict[str, int] = {}
+        hour_counts: Dict[int, int] = {}
+        for row in rows:
+            object_counts[row["object_type"]] = object_counts.get(row["object_type"], 0) + row["count"]
+            hour = int(row["hour_of_day"])
+            hour_counts[hour] = hour_counts.get(hour, 0) + row["count"]
+        most_common_object = max(object_counts, key=object_counts.get) if total else "N/A"
+
+        # 活躍時段
+        if total:
+            peak_hour = max(hour_counts, key=hour_counts.get)
+            peak_hours = f"{peak_hour:02d}:00-{peak_hour + 1:02d}:00"
+        else:
+            peak_hours = "N/A"
+
+        # 高信心度檢測百分比
+        high_confidence_percentage = (
+            sum(row["high_confidence_count"] for row in rows) * 100.0 / total if total else 0
+        )
+        
+        # 追蹤連續性（簡化計算）
+        tracking_continuity = 85.0  # 假設值，實際應該根據object_id連續性計算
+        
+        return {
+            "today_detections": int(today_detections),
+            "avg_confidence": float(avg_confidence),
+            "most_common_object": most_common_object,
+            "peak_hours": peak_hours,
+            "high_confidence_percentage": float(high_confidence_percentage),
+            "tracking_continuity": tracking_continuity
+        }
+
 @router.get("/quick-stats")
 async def get_quick_stats():
     """獲取快速統計數據"""
     try:
-        async with AsyncSessionLocal() as db:
-            # 今日檢測數
-            today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-            result = await db.execute(text("""
-                SELECT COUNT(*) FROM detection_results 
-                WHERE timestamp >= :today_start
-            """), {"today_start": today_start})
-            today_detections = result.scalar() or 0
-            
-            # 平均信心度
-            result = await db.execute(text("SELECT AVG(confidence) FROM detection_results"))
-            avg_confidence = result.scalar() or 0
-            
-            # 最常見物件
-            result = await db.execute(text("""
-                SELECT object_type, COUNT(*) as count 
-                FROM detection_results 
-                GROUP BY object_type 
-                ORDER BY count DESC 
-                LIMIT 1
-            """))
-            most_common = result.fetchone()
-            most_common_object = most_common[0] if most_common else "N/A"
-            
-            # 活躍時段
-            result = await db.execute(text("""
-                SELECT EXTRACT(hour FROM timestamp) as hour, COUNT(*) as count
-                FROM detection_results 
-                GROUP BY hour 
-                ORDER BY count DESC 
-                LIMIT 1
-            """))
-            peak_hour = result.fetchone()
-            peak_hours = f"{int(peak_hour[0]):02d}:00-{int(peak_hour[0])+1:02d}:00" if peak_hour else "N/A"
-            
-            # 高信心度檢測百分比
-            result = await db.execute(text("""
-                SELECT 
-                    CASE 
-                        WHEN COUNT(*) > 0 THEN
-                            COUNT(CASE WHEN confidence >= 0.8 THEN 1 END) * 100.0 / COUNT(*)
-                        ELSE 0 
-                    END as high_confidence_percentage
-                FROM detection_results
-            """))
-            high_confidence_percentage = result.scalar() or 0
-            
-            # 追蹤連續性（簡化計算）
-            tracking_continuity = 85.0  # 假設值，實際應該根據object_id連續性計算
-            
-            return {
-                "today_detections": int(today_detections),
-                "avg_confidence": float(avg_confidence),
-                "most_common_object": most_common_object,
-                "peak_hours": peak_hours,
-                "high_confidence_percentage": float(high_confidence_percentage),
-                "tracking_continuity": tracking_continuity
-            }
+        return await get_analytics_cache().get_or_load("quick-stats", _load_quick_stats)
     except Exception as e:
         api_logger.error(f"獲取快速統計失敗: {e}")
         raise HTTPException(status_code=500, detail=f"獲取快速統計失敗: {str(e)}")
 
 @router.get("/export-data")
 async def export_data(
-    format: str = Query(..., description="匯出格式: csv, json, excel"),
+    format: str = Query(..., description="匯出格式: csv, json, ndjson, parquet"),
+    table: str = Query("detections", description="資料表: detections, line_events, zone_events, speed_events"),
     ids: Optional[str] = Query(None, description="要匯出的記錄ID，用逗號分隔"),
+    task_id: Optional[int] = Query(None, description="任務 ID"),
     object_type: Optional[str] = Query(None, description="物件類型篩選"),
     confidence_min: Optional[float] = Query(None, description="最小信心度"),
     confidence_max: Optional[float] = Query(None, description="最大信心度"),
-    start_date: Optional[str] = Query(None, description="開始日期"),
-    end_date: Optional[str] = Query(None, description="結束日期")
+    start_date: Optional[str] = Query(None, description="開始時間 (ISO 8601 或 YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="結束時間 (ISO 8601 或 YYYY-MM-DD，只有日期時包含當天)"),
+    gzip: bool = Query(False, description="以 gzip 壓縮輸出"),
+    background: Optional[bool] = Query(
+        None, description="改為背景工作（未指定時依估計列數與 EXPORT_BACKGROUND_ROWS 自動判斷）"
+    ),
 ):
-    """匯出檢測數據"""
+    """
+    匯出檢測數據（串流輸出，不把整個結果讀進記憶體）
+
+    大型匯出回傳 202 與背景工作資訊，以 /exports/{job_id} 查詢進度、完成後由 /exports/{job_id}/download 下載。
+    """
     try:
-        from fastapi.responses import StreamingResponse
-        import csv
-        import json
-        import io
-        
-        async with AsyncSessionLocal() as db:
-            # 構建查詢
-            query = "SELECT * FROM detection_results WHERE 1=1"
-            params = {}
-            
-            if ids:
-                id_list = [int(id.strip()) for id in ids.split(',')]
-                query += " AND id = ANY(:ids)"
-                params["ids"] = id_list
-            
-            if object_type:
-                query += " AND object_type = :object_type"
-                params["object_type"] = object_type
-            
-            if confidence_min is not None:
-                query += " AND confidence >= :confidence_min"
-                params["confidence_min"] = confidence_min
-                
-            if confidence_max is not None:
-                query += " AND confidence <= :confidence_max"
-                params["confidence_max"] = confidence_max
-            
-            if start_date:
-                query += " AND timestamp >= :start_date"
-                params["start_date"] = start_date
-                
-            if end_date:
-                query += " AND timestamp <= :end_date"
-                params["end_date"] = end_date
-            
-            query += " ORDER BY timestamp DESC"
-            
-            result = await db.execute(text(query), params)
-            records = result.fetchall()
-            
-            if format.lower() == 'csv':
-                output = io.StringIO()
-                writer = csv.writer(output)
-                
-                # 寫入標題
-                if records:
-                    writer.writerow(records[0]._fields)
-                    
-                # 寫入數據
-                for record in records:
-                    writer.writerow(record)
-                
-                output.seek(0)
-                return StreamingResponse(
-                    io.BytesIO(output.getvalue().encode('utf-8')),
-                    media_type="text/csv",
-                    headers={"Content-Disposition": f"attachment; filename=detection_results_{datetime.now().strftime('%Y%m%d')}.csv"}
-                )
-            
-            elif format.lower() == 'json':
-                data = []
-                for record in records:
-                    record_dict = {}
-                    for i, field in enumerate(record._fields):
-                        value = record[i]
-                        if isinstance(value, datetime):
-                            value = value.isoformat()
-                        record_dict[field] = value
-                    data.append(record_dict)
-                
-                json_str = json.dumps(data, ensure_ascii=False, indent=2)
-                return StreamingResponse(
-                    io.BytesIO(json_str.encode('utf-8')),
-                    media_type="application/json",
-                    headers={"Content-Disposition": f"attachment; filename=detection_results_{datetime.now().strftime('%Y%m%d')}.json"}
-                )
-            
-            else:
-                raise HTTPException(status_code=400, detail="不支援的匯出格式")
-                
+        export_request = ExportRequest(
+            source=table,
+            format=format.lower(),
+            gzip=gzip,
+            task_id=task_id,
+            start_time=parse_export_time(start_date, "start_date"),
+            end_time=parse_export_time(end_date, "end_date", end=True),
+            object_type=object_type,
+            confidence_min=confidence_min,
+            confidence_max=confidence_max,
+            ids=[int(item.strip()) for item in ids.split(",") if item.strip()] if ids else None,
+        )
+        export_request.validate()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        export_service = get_export_service()
+        if background or (background is None and await export_service.should_run_in_background(export_request)):
+            job = await export_service.start_job(export_request)
+            return JSONResponse(status_code=202, content=job)
+
+        return StreamingResponse(
+            export_request.stream(),
+            media_type=export_request.media_type,
+            headers={"Content-Disposition": f"attachment; filename={export_request.filename()}"},
+        )
     except Exception as e:
         api_logger.error(f"匯出數據失敗: {e}")
         raise HTTPException(status_code=500, detail=f"匯出數據失敗: {str(e)}")
 
+
+@router.get("/exports")
+async def list_export_jobs():
+    """背景匯出工作列表"""
+    return get_export_service().list_jobs()
+
+
+@router.get("/exports/{job_id}")
+async def get_export_job(job_id: str):
+    """背景匯出工作進度"""
+    job = get_export_service().get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="匯出工作不存在")
+    return job
+
+
+@router.get("/exports/{job_id}/download")
+async def download_export(job_id: str):
+    """下載已完成的背景匯出檔"""
+    export_service = get_export_service()
+    job = export_service.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="匯出工作不存在")
+    path = export_service.get_file(job_id)
+    if path is None:
+        raise HTTPException(status_code=409, detail=f"匯出尚未完成（{job['status']}）")
+    return FileResponse(path, media_type=job["media_type"], filename=job["filename"])
+
+
+@router.delete("/exports/{job_id}")
+async def delete_export_job(job_id: str):
+    """取消背景匯出或刪除匯出檔"""
+    if not get_export_service().cancel_job(job_id):
+        raise HTTPException(status_code=404, detail="匯出工作不存在")
+    return {"job_id": job_id, "deleted": True}
+
 @router.delete("/detection-results/{detection_id}")
 async def delete_detection_result(detection_id: int):
     """刪除檢測結果"""
@@ -4697,6 +4893,8 @@ async def run_realtime_detection(
                         task.end_time = datetime.utcnow()
                         
                     await db.commit()
+                    get_task_status_cache().set(task_id, status)
+                    notify_task_changed(task_id)
                     api_logger.info(f"任務 {task_id} 狀態更新為: {status}")
         except Exception as e:
             api_logger.error(f"更新任務狀態失敗: {e}")
@@ -4890,6 +5088,8 @@ async def stop_live_person_camera(task_id: int, db: AsyncSession = Depends(get_d
             .values(status="stopped", end_time=datetime.utcnow())
         )
         await db.commit()
+        get_task_status_cache().set(task_id, "stopped")
+        notify_task_changed(task_id)
 
         return {
             "task_id": task_id,
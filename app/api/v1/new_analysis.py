@@ -4,6 +4,7 @@ from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, UploadFi
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional, Dict, Any
 from datetime import datetime
+import asyncio
 import json
 import os
 import shutil
@@ -14,7 +15,8 @@ from app.services.enhanced_video_analysis_service import EnhancedVideoAnalysisSe
 from app.services.task_processor import get_task_processor
 from app.models.database import AnalysisTask, DetectionResult, DataSource, SystemConfig
 from app.core.logger import main_logger as logger
-from app.utils.media_info import probe_resolution
+from app.utils.media_info import probe_resolution, probe_video
+from app.services.upload_service import UploadError, get_upload_service
 
 router = APIRouter()
 db_service = DatabaseService()
@@ -277,6 +279,7 @@ async def start_video_analysis(
     file: Optional[UploadFile] = File(None),
     source_id: Optional[int] = Form(None),
     file_path: Optional[str] = Form(None),
+    upload_id: Optional[str] = Form(None),  # 已完成的分段上傳（/data-sources/uploads）
     task_name: str = Form("影片分析任務"),
     model_id: str = Form("yolo11n"),  # 可能是內建名稱或資料庫數字ID (字串型態)
     confidence_threshold: float = Form(0.5),
@@ -284,12 +287,23 @@ async def start_video_analysis(
 ):
     """上傳影片並開始分析"""
     try:
-        # 驗證至少提供檔案或檔案路徑其中一個
-        if not file and not file_path:
+        # 驗證至少提供檔案、檔案路徑或分段上傳其中一個
+        if not file and not file_path and not upload_id:
             raise HTTPException(status_code=400, detail="必須提供檔案或檔案路徑")
         
         actual_file_path = None
         
+        # 分段上傳完成後改用其檔案與資料來源
+        if upload_id and not file_path:
+            try:
+                upload = get_upload_service().status(upload_id)
+            except UploadError as exc:
+                raise HTTPException(status_code=exc.status_code, detail=str(exc))
+            if upload["status"] != "completed":
+                raise HTTPException(status_code=409, detail=f"分段上傳尚未完成（{upload['status']}）")
+            file_path = upload["result"]["file_path"]
+            source_id = source_id or upload["result"]["source_id"]
+        
         # 如果提供了檔案路徑，使用伺服器上的檔案
         if file_path:
             logger.info(f"🎬 使用伺服器檔案: {file_path}")
@@ -316,8 +330,9 @@ async def start_video_analysis(
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             actual_file_path = f"{upload_dir}/{timestamp}_{file.filename}"
             
+            # 複製在工作執行緒進行，避免大檔案阻塞事件迴圈
             with open(actual_file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
+                await asyncio.to_thread(shutil.copyfileobj, file.file, buffer, 1024 * 1024)
             
             original_filename = file.filename
         
@@ -364,19 +379,12 @@ async def start_video_analysis(
 
         # 量測來源解析度和FPS並寫入專用欄位（若量測失敗則略過，不阻斷流程）
         try:
-            import cv2
-            cap = cv2.VideoCapture(actual_file_path)
-            if cap.isOpened():
-                width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-                height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-                fps = cap.get(cv2.CAP_PROP_FPS)
-                if fps <= 0:  # 如果無法獲取 FPS
-                    fps = 25.0  # 影片預設值
-                cap.release()
-                
-                task_data['source_width'] = width
-                task_data['source_height'] = height
-                task_data['source_fps'] = fps
+            video_info = await asyncio.to_thread(probe_video, actual_file_path)
+            if video_info is not None:
+                task_data['source_width'] = video_info['width']
+                task_data['source_height'] = video_info['height']
+                # 如果無法獲取 FPS 使用影片預設值
+                task_data['source_fps'] = video_info['fps'] if video_info['fps'] > 0 else 25.0
             else:
                 # 無法開啟影片，使用預設值
                 task_data['source_width'] = 1920
@@ -220,6 +220,75 @@ async def get_all_detection_sessions():
         raise HTTPException(status_code=500, detail=f"獲取檢測會話失敗: {str(e)}")
 
 
+@router.get("/sessions/{task_id}/profile")
+async def get_detection_session_profile(task_id: str):
+    """獲取實時檢測會話的分段耗時（滾動百分位數、超出幀預算與掉幀數）"""
+    try:
+        realtime_service = get_realtime_detection_service()
+        profile = realtime_service.get_session_profile(task_id)
+
+        if profile is None:
+            raise HTTPException(status_code=404, detail="檢測任務不存在")
+
+        return {
+            "status": "success",
+            "data": profile
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        api_logger.error(f"獲取會話剖析失敗: {e}")
+        raise HTTPException(status_code=500, detail=f"獲取會話剖析失敗: {str(e)}")
+
+
+@router.get("/inference/batch-stats")
+async def get_batch_inference_stats():
+    """獲取多攝影機批次推論的佔用率與排隊等待統計"""
+    try:
+        realtime_service = get_realtime_detection_service()
+        return {
+            "status": "success",
+            "data": realtime_service.yolo_service.get_batch_stats()
+        }
+
+    except Exception as e:
+        api_logger.error(f"獲取批次推論統計失敗: {e}")
+        raise HTTPException(status_code=500, detail=f"獲取批次推論統計失敗: {str(e)}")
+
+
+@router.get("/inference/model-registry")
+async def get_model_registry_stats():
+    """獲取共享模型註冊表狀態（已載入模型、參考計數、閒置淘汰）"""
+    try:
+        from app.services.model_registry import get_model_registry
+
+        return {
+            "status": "success",
+            "data": get_model_registry().get_stats()
+        }
+
+    except Exception as e:
+        api_logger.error(f"獲取模型註冊表狀態失敗: {e}")
+        raise HTTPException(status_code=500, detail=f"獲取模型註冊表狀態失敗: {str(e)}")
+
+
+@router.get("/inference/housekeeping")
+async def get_memory_housekeeping_stats():
+    """獲取記憶體整理策略、觸發原因統計與整理耗時"""
+    try:
+        from app.services.memory_housekeeping import get_memory_housekeeper
+
+        return {
+            "status": "success",
+            "data": get_memory_housekeeper().get_stats()
+        }
+
+    except Exception as e:
+        api_logger.error(f"獲取記憶體整理統計失敗: {e}")
+        raise HTTPException(status_code=500, detail=f"獲取記憶體整理統計失敗: {str(e)}")
+
+
 @router.get("/detection-results/{task_id}")
 async def get_realtime_detection_results(
     task_id: str,
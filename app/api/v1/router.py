@@ -4,7 +4,7 @@ YOLOv11 數位雙生分析系統 - API 路由器
 
 from fastapi import APIRouter
 
-from app.api.v1.endpoints import detection, health
+from app.api.v1.endpoints import detection, health, metrics
 # 使用簡化版 analysis
 from app.api.v1.endpoints import analysis_simple
 from app.api.v1 import frontend
@@ -25,6 +25,12 @@ api_router.include_router(
     tags=["健康檢查"]
 )
 
+# 效能量測（Prometheus）
+api_router.include_router(
+    metrics.router,
+    tags=["效能量測"]
+)
+
 # 包含影片分析端點 (簡化版)
 api_router.include_router(
     analysis_simple.router
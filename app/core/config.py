@@ -40,6 +40,127 @@ class Settings:
         self.max_detections = int(os.getenv("MAX_DETECTIONS", "100"))
         self.MAX_DETECTIONS = self.max_detections
 
+        # 批次推論排程（多攝影機共用一次 forward）
+        self.batch_inference_enabled = (
+            os.getenv("BATCH_INFERENCE_ENABLED", "true").lower() in ("true", "1", "yes")
+        )
+        self.batch_max_size = int(os.getenv("BATCH_MAX_SIZE", "8"))
+        self.batch_max_wait_ms = float(os.getenv("BATCH_MAX_WAIT_MS", "10"))
+        self.batch_result_timeout = float(os.getenv("BATCH_RESULT_TIMEOUT", "5.0"))
+
+        # 推論後端：auto / ultralytics / onnxruntime / openvino
+        self.inference_backend = os.getenv("INFERENCE_BACKEND", "auto").lower()
+        self.onnx_imgsz = int(os.getenv("ONNX_IMGSZ", "640"))
+        self.onnx_intra_op_threads = int(os.getenv("ONNX_INTRA_OP_THREADS", "0"))
+        self.onnx_inter_op_threads = int(os.getenv("ONNX_INTER_OP_THREADS", "0"))
+        self.onnx_prefer_exported = (
+            os.getenv("ONNX_PREFER_EXPORTED", "false").lower() in ("true", "1", "yes")
+        )
+
+        # 模型共享註冊表
+        self.model_registry_max_idle = int(os.getenv("MODEL_REGISTRY_MAX_IDLE", "2"))
+        self.model_registry_pool_size = int(os.getenv("MODEL_REGISTRY_POOL_SIZE", "1"))
+
+        # 實時管線分段計時（每會話環形緩衝區長度、無法取得攝影機 FPS 時的預設幀率）
+        self.realtime_profile_window = int(os.getenv("REALTIME_PROFILE_WINDOW", "300"))
+        self.realtime_profile_default_fps = float(os.getenv("REALTIME_PROFILE_DEFAULT_FPS", "30"))
+
+        # 任務狀態快取 TTL（秒，0 = 只在端點更新時失效）
+        self.task_status_cache_ttl = float(os.getenv("TASK_STATUS_CACHE_TTL", "30"))
+
+        # 攝影機流影格緩衝池（每個攝影機流預先保留的緩衝區數量）
+        self.frame_pool_size = int(os.getenv("FRAME_POOL_SIZE", "6"))
+
+        # 攝影機流消費者信箱（drop_oldest / block 策略的預設容量、block 策略最長等待秒數）
+        self.stream_consumer_queue_size = int(os.getenv("STREAM_CONSUMER_QUEUE_SIZE", "2"))
+        self.stream_consumer_block_timeout = float(os.getenv("STREAM_CONSUMER_BLOCK_TIMEOUT", "1.0"))
+
+        # 記憶體整理策略（背景依 RSS / CUDA 保留量 / 影格數觸發，上限 0 表示不檢查）
+        self.housekeeping_enabled = (
+            os.getenv("HOUSEKEEPING_ENABLED", "true").lower() in ("true", "1", "yes")
+        )
+        self.housekeeping_check_interval = float(os.getenv("HOUSEKEEPING_CHECK_INTERVAL", "5"))
+        self.housekeeping_min_interval = float(os.getenv("HOUSEKEEPING_MIN_INTERVAL", "30"))
+        self.housekeeping_frame_interval = int(os.getenv("HOUSEKEEPING_FRAME_INTERVAL", "3000"))
+        self.housekeeping_rss_limit_mb = float(os.getenv("HOUSEKEEPING_RSS_LIMIT_MB", "4096"))
+        self.housekeeping_cuda_reserved_limit_mb = float(
+            os.getenv("HOUSEKEEPING_CUDA_RESERVED_LIMIT_MB", "1024")
+        )
+        self.housekeeping_gc_generation = int(os.getenv("HOUSEKEEPING_GC_GENERATION", "2"))
+
+        # 延後批次寫入（COPY），資料庫無法寫入時的磁碟日誌目錄（空白 = data/write_behind）
+        self.write_behind_batch_rows = int(os.getenv("WRITE_BEHIND_BATCH_ROWS", "2000"))
+        self.write_behind_flush_interval = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "1.0"))
+        self.write_behind_retry_interval = float(os.getenv("WRITE_BEHIND_RETRY_INTERVAL", "5.0"))
+        self.write_behind_journal_dir = os.getenv("WRITE_BEHIND_JOURNAL_DIR", "")
+
+        # 偵測明細表時間分區（daily / weekly）與保留期（0 天 = 永久保留；drop / detach）
+        self.partition_enabled = (
+            os.getenv("PARTITION_ENABLED", "true").lower() in ("true", "1", "yes")
+        )
+        self.partition_interval = os.getenv("PARTITION_INTERVAL", "daily").lower()
+        self.partition_premake = int(os.getenv("PARTITION_PREMAKE", "7"))
+        self.partition_retention_days = int(os.getenv("PARTITION_RETENTION_DAYS", "0"))
+        self.partition_retention_mode = os.getenv("PARTITION_RETENTION_MODE", "drop").lower()
+        self.partition_maintenance_interval = float(os.getenv("PARTITION_MAINTENANCE_INTERVAL", "3600"))
+        self.partition_auto_migrate = (
+            os.getenv("PARTITION_AUTO_MIGRATE", "false").lower() in ("true", "1", "yes")
+        )
+
+        # 分析彙總表（每分鐘 / 每小時）：彙總週期、遲到資料容許秒數、每段回補時數、分鐘列保留天數（0 = 永久）
+        self.rollup_enabled = (
+            os.getenv("ROLLUP_ENABLED", "true").lower() in ("true", "1", "yes")
+        )
+        self.rollup_interval = float(os.getenv("ROLLUP_INTERVAL", "30"))
+        self.rollup_lateness = float(os.getenv("ROLLUP_LATENESS", "120"))
+        self.rollup_backfill_hours = int(os.getenv("ROLLUP_BACKFILL_HOURS", "24"))
+        self.rollup_minute_retention_days = int(os.getenv("ROLLUP_MINUTE_RETENTION_DAYS", "7"))
+
+        # 熱點圖：每邊網格數、預設高斯平滑標準差（網格單位）、任務未記錄來源解析度時的假設尺寸
+        self.heatmap_grid_size = int(os.getenv("HEATMAP_GRID_SIZE", "64"))
+        self.heatmap_gaussian_sigma = float(os.getenv("HEATMAP_GAUSSIAN_SIGMA", "2.0"))
+        self.heatmap_default_frame_width = int(os.getenv("HEATMAP_DEFAULT_FRAME_WIDTH", "1920"))
+        self.heatmap_default_frame_height = int(os.getenv("HEATMAP_DEFAULT_FRAME_HEIGHT", "1080"))
+
+        # 分析查詢快取：預設存活秒數（0 = 不快取，只合併同時的相同查詢）、最多保留筆數（LRU）
+        self.analytics_cache_ttl = float(os.getenv("ANALYTICS_CACHE_TTL", "60"))
+        self.analytics_cache_max_entries = int(os.getenv("ANALYTICS_CACHE_MAX_ENTRIES", "256"))
+
+        # 資料匯出：輸出目錄（相對路徑以專案根目錄為準）、每批列數、估計列數超過此值改為背景工作（0 = 一律直接串流）、背景匯出檔保留時數
+        self.export_dir = os.getenv("EXPORT_DIR", "exports")
+        self.export_batch_size = int(os.getenv("EXPORT_BATCH_SIZE", "5000"))
+        self.export_background_rows = int(os.getenv("EXPORT_BACKGROUND_ROWS", "200000"))
+        self.export_retention_hours = float(os.getenv("EXPORT_RETENTION_HOURS", "24"))
+
+        # 分段影片上傳：暫存目錄（相對路徑以專案根目錄為準）、預設分段大小、單檔上限（MB）、未完成上傳保留時數
+        self.upload_temp_dir = os.getenv("UPLOAD_TEMP_DIR", "uploads/.partial")
+        self.upload_part_size_mb = int(os.getenv("UPLOAD_PART_SIZE_MB", "8"))
+        self.upload_max_size_mb = int(os.getenv("UPLOAD_MAX_SIZE_MB", "20480"))
+        self.upload_session_ttl_hours = float(os.getenv("UPLOAD_SESSION_TTL_HOURS", "48"))
+
+        # WebSocket 廣播：每個連線的送出佇列上限、佇列滿時的策略（drop_oldest / coalesce / disconnect）、單則送出逾時秒數（0 = 不限）
+        self.ws_send_queue_size = int(os.getenv("WS_SEND_QUEUE_SIZE", "100"))
+        self.ws_slow_consumer_policy = os.getenv("WS_SLOW_CONSUMER_POLICY", "drop_oldest").strip().lower()
+        self.ws_send_timeout = float(os.getenv("WS_SEND_TIMEOUT", "5"))
+
+        # 非同步佇列（AsyncQueueManager）：每個佇列的容量、佇列滿時的策略（block / drop_oldest / spill）、
+        # block 最長等待秒數、spill 目錄（空白 = data/queue_spill）、每批最多訊息數、湊批最長等待毫秒、
+        # 資料庫批次暫時性失敗的重試次數與初始退避秒數（每次加倍，重試用盡後寫回 spill 目錄待重放）
+        self.async_queue_max_size = int(os.getenv("ASYNC_QUEUE_MAX_SIZE", "1000"))
+        self.async_queue_websocket_policy = os.getenv("ASYNC_QUEUE_WEBSOCKET_POLICY", "drop_oldest").strip().lower()
+        self.async_queue_database_policy = os.getenv("ASYNC_QUEUE_DATABASE_POLICY", "spill").strip().lower()
+        self.async_queue_block_timeout = float(os.getenv("ASYNC_QUEUE_BLOCK_TIMEOUT", "0.5"))
+        self.async_queue_spill_dir = os.getenv("ASYNC_QUEUE_SPILL_DIR", "")
+        self.async_queue_batch_size = int(os.getenv("ASYNC_QUEUE_BATCH_SIZE", "200"))
+        self.async_queue_batch_wait_ms = float(os.getenv("ASYNC_QUEUE_BATCH_WAIT_MS", "50"))
+        self.async_queue_save_retries = int(os.getenv("ASYNC_QUEUE_SAVE_RETRIES", "3"))
+        self.async_queue_save_backoff = float(os.getenv("ASYNC_QUEUE_SAVE_BACKOFF", "0.5"))
+
+        # 啟動時於背景補建 app/models/indexes.py 宣告的索引（一般資料表使用 CONCURRENTLY）
+        self.index_auto_create = (
+            os.getenv("INDEX_AUTO_CREATE", "true").lower() in ("true", "1", "yes")
+        )
+
         # 跌倒偵測 / 通知設定
         default_fall_model = (
             Path(__file__).resolve().parents[2]
@@ -55,6 +176,8 @@ class Settings:
             os.getenv("FALL_CONFIDENCE_THRESHOLD", "0.5")
         )
         self.FALL_CONFIDENCE_THRESHOLD = self.fall_confidence_default
+        # 跌倒偵測需要的最高幀率（0 = 跟隨攝影機），攝影機流可據此少解碼影格
+        self.fall_detection_max_fps = float(os.getenv("FALL_DETECTION_MAX_FPS", "10"))
         self.smtp_server = os.getenv("SMTP_SERVER", "smtp.gmail.com")
         self.smtp_port = int(os.getenv("SMTP_PORT", "465"))
         self.smtp_username = os.getenv("SENDER_EMAIL")
@@ -65,14 +65,6 @@ main_logger = StructuredLogger("yolo_system")
 performance_logger = get_logger("yolo_system.performance")
 
 def log_performance(func_name):
-    """性能日誌裝飾器"""
-    def decorator(func):
-        def wrapper(*args, **kwargs):
-            import time
-            start_time = time.time()
-            result = func(*args, **kwargs)
-            end_time = time.time()
-            performance_logger.info(f"{func_name} executed in {end_time - start_time:.3f}s")
-            return result
-        return wrapper
-    return decorator
+    """性能日誌裝飾器（相容舊介面，支援 async；新程式請使用 app.core.metrics.instrument）"""
+    from app.core.metrics import instrument
+    return instrument("call", func_name, log=True)
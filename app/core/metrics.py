@@ -0,0 +1,281 @@
+"""
+效能量測（行程內直方圖）
+
+instrument() 裝飾器與 timed() 上下文管理器同時支援同步與 async 呼叫，
+依階段（stage）記錄耗時到行程內直方圖，提供 p50/p95/p99 與次數，
+並可輸出 Prometheus 文字格式（/api/v1/metrics）。
+"""
+
+from __future__ import annotations
+
+import functools
+import inspect
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from app.core.logger import performance_logger
+
+# 管線階段
+STAGES = (
+    "decode",
+    "preprocess",
+    "inference",
+    "postprocess",
+    "tracking",
+    "annotate",
+    "encode",
+    "db_write",
+    "push",
+)
+
+# Prometheus 直方圖桶（秒）
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """固定桶直方圖 + 最近樣本（計算百分位數）"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, window: int = 2048):
+        self.buckets = buckets
+        self._bucket_counts = [0] * len(buckets)
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._count = 0
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self._count += 1
+            self._sum += value
+            self._samples.append(value)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self._bucket_counts[index] += 1
+                    break
+
+    @staticmethod
+    def _percentile(ordered: List[float], percentile: float) -> float:
+        if not ordered:
+            return 0.0
+        index = min(len(ordered) - 1, int(round(percentile / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            ordered = sorted(self._samples)
+            count, total = self._count, self._sum
+            buckets = list(self._bucket_counts)
+        cumulative, running = [], 0
+        for bound, bucket_count in zip(self.buckets, buckets):
+            running += bucket_count
+            cumulative.append((bound, running))
+        return {
+            "count": count,
+            "sum": total,
+            "p50": self._percentile(ordered, 50),
+            "p95": self._percentile(ordered, 95),
+            "p99": self._percentile(ordered, 99),
+            "max": ordered[-1] if ordered else 0.0,
+            "buckets": cumulative,
+        }
+
+
+class MetricsRegistry:
+    """行程層級的量測註冊表（單例）"""
+
+    _instance: Optional["MetricsRegistry"] = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+        self._histograms: Dict[LabelKey, Histogram] = {}
+        self._counters: Dict[Tuple[str, LabelKey], float] = {}
+        self._lock = threading.Lock()
+        self._initialized = True
+
+    @staticmethod
+    def _labels(stage: str, name: Optional[str], labels: Dict[str, Any]) -> LabelKey:
+        merged = {"stage": stage, "name": name or stage}
+        merged.update({k: str(v) for k, v in labels.items()})
+        return tuple(sorted(merged.items()))
+
+    def observe(self, stage: str, seconds: float, name: Optional[str] = None, **labels: Any) -> None:
+        key = self._labels(stage, name, labels)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram())
+        histogram.observe(seconds)
+
+    def inc(self, metric: str, value: float = 1.0, **labels: Any) -> None:
+        key = (metric, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            histograms = list(self._histograms.items())
+            counters = list(self._counters.items())
+        stages = []
+        for key, histogram in histograms:
+            data = histogram.snapshot()
+            data.pop("buckets")
+            stages.append({**dict(key), **data})
+        stages.sort(key=lambda item: (item["stage"], item["name"]))
+        return {
+            "stages": stages,
+            "counters": [
+                {"metric": metric, **dict(labels), "value": value}
+                for (metric, labels), value in counters
+            ],
+        }
+
+    @staticmethod
+    def _format_labels(labels: LabelKey, extra: Optional[Dict[str, str]] = None) -> str:
+        pairs = list(labels) + list((extra or {}).items())
+        escaped = []
+        for key, value in pairs:
+            value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            escaped.append(f'{key}="{value}"')
+        return "{" + ",".join(escaped) + "}"
+
+    def render_prometheus(self) -> str:
+        """輸出 Prometheus text exposition format 0.0.4"""
+        with self._lock:
+            histograms = list(self._histograms.items())
+            counters = list(self._counters.items())
+
+        lines = [
+            "# HELP yolo_stage_duration_seconds 各處理階段耗時",
+            "# TYPE yolo_stage_duration_seconds histogram",
+        ]
+        quantile_lines = []
+        for labels, histogram in histograms:
+            data = histogram.snapshot()
+            for bound, cumulative in data["buckets"]:
+                lines.append(
+                    f"yolo_stage_duration_seconds_bucket"
+                    f"{self._format_labels(labels, {'le': repr(bound)})} {cumulative}"
+                )
+            lines.append(
+                f"yolo_stage_duration_seconds_bucket"
+                f"{self._format_labels(labels, {'le': '+Inf'})} {data['count']}"
+            )
+            lines.append(f"yolo_stage_duration_seconds_sum{self._format_labels(labels)} {data['sum']}")
+            lines.append(f"yolo_stage_duration_seconds_count{self._format_labels(labels)} {data['count']}")
+            for quantile in ("p50", "p95", "p99"):
+                q = f"0.{quantile[1:]}"
+                quantile_lines.append(
+                    f"yolo_stage_duration_quantile_seconds"
+                    f"{self._format_labels(labels, {'quantile': q})} {data[quantile]}"
+                )
+
+        if quantile_lines:
+            lines.append("# HELP yolo_stage_duration_quantile_seconds 最近樣本的耗時百分位數")
+            lines.append("# TYPE yolo_stage_duration_quantile_seconds gauge")
+            lines.extend(quantile_lines)
+
+        seen_counters = set()
+        for (metric, labels), value in sorted(counters):
+            if metric not in seen_counters:
+                seen_counters.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            label_text = self._format_labels(labels) if labels else ""
+            lines.append(f"{metric}{label_text} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    """獲取量測註冊表實例"""
+    return MetricsRegistry()
+
+
+class timed:
+    """
+    量測區塊耗時，可用於 with 與 async with
+
+        with timed("decode"):
+            image = cv2.imdecode(...)
+    """
+
+    def __init__(self, stage: str, name: Optional[str] = None, log: bool = False, **labels: Any):
+        self.stage = stage
+        self.name = name
+        self.log = log
+        self.labels = labels
+        self.elapsed = 0.0
+        self._start = 0.0
+
+    def __enter__(self) -> "timed":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.elapsed = time.perf_counter() - self._start
+        get_metrics_registry().observe(self.stage, self.elapsed, self.name, **self.labels)
+        if self.log:
+            performance_logger.info(f"{self.name or self.stage} executed in {self.elapsed:.3f}s")
+
+    async def __aenter__(self) -> "timed":
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self.__exit__(exc_type, exc, tb)
+
+
+def instrument(stage: str, name: Optional[str] = None, log: bool = False,
+               **labels: Any) -> Callable[[Callable], Callable]:
+    """
+    量測函式耗時的裝飾器；async 函式會量測到 await 完成為止，而不是只量到建立 coroutine
+    """
+
+    def decorator(func: Callable) -> Callable:
+        metric_name = name or func.__qualname__
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with timed(stage, metric_name, log=log, **labels):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(stage, metric_name, log=log, **labels):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+__all__ = [
+    "STAGES",
+    "Histogram",
+    "MetricsRegistry",
+    "get_metrics_registry",
+    "timed",
+    "instrument",
+]
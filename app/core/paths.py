@@ -49,7 +49,7 @@ def resolve_model_path(model_id_or_path: Optional[str]) -> Optional[str]:
     規則：
     - None -> None
     - 實際存在的檔案 (絕對/相對) -> 轉成絕對路徑
-    - 僅檔名 (含 .pt) -> 於 models 目錄尋找
+    - 僅檔名 (含 .pt / .onnx) -> 於 models 目錄尋找
     - 無副檔名 -> 嘗試補 .pt
     - 找不到 -> 回傳原字串 (允許 Ultralytics 自動下載)
     """
@@ -63,8 +63,8 @@ def resolve_model_path(model_id_or_path: Optional[str]) -> Optional[str]:
 
     models_dir = get_models_dir()
 
-    # 含副檔名 .pt
-    if raw.suffix == ".pt":
+    # 含副檔名 .pt / .onnx
+    if raw.suffix in (".pt", ".onnx"):
         candidate = models_dir / raw.name
         if candidate.exists():
             return str(candidate.resolve())
@@ -38,7 +38,6 @@ import cv2
 import numpy as np
 import supervision as sv
 
-from app.core.database import SyncSessionLocal
 from app.core.logger import detection_logger
 from app.models.database import (
     DetectionResult,
@@ -53,6 +52,7 @@ from app.services.camera_stream_manager import (
     camera_stream_manager,
 )
 from app.services.email_notification_service import send_alert_rule_email
+from app.services.write_behind import WriteBehindWriter
 from app.services.notification_settings_service import get_email_settings
 
 
@@ -997,13 +997,11 @@ class AlertRuleEvaluator:
 
 
 class DatabaseWriter:
-    """負責將偵測資料寫入資料庫。"""
+    """負責將偵測資料寫入資料庫（延後批次寫入，不阻塞推論執行緒）。"""
 
     def __init__(self, task_id: int) -> None:
         self._task_id = task_id
-        self._session = None
-        self._lock = threading.Lock()
-        self._disabled = False
+        self._writer = WriteBehindWriter(f"gui_task_{task_id}")
         self._last_person_count = 0
         self._confidence_sum = 0.0
         self._confidence_count = 0
@@ -1012,23 +1010,11 @@ class DatabaseWriter:
         self._speed_count = 0
         self._speed_max = 0.0
 
-    def _get_session(self):
-        if self._disabled:
-            return None
-        if self._session is None:
-            try:
-                self._session = SyncSessionLocal()
-            except Exception as exc:  # noqa: BLE001
-                detection_logger.error(f"建立資料庫連線失敗: {exc}")
-                self._disabled = True
-                return None
-        return self._session
-
     def close(self) -> None:
-        with self._lock:
-            if self._session is not None:
-                self._session.close()
-                self._session = None
+        self._writer.close()
+
+    def get_stats(self) -> dict:
+        return self._writer.get_stats()
 
     def persist_frame(
         self,
@@ -1041,146 +1027,143 @@ class DatabaseWriter:
         speed_events: list[dict],
         stats_payload: dict,
     ) -> None:
-        session = self._get_session()
-        if session is None:
-            return
-
-        try:
-            if detections:
-                session.add_all(
-                    [
-                            DetectionResult(
-                                task_id=self._task_id,
-                                tracker_id=row.get("tracker_id"),
-                                object_speed=row.get("object_speed"),
-                                zones=row.get("zones"),
-                                frame_number=frame_number,
-                                frame_timestamp=frame_timestamp,
-                                object_type=row.get("object_type"),
-                                confidence=row.get("confidence"),
-                                bbox_x1=row["bbox"][0],
-                                bbox_y1=row["bbox"][1],
-                                bbox_x2=row["bbox"][2],
-                                bbox_y2=row["bbox"][3],
-                                center_x=row["center"][0],
-                                center_y=row["center"][1],
-                                thumbnail_path=row.get("thumbnail_path"),
-                            )
-                        for row in detections
-                    ]
-                )
-                frame_confidences = [
-                    row.get("confidence")
+        if detections:
+            self._writer.add_rows(
+                DetectionResult,
+                [
+                    {
+                        "task_id": self._task_id,
+                        "tracker_id": row.get("tracker_id"),
+                        "object_speed": row.get("object_speed"),
+                        "zones": row.get("zones"),
+                        "frame_number": frame_number,
+                        "frame_timestamp": frame_timestamp,
+                        "object_type": row.get("object_type"),
+                        "confidence": row.get("confidence"),
+                        "bbox_x1": row["bbox"][0],
+                        "bbox_y1": row["bbox"][1],
+                        "bbox_x2": row["bbox"][2],
+                        "bbox_y2": row["bbox"][3],
+                        "center_x": row["center"][0],
+                        "center_y": row["center"][1],
+                        "thumbnail_path": row.get("thumbnail_path"),
+                    }
                     for row in detections
-                    if row.get("confidence") is not None
-                ]
-                if frame_confidences:
-                    self._confidence_sum += sum(frame_confidences)
-                    self._confidence_count += len(frame_confidences)
-                    self._last_avg_confidence = (
-                        self._confidence_sum / self._confidence_count
-                    )
-
-            if line_events:
-                session.add_all(
-                    [
-                        LineCrossingEvent(
-                            task_id=self._task_id,
-                            tracker_id=event.get("tracker_id"),
-                            line_id=event.get("line_id"),
-                            direction=event.get("direction"),
-                            frame_number=event.get("frame_number"),
-                            frame_timestamp=event.get("frame_timestamp"),
-                            extra=event.get("extra"),
-                        )
-                        for event in line_events
-                    ]
+                ],
+            )
+            frame_confidences = [
+                row.get("confidence")
+                for row in detections
+                if row.get("confidence") is not None
+            ]
+            if frame_confidences:
+                self._confidence_sum += sum(frame_confidences)
+                self._confidence_count += len(frame_confidences)
+                self._last_avg_confidence = (
+                    self._confidence_sum / self._confidence_count
                 )
 
-            if zone_events:
-                session.add_all(
-                    [
-                        ZoneDwellEvent(
-                            task_id=self._task_id,
-                            tracker_id=event.get("tracker_id"),
-                            zone_id=event.get("zone_id"),
-                            entered_at=event.get("entered_at"),
-                            exited_at=event.get("exited_at"),
-                            dwell_seconds=event.get("dwell_seconds"),
-                            frame_number=event.get("frame_number"),
-                            event_timestamp=event.get("event_timestamp"),
-                            extra=event.get("extra"),
-                        )
-                        for event in zone_events
-                    ]
-                )
+        if line_events:
+            self._writer.add_rows(
+                LineCrossingEvent,
+                [
+                    {
+                        "task_id": self._task_id,
+                        "tracker_id": event.get("tracker_id"),
+                        "line_id": event.get("line_id"),
+                        "direction": event.get("direction"),
+                        "frame_number": event.get("frame_number"),
+                        "frame_timestamp": event.get("frame_timestamp"),
+                        "extra": event.get("extra"),
+                    }
+                    for event in line_events
+                ],
+            )
 
-            if speed_events:
-                session.add_all(
-                    [
-                        SpeedEvent(
-                            task_id=self._task_id,
-                            tracker_id=event.get("tracker_id"),
-                            speed_avg=event.get("speed_avg"),
-                            speed_max=event.get("speed_max"),
-                            threshold=event.get("threshold"),
-                            frame_number=event.get("frame_number"),
-                            event_timestamp=event.get("event_timestamp"),
-                            extra=event.get("extra"),
-                        )
-                        for event in speed_events
-                    ]
-                )
-                speed_values = [
-                    float(event.get("speed_avg"))
-                    for event in speed_events
-                    if event.get("speed_avg") is not None
-                ]
-                if speed_values:
-                    self._speed_sum += sum(speed_values)
-                    self._speed_count += len(speed_values)
-                    self._speed_max = max(self._speed_max, max(speed_values))
-
-            stats = session.get(TaskStatistics, self._task_id)
-            if not stats:
-                stats = TaskStatistics(task_id=self._task_id)
-                session.add(stats)
-            stats.updated_at = frame_timestamp
-            stats.fps = stats_payload.get("fps")
-            current_person_count = int(stats_payload.get("person_count") or 0)
-            if current_person_count > 0 or self._last_person_count == 0:
-                self._last_person_count = current_person_count
-            stats.person_count = (
-                self._last_person_count if self._last_person_count else current_person_count
+        if zone_events:
+            self._writer.add_rows(
+                ZoneDwellEvent,
+                [
+                    {
+                        "task_id": self._task_id,
+                        "tracker_id": event.get("tracker_id"),
+                        "zone_id": event.get("zone_id"),
+                        "entered_at": event.get("entered_at"),
+                        "exited_at": event.get("exited_at"),
+                        "dwell_seconds": event.get("dwell_seconds"),
+                        "frame_number": event.get("frame_number"),
+                        "event_timestamp": event.get("event_timestamp"),
+                        "extra": event.get("extra"),
+                    }
+                    for event in zone_events
+                ],
             )
-            aggregated_avg_confidence = (
-                self._last_avg_confidence
-                if self._confidence_count
-                else stats_payload.get("avg_confidence")
+
+        if speed_events:
+            self._writer.add_rows(
+                SpeedEvent,
+                [
+                    {
+                        "task_id": self._task_id,
+                        "tracker_id": event.get("tracker_id"),
+                        "speed_avg": event.get("speed_avg"),
+                        "speed_max": event.get("speed_max"),
+                        "threshold": event.get("threshold"),
+                        "frame_number": event.get("frame_number"),
+                        "event_timestamp": event.get("event_timestamp"),
+                        "extra": event.get("extra"),
+                    }
+                    for event in speed_events
+                ],
             )
-            stats.avg_confidence = aggregated_avg_confidence or 0.0
-            stats.line_stats = stats_payload.get("line_stats")
-            stats.zone_stats = stats_payload.get("zone_stats")
-            speed_stats_payload = dict(stats_payload.get("speed_stats") or {})
-            unit = speed_stats_payload.get("unit") or "m/s"
-            configured = bool(speed_stats_payload.get("configured"))
-            if configured and self._speed_count:
-                factor = 3.6 if unit.lower() == "km/h" else 1.0
-                speed_stats_payload["avg_speed"] = (
-                    self._speed_sum / self._speed_count
-                ) * factor
-                speed_stats_payload["max_speed"] = self._speed_max * factor
-            stats.speed_stats = speed_stats_payload
-            extra_payload = dict(stats_payload.get("extra") or {})
-            extra_payload["current_person_count"] = current_person_count
-            extra_payload["last_person_count"] = self._last_person_count
-            stats.extra = extra_payload
-
-            session.commit()
-        except Exception as exc:  # noqa: BLE001
-            session.rollback()
-            detection_logger.error(f"寫入即時辨識資料失敗: {exc}")
-            self._disabled = True
+            speed_values = [
+                float(event.get("speed_avg"))
+                for event in speed_events
+                if event.get("speed_avg") is not None
+            ]
+            if speed_values:
+                self._speed_sum += sum(speed_values)
+                self._speed_count += len(speed_values)
+                self._speed_max = max(self._speed_max, max(speed_values))
+
+        # TaskStatistics 在記憶體中彙總，每批寫入時只做一次 upsert
+        current_person_count = int(stats_payload.get("person_count") or 0)
+        if current_person_count > 0 or self._last_person_count == 0:
+            self._last_person_count = current_person_count
+        aggregated_avg_confidence = (
+            self._last_avg_confidence
+            if self._confidence_count
+            else stats_payload.get("avg_confidence")
+        )
+        speed_stats_payload = dict(stats_payload.get("speed_stats") or {})
+        unit = speed_stats_payload.get("unit") or "m/s"
+        configured = bool(speed_stats_payload.get("configured"))
+        if configured and self._speed_count:
+            factor = 3.6 if unit.lower() == "km/h" else 1.0
+            speed_stats_payload["avg_speed"] = (
+                self._speed_sum / self._speed_count
+            ) * factor
+            speed_stats_payload["max_speed"] = self._speed_max * factor
+        extra_payload = dict(stats_payload.get("extra") or {})
+        extra_payload["current_person_count"] = current_person_count
+        extra_payload["last_person_count"] = self._last_person_count
+
+        self._writer.upsert(
+            TaskStatistics,
+            {
+                "task_id": self._task_id,
+                "updated_at": frame_timestamp,
+                "fps": stats_payload.get("fps"),
+                "person_count": (
+                    self._last_person_count if self._last_person_count else current_person_count
+                ),
+                "avg_confidence": aggregated_avg_confidence or 0.0,
+                "line_stats": stats_payload.get("line_stats"),
+                "zone_stats": stats_payload.get("zone_stats"),
+                "speed_stats": speed_stats_payload,
+                "extra": extra_payload,
+            },
+        )
 
 def _draw_line_overlay(scene: np.ndarray, line_state: LineState) -> np.ndarray:
     color = line_state.color or sv.ColorPalette.DEFAULT.by_idx(0)
@@ -1324,10 +1307,12 @@ class DetectionWorker(QtCore.QThread):
     def _handle_shared_frame(self, frame_data: FrameData) -> None:
         if not self._shared_running.is_set() or self._shared_queue is None:
             return
+        # 回呼結束後擷取線程會釋放自己的引用，排隊期間需另外持有，避免緩衝區被池回收
+        frame_data.retain()
         try:
             self._shared_queue.put_nowait(frame_data)
         except queue.Full:
-            pass
+            frame_data.release()
 
     def _start_shared_stream(self) -> None:
         if not self._shared_camera_id or self._shared_device_index is None:
@@ -1353,7 +1338,10 @@ class DetectionWorker(QtCore.QThread):
         self._shared_consumer = None
         if self._shared_queue:
             with self._shared_queue.mutex:
+                pending = list(self._shared_queue.queue)
                 self._shared_queue.queue.clear()
+            for frame_data in pending:
+                frame_data.release()
 
     def _wait_shared_frame(self, timeout: float = 1.0) -> tuple[np.ndarray, datetime]:
         if not self._shared_queue:
@@ -1362,8 +1350,12 @@ class DetectionWorker(QtCore.QThread):
             frame_data = self._shared_queue.get(timeout=timeout)
         except queue.Empty:
             raise TimeoutError("共享攝影機無影格可用")
-        frame = frame_data.frame.copy()
-        timestamp = frame_data.timestamp or datetime.utcnow()
+        try:
+            # 繪製使用私有副本，複製完成即可把緩衝區交還給池
+            frame = frame_data.writable_frame()
+            timestamp = frame_data.timestamp or datetime.utcnow()
+        finally:
+            frame_data.release()
         return frame, timestamp
 
     def _save_detection_thumbnail(
@@ -1,5 +1,8 @@
 # 資料庫 ORM 模型 (SQLAlchemy)
 # 與 deployment/db/init.sql 保持同步
+# detection_results / line_crossing_events / zone_dwell_events / speed_events
+# 在資料庫中為時間分區表（主鍵為 id + 時間欄位），見 app/services/partition_manager.py
+# 複合 / BRIN / 部分索引策略見 app/models/indexes.py
 
 from __future__ import annotations
 
@@ -19,7 +22,7 @@ from sqlalchemy import (
     Text,
 )
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship, reconstructor
+from sqlalchemy.orm import declared_attr, relationship, reconstructor
 
 Base = declarative_base()
 
@@ -427,6 +430,101 @@ class TaskStatistics(Base):
         }
 
 
+class _AnalyticsRollupColumns:
+    """
+    分析彙總表共用欄位（由 app/services/rollup_service.py 的背景彙總器維護）
+
+    metric: detection / line_crossing / zone_dwell / speed
+    dimension: 物件類別 / 線段 ID / 區域 ID（speed 為空字串）
+    value_*: zone_dwell 為停留秒數，speed 為平均 / 最高速度
+    """
+
+    bucket_start = Column(DateTime, primary_key=True)
+
+    @declared_attr
+    def task_id(cls):
+        return Column(
+            Integer, ForeignKey("analysis_tasks.id", ondelete="CASCADE"), primary_key=True
+        )
+
+    metric = Column(String(20), primary_key=True)
+    dimension = Column(String(100), primary_key=True, default="")
+    direction = Column(String(20), primary_key=True, default="")
+    camera_id = Column(String(100))
+    event_count = Column(Integer, nullable=False, default=0)
+    confidence_sum = Column(Float)
+    confidence_max = Column(Float)
+    high_confidence_count = Column(Integer)
+    alert_count = Column(Integer)
+    value_sum = Column(Float)
+    value_max = Column(Float)
+    last_seen = Column(DateTime)
+
+    def to_dict(self):
+        return {
+            "bucket_start": _safe_iso(self.bucket_start),
+            "task_id": self.task_id,
+            "metric": self.metric,
+            "dimension": self.dimension,
+            "direction": self.direction,
+            "camera_id": self.camera_id,
+            "event_count": self.event_count,
+            "confidence_sum": self.confidence_sum,
+            "confidence_max": self.confidence_max,
+            "high_confidence_count": self.high_confidence_count,
+            "alert_count": self.alert_count,
+            "value_sum": self.value_sum,
+            "value_max": self.value_max,
+            "last_seen": _safe_iso(self.last_seen),
+        }
+
+
+class AnalyticsRollupMinute(_AnalyticsRollupColumns, Base):
+    __tablename__ = "analytics_rollup_minute"
+
+
+class AnalyticsRollupHour(_AnalyticsRollupColumns, Base):
+    __tablename__ = "analytics_rollup_hour"
+
+
+class AnalyticsRollupDirty(Base):
+    """
+    遲到資料標記：寫入時間早於彙總水位線的明細（日誌重放、延遲送出的批次）
+    在同一交易內記下最早的時間，彙總器取出後從該小時起重新彙總
+    """
+
+    __tablename__ = "analytics_rollup_dirty"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    earliest = Column(DateTime, nullable=False)
+    recorded_at = Column(DateTime, default=datetime.utcnow)
+
+
+class HeatmapBin(Base):
+    """每小時、每任務的偵測中心點網格計數（見 app/services/heatmap_service.py）"""
+
+    __tablename__ = "heatmap_bins"
+
+    bucket_start = Column(DateTime, primary_key=True)
+    task_id = Column(
+        Integer, ForeignKey("analysis_tasks.id", ondelete="CASCADE"), primary_key=True
+    )
+    grid_size = Column(Integer, primary_key=True)
+    cell_x = Column(Integer, primary_key=True)
+    cell_y = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+    def to_dict(self):
+        return {
+            "bucket_start": _safe_iso(self.bucket_start),
+            "task_id": self.task_id,
+            "grid_size": self.grid_size,
+            "cell_x": self.cell_x,
+            "cell_y": self.cell_y,
+            "count": self.count,
+        }
+
+
 # 索引
 Index("idx_analysis_tasks_status", AnalysisTask.status)
 Index("idx_analysis_tasks_type", AnalysisTask.task_type)
@@ -452,3 +550,10 @@ Index("idx_data_sources_type", DataSource.source_type)
 Index("idx_system_config_key", SystemConfig.config_key)
 
 Index("idx_task_statistics_updated", TaskStatistics.updated_at)
+
+Index("idx_rollup_minute_task", AnalyticsRollupMinute.task_id, AnalyticsRollupMinute.bucket_start)
+Index("idx_rollup_hour_task", AnalyticsRollupHour.task_id, AnalyticsRollupHour.bucket_start)
+Index("idx_heatmap_bins_task", HeatmapBin.task_id, HeatmapBin.bucket_start)
+
+# 依查詢形狀調整的複合 / BRIN / 部分索引（註冊到同一個 metadata，create_all 一併建立）
+from app.models import indexes as _strategy_indexes  # noqa: E402,F401
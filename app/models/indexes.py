@@ -0,0 +1,231 @@
+"""
+偵測明細表的索引策略
+
+依實際查詢形狀宣告的索引（與 deployment/db/init.sql 同步）：
+- 偵測記錄列表以 (task_id, coalesce(tracker_id, id)) 分組、依 frame_timestamp DESC 排名，
+  對應的運算式索引讓視窗函數直接取得已排序的輸入，不必整批排序
+- (task_id, tracker_id, 時間 DESC)：單一追蹤目標的軌跡 / 最後出現時間
+- (task_id, 時間)：單一任務的時間區間查詢與統計
+- 只追加寫入的時間欄位使用 BRIN（體積為 B-tree 的千分之一以下），供跨任務的時間區間掃描
+- tracker_id 大量為 NULL（未追蹤的偵測），追蹤相關索引只收錄 tracker_id IS NOT NULL 的資料列
+
+新資料庫由 create_all 建立；既有資料庫由 ensure_indexes() 補建
+（一般資料表使用 CREATE INDEX CONCURRENTLY，不阻塞寫入；分區父表不支援 CONCURRENTLY，
+索引會在各分區上建立，期間短暫阻塞該分區的寫入）。
+
+用法：
+    python -m app.models.indexes status
+    python -m app.models.indexes ensure
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import Index, func, text
+from sqlalchemy.schema import CreateIndex
+
+from app.models.database import (
+    DetectionResult,
+    LineCrossingEvent,
+    SpeedEvent,
+    ZoneDwellEvent,
+)
+
+STRATEGY_INDEXES: List[Index] = [
+    # detection_results
+    Index(
+        "idx_detection_results_task_track_group_ts",
+        DetectionResult.task_id,
+        func.coalesce(DetectionResult.tracker_id, DetectionResult.id),
+        DetectionResult.frame_timestamp.desc(),
+    ),
+    Index(
+        "idx_detection_results_task_tracker_ts",
+        DetectionResult.task_id,
+        DetectionResult.tracker_id,
+        DetectionResult.frame_timestamp.desc(),
+        postgresql_where=DetectionResult.tracker_id.isnot(None),
+    ),
+    Index(
+        "idx_detection_results_task_ts",
+        DetectionResult.task_id,
+        DetectionResult.frame_timestamp,
+    ),
+    Index(
+        "idx_detection_results_ts_brin",
+        DetectionResult.frame_timestamp,
+        postgresql_using="brin",
+    ),
+    # line_crossing_events
+    Index(
+        "idx_line_events_task_ts",
+        LineCrossingEvent.task_id,
+        LineCrossingEvent.frame_timestamp,
+    ),
+    Index(
+        "idx_line_events_task_tracker_ts",
+        LineCrossingEvent.task_id,
+        LineCrossingEvent.tracker_id,
+        LineCrossingEvent.frame_timestamp.desc(),
+        postgresql_where=LineCrossingEvent.tracker_id.isnot(None),
+    ),
+    Index(
+        "idx_line_events_ts_brin",
+        LineCrossingEvent.frame_timestamp,
+        postgresql_using="brin",
+    ),
+    # zone_dwell_events
+    Index(
+        "idx_zone_events_task_ts",
+        ZoneDwellEvent.task_id,
+        ZoneDwellEvent.event_timestamp,
+    ),
+    Index(
+        "idx_zone_events_task_tracker_ts",
+        ZoneDwellEvent.task_id,
+        ZoneDwellEvent.tracker_id,
+        ZoneDwellEvent.event_timestamp.desc(),
+        postgresql_where=ZoneDwellEvent.tracker_id.isnot(None),
+    ),
+    Index(
+        "idx_zone_events_ts_brin",
+        ZoneDwellEvent.event_timestamp,
+        postgresql_using="brin",
+    ),
+    # speed_events
+    Index(
+        "idx_speed_events_task_ts",
+        SpeedEvent.task_id,
+        SpeedEvent.event_timestamp,
+    ),
+    Index(
+        "idx_speed_events_task_tracker_ts",
+        SpeedEvent.task_id,
+        SpeedEvent.tracker_id,
+        SpeedEvent.event_timestamp.desc(),
+        postgresql_where=SpeedEvent.tracker_id.isnot(None),
+    ),
+    Index(
+        "idx_speed_events_ts_brin",
+        SpeedEvent.event_timestamp,
+        postgresql_using="brin",
+    ),
+]
+
+
+def _relkind(connection, table: str) -> Optional[str]:
+    return connection.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:name)"),
+        {"name": table},
+    ).scalar()
+
+
+def _index_valid(connection, name: str) -> Optional[bool]:
+    """索引是否有效；不存在回傳 None（CONCURRENTLY 中斷會留下無效索引）"""
+    return connection.execute(
+        text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"),
+        {"name": name},
+    ).scalar()
+
+
+def _create_index(connection, index: Index, concurrently: bool) -> None:
+    options = index.dialect_options["postgresql"]
+    previous = options["concurrently"]
+    options["concurrently"] = concurrently
+    try:
+        connection.execute(CreateIndex(index, if_not_exists=True))
+    finally:
+        options["concurrently"] = previous
+
+
+def ensure_indexes(engine: Any = None, concurrently: bool = True) -> Dict[str, str]:
+    """補建缺少（或先前建立失敗而無效）的策略索引，回傳每個索引的處理結果"""
+    from app.core.logger import main_logger
+
+    if engine is None:
+        from app.core.database import sync_engine
+
+        engine = sync_engine
+
+    results: Dict[str, str] = {}
+    # CONCURRENTLY 不能在交易區塊內執行
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        for index in STRATEGY_INDEXES:
+            table = index.table.name
+            try:
+                relkind = _relkind(connection, table)
+                if relkind is None:
+                    results[index.name] = "missing_table"
+                    continue
+                valid = _index_valid(connection, index.name)
+                if valid:
+                    results[index.name] = "exists"
+                    continue
+                use_concurrently = concurrently and relkind == "r"
+                if valid is False:
+                    connection.execute(
+                        text(f"DROP INDEX {'CONCURRENTLY ' if use_concurrently else ''}IF EXISTS {index.name}")
+                    )
+                _create_index(connection, index, use_concurrently)
+                results[index.name] = "created"
+                main_logger.info(f"[index] 已建立 {index.name} ON {table}")
+            except Exception as exc:  # noqa: BLE001
+                results[index.name] = f"error: {exc}"
+                main_logger.error(f"[index] 建立 {index.name} 失敗: {exc}")
+    return results
+
+
+def get_index_status(engine: Any = None) -> Dict[str, Dict[str, Any]]:
+    """各策略索引的存在狀態、大小與使用次數（pg_stat_user_indexes，分區索引為各分區加總）"""
+    if engine is None:
+        from app.core.database import sync_engine
+
+        engine = sync_engine
+
+    status: Dict[str, Dict[str, Any]] = {}
+    with engine.connect() as connection:
+        for index in STRATEGY_INDEXES:
+            row = connection.execute(
+                text(
+                    """
+                    SELECT i.indisvalid AS valid,
+                           COALESCE(sum(pg_relation_size(s.indexrelid)), 0) AS size_bytes,
+                           COALESCE(sum(s.idx_scan), 0) AS scans
+                    FROM pg_index i
+                    LEFT JOIN pg_inherits inh ON inh.inhparent = i.indexrelid
+                    LEFT JOIN pg_stat_user_indexes s
+                           ON s.indexrelid = COALESCE(inh.inhrelid, i.indexrelid)
+                    WHERE i.indexrelid = to_regclass(:name)
+                    GROUP BY i.indisvalid
+                    """
+                ),
+                {"name": index.name},
+            ).first()
+            status[index.name] = {
+                "table": index.table.name,
+                "exists": row is not None,
+                "valid": bool(row.valid) if row is not None else False,
+                "size_bytes": int(row.size_bytes) if row is not None else 0,
+                "scans": int(row.scans) if row is not None else 0,
+            }
+    return status
+
+
+__all__ = ["STRATEGY_INDEXES", "ensure_indexes", "get_index_status"]
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="偵測明細表索引策略")
+    parser.add_argument("command", choices=("status", "ensure"))
+    parser.add_argument("--blocking", action="store_true", help="一般資料表也不使用 CONCURRENTLY（較快但會阻塞寫入）")
+    args = parser.parse_args()
+
+    if args.command == "ensure":
+        output: Any = ensure_indexes(concurrently=not args.blocking)
+    else:
+        output = get_index_status()
+    print(json.dumps(output, ensure_ascii=False, indent=2, default=str))
@@ -0,0 +1,151 @@
+"""
+分析查詢快取（應用程式層級）
+
+分析 / 儀表板端點每次請求都會建立新的 AnalyticsService，實例上的快取無法跨請求保留。
+改由行程內單例快取：
+- LRU 上限 ANALYTICS_CACHE_MAX_ENTRIES 筆，每個鍵可指定 TTL（預設 ANALYTICS_CACHE_TTL 秒）
+- single-flight：同一個鍵同時只有一個請求查詢資料庫，其餘請求等待同一個結果
+- 任務建立 / 開始 / 暫停 / 停止時呼叫 notify_task_changed() 使快取失效；
+  失效前已開始的查詢結果不會寫回快取
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.core.config import settings
+
+
+class AnalyticsCache:
+    """LRU + TTL + single-flight 快取（單例）"""
+
+    _instance: Optional["AnalyticsCache"] = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+        self.max_entries = max(1, settings.analytics_cache_max_entries)
+        self.default_ttl = settings.analytics_cache_ttl
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.load_errors = 0
+        self._initialized = True
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: Optional[float] = None) -> Any:
+        """取得快取值；未命中時由第一個請求執行 loader，同時間的其他請求共用結果"""
+        ttl = self.default_ttl if ttl is None else ttl
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    if entry[1] > time.monotonic():
+                        self._entries.move_to_end(key)
+                        self.hits += 1
+                        return entry[0]
+                    del self._entries[key]
+                future = self._inflight.get(key)
+                if future is None:
+                    self.misses += 1
+                    future = asyncio.get_running_loop().create_future()
+                    self._inflight[key] = future
+                    generation = self._generation
+                    break
+                self.coalesced += 1
+
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # 負責查詢的請求被取消（用戶端斷線）時重新排隊，自己被取消則照常結束
+                if not future.cancelled():
+                    raise
+
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.cancel()
+            raise
+        except Exception as exc:
+            with self._lock:
+                self._inflight.pop(key, None)
+                self.load_errors += 1
+            future.set_exception(exc)
+            future.exception()  # 沒有等待者時避免 "exception was never retrieved"
+            raise
+
+        with self._lock:
+            self._inflight.pop(key, None)
+            if ttl > 0 and generation == self._generation:
+                self._entries[key] = (value, time.monotonic() + ttl)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        future.set_result(value)
+        return value
+
+    def invalidate(self, prefix: Optional[str] = None) -> int:
+        """清除全部（或指定前綴）的快取，回傳清除筆數；可由任何執行緒呼叫"""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            if prefix is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                return removed
+            keys = [key for key in self._entries if key.startswith(prefix)]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "default_ttl": self.default_ttl,
+                "inflight": len(self._inflight),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "hit_ratio": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "load_errors": self.load_errors,
+            }
+
+
+def get_analytics_cache() -> AnalyticsCache:
+    """獲取分析查詢快取實例"""
+    return AnalyticsCache()
+
+
+def notify_task_changed(task_id: Any = None) -> None:
+    """任務建立或狀態改變（開始 / 暫停 / 恢復 / 停止）時使分析快取失效"""
+    get_analytics_cache().invalidate()
+
+
+__all__ = ["AnalyticsCache", "get_analytics_cache", "notify_task_changed"]
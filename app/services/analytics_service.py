@@ -3,22 +3,23 @@
 提供檢測結果的統計分析和數據視覺化支持
 """
 
-import asyncio
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
-from sqlalchemy import func, and_, desc, text, or_
 
 from app.core.logger import api_logger
-from app.models.database import DetectionResult, AnalysisTask
+from app.services.analytics_cache import get_analytics_cache
+from app.services.heatmap_service import build_heatmap
+from app.services.rollup_service import fetch_detection_summary
+
+VEHICLE_TYPES = ("car", "truck", "bus", "motorcycle")
 
 class AnalyticsService:
     """分析統計服務"""
     
     def __init__(self):
-        self.cache = {}
-        self.cache_timeout = 300  # 5分鐘緩存
+        # 每次請求都會建立新的實例，快取改用應用程式層級的 AnalyticsCache
+        self.cache = get_analytics_cache()
     
     async def get_analytics_data(
         self,
@@ -27,28 +28,15 @@ class AnalyticsService:
     ) -> Dict[str, Any]:
         """獲取分析統計數據"""
         try:
-            # 檢查緩存
-            cache_key = f"analytics_{period}"
-            if self._is_cache_valid(cache_key):
-                return self.cache[cache_key]["data"]
-            
-            # 根據時間段設定查詢範圍
-            time_range = self._get_time_range(period)
-            
-            if db:
-                # 從數據庫獲取真實數據
-                data = await self._get_database_analytics(time_range, db)
-            else:
+            if not db:
                 # 生成模擬數據
-                data = self._generate_mock_analytics(period)
-            
-            # 更新緩存
-            self.cache[cache_key] = {
-                "data": data,
-                "timestamp": datetime.now()
-            }
+                return self._generate_mock_analytics(period)
             
-            return data
+            # 從數據庫獲取真實數據（同時間的相同查詢只執行一次）
+            return await self.cache.get_or_load(
+                f"analytics:{period}",
+                lambda: self._get_database_analytics(self._get_time_range(period), db),
+            )
             
         except Exception as e:
             api_logger.error(f"獲取分析數據失敗: {e}")
@@ -77,231 +65,76 @@ class AnalyticsService:
         time_range: Dict[str, datetime],
         db: AsyncSession
     ) -> Dict[str, Any]:
-        """從數據庫獲取真實的分析數據"""
+        """從數據庫獲取真實的分析數據（讀彙總表，尚未彙總的尾段讀明細表，只查一次）"""
         try:
-            start_time = time_range["start"]
-            end_time = time_range["end"]
-            
-            # 檢測總數統計
-            detection_counts = await self._get_detection_counts(start_time, end_time, db)
-            
-            # 小時趨勢數據
-            hourly_trend = await self._get_hourly_trend(start_time, end_time, db)
-            
-            # 類別分布統計
-            category_distribution = await self._get_category_distribution(start_time, end_time, db)
-            
-            # 時段分析
-            time_period_analysis = await self._get_time_period_analysis(start_time, end_time, db)
+            rows = await fetch_detection_summary(
+                db,
+                time_range["start"],
+                time_range["end"],
+                group_by=("hour_of_day", "object_type"),
+            )
             
             return {
-                "detection_counts": detection_counts,
-                "hourly_trend": hourly_trend,
-                "category_distribution": category_distribution,
-                "time_period_analysis": time_period_analysis
+                "detection_counts": self._get_detection_counts(rows),
+                "hourly_trend": self._get_hourly_trend(rows),
+                "category_distribution": self._get_category_distribution(rows),
+                "time_period_analysis": self._get_time_period_analysis(rows)
             }
             
         except Exception as e:
             api_logger.error(f"從數據庫獲取分析數據失敗: {e}")
             raise
     
-    async def _get_detection_counts(
-        self,
-        start_time: datetime,
-        end_time: datetime,
-        db: AsyncSession
-    ) -> Dict[str, int]:
+    def _get_detection_counts(self, rows: List[Dict[str, Any]]) -> Dict[str, int]:
         """獲取檢測數量統計"""
-        try:
-            # 總檢測數
-            total_query = select(func.count(DetectionResult.id)).where(
-                and_(
-                    DetectionResult.frame_timestamp >= start_time,
-                    DetectionResult.frame_timestamp <= end_time
-                )
-            )
-            total_result = await db.execute(total_query)
-            total_detections = total_result.scalar() or 0
-            
-            # 人員檢測數
-            person_query = select(func.count(DetectionResult.id)).where(
-                and_(
-                    DetectionResult.object_type == "person",
-                    DetectionResult.frame_timestamp >= start_time,
-                    DetectionResult.frame_timestamp <= end_time
-                )
-            )
-            person_result = await db.execute(person_query)
-            person_count = person_result.scalar() or 0
-            
-            # 車輛檢測數
-            vehicle_query = select(func.count(DetectionResult.id)).where(
-                and_(
-                    DetectionResult.object_type.in_(["car", "truck", "bus", "motorcycle"]),
-                    DetectionResult.frame_timestamp >= start_time,
-                    DetectionResult.frame_timestamp <= end_time
-                )
-            )
-            vehicle_result = await db.execute(vehicle_query)
-            vehicle_count = vehicle_result.scalar() or 0
-            
+        return {
+            "total_detections": sum(row["count"] for row in rows),
+            "person_count": sum(row["count"] for row in rows if row["object_type"] == "person"),
+            "vehicle_count": sum(row["count"] for row in rows if row["object_type"] in VEHICLE_TYPES),
             # 異常事件（高信心度的檢測）
-            alert_query = select(func.count(DetectionResult.id)).where(
-                and_(
-                    DetectionResult.confidence > 0.9,
-                    DetectionResult.frame_timestamp >= start_time,
-                    DetectionResult.frame_timestamp <= end_time
-                )
-            )
-            alert_result = await db.execute(alert_query)
-            alert_count = alert_result.scalar() or 0
-            
-            return {
-                "total_detections": total_detections,
-                "person_count": person_count,
-                "vehicle_count": vehicle_count,
-                "alert_count": alert_count
-            }
-            
-        except Exception as e:
-            api_logger.error(f"獲取檢測數量統計失敗: {e}")
-            return {"total_detections": 0, "person_count": 0, "vehicle_count": 0, "alert_count": 0}
+            "alert_count": sum(row["alert_count"] for row in rows)
+        }
     
-    async def _get_hourly_trend(
-        self,
-        start_time: datetime,
-        end_time: datetime,
-        db: AsyncSession
-    ) -> List[Dict[str, Any]]:
+    def _get_hourly_trend(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """獲取小時趨勢數據"""
-        try:
-            # 使用簡化的 SQL 查詢
-            query = text("""
-                SELECT 
-                    EXTRACT(hour FROM timestamp) as hour,
-                    object_type,
-                    COUNT(*) as count
-                FROM detection_results 
-                WHERE timestamp >= :start_time AND timestamp <= :end_time
-                GROUP BY EXTRACT(hour FROM timestamp), object_type
-                ORDER BY hour
-            """)
-            
-            result = await db.execute(query, {
-                "start_time": start_time,
-                "end_time": end_time
-            })
-            
-            # 處理查詢結果
-            hourly_data = {}
-            for row in result:
-                hour = int(row.hour)
-                hour_str = f"{hour:02d}:00"
-                if hour_str not in hourly_data:
-                    hourly_data[hour_str] = {"total": 0, "person": 0, "vehicle": 0, "other": 0}
-                
-                hourly_data[hour_str]["total"] += row.count
-                
-                if row.object_type == "person":
-                    hourly_data[hour_str]["person"] += row.count
-                elif row.object_type in ["car", "truck", "bus", "motorcycle"]:
-                    hourly_data[hour_str]["vehicle"] += row.count
-                else:
-                    hourly_data[hour_str]["other"] += row.count
-            
-            # 轉換為列表格式
-            trend_list = []
-            for hour, counts in sorted(hourly_data.items()):
-                trend_list.append({
-                    "hour": hour,
-                    "total": counts["total"],
-                    "person": counts["person"],
-                    "vehicle": counts["vehicle"],
-                    "other": counts["other"]
-                })
-            
-            return trend_list
-            
-        except Exception as e:
-            api_logger.error(f"獲取小時趨勢失敗: {e}")
-            # 返回空列表而不是空字典，確保數據結構正確
-            return []
+        hourly_data: Dict[str, Dict[str, int]] = {}
+        for row in rows:
+            hour_str = f"{int(row['hour_of_day']):02d}:00"
+            counts = hourly_data.setdefault(hour_str, {"total": 0, "person": 0, "vehicle": 0, "other": 0})
+            counts["total"] += row["count"]
+            if row["object_type"] == "person":
+                counts["person"] += row["count"]
+            elif row["object_type"] in VEHICLE_TYPES:
+                counts["vehicle"] += row["count"]
+            else:
+                counts["other"] += row["count"]
+        
+        return [
+            {"hour": hour, **counts}
+            for hour, counts in sorted(hourly_data.items())
+        ]
     
-    async def _get_category_distribution(
-        self,
-        start_time: datetime,
-        end_time: datetime,
-        db: AsyncSession
-    ) -> Dict[str, int]:
+    def _get_category_distribution(self, rows: List[Dict[str, Any]]) -> Dict[str, int]:
         """獲取類別分布統計"""
-        try:
-            query = select(
-                DetectionResult.object_type,
-                func.count(DetectionResult.id).label('count')
-            ).where(
-                and_(
-                    DetectionResult.frame_timestamp >= start_time,
-                    DetectionResult.frame_timestamp <= end_time
-                )
-            ).group_by(DetectionResult.object_type)
-            
-            result = await db.execute(query)
-            
-            distribution = {}
-            for row in result:
-                distribution[row.object_type] = row.count
-            
-            return distribution
-            
-        except Exception as e:
-            api_logger.error(f"獲取類別分布失敗: {e}")
-            return {}
+        distribution: Dict[str, int] = {}
+        for row in rows:
+            distribution[row["object_type"]] = distribution.get(row["object_type"], 0) + row["count"]
+        return distribution
     
-    async def _get_time_period_analysis(
-        self,
-        start_time: datetime,
-        end_time: datetime,
-        db: AsyncSession
-    ) -> Dict[str, int]:
+    def _get_time_period_analysis(self, rows: List[Dict[str, Any]]) -> Dict[str, int]:
         """獲取時段分析數據"""
-        try:
-            # 查詢不同時段的檢測數量
-            periods = {
-                "morning": (6, 12),    # 06:00-12:00
-                "afternoon": (12, 18), # 12:00-18:00
-                "evening": (18, 24),   # 18:00-24:00
-                "night": (0, 6)        # 00:00-06:00
-            }
-            
-            period_data = {}
-            for period_name, (start_hour, end_hour) in periods.items():
-                if start_hour < end_hour:
-                    hour_condition = and_(
-                        func.extract('hour', DetectionResult.frame_timestamp) >= start_hour,
-                        func.extract('hour', DetectionResult.frame_timestamp) < end_hour
-                    )
-                else:  # 跨日情況（night period）
-                    hour_condition = or_(
-                        func.extract('hour', DetectionResult.frame_timestamp) >= start_hour,
-                        func.extract('hour', DetectionResult.frame_timestamp) < end_hour
-                    )
-                
-                query = select(func.count(DetectionResult.id)).where(
-                    and_(
-                        DetectionResult.frame_timestamp >= start_time,
-                        DetectionResult.frame_timestamp <= end_time,
-                        hour_condition
-                    )
-                )
-                
-                result = await db.execute(query)
-                period_data[period_name] = result.scalar() or 0
-            
-            return period_data
-            
-        except Exception as e:
-            api_logger.error(f"獲取時段分析失敗: {e}")
-            return {"morning": 0, "afternoon": 0, "evening": 0, "night": 0}
+        period_data = {"morning": 0, "afternoon": 0, "evening": 0, "night": 0}
+        for row in rows:
+            hour = int(row["hour_of_day"])
+            if 6 <= hour < 12:       # 06:00-12:00
+                period_data["morning"] += row["count"]
+            elif 12 <= hour < 18:    # 12:00-18:00
+                period_data["afternoon"] += row["count"]
+            elif hour >= 18:         # 18:00-24:00
+                period_data["evening"] += row["count"]
+            else:                    # 00:00-06:00
+                period_data["night"] += row["count"]
+        return period_data
     
     def _generate_mock_analytics(self, period: str) -> Dict[str, Any]:
         """生成模擬的分析數據"""
@@ -359,64 +192,48 @@ class AnalyticsService:
             "time_period_analysis": time_period_analysis
         }
     
-    async def get_heatmap_data(self, db: AsyncSession = None) -> Dict[str, Any]:
-        """獲取熱點圖數據"""
-        try:
-            if db:
-                # 從數據庫獲取位置數據
-                return await self._get_database_heatmap(db)
-            else:
-                # 生成模擬熱點圖數據
-                return self._generate_mock_heatmap()
-                
-        except Exception as e:
-            api_logger.error(f"獲取熱點圖數據失敗: {e}")
+    async def get_heatmap_data(
+        self,
+        db: AsyncSession = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        task_id: Optional[int] = None,
+        camera_id: Optional[str] = None,
+        grid_size: Optional[int] = None,
+        gaussian_sigma: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """獲取熱點圖數據（偵測中心點網格計數，預設最近 24 小時）"""
+        if not db:
+            # 生成模擬熱點圖數據
             return self._generate_mock_heatmap()
-    
-    async def _get_database_heatmap(self, db: AsyncSession) -> Dict[str, Any]:
-        """從數據庫獲取熱點圖數據"""
+        
+        # 未指定時間（最近 24 小時）的請求共用同一個快取鍵，在 TTL 內視為相同查詢
+        cache_key = ":".join(
+            str(part) for part in (
+                "heatmap",
+                start_time.isoformat() if start_time else "",
+                end_time.isoformat() if end_time else "latest",
+                task_id, camera_id, grid_size, gaussian_sigma,
+            )
+        )
+        end_time = end_time or datetime.now()
+        start_time = start_time or end_time - timedelta(days=1)
         try:
-            # 查詢檢測結果的位置分布
-            yesterday = datetime.now() - timedelta(days=1)
-            
-            # 簡化的熱點數據查詢（實際應該根據檢測框的中心點計算）
-            query = select(
-                DetectionResult.x_min,
-                DetectionResult.y_min,
-                DetectionResult.x_max,
-                DetectionResult.y_max,
-                func.count(DetectionResult.id).label('count')
-            ).where(
-                DetectionResult.created_at >= yesterday
-            ).group_by(
-                DetectionResult.x_min,
-                DetectionResult.y_min,
-                DetectionResult.x_max,
-                DetectionResult.y_max
-            ).limit(100)
-            
-            result = await db.execute(query)
-            
-            heatmap_points = []
-            for row in result:
-                # 計算檢測框中心點
-                center_x = (row.x_min + row.x_max) / 2
-                center_y = (row.y_min + row.y_max) / 2
-                
-                heatmap_points.append({
-                    "x": center_x,
-                    "y": center_y,
-                    "intensity": row.count
-                })
-            
-            return {
-                "points": heatmap_points,
-                "max_intensity": max([p["intensity"] for p in heatmap_points]) if heatmap_points else 1
-            }
-            
+            return await self.cache.get_or_load(
+                cache_key,
+                lambda: build_heatmap(
+                    db,
+                    start_time,
+                    end_time,
+                    task_id=task_id,
+                    camera_id=camera_id,
+                    grid_size=grid_size,
+                    sigma=gaussian_sigma,
+                ),
+            )
         except Exception as e:
             api_logger.error(f"從數據庫獲取熱點圖數據失敗: {e}")
-            return self._generate_mock_heatmap()
+            raise
     
     def _generate_mock_heatmap(self) -> Dict[str, Any]:
         """生成模擬熱點圖數據"""
@@ -436,15 +253,8 @@ class AnalyticsService:
             "max_intensity": 100
         }
     
-    def _is_cache_valid(self, cache_key: str) -> bool:
-        """檢查緩存是否有效"""
-        if cache_key not in self.cache:
-            return False
-        
-        cache_time = self.cache[cache_key]["timestamp"]
-        return (datetime.now() - cache_time).total_seconds() < self.cache_timeout
-    
     def clear_cache(self):
         """清空緩存"""
-        self.cache.clear()
+        self.cache.invalidate("analytics:")
+        self.cache.invalidate("heatmap:")
         api_logger.info("分析數據緩存已清空")
@@ -1,39 +1,390 @@
 """
 異步隊列管理器
 處理從同步線程向異步操作發送資料的問題
+
+- 每個隊列都有容量上限，滿時依策略處理（block / drop_oldest / spill）
+  - block：生產者最多等待 ASYNC_QUEUE_BLOCK_TIMEOUT 秒，仍然滿就捨棄這則訊息
+  - drop_oldest：捨棄最舊的訊息（即時推送只在乎最新資料）
+  - spill：溢出的訊息依序寫入磁碟分段檔，記憶體有空間時再讀回；重啟後會接續處理
+- 工作線程以微批次處理：取得第一則後最多再等 T 毫秒湊滿 N 則，
+  資料庫一批只做一次寫入（共用 sync_engine 的 executemany），推送一批只跨一次事件循環
+- 資料庫批次寫入遇到暫時性錯誤時以指數退避重試，重試用盡（或停止中）時整批寫回磁碟分段待重放；
+  永久性錯誤逐則重試，仍失敗的訊息改存為 .bad 檔並記錄
+- get_queue_stats() 提供深度、最舊訊息等待時間、吞吐量與丟棄 / 溢出 / 重放計數
 """
 
 import asyncio
-import queue
+import bisect
+import concurrent.futures
+import json
+import os
 import threading
 import time
-from typing import Dict, List, Any, Optional
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime
-import json
 
+from app.core.config import settings
 from app.core.logger import get_logger
+from app.core.paths import get_base_dir
 from app.websocket.push_service import push_yolo_detection
 from app.services.new_database_service import DatabaseService
+from app.services.write_behind import POISONED_SUFFIX, is_transient_error
 
 logger = get_logger(__name__)
 
+OVERFLOW_POLICIES = ("block", "drop_oldest", "spill")
+SPILL_SUFFIX = ".jsonl"
+RATE_WINDOW_SECONDS = 60.0
+SAVE_BACKOFF_MAX = 30.0
+
+
+class BoundedMessageQueue:
+    """有界訊息隊列（執行緒安全），支援溢出策略與批次取出"""
+
+    def __init__(
+        self,
+        name: str,
+        maxsize: Optional[int] = None,
+        policy: Optional[str] = None,
+        block_timeout: Optional[float] = None,
+        spill_dir: Optional[os.PathLike] = None,
+    ):
+        policy = (policy or "drop_oldest").strip().lower()
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"不支援的隊列溢出策略: {policy}（可用: {', '.join(OVERFLOW_POLICIES)}）")
+        self.name = name
+        self.maxsize = max(1, maxsize or settings.async_queue_max_size)
+        self.policy = policy
+        self.block_timeout = max(0.0, settings.async_queue_block_timeout if block_timeout is None else block_timeout)
+        base_dir = spill_dir or settings.async_queue_spill_dir or (get_base_dir() / "data" / "queue_spill")
+        self.spill_dir = Path(base_dir) / name
+
+        # (enqueued_at, message)；enqueued_at 為 time.time()，溢出到磁碟後仍可計算等待時間
+        self._items: deque = deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._closed = False
+
+        self._spill_segments: deque = deque()
+        self._spill_handle = None
+        self._spill_active: Optional[Path] = None
+        self._spill_active_count = 0
+        self._spilled_pending = 0
+        self._spill_seq = 0
+        # 任何策略都可能有寫回磁碟的失敗批次（requeue），啟動時一律接續處理
+        self._recover_spill()
+
+        self.enqueued = 0
+        self.dequeued = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.requeued = 0
+        self.quarantined = 0
+        self.block_waits = 0
+        self.batches = 0
+        self.last_batch_size = 0
+        self.last_batch_wait = 0.0
+        self.max_wait = 0.0
+        self._enqueue_times: deque = deque()
+        self._dequeue_times: deque = deque()
+
+    # ===== 生產者 =====
+
+    def put(self, message: Dict[str, Any]) -> bool:
+        """加入訊息；依策略被捨棄時回傳 False"""
+        now = time.time()
+        with self._lock:
+            if self._closed:
+                return False
+            if self.policy == "spill" and (self._spilled_pending or len(self._items) >= self.maxsize):
+                # 已有訊息在磁碟上時，新訊息也寫到磁碟，保持先進先出
+                try:
+                    self._spill_locked(now, message)
+                except OSError as exc:
+                    self.dropped += 1
+                    logger.error(f"[{self.name}] 隊列溢出寫入磁碟失敗，捨棄訊息: {exc}")
+                    return False
+                self._count_enqueue_locked(now)
+                self._not_empty.notify()
+                return True
+            if len(self._items) >= self.maxsize:
+                if self.policy == "block":
+                    self.block_waits += 1
+                    if not self._not_full.wait_for(
+                        lambda: self._closed or len(self._items) < self.maxsize,
+                        timeout=self.block_timeout,
+                    ) or self._closed:
+                        self.dropped += 1
+                        return False
+                else:
+                    self._items.popleft()
+                    self.dropped += 1
+            self._items.append((now, message))
+            self._count_enqueue_locked(now)
+            self._not_empty.notify()
+            return True
+
+    def _count_enqueue_locked(self, now: float) -> None:
+        self.enqueued += 1
+        self._enqueue_times.append(now)
+        self._trim_rate_window(self._enqueue_times, now)
+
+    # ===== 消費者 =====
+
+    def get_batch(self, max_items: int, max_wait: float, timeout: float = 1.0) -> List[Tuple[float, Dict[str, Any]]]:
+        """
+        取出一批訊息：最多等待 timeout 秒取得第一則，
+        之後最多再等 max_wait 秒湊滿 max_items 則；隊列已關閉且清空時回傳空列表
+        """
+        batch: List[Tuple[float, Dict[str, Any]]] = []
+        with self._lock:
+            if not self._not_empty.wait_for(self._has_pending_locked, timeout=timeout):
+                return batch
+            deadline = time.monotonic() + max_wait
+            while True:
+                self._refill_locked()
+                while self._items and len(batch) < max_items:
+                    batch.append(self._items.popleft())
+                remaining = deadline - time.monotonic()
+                if len(batch) >= max_items or remaining <= 0 or self._closed:
+                    break
+                self._not_empty.wait_for(self._has_pending_locked, timeout=remaining)
+            if batch:
+                now = time.time()
+                self.dequeued += len(batch)
+                self.batches += 1
+                self.last_batch_size = len(batch)
+                self.last_batch_wait = now - batch[0][0]
+                self.max_wait = max(self.max_wait, self.last_batch_wait)
+                self._dequeue_times.extend([now] * len(batch))
+                self._trim_rate_window(self._dequeue_times, now)
+                self._not_full.notify_all()
+        return batch
+
+    def _has_pending_locked(self) -> bool:
+        return bool(self._items) or self._spilled_pending > 0 or self._closed
+
+    def close(self) -> None:
+        """停止接收新訊息並喚醒等待中的生產者與消費者"""
+        with self._lock:
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+            self._close_spill_handle_locked()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._items) + self._spilled_pending
+
+    # ===== 磁碟溢出 =====
+
+    def _recover_spill(self) -> None:
+        # 上次執行留下的分段檔依序接續處理
+        if not self.spill_dir.exists():
+            return
+        for path in sorted(self.spill_dir.glob(f"*{SPILL_SUFFIX}")):
+            with open(path, "r", encoding="utf-8") as handle:
+                count = sum(1 for line in handle if line.strip())
+            if count:
+                self._spill_segments.append((path, count))
+                self._spilled_pending += count
+            else:
+                path.unlink(missing_ok=True)
+        if self._spilled_pending:
+            logger.info(f"[{self.name}] 發現 {self._spilled_pending} 則上次溢出的訊息，將依序處理")
+
+    def _spill_locked(self, enqueued_at: float, message: Dict[str, Any]) -> None:
+        if self._spill_handle is None or self._spill_active_count >= self.maxsize:
+            self._close_spill_handle_locked()
+            self.spill_dir.mkdir(parents=True, exist_ok=True)
+            self._spill_seq += 1
+            self._spill_active = self.spill_dir / f"{time.time_ns():020d}-{self._spill_seq:06d}{SPILL_SUFFIX}"
+            self._spill_handle = open(self._spill_active, "a", encoding="utf-8")
+            self._spill_active_count = 0
+        line = json.dumps({"t": enqueued_at, "m": message}, ensure_ascii=False, default=str)
+        self._spill_handle.write(line + "\n")
+        self._spill_handle.flush()
+        self._spill_active_count += 1
+        self._spilled_pending += 1
+        self.spilled += 1
+
+    def _close_spill_handle_locked(self) -> None:
+        if self._spill_handle is None:
+            return
+        self._spill_handle.close()
+        if self._spill_active_count:
+            self._spill_segments.append((self._spill_active, self._spill_active_count))
+        else:
+            self._spill_active.unlink(missing_ok=True)
+        self._spill_handle = None
+        self._spill_active = None
+        self._spill_active_count = 0
+
+    def _write_segment(self, path: Path, entries: List[Tuple[float, Dict[str, Any]]]) -> None:
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            with open(path, "w", encoding="utf-8") as handle:
+                for enqueued_at, message in entries:
+                    handle.write(json.dumps({"t": enqueued_at, "m": message}, ensure_ascii=False, default=str) + "\n")
+        except OSError:
+            path.unlink(missing_ok=True)
+            raise
+
+    def requeue(self, entries: List[Tuple[float, Dict[str, Any]]]) -> bool:
+        """
+        把處理失敗的一批訊息寫回磁碟分段，依原本的入隊時間排在其他分段之間重放
+
+        關閉後仍可寫入（留在磁碟待下次啟動）；寫檔失敗時計入 dropped 並回傳 False
+        """
+        if not entries:
+            return True
+        with self._lock:
+            self._spill_seq += 1
+            path = self.spill_dir / f"{int(entries[0][0] * 1e9):020d}-{self._spill_seq:06d}{SPILL_SUFFIX}"
+            try:
+                self._write_segment(path, entries)
+            except OSError as exc:
+                self.dropped += len(entries)
+                logger.error(f"[{self.name}] 失敗批次寫回磁碟失敗，捨棄 {len(entries)} 則訊息: {exc}")
+                return False
+            # 分段檔名以時間開頭，依檔名插入即維持先進先出
+            names = [segment.name for segment, _ in self._spill_segments]
+            self._spill_segments.insert(bisect.bisect(names, path.name), (path, len(entries)))
+            self._spilled_pending += len(entries)
+            self.requeued += len(entries)
+            self._not_empty.notify()
+            return True
+
+    def quarantine(self, entries: List[Tuple[float, Dict[str, Any]]]) -> Optional[Path]:
+        """無法寫入的訊息另存為 .bad 檔（不再重放），回傳檔案路徑"""
+        if not entries:
+            return None
+        with self._lock:
+            self._spill_seq += 1
+            path = self.spill_dir / f"{time.time_ns():020d}-{self._spill_seq:06d}{POISONED_SUFFIX}"
+            try:
+                self._write_segment(path, entries)
+            except OSError as exc:
+                self.dropped += len(entries)
+                logger.error(f"[{self.name}] 無法保存失敗訊息，捨棄 {len(entries)} 則: {exc}")
+                return None
+            self.quarantined += len(entries)
+            return path
+
+    def _refill_locked(self) -> None:
+        """記憶體隊列清空後，從最舊的分段檔讀回（一個分段最多 maxsize 則）；關閉後留在磁碟待下次啟動"""
+        if self._items or not self._spilled_pending or self._closed:
+            return
+        if not self._spill_segments:
+            self._close_spill_handle_locked()
+        if not self._spill_segments:
+            return
+        path, count = self._spill_segments.popleft()
+        self._spilled_pending -= count
+        try:
+            with open(path, "r", encoding="utf-8") as handle:
+                for line in handle:
+                    if not line.strip():
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        self.dropped += 1
+                        continue
+                    self._items.append((entry["t"], entry["m"]))
+            path.unlink(missing_ok=True)
+        except OSError as exc:
+            self.dropped += count
+            logger.error(f"[{self.name}] 讀回溢出分段失敗 {path.name}: {exc}")
+
+    # ===== 統計 =====
+
+    @staticmethod
+    def _trim_rate_window(times: deque, now: float) -> None:
+        while times and now - times[0] > RATE_WINDOW_SECONDS:
+            times.popleft()
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            self._trim_rate_window(self._enqueue_times, now)
+            self._trim_rate_window(self._dequeue_times, now)
+            oldest = self._items[0][0] if self._items else None
+            if self._spill_segments or self._spill_active_count:
+                # 磁碟上的訊息都比記憶體中的舊（記憶體清空後才讀回）
+                oldest = self._oldest_spilled_locked() or oldest
+            return {
+                "name": self.name,
+                "policy": self.policy,
+                "capacity": self.maxsize,
+                "depth": len(self._items),
+                "spilled_depth": self._spilled_pending,
+                "oldest_age_seconds": round(now - oldest, 3) if oldest else 0.0,
+                "enqueued": self.enqueued,
+                "dequeued": self.dequeued,
+                "dropped": self.dropped,
+                "spilled": self.spilled,
+                "requeued": self.requeued,
+                "quarantined": self.quarantined,
+                "block_waits": self.block_waits,
+                "batches": self.batches,
+                "avg_batch_size": round(self.dequeued / self.batches, 2) if self.batches else 0.0,
+                "last_batch_size": self.last_batch_size,
+                "last_batch_wait_seconds": round(self.last_batch_wait, 3),
+                "max_wait_seconds": round(self.max_wait, 3),
+                "enqueue_rate": round(len(self._enqueue_times) / RATE_WINDOW_SECONDS, 2),
+                "dequeue_rate": round(len(self._dequeue_times) / RATE_WINDOW_SECONDS, 2),
+                "closed": self._closed,
+            }
+
+    def _oldest_spilled_locked(self) -> Optional[float]:
+        path = self._spill_segments[0][0] if self._spill_segments else self._spill_active
+        try:
+            with open(path, "r", encoding="utf-8") as handle:
+                return json.loads(handle.readline())["t"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+
 class AsyncQueueManager:
     """異步隊列管理器，處理資料庫保存和 WebSocket 推送"""
-    
-    def __init__(self):
-        self.websocket_queue = queue.Queue()
-        self.database_queue = queue.Queue()
+
+    def __init__(self, batch_size: Optional[int] = None, batch_wait_ms: Optional[float] = None):
+        self.websocket_queue = BoundedMessageQueue("websocket", policy=settings.async_queue_websocket_policy)
+        self.database_queue = BoundedMessageQueue("database", policy=settings.async_queue_database_policy)
+        self.batch_size = max(1, batch_size or settings.async_queue_batch_size)
+        self.batch_wait = max(0.0, (settings.async_queue_batch_wait_ms if batch_wait_ms is None else batch_wait_ms) / 1000)
+        self.save_retries = max(0, settings.async_queue_save_retries)
+        self.save_backoff = max(0.0, settings.async_queue_save_backoff)
         self.running = False
+        self._stop_event = threading.Event()
         self.worker_threads = []
         self.event_loop = None
-        
+
+        self.pushed_messages = 0
+        self.push_failures = 0
+        self.saved_rows = 0
+        self.save_failures = 0
+        self.save_retries_used = 0
+        self.last_save_ms = 0.0
+
     def start(self):
         """啟動隊列處理器"""
         if self.running:
             return
-            
+
         self.running = True
-        
+        self._stop_event.clear()
+
+        # 在應用程式的事件循環中呼叫時，推送批次直接交給該循環（推送服務的 asyncio.Queue 屬於它）
+        try:
+            self.event_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.event_loop = None
+
         # 啟動 WebSocket 推送處理線程
         websocket_thread = threading.Thread(
             target=self._websocket_worker,
@@ -42,52 +393,59 @@ class AsyncQueueManager:
         )
         websocket_thread.start()
         self.worker_threads.append(websocket_thread)
-        
+
         # 啟動資料庫保存處理線程
         database_thread = threading.Thread(
             target=self._database_worker,
-            name="DatabaseWorker", 
+            name="DatabaseWorker",
             daemon=True
         )
         database_thread.start()
         self.worker_threads.append(database_thread)
-        
-        logger.info("異步隊列管理器已啟動")
-    
+
+        logger.info(
+            f"異步隊列管理器已啟動（容量 {self.websocket_queue.maxsize}/{self.database_queue.maxsize}，"
+            f"策略 {self.websocket_queue.policy}/{self.database_queue.policy}，"
+            f"每批 {self.batch_size} 則 / {self.batch_wait * 1000:.0f} ms）"
+        )
+
     def stop(self):
-        """停止隊列處理器"""
+        """停止隊列處理器（工作線程會先處理完記憶體中剩餘的訊息）"""
         self.running = False
-        
+        self._stop_event.set()
+
         # 發送停止信號
-        self.websocket_queue.put(None)
-        self.database_queue.put(None)
-        
+        self.websocket_queue.close()
+        self.database_queue.close()
+
         # 等待線程結束
         for thread in self.worker_threads:
             thread.join(timeout=5.0)
-        
+
         self.worker_threads.clear()
         logger.info("異步隊列管理器已停止")
-    
-    def push_websocket_data(self, task_id: int, frame_number: int, detections: List[Dict], processing_time: float = 0):
-        """將 WebSocket 推送資料加入隊列"""
+
+    def push_websocket_data(self, task_id: int, frame_number: int, detections: List[Dict], processing_time: float = 0) -> bool:
+        """將 WebSocket 推送資料加入隊列；被溢出策略捨棄時回傳 False"""
         try:
             data = {
                 'task_id': task_id,
-                'frame_number': frame_number, 
+                'frame_number': frame_number,
                 'detections': detections,
                 'processing_time': processing_time,
                 'timestamp': time.time()
             }
-            self.websocket_queue.put(data, block=False)
+            if not self.websocket_queue.put(data):
+                logger.debug(f"WebSocket 隊列已滿，跳過推送: {task_id}")
+                return False
             logger.debug(f"WebSocket 推送資料已加入隊列: {task_id}")
-        except queue.Full:
-            logger.warning(f"WebSocket 隊列已滿，跳過推送: {task_id}")
+            return True
         except Exception as e:
             logger.error(f"WebSocket 推送資料加入隊列失敗: {e}")
-    
-    def push_database_data(self, task_id: str, frame_number: int, objects: List[Dict], timestamp: datetime):
-        """將資料庫保存資料加入隊列"""
+            return False
+
+    def push_database_data(self, task_id: str, frame_number: int, objects: List[Dict], timestamp: datetime) -> bool:
+        """將資料庫保存資料加入隊列；被溢出策略捨棄時回傳 False"""
         try:
             data = {
                 'task_id': task_id,
@@ -96,181 +454,197 @@ class AsyncQueueManager:
                 'timestamp': timestamp.isoformat(),
                 'queue_time': time.time()
             }
-            self.database_queue.put(data, block=False)
+            if not self.database_queue.put(data):
+                logger.warning(f"資料庫隊列已滿，跳過保存: {task_id}")
+                return False
             logger.debug(f"資料庫保存資料已加入隊列: {task_id}")
-        except queue.Full:
-            logger.warning(f"資料庫隊列已滿，跳過保存: {task_id}")
+            return True
         except Exception as e:
             logger.error(f"資料庫保存資料加入隊列失敗: {e}")
-    
+            return False
+
+    def _drain(self, message_queue: BoundedMessageQueue):
+        """批次迭代隊列，直到停止且記憶體中的訊息處理完畢"""
+        while True:
+            batch = message_queue.get_batch(self.batch_size, self.batch_wait)
+            if batch:
+                yield batch
+            elif not self.running:
+                break
+
     def _websocket_worker(self):
         """WebSocket 推送工作線程"""
         logger.info("WebSocket 工作線程已啟動")
-        
-        # 創建新的事件循環
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
+
+        # 沒有應用程式的事件循環時（例如獨立腳本），使用線程自己的循環
+        own_loop = None
+        if self.event_loop is None:
+            own_loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(own_loop)
+
         try:
-            while self.running:
+            for entries in self._drain(self.websocket_queue):
+                batch = [message for _, message in entries]
                 try:
-                    # 獲取隊列資料（阻塞等待）
-                    data = self.websocket_queue.get(timeout=1.0)
-                    
-                    # 檢查停止信號
-                    if data is None:
+                    if own_loop is not None:
+                        own_loop.run_until_complete(self._push_websocket_batch(batch))
+                    elif self.running:
+                        # 一批只跨一次線程，交給主事件循環依序推送
+                        self._wait_on_loop(self._push_websocket_batch(batch))
+                    else:
+                        # 關閉中：主事件循環正在等待本線程結束，剩餘推送已無接收者
                         break
-                    
-                    # 執行異步推送
-                    try:
-                        loop.run_until_complete(self._push_websocket_async(data))
-                        logger.debug(f"WebSocket 推送成功: {data['task_id']}")
-                    except Exception as push_error:
-                        logger.error(f"WebSocket 推送失敗: {push_error}")
-                    
-                    # 標記任務完成
-                    self.websocket_queue.task_done()
-                    
-                except queue.Empty:
-                    # 超時是正常的，繼續循環
-                    continue
-                except Exception as e:
-                    logger.error(f"WebSocket 工作線程錯誤: {e}")
-                    
+                    self.pushed_messages += len(batch)
+                    logger.debug(f"WebSocket 批次推送成功: {len(batch)} 則")
+                except Exception as push_error:
+                    self.push_failures += 1
+                    logger.error(f"WebSocket 批次推送失敗: {push_error}")
+
         finally:
-            loop.close()
+            if own_loop is not None:
+                own_loop.close()
             logger.info("WebSocket 工作線程已結束")
-    
+
+    def _wait_on_loop(self, coro) -> None:
+        """在主事件循環執行並等待完成；停止時不再等待，避免與 stop() 的 join 互相等待"""
+        future = asyncio.run_coroutine_threadsafe(coro, self.event_loop)
+        while True:
+            try:
+                future.result(timeout=0.5)
+                return
+            except concurrent.futures.TimeoutError:
+                if not self.running:
+                    future.cancel()
+                    raise RuntimeError("隊列管理器停止中，取消推送")
+
     def _database_worker(self):
-        """資料庫保存工作線程"""
+        """資料庫保存工作線程（共用 sync_engine，一批一次 executemany）"""
         logger.info("資料庫工作線程已啟動")
-        
-        # 創建新的事件循環
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        # 在工作線程中創建獨立的資料庫引擎和會話工廠
-        try:
-            from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
-            from app.core.config import settings
-            
-            # 創建線程專用的異步引擎
-            thread_engine = create_async_engine(
-                settings.DATABASE_URL,
-                pool_size=2,  # 較小的連接池
-                max_overflow=0,
-                echo=False,
-                future=True
-            )
-            
-            # 創建線程專用的會話工廠
-            ThreadSessionLocal = async_sessionmaker(
-                bind=thread_engine,
-                class_=AsyncSession,
-                expire_on_commit=False
-            )
-            
-            logger.info("資料庫工作線程引擎已創建")
-            
-        except Exception as engine_error:
-            logger.error(f"資料庫引擎創建失敗: {engine_error}")
-            return
-        
+        db_service = DatabaseService()
+
         try:
-            while self.running:
-                try:
-                    # 獲取隊列資料（阻塞等待）
-                    data = self.database_queue.get(timeout=1.0)
-                    
-                    # 檢查停止信號
-                    if data is None:
-                        break
-                    
-                    # 執行異步保存
-                    try:
-                        loop.run_until_complete(
-                            self._save_database_async_thread_safe(data, ThreadSessionLocal)
-                        )
-                        logger.debug(f"資料庫保存成功: {data['task_id']}")
-                    except Exception as save_error:
-                        logger.error(f"資料庫保存失敗: {save_error}")
-                    
-                    # 標記任務完成
-                    self.database_queue.task_done()
-                    
-                except queue.Empty:
-                    # 超時是正常的，繼續循環
-                    continue
-                except Exception as e:
-                    logger.error(f"資料庫工作線程錯誤: {e}")
-                    
+            for entries in self._drain(self.database_queue):
+                self._save_entries(db_service, entries)
         finally:
-            # 清理資源
-            try:
-                loop.run_until_complete(thread_engine.dispose())
-                logger.info("資料庫引擎已關閉")
-            except Exception as cleanup_error:
-                logger.error(f"資料庫引擎清理失敗: {cleanup_error}")
-            
-            loop.close()
             logger.info("資料庫工作線程已停止")
-    
-    async def _save_database_async_thread_safe(self, data: Dict, SessionLocal):
-        """線程安全的異步資料庫保存方法"""
-        try:
-            logger.debug(f"開始保存檢測結果: {data['task_id']}")
-            
-            if not data.get('objects'):
-                logger.debug("沒有檢測結果需要保存")
+
+    def _save_entries(self, db_service: DatabaseService, entries: List[Tuple[float, Dict[str, Any]]]) -> None:
+        """
+        寫入一批訊息；失敗的訊息不會只計數後丟棄
+
+        - 暫時性錯誤（連線中斷等）：指數退避重試 ASYNC_QUEUE_SAVE_RETRIES 次，
+          仍失敗或停止中時整批寫回磁碟分段，之後（或下次啟動）依入隊順序重放
+        - 永久性錯誤：逐則重試找出有問題的訊息，存為 .bad 檔，其餘照常寫入
+        """
+        rows = []
+        for _, data in entries:
+            rows.extend(self._detection_rows(data))
+        if not rows:
+            return
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                saved = db_service.create_detection_results_sync_bulk(rows, raise_errors=True)
+                self.saved_rows += saved
+                self.last_save_ms = (time.perf_counter() - started) * 1000
+                logger.debug(f"資料庫批次保存: {len(entries)} 則訊息，{saved}/{len(rows)} 筆檢測結果")
                 return
-                
-            # 準備檢測結果資料
-            detection_data = []
-            for obj in data['objects']:
-                detection_data.append({
-                    'frame_number': data['frame_number'],
-                    'timestamp': datetime.fromisoformat(data['timestamp']),
-                    'object_type': obj.get('class', obj.get('class_name', 'unknown')),
-                    'confidence': obj.get('confidence', 0.0),
-                    'bbox_x1': obj.get('bbox', [0, 0, 0, 0])[0] if obj.get('bbox') else 0,
-                    'bbox_y1': obj.get('bbox', [0, 0, 0, 0])[1] if obj.get('bbox') else 0,
-                    'bbox_x2': obj.get('bbox', [0, 0, 0, 0])[2] if obj.get('bbox') else 0,
-                    'bbox_y2': obj.get('bbox', [0, 0, 0, 0])[3] if obj.get('bbox') else 0,
-                    'center_x': obj.get('center', {}).get('x', 0) if obj.get('center') else 0,
-                    'center_y': obj.get('center', {}).get('y', 0) if obj.get('center') else 0
-                })
-            
-            # 創建資料庫服務實例
-            from app.services.new_database_service import DatabaseService
-            db_service = DatabaseService()
-            
-            # 使用線程專用的會話工廠
-            async with SessionLocal() as session:
-                result = await db_service.save_detection_results(
-                    session=session,
-                    task_id=int(data['task_id']), 
-                    detections=detection_data
+            except Exception as save_error:
+                self.save_failures += 1
+                if not is_transient_error(save_error):
+                    logger.error(f"資料庫批次保存失敗（永久性錯誤），逐則重試: {save_error}")
+                    self._save_individually(db_service, entries)
+                    return
+                if attempt >= self.save_retries or not self.running:
+                    logger.error(f"資料庫批次保存失敗，{len(entries)} 則訊息寫回磁碟待重放: {save_error}")
+                    self.database_queue.requeue(entries)
+                    return
+                delay = min(SAVE_BACKOFF_MAX, self.save_backoff * (2 ** attempt))
+                attempt += 1
+                self.save_retries_used += 1
+                logger.warning(f"資料庫批次保存失敗，{delay:.1f} 秒後重試（第 {attempt} 次）: {save_error}")
+                if self._stop_event.wait(delay):
+                    self.database_queue.requeue(entries)
+                    return
+
+    def _save_individually(self, db_service: DatabaseService, entries: List[Tuple[float, Dict[str, Any]]]) -> None:
+        failed = []
+        for index, entry in enumerate(entries):
+            rows = self._detection_rows(entry[1])
+            try:
+                self.saved_rows += db_service.create_detection_results_sync_bulk(rows, raise_errors=True)
+            except Exception as save_error:
+                if is_transient_error(save_error):
+                    # 逐則重試期間資料庫中斷：剩下的訊息寫回磁碟
+                    self.database_queue.requeue(entries[index:])
+                    break
+                failed.append(entry)
+                logger.error(f"檢測結果訊息無法寫入（任務 {entry[1].get('task_id')}，影格 {entry[1].get('frame_number')}）: {save_error}")
+        if failed:
+            path = self.database_queue.quarantine(failed)
+            if path is not None:
+                logger.error(f"{len(failed)} 則無法寫入的訊息已保存至 {path}")
+
+    @staticmethod
+    def _detection_rows(data: Dict) -> List[Dict[str, Any]]:
+        """將一則隊列訊息轉成檢測結果資料列"""
+        if not data.get('objects'):
+            return []
+        frame_timestamp = datetime.fromisoformat(data['timestamp'])
+        rows = []
+        for obj in data['objects']:
+            bbox = obj.get('bbox') or [0, 0, 0, 0]
+            center = obj.get('center') or {}
+            rows.append({
+                'task_id': int(data['task_id']),
+                'tracker_id': obj.get('tracker_id', obj.get('track_id')),
+                'frame_number': data['frame_number'],
+                'frame_timestamp': frame_timestamp,
+                'object_type': obj.get('class', obj.get('class_name', 'unknown')),
+                'confidence': obj.get('confidence', 0.0),
+                'bbox_x1': bbox[0],
+                'bbox_y1': bbox[1],
+                'bbox_x2': bbox[2],
+                'bbox_y2': bbox[3],
+                'center_x': center.get('x', 0),
+                'center_y': center.get('y', 0)
+            })
+        return rows
+
+    async def _push_websocket_batch(self, batch: List[Dict]):
+        """異步執行一批 WebSocket 推送"""
+        for data in batch:
+            try:
+                await push_yolo_detection(
+                    task_id=data['task_id'],
+                    frame_number=data['frame_number'],
+                    detections=data['detections'],
+                    processing_time=data['processing_time']
                 )
-                logger.debug(f"檢測結果保存成功: {result}")
-                return result
-            
-        except Exception as e:
-            logger.error(f"資料庫保存異步執行失敗: {e}")
-            raise
-            logger.info("資料庫工作線程已結束")
-    
-    async def _push_websocket_async(self, data: Dict):
-        """異步執行 WebSocket 推送"""
-        try:
-            await push_yolo_detection(
-                task_id=data['task_id'],
-                frame_number=data['frame_number'],
-                detections=data['detections'],
-                processing_time=data['processing_time']
-            )
-        except Exception as e:
-            logger.error(f"WebSocket 推送異步執行失敗: {e}")
-            raise
+            except Exception as e:
+                self.push_failures += 1
+                logger.error(f"WebSocket 推送異步執行失敗: {e}")
+
+    def get_queue_stats(self) -> Dict[str, Any]:
+        """隊列深度、等待時間、吞吐量與工作線程統計"""
+        return {
+            "running": self.running,
+            "batch_size": self.batch_size,
+            "batch_wait_ms": self.batch_wait * 1000,
+            "websocket": {
+                **self.websocket_queue.get_stats(),
+                "pushed_messages": self.pushed_messages,
+                "push_failures": self.push_failures,
+            },
+            "database": {
+                **self.database_queue.get_stats(),
+                "saved_rows": self.saved_rows,
+                "save_failures": self.save_failures,
+                "save_retries": self.save_retries_used,
+                "last_save_ms": round(self.last_save_ms, 2),
+            },
+        }
 
 # 全局隊列管理器實例
 _queue_manager = None
@@ -15,6 +15,8 @@ from dataclasses import dataclass, field
 from sqlalchemy.orm import Session
 from app.models.database import DataSource
 from app.core.database import SyncSessionLocal
+from app.services.capture_pacing import CapturePacer
+from app.services.preview_encoder import DEFAULT_TIER, get_preview_encoder_service
 from datetime import datetime
 
 
@@ -32,6 +34,7 @@ class CameraSession:
     _running: bool = field(default=False, init=False)
     _lock: threading.Lock = field(default_factory=threading.Lock, init=False)
     _latest_frame: Optional[Tuple[float, any]] = field(default=None, init=False)  # (ts, frame)
+    _pacer: Optional[CapturePacer] = field(default=None, init=False)
 
     def start(self):
         if self._running:
@@ -90,6 +93,7 @@ class CameraSession:
         self.width = int(self._cap.get(cv2.CAP_PROP_FRAME_WIDTH) or self.width or 640)
         self.height = int(self._cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or self.height or 480)
         self.fps = float(self._cap.get(cv2.CAP_PROP_FPS) or self.fps or 30.0)
+        self._pacer = CapturePacer(self.fps)
         
         self._running = True
         self._thread = threading.Thread(target=self._loop, daemon=True)
@@ -99,9 +103,19 @@ class CameraSession:
         consecutive_failures = 0
         max_failures = 10  # 連續失敗10次後停止
         
+        pacer = self._pacer or CapturePacer(self.fps)
         while self._running:
             try:
-                ok, frame = self._cap.read()
+                # grab() 本身阻塞到下一幀，只在需要時 retrieve() 解碼
+                pacer.begin()
+                ok = self._cap.grab()
+                pacer.record_grab()
+                frame = None
+                if ok and pacer.frame_due():
+                    ok, frame = self._cap.retrieve()
+                elif ok:
+                    pacer.throttle()
+                    continue
                 if ok and frame is not None:
                     consecutive_failures = 0  # 重置失敗計數
                     ts = time.time()
@@ -114,8 +128,8 @@ class CameraSession:
                         self._running = False
                         break
                     
-                # 控制抓取頻率（避免 CPU 過高）
-                time.sleep(0.03)  # 約30 FPS
+                # 只補足裝置幀間隔的剩餘時間，不再固定 sleep(0.03)
+                pacer.throttle()
                 
             except Exception as e:
                 consecutive_failures += 1
@@ -126,22 +140,28 @@ class CameraSession:
                     break
                 time.sleep(0.1)  # 錯誤時等待較長時間
 
-    def get_latest_jpeg(self) -> Optional[bytes]:
+    @property
+    def preview_source_id(self) -> str:
+        return f"camera_session_{self.task_id}"
+
+    def get_latest_jpeg(self, tier: str = DEFAULT_TIER) -> Optional[bytes]:
+        """最新影格的 JPEG（同一影格只編碼一次，由預覽編碼服務快取）"""
         with self._lock:
             data = self._latest_frame
         if not data:
             return None
-        _, frame = data
-        ok, buf = cv2.imencode('.jpg', frame)
-        if not ok:
-            return None
-        return buf.tobytes()
+        ts, frame = data
+        return get_preview_encoder_service().encode(self.preview_source_id, ts, frame, tier)
 
     def get_latest_frame(self) -> Optional[Tuple[float, any]]:
         """獲取最新的原始影格數據（用於 YOLO 檢測）"""
         with self._lock:
             return self._latest_frame
 
+    def get_pacing_stats(self) -> Optional[Dict[str, any]]:
+        """擷取節奏統計（實際讀取耗時、解碼/略過影格數、量測幀率）"""
+        return self._pacer.get_stats() if self._pacer else None
+
     def stop(self):
         self._running = False
         if self._thread and self._thread.is_alive():
@@ -152,6 +172,7 @@ class CameraSession:
             except Exception:
                 pass
         self._cap = None
+        get_preview_encoder_service().release(self.preview_source_id)
 
 
 class CameraManager:
@@ -468,7 +489,8 @@ class CameraManager:
                     'width': s.width,
                     'height': s.height,
                     'fps': s.fps,
-                    'uptime_sec': round(time.time() - s.started_at, 1)
+                    'uptime_sec': round(time.time() - s.started_at, 1),
+                    'pacing': s.get_pacing_stats(),
                 })
         return out
 
@@ -7,15 +7,18 @@ import asyncio
 import cv2
 import threading
 import time
+from collections import deque
 from datetime import datetime
-from typing import Dict, List, Callable, Optional, Tuple, Any, Set
-from dataclasses import dataclass
+from typing import Deque, Dict, List, Callable, Optional, Tuple, Any, Set
+from dataclasses import dataclass, field
 import numpy as np
 from concurrent.futures import ThreadPoolExecutor
 import weakref
 from enum import Enum
 
+from app.core.config import settings
 from app.core.logger import detection_logger
+from app.services.capture_pacing import CapturePacer
 
 
 class StreamStatus(Enum):
@@ -26,36 +29,320 @@ class StreamStatus(Enum):
     ERROR = "error"
 
 
+class FrameBuffer:
+    """
+    池化的影格緩衝區（顯式引用計數）
+
+    擷取執行緒持有第一個引用；需要在回呼結束後繼續使用影格的消費者
+    呼叫 retain()，用完呼叫 release()。計數歸零時緩衝區交回所屬的池。
+    """
+
+    __slots__ = ("array", "_pool", "_refs", "_lock")
+
+    def __init__(self, array: np.ndarray, pool: Optional["FrameBufferPool"] = None):
+        self.array = array
+        self._pool = pool
+        self._refs = 1
+        self._lock = threading.Lock()
+
+    @property
+    def refcount(self) -> int:
+        return self._refs
+
+    def retain(self) -> None:
+        with self._lock:
+            if self._refs <= 0:
+                raise RuntimeError("影格緩衝區已釋放，無法再取得引用")
+            self._refs += 1
+
+    def release(self) -> None:
+        with self._lock:
+            if self._refs <= 0:
+                return
+            self._refs -= 1
+            recycled = self._refs == 0
+        if recycled and self._pool is not None:
+            self._pool._recycle(self)
+
+
+class FrameBufferPool:
+    """
+    預先配置的影格緩衝池
+
+    cap.read() 直接寫入池中的緩衝區，取代每幀 frame.copy()。
+    緩衝區是否可重用只看 FrameBuffer 的顯式引用計數：
+    需要在回呼之後保留影格的消費者必須 retain() / release()，
+    引用計數歸零後緩衝區立即回到閒置佇列供下一幀覆寫。
+    """
+
+    def __init__(self, size: int):
+        self.size = max(1, size)
+        self._shape: Optional[Tuple[int, ...]] = None
+        self._dtype = np.dtype(np.uint8)
+        self._free: Deque[FrameBuffer] = deque()
+        self._lock = threading.Lock()
+        self.allocated = 0
+        self.reused = 0
+        self.discarded = 0
+
+    def acquire(self, shape: Tuple[int, ...], dtype: Any = np.uint8) -> FrameBuffer:
+        """取得一個可寫入的緩衝區（引用計數為 1）"""
+        shape = tuple(shape)
+        dtype = np.dtype(dtype)
+        with self._lock:
+            if shape != self._shape or dtype != self._dtype:
+                # 解析度改變：舊緩衝區不再回收
+                self._shape = shape
+                self._dtype = dtype
+                self._free.clear()
+            if self._free:
+                buffer = self._free.popleft()
+                buffer._refs = 1
+                self.reused += 1
+                return buffer
+            self.allocated += 1
+        return FrameBuffer(np.empty(shape, dtype=dtype), self)
+
+    def reset(self) -> None:
+        """丟棄所有緩衝區（下次 acquire 依新形狀配置）"""
+        with self._lock:
+            self._shape = None
+            self._free.clear()
+
+    def _recycle(self, buffer: FrameBuffer) -> None:
+        with self._lock:
+            if buffer.array.shape != self._shape or buffer.array.dtype != self._dtype:
+                return
+            if len(self._free) >= self.size:
+                # 閒置緩衝區已滿（例如消費者暫時持有較多影格），多出的交給 GC
+                self.discarded += 1
+                return
+            self._free.append(buffer)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": self.size,
+                "shape": self._shape,
+                "free": len(self._free),
+                "allocated": self.allocated,
+                "reused": self.reused,
+                "discarded": self.discarded,
+            }
+
+
 @dataclass
 class FrameData:
-    """影像框架數據"""
+    """
+    影像框架數據
+
+    frame 是共享緩衝區的唯讀視圖，所有消費者看到同一份像素；
+    需要修改影像時呼叫 writable_frame() 取得副本（copy-on-write），
+    需要在回呼之後保留影格時以 retain() / release() 配對管理引用。
+    """
     frame: np.ndarray
     timestamp: datetime
     frame_number: int
     camera_id: str
+    buffer: Optional[FrameBuffer] = field(default=None, repr=False, compare=False)
+
+    def retain(self) -> "FrameData":
+        """取得一個引用（回傳自身，方便直接放進佇列）"""
+        if self.buffer is not None:
+            self.buffer.retain()
+        return self
+
+    def release(self) -> None:
+        """釋放 retain() 取得的引用"""
+        if self.buffer is not None:
+            self.buffer.release()
+
+    def writable_frame(self) -> np.ndarray:
+        """回傳可修改的影像副本"""
+        return self.frame.copy()
+
+
+class DropPolicy(Enum):
+    """消費者信箱滿時的處理策略"""
+    LATEST = "latest"            # 只保留最新一幀
+    DROP_OLDEST = "drop_oldest"  # 丟棄信箱中最舊的一幀
+    BLOCK = "block"              # 擷取線程等待空位，逾時則丟棄新影格
 
 
 class StreamConsumer:
-    """流消費者基類"""
+    """
+    流消費者基類
+
+    每個消費者有自己的有界信箱與工作線程：擷取線程只把影格放進信箱
+    （取得一個緩衝區引用），回呼在消費者自己的線程執行，
+    慢的消費者只會讓自己掉幀，不會拖慢攝影機擷取與其他消費者。
+    """
     
-    def __init__(self, consumer_id: str, callback: Callable[[FrameData], None]):
+    def __init__(
+        self,
+        consumer_id: str,
+        callback: Callable[[FrameData], None],
+        policy: DropPolicy | str = DropPolicy.LATEST,
+        maxsize: Optional[int] = None,
+        block_timeout: Optional[float] = None,
+        max_fps: Optional[float] = None,
+    ):
         self.consumer_id = consumer_id
         self.callback = callback
+        self.policy = DropPolicy(policy)
+        if self.policy is DropPolicy.LATEST:
+            maxsize = 1
+        self.maxsize = max(1, maxsize or settings.stream_consumer_queue_size)
+        self.block_timeout = (
+            settings.stream_consumer_block_timeout if block_timeout is None else block_timeout
+        )
+        # 消費者需要的最高幀率（None 表示跟隨攝影機），攝影機流依此降低解碼幀率
+        self.max_fps = max_fps if max_fps and max_fps > 0 else None
         self.active = True
         self.last_frame_time = None
+        self._last_offer = 0.0
+        
+        self._mailbox: Deque[FrameData] = deque()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        
+        # 統計
+        self.received = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self.last_frame_number = 0
+        self._lag_last = 0.0
+        self._lag_max = 0.0
+        self._lag_total = 0.0
+        self._callback_last = 0.0
+        self._callback_max = 0.0
+    
+    def start(self):
+        """啟動消費者工作線程"""
+        with self._cond:
+            if self._thread is not None or not self.active:
+                return
+            self._thread = threading.Thread(
+                target=self._run, name=f"consumer-{self.consumer_id}", daemon=True
+            )
+        self._thread.start()
+    
+    def offer(self, frame_data: FrameData) -> bool:
+        """由擷取線程呼叫：依丟棄策略把影格放進信箱，回傳是否已排入"""
+        if not self.active:
+            return False
+        
+        if self.max_fps is not None:
+            # 其他消費者需要較高幀率時，依自己的 max_fps 略過多餘影格
+            now = time.perf_counter()
+            if now - self._last_offer < 0.75 / self.max_fps:
+                self.rate_limited += 1
+                return False
+            self._last_offer = now
+        
+        frame_data.retain()
+        dropped: Optional[FrameData] = None
+        with self._cond:
+            self.received += 1
+            if len(self._mailbox) >= self.maxsize:
+                if self.policy is DropPolicy.BLOCK:
+                    self._cond.wait_for(
+                        lambda: len(self._mailbox) < self.maxsize or not self.active,
+                        timeout=self.block_timeout,
+                    )
+                    if not self.active or len(self._mailbox) >= self.maxsize:
+                        dropped = frame_data
+                else:
+                    dropped = self._mailbox.popleft()
+            if dropped is not None:
+                self.dropped += 1
+            if dropped is not frame_data:
+                self._mailbox.append(frame_data)
+                self._cond.notify_all()
+        
+        if dropped is not None:
+            dropped.release()
+        return dropped is not frame_data
+    
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._mailbox or not self.active)
+                if not self.active:
+                    break
+                frame_data = self._mailbox.popleft()
+                self._cond.notify_all()
+            try:
+                self.consume_frame(frame_data)
+            finally:
+                frame_data.release()
     
     def consume_frame(self, frame_data: FrameData):
         """消費影像框架"""
         if self.active:
+            lag = max(0.0, (datetime.now() - frame_data.timestamp).total_seconds())
+            start = time.perf_counter()
             try:
                 self.callback(frame_data)
                 self.last_frame_time = datetime.now()
             except Exception as e:
+                self.errors += 1
                 detection_logger.error(f"消費者 {self.consumer_id} 處理影像失敗: {e}")
+            elapsed = time.perf_counter() - start
+            
+            self.delivered += 1
+            self.last_frame_number = frame_data.frame_number
+            self._lag_last = lag
+            self._lag_max = max(self._lag_max, lag)
+            self._lag_total += lag
+            self._callback_last = elapsed
+            self._callback_max = max(self._callback_max, elapsed)
     
-    def stop(self):
-        """停止消費"""
-        self.active = False
+    def stop(self, timeout: float = 1.0):
+        """停止消費：喚醒工作線程並釋放信箱中尚未處理的影格"""
+        with self._cond:
+            self.active = False
+            pending = list(self._mailbox)
+            self._mailbox.clear()
+            self._cond.notify_all()
+            thread = self._thread
+        for frame_data in pending:
+            frame_data.release()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=timeout)
+    
+    def get_stats(self, stream_frame_number: Optional[int] = None) -> Dict[str, Any]:
+        """信箱深度、掉幀數與延遲"""
+        with self._cond:
+            queue_depth = len(self._mailbox)
+        delivered = self.delivered
+        return {
+            "policy": self.policy.value,
+            "maxsize": self.maxsize,
+            "max_fps": self.max_fps,
+            "active": self.active,
+            "queue_depth": queue_depth,
+            "received": self.received,
+            "delivered": delivered,
+            "dropped": self.dropped,
+            "rate_limited": self.rate_limited,
+            "errors": self.errors,
+            "frames_behind": (
+                max(0, stream_frame_number - self.last_frame_number)
+                if stream_frame_number is not None and delivered else None
+            ),
+            "lag_ms": {
+                "last": self._lag_last * 1000,
+                "avg": self._lag_total / delivered * 1000 if delivered else 0.0,
+                "max": self._lag_max * 1000,
+            },
+            "callback_ms": {
+                "last": self._callback_last * 1000,
+                "max": self._callback_max * 1000,
+            },
+        }
 
 
 class CameraStream:
@@ -69,8 +356,10 @@ class CameraStream:
         self.thread: Optional[threading.Thread] = None
         self.consumers: Dict[str, StreamConsumer] = {}
         self.current_frame: Optional[FrameData] = None
+        self.frame_pool = FrameBufferPool(settings.frame_pool_size)
         self.frame_count = 0
         self.fps = 30.0
+        self.pacer = CapturePacer(self.fps)
         self.resolution = (640, 480)
         self.last_error: Optional[str] = None
         self.start_time: Optional[datetime] = None
@@ -111,6 +400,8 @@ class CameraStream:
             
             self.resolution = (actual_width, actual_height)
             self.fps = actual_fps if actual_fps > 0 else 30.0
+            self.pacer.set_device_fps(self.fps)
+            self._update_target_fps()
             
             detection_logger.info(f"攝影機初始化成功: {actual_width}x{actual_height}@{self.fps}fps")
             
@@ -141,11 +432,12 @@ class CameraStream:
         if self.thread and self.thread.is_alive():
             self.thread.join(timeout=2.0)
         
-        # 停止所有消費者
+        # 停止所有消費者（在鎖外等待工作線程結束）
         with self._lock:
-            for consumer in self.consumers.values():
-                consumer.stop()
+            consumers = list(self.consumers.values())
             self.consumers.clear()
+        for consumer in consumers:
+            consumer.stop()
         
         self._cleanup()
     
@@ -186,7 +478,11 @@ class CameraStream:
             self.cap.release()
             self.cap = None
         self.thread = None
-        self.current_frame = None
+        with self._lock:
+            previous, self.current_frame = self.current_frame, None
+        if previous is not None:
+            previous.release()
+        self.frame_pool.reset()
     
     def _stream_loop(self):
         """主要的流讀取循環"""
@@ -196,7 +492,31 @@ class CameraStream:
         
         while not self._stop_event.is_set() and self.cap and self.cap.isOpened():
             try:
-                ret, frame = self.cap.read()
+                # grab() 阻塞到下一幀；只有消費者需要的影格才 retrieve() 解碼
+                self.pacer.begin()
+                grabbed = self.cap.grab()
+                self.pacer.record_grab()
+                if grabbed and not self.pacer.frame_due():
+                    consecutive_failures = 0
+                    self.pacer.throttle()
+                    continue
+                
+                ret = False
+                if grabbed:
+                    buffer = self.frame_pool.acquire(
+                        (self.resolution[1], self.resolution[0], 3)
+                    )
+                    ret, frame = self.cap.retrieve(buffer.array)
+                    if ret and frame is not buffer.array:
+                        # 實際影像尺寸與緩衝區不同，OpenCV 另外配置了陣列：
+                        # 以實際尺寸重設緩衝池，這一幀直接包裝使用
+                        buffer.release()
+                        self.frame_pool.reset()
+                        self.resolution = (frame.shape[1], frame.shape[0])
+                        buffer = FrameBuffer(frame)
+                    del frame
+                    if not ret:
+                        buffer.release()
                 if not ret:
                     consecutive_failures += 1
                     
@@ -220,37 +540,52 @@ class CameraStream:
                 consecutive_failures = 0
                 self.frame_count += 1
                 
-                # 創建框架數據
+                # 創建框架數據：唯讀視圖，不再每幀複製
+                view = buffer.array.view()
+                view.flags.writeable = False
                 frame_data = FrameData(
-                    frame=frame.copy(),
+                    frame=view,
                     timestamp=datetime.now(),
                     frame_number=self.frame_count,
-                    camera_id=self.camera_id
+                    camera_id=self.camera_id,
+                    buffer=buffer,
                 )
+                del view
                 
-                # 更新當前框架（線程安全）
+                # 更新當前框架（線程安全），current_frame 自行持有一個引用
+                frame_data.retain()
                 with self._lock:
-                    self.current_frame = frame_data
+                    previous, self.current_frame = self.current_frame, frame_data
+                if previous is not None:
+                    previous.release()
                 
-                # 分發給所有消費者
+                # 分發給所有消費者：只放進各自的信箱，不在鎖內執行回呼
                 with self._lock:
-                    active_consumers = []
-                    for consumer in self.consumers.values():
-                        if consumer.active:
-                            try:
-                                consumer.consume_frame(frame_data)
-                                active_consumers.append(consumer)
-                            except Exception as e:
-                                detection_logger.error(f"消費者 {consumer.consumer_id} 處理幀失敗: {e}")
-                                consumer.active = False  # 標記為非活躍
-                        else:
-                            detection_logger.debug(f"移除非活躍消費者: {consumer.consumer_id}")
-                    
-                    # 清理非活躍消費者
-                    self.consumers = {cid: c for cid, c in self.consumers.items() if c.active}
+                    consumers = list(self.consumers.values())
+                inactive = []
+                for consumer in consumers:
+                    if consumer.active:
+                        consumer.offer(frame_data)
+                    else:
+                        inactive.append(consumer)
+                
+                # 清理非活躍消費者
+                if inactive:
+                    with self._lock:
+                        for consumer in inactive:
+                            if self.consumers.get(consumer.consumer_id) is consumer:
+                                detection_logger.debug(f"移除非活躍消費者: {consumer.consumer_id}")
+                                del self.consumers[consumer.consumer_id]
+                        self._update_target_fps()
+                    for consumer in inactive:
+                        consumer.stop()
+                
+                # 分發完成，釋放擷取迴圈持有的引用
+                frame_data.release()
+                del frame_data
                 
-                # 控制幀率
-                time.sleep(1.0 / self.fps)
+                # 只補足裝置幀間隔的剩餘時間（相機阻塞時不再額外睡一幀）
+                self.pacer.throttle()
                 
             except cv2.error as e:
                 detection_logger.error(f"OpenCV 錯誤: {e}")
@@ -279,10 +614,26 @@ class CameraStream:
         
         detection_logger.info(f"攝影機流循環結束: {self.camera_id}")
     
+    def _update_target_fps(self):
+        """目標幀率 = 消費者需求的最大值；任一消費者未限制（或沒有消費者）時跟隨裝置幀率"""
+        rates = [consumer.max_fps for consumer in self.consumers.values() if consumer.active]
+        if not rates or any(rate is None for rate in rates):
+            self.pacer.set_target_fps(None)
+        else:
+            self.pacer.set_target_fps(max(rates))
+    
     def get_latest_frame(self) -> Optional[FrameData]:
-        """獲取最新的幀數據"""
+        """獲取最新的幀數據（未 retain，只適合檢查是否有影格或讀取 metadata）"""
         with self._lock:
             return self.current_frame
+
+    def retain_latest_frame(self) -> Optional[FrameData]:
+        """獲取最新的幀數據並取得一個引用，呼叫端讀完像素後必須 release()"""
+        with self._lock:
+            if self.current_frame is None:
+                return None
+            # current_frame 持有引用，鎖內 retain 不會遇到已回收的緩衝區
+            return self.current_frame.retain()
     
     def add_consumer(self, consumer: StreamConsumer) -> bool:
         """添加流消費者"""
@@ -292,23 +643,36 @@ class CameraStream:
                 return False
             
             self.consumers[consumer.consumer_id] = consumer
-            detection_logger.info(f"新增消費者: {consumer.consumer_id} 到攝影機 {self.camera_id}")
-            
-            # 如果有當前影像，立即發送
-            if self.current_frame and consumer.active:
-                consumer.consume_frame(self.current_frame)
-            
-            return True
+            self._update_target_fps()
+            current_frame = self.current_frame
+            if current_frame is not None:
+                current_frame.retain()
+        
+        consumer.start()
+        detection_logger.info(
+            f"新增消費者: {consumer.consumer_id} 到攝影機 {self.camera_id} (策略: {consumer.policy.value})"
+        )
+        
+        # 如果有當前影像，立即發送
+        if current_frame is not None:
+            try:
+                if consumer.active:
+                    consumer.offer(current_frame)
+            finally:
+                current_frame.release()
+        
+        return True
     
     def remove_consumer(self, consumer_id: str) -> bool:
         """移除流消費者"""
         with self._lock:
-            if consumer_id in self.consumers:
-                consumer = self.consumers.pop(consumer_id)
-                consumer.stop()
-                detection_logger.info(f"移除消費者: {consumer_id} 從攝影機 {self.camera_id}")
-                return True
+            consumer = self.consumers.pop(consumer_id, None)
+            self._update_target_fps()
+        if consumer is None:
             return False
+        consumer.stop()
+        detection_logger.info(f"移除消費者: {consumer_id} 從攝影機 {self.camera_id}")
+        return True
 
     def consumer_count(self) -> int:
         """目前活躍消費者數量"""
@@ -317,6 +681,8 @@ class CameraStream:
     
     def get_stats(self) -> Dict[str, Any]:
         """獲取流統計信息"""
+        with self._lock:
+            consumers = dict(self.consumers)
         return {
             "camera_id": self.camera_id,
             "device_index": self.device_index,
@@ -324,11 +690,16 @@ class CameraStream:
             "frame_count": self.frame_count,
             "fps": self.fps,
             "resolution": self.resolution,
-            "consumers": list(self.consumers.keys()),
-            "consumer_count": len(self.consumers),
+            "consumers": list(consumers.keys()),
+            "consumer_count": len(consumers),
+            "consumer_stats": {
+                cid: consumer.get_stats(self.frame_count) for cid, consumer in consumers.items()
+            },
             "last_error": self.last_error,
             "start_time": self.start_time.isoformat() if self.start_time else None,
-            "uptime_seconds": (datetime.now() - self.start_time).total_seconds() if self.start_time else 0
+            "uptime_seconds": (datetime.now() - self.start_time).total_seconds() if self.start_time else 0,
+            "frame_pool": self.frame_pool.get_stats(),
+            "pacing": self.pacer.get_stats(),
         }
 
 
@@ -473,6 +844,14 @@ class CameraStreamManager:
         if canonical_id not in self.streams:
             return None
         return self.streams[canonical_id].get_latest_frame()
+
+    def retain_latest_frame(self, camera_id: str) -> Optional[FrameData]:
+        """獲取攝影機的最新幀數據並 retain，呼叫端負責 release()"""
+        canonical_id = self._resolve_camera_id(camera_id)
+        stream = self.streams.get(canonical_id)
+        if stream is None:
+            return None
+        return stream.retain_latest_frame()
     
     def is_stream_running(self, camera_id: str) -> bool:
         """檢查指定攝影機流是否在運行"""
@@ -4,7 +4,6 @@ from typing import Optional
 import av
 from aiortc import MediaStreamTrack
 from aiortc.mediastreams import MediaStreamError
-import numpy as np
 
 from app.services.camera_stream_manager import (
     FrameData,
@@ -22,7 +21,7 @@ class CameraStreamTrack(MediaStreamTrack):
         super().__init__()
         self.camera_id = camera_id
         self._loop = asyncio.get_running_loop()
-        self._queue: asyncio.Queue[Optional[np.ndarray]] = asyncio.Queue(maxsize=2)
+        self._queue: asyncio.Queue[Optional[FrameData]] = asyncio.Queue(maxsize=2)
         self._consumer_id = f"webrtc_{camera_id}_{id(self)}"
         self._consumer: Optional[StreamConsumer] = None
         self._closed = False
@@ -32,25 +31,30 @@ class CameraStreamTrack(MediaStreamTrack):
             if self._closed:
                 return
 
+            # 共享緩衝區的唯讀影格，只取得引用不複製；送進編碼器後才釋放
+            frame_data.retain()
+
             def _deliver() -> None:
                 if self._closed:
+                    frame_data.release()
                     return
                 try:
                     if self._queue.full():
                         try:
-                            self._queue.get_nowait()
+                            dropped = self._queue.get_nowait()
+                            if dropped is not None:
+                                dropped.release()
                         except asyncio.QueueEmpty:
                             pass
-                    # 使用副本避免與其他消費者共享同一個 numpy 陣列
-                    self._queue.put_nowait(frame_data.frame.copy())
+                    self._queue.put_nowait(frame_data)
                 except asyncio.QueueFull:
-                    pass
+                    frame_data.release()
 
             try:
                 self._loop.call_soon_threadsafe(_deliver)
             except RuntimeError:
                 # 事件迴圈可能已經關閉
-                pass
+                frame_data.release()
 
         self._consumer = StreamConsumer(self._consumer_id, _on_frame)
         added = camera_stream_manager.add_consumer(self.camera_id, self._consumer)
@@ -62,12 +66,16 @@ class CameraStreamTrack(MediaStreamTrack):
         if self._closed:
             raise MediaStreamError("Stream closed")
 
-        frame = await self._queue.get()
-        if frame is None:
+        frame_data = await self._queue.get()
+        if frame_data is None:
             raise MediaStreamError("Stream closed")
 
-        pts, time_base = await self.next_timestamp()
-        video_frame = av.VideoFrame.from_ndarray(frame, format="bgr24")
+        try:
+            pts, time_base = await self.next_timestamp()
+            # from_ndarray 會把像素複製進 AVFrame，之後即可歸還緩衝區
+            video_frame = av.VideoFrame.from_ndarray(frame_data.frame, format="bgr24")
+        finally:
+            frame_data.release()
         video_frame = video_frame.reformat(format="yuv420p")
         video_frame.pts = pts
         video_frame.time_base = time_base
@@ -93,7 +101,9 @@ class CameraStreamTrack(MediaStreamTrack):
     def _signal_stop(self) -> None:
         try:
             while True:
-                self._queue.get_nowait()
+                pending = self._queue.get_nowait()
+                if pending is not None:
+                    pending.release()
         except asyncio.QueueEmpty:
             pass
 
@@ -0,0 +1,118 @@
+"""
+擷取節奏控制
+
+cap.read() / cap.grab() 本身就會阻塞到下一幀，讀取後再固定 sleep(1/fps)
+會讓實際幀率減半並多出最多一幀的延遲。CapturePacer 改為：
+- 量測每次 grab 的實際耗時，只補足到裝置幀間隔的剩餘時間
+  （相機本身會阻塞時幾乎不睡；不會阻塞的來源仍維持裝置幀率）
+- 依消費者需求維持目標幀率（可低於裝置幀率），
+  不需要的影格只 grab() 不 retrieve()，省下解碼成本
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+DEFAULT_DEVICE_FPS = 30.0
+
+
+class CapturePacer:
+    """單一擷取迴圈的節奏控制器"""
+
+    def __init__(self, device_fps: float = DEFAULT_DEVICE_FPS, target_fps: Optional[float] = None,
+                 smoothing: float = 0.1):
+        self.device_fps = DEFAULT_DEVICE_FPS
+        self.target_fps: Optional[float] = None
+        self.smoothing = smoothing
+        self.set_device_fps(device_fps)
+        self.set_target_fps(target_fps)
+
+        self._lock = threading.Lock()
+        self._loop_start = time.perf_counter()
+        self._last_decode = 0.0
+        self._decode_times: Deque[float] = deque(maxlen=120)
+        self.read_time = 0.0
+        self.grabbed = 0
+        self.decoded = 0
+        self.skipped = 0
+        self.sleep_total = 0.0
+
+    def set_device_fps(self, fps: Optional[float]) -> None:
+        self.device_fps = fps if fps and fps > 0 else DEFAULT_DEVICE_FPS
+
+    def set_target_fps(self, fps: Optional[float]) -> None:
+        """設定目標幀率；None 或不小於裝置幀率表示每幀都解碼"""
+        if fps is None or fps <= 0 or fps >= self.device_fps:
+            self.target_fps = None
+        else:
+            self.target_fps = fps
+
+    @property
+    def device_interval(self) -> float:
+        return 1.0 / self.device_fps
+
+    @property
+    def target_interval(self) -> float:
+        return 1.0 / (self.target_fps or self.device_fps)
+
+    def begin(self) -> None:
+        """每次迴圈開始（grab 之前）呼叫"""
+        self._loop_start = time.perf_counter()
+
+    def record_grab(self) -> None:
+        """grab()/read() 返回後呼叫，以指數平滑記錄實際讀取耗時"""
+        elapsed = time.perf_counter() - self._loop_start
+        with self._lock:
+            self.grabbed += 1
+            if self.grabbed == 1:
+                self.read_time = elapsed
+            else:
+                self.read_time += self.smoothing * (elapsed - self.read_time)
+
+    def frame_due(self) -> bool:
+        """這一幀是否需要解碼；容許半個裝置幀間隔的誤差，避免與裝置幀率互相拍頻"""
+        now = time.perf_counter()
+        with self._lock:
+            if self.target_fps is not None and (
+                now - self._last_decode < self.target_interval - self.device_interval / 2
+            ):
+                self.skipped += 1
+                return False
+            self._last_decode = now
+            self.decoded += 1
+            self._decode_times.append(now)
+            return True
+
+    def throttle(self) -> float:
+        """只睡到本次迴圈滿一個裝置幀間隔為止，回傳實際睡眠秒數"""
+        remaining = self.device_interval - (time.perf_counter() - self._loop_start)
+        if remaining <= 0:
+            return 0.0
+        time.sleep(remaining)
+        with self._lock:
+            self.sleep_total += remaining
+        return remaining
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            decode_times = list(self._decode_times)
+            stats = {
+                "device_fps": self.device_fps,
+                "target_fps": self.target_fps or self.device_fps,
+                "read_time_ms": self.read_time * 1000,
+                "grabbed": self.grabbed,
+                "decoded": self.decoded,
+                "skipped": self.skipped,
+                "sleep_total_s": self.sleep_total,
+            }
+        if len(decode_times) >= 2 and decode_times[-1] > decode_times[0]:
+            stats["measured_fps"] = (len(decode_times) - 1) / (decode_times[-1] - decode_times[0])
+        else:
+            stats["measured_fps"] = 0.0
+        return stats
+
+
+__all__ = ["CapturePacer", "DEFAULT_DEVICE_FPS"]
@@ -0,0 +1,203 @@
+"""
+欄位式偵測結果
+
+推論熱路徑只保留 NumPy 陣列（xyxy / confidence / class_id / track_id），
+中心點與面積在建構時一次向量化計算；
+逐框的 dict 只在 API 回應或 WebSocket 推送真正需要 JSON 時才建立，並快取結果。
+"""
+
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import YOLO_CLASSES
+
+NO_TRACK_ID = -1
+
+
+@dataclass
+class DetectionResult:
+    """單張影像的偵測結果（欄位式）"""
+    xyxy: np.ndarray                      # (N, 4) float32
+    confidence: np.ndarray                # (N,) float32
+    class_id: np.ndarray                  # (N,) int64
+    track_id: Optional[np.ndarray] = None  # (N,) int64，無追蹤 ID 為 -1
+    names: Mapping[int, str] = field(default_factory=lambda: YOLO_CLASSES)
+    image_shape: Tuple[int, ...] = ()
+    inference_time: float = 0.0
+    timestamp: float = field(default_factory=time.time)
+
+    def __post_init__(self):
+        self.xyxy = np.asarray(self.xyxy, dtype=np.float32).reshape(-1, 4)
+        self.confidence = np.asarray(self.confidence, dtype=np.float32).reshape(-1)
+        self.class_id = np.asarray(self.class_id, dtype=np.int64).reshape(-1)
+        if self.track_id is not None:
+            self.track_id = np.asarray(self.track_id, dtype=np.int64).reshape(-1)
+        # 一次向量化計算中心點與面積
+        self.center = np.column_stack(
+            ((self.xyxy[:, 0] + self.xyxy[:, 2]) / 2, (self.xyxy[:, 1] + self.xyxy[:, 3]) / 2)
+        ).astype(np.float32)
+        self.area = (
+            (self.xyxy[:, 2] - self.xyxy[:, 0]) * (self.xyxy[:, 3] - self.xyxy[:, 1])
+        ).astype(np.float32)
+        self._dicts: Optional[List[Dict[str, Any]]] = None
+
+    @classmethod
+    def from_raw(cls, raw: Any, names: Optional[Mapping[int, str]] = None,
+                 track_id: Optional[np.ndarray] = None, **kwargs: Any) -> "DetectionResult":
+        """由後端的 RawDetections（或任何具 xyxy/confidence/class_id 的物件）建立"""
+        return cls(
+            xyxy=raw.xyxy,
+            confidence=raw.confidence,
+            class_id=raw.class_id,
+            track_id=track_id,
+            names=names if names is not None else YOLO_CLASSES,
+            **kwargs,
+        )
+
+    @classmethod
+    def from_ultralytics(cls, result: Any, names: Optional[Mapping[int, str]] = None,
+                         **kwargs: Any) -> "DetectionResult":
+        """由 ultralytics Results 建立（含 model.track 的 boxes.id）"""
+        boxes = getattr(result, "boxes", None)
+        if boxes is None or len(boxes) == 0:
+            return cls.empty(names=names, **kwargs)
+        boxes = boxes.cpu().numpy()
+        track_id = None
+        if getattr(boxes, "id", None) is not None:
+            track_id = np.asarray(boxes.id, dtype=np.int64)
+        return cls(
+            xyxy=boxes.xyxy,
+            confidence=boxes.conf,
+            class_id=boxes.cls,
+            track_id=track_id,
+            names=names if names is not None else YOLO_CLASSES,
+            **kwargs,
+        )
+
+    @classmethod
+    def empty(cls, names: Optional[Mapping[int, str]] = None, **kwargs: Any) -> "DetectionResult":
+        return cls(
+            xyxy=np.zeros((0, 4), dtype=np.float32),
+            confidence=np.zeros((0,), dtype=np.float32),
+            class_id=np.zeros((0,), dtype=np.int64),
+            names=names if names is not None else YOLO_CLASSES,
+            **kwargs,
+        )
+
+    def __len__(self) -> int:
+        return int(self.confidence.shape[0])
+
+    @property
+    def has_tracks(self) -> bool:
+        return self.track_id is not None and bool(np.any(self.track_id != NO_TRACK_ID))
+
+    def class_names(self) -> List[str]:
+        names = self.names
+        return [names.get(cls, f"class_{cls}") for cls in self.class_id.tolist()]
+
+    def select(self, mask: np.ndarray) -> "DetectionResult":
+        """以布林遮罩或索引取子集（例如只保留 person）"""
+        return DetectionResult(
+            xyxy=self.xyxy[mask],
+            confidence=self.confidence[mask],
+            class_id=self.class_id[mask],
+            track_id=self.track_id[mask] if self.track_id is not None else None,
+            names=self.names,
+            image_shape=self.image_shape,
+            inference_time=self.inference_time,
+            timestamp=self.timestamp,
+        )
+
+    # ===== 延遲建立的 JSON 表示 =====
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        """逐框 dict（與舊版 _format_results 的 detections 格式相同），建立後快取"""
+        if self._dicts is not None:
+            return self._dicts
+
+        # tolist() 一次轉成 Python 數值，避免逐欄位 float()
+        boxes = self.xyxy.tolist()
+        confidences = self.confidence.tolist()
+        class_ids = self.class_id.tolist()
+        centers = self.center.tolist()
+        areas = self.area.tolist()
+        track_ids = self.track_id.tolist() if self.track_id is not None else None
+        class_names = self.class_names()
+
+        detections: List[Dict[str, Any]] = []
+        for i, (x1, y1, x2, y2) in enumerate(boxes):
+            detection = {
+                "class_id": class_ids[i],
+                "class": class_names[i],  # 使用 'class' 鍵名保持一致
+                "class_name": class_names[i],
+                "confidence": confidences[i],
+                "bbox": [x1, y1, x2, y2],  # 簡化格式
+                "bbox_detailed": {"x1": x1, "y1": y1, "x2": x2, "y2": y2},
+                "center": {"x": centers[i][0], "y": centers[i][1]},
+                "area": areas[i],
+            }
+            if track_ids is not None and track_ids[i] != NO_TRACK_ID:
+                detection["track_id"] = track_ids[i]
+            detections.append(detection)
+
+        self._dicts = detections
+        return detections
+
+    def to_response(self) -> Dict[str, Any]:
+        """偵測 API 回應格式"""
+        detections = self.to_dicts()
+        return {
+            "detections": detections,
+            "objects": detections,  # 為向後兼容性添加
+            "inference_time": self.inference_time,
+            "image_shape": self.image_shape,
+            "image_size": list(self.image_shape),  # 為向後兼容性添加
+            "detection_count": len(detections),
+            "timestamp": self.timestamp,
+        }
+
+    def to_tracking_response(self) -> Dict[str, Any]:
+        """追蹤 API 回應格式（bbox 為 x1/y1/x2/y2 dict，另附 tracks）"""
+        detections = []
+        tracks = []
+        now = time.time()
+        for item in self.to_dicts():
+            detection = {
+                "class_id": item["class_id"],
+                "class_name": item["class_name"],
+                "confidence": item["confidence"],
+                "bbox": item["bbox_detailed"],
+                "center": item["center"],
+                "area": item["area"],
+            }
+            track_id = item.get("track_id")
+            if track_id is not None:
+                detection["track_id"] = track_id
+                tracks.append({
+                    "track_id": track_id,
+                    "class_id": item["class_id"],
+                    "class_name": item["class_name"],
+                    "bbox": item["bbox_detailed"],
+                    "center": item["center"],
+                    "confidence": item["confidence"],
+                    "timestamp": now,
+                })
+            detections.append(detection)
+
+        return {
+            "detections": detections,
+            "tracks": tracks,
+            "inference_time": self.inference_time,
+            "image_shape": self.image_shape,
+            "detection_count": len(detections),
+            "track_count": len(tracks),
+            "timestamp": self.timestamp,
+        }
+
+
+__all__ = ["DetectionResult", "NO_TRACK_ID"]
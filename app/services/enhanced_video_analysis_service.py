@@ -23,17 +23,8 @@ class EnhancedVideoAnalysisService(VideoAnalysisService):
     """增強的影片分析服務 - 支援資料庫保存"""
     
     def __init__(self, model_path: str = "yolo11n.pt", device: str = "auto", db_service: Optional[DatabaseService] = None):
-        super().__init__(resolve_model_path(model_path))
-        # 單獨設定 device
-        self.device = device
-        # 如果指定了 device，設定模型的設備
-        if device != "auto":
-            try:
-                # 設定 YOLO 模型的設備
-                self.model.to(device)
-                logger.info(f"YOLO 模型已設定到設備: {device}")
-            except Exception as e:
-                logger.warning(f"無法設定設備 {device}: {e}")
+        # device 為模型註冊表鍵的一部分，載入時即放到指定設備
+        super().__init__(resolve_model_path(model_path), device=device)
         
         self.db_service = db_service
         self.current_analysis_record: Optional[AnalysisRecord] = None
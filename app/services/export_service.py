@@ -0,0 +1,525 @@
+"""
+偵測 / 事件資料串流匯出
+
+原本的匯出端點把整個查詢結果讀進記憶體（StringIO / JSON 清單 / pandas DataFrame）再一次回傳，
+匯出一個月的偵測資料就會讓 API 行程記憶體不足。改為：
+- 以伺服器端游標（AsyncSession.stream + yield_per）每次取 EXPORT_BATCH_SIZE 列
+- 逐批編碼成 CSV / NDJSON / JSON 陣列 / Parquet（每批一個 row group，需 pyarrow），可選 gzip
+- 直接交給 StreamingResponse；記憶體用量只與批次大小有關
+- 估計列數（EXPLAIN）超過 EXPORT_BACKGROUND_ROWS 時改為背景工作，
+  寫入 EXPORT_DIR 後以工作 ID 查詢進度、完成後下載；檔案保留 EXPORT_RETENTION_HOURS 小時
+"""
+
+from __future__ import annotations
+
+import asyncio
+import csv
+import io
+import json
+import threading
+import time
+import uuid
+import zlib
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+
+from sqlalchemy import Boolean, DateTime, Float, Integer, select
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.logger import api_logger
+from app.core.paths import get_base_dir
+from app.models.database import DetectionResult, LineCrossingEvent, SpeedEvent, ZoneDwellEvent
+from app.utils.pagination import estimate_count
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow 為選用依賴，缺少時不提供 Parquet 匯出
+    pa = None
+    pq = None
+
+# 格式 → (media type, 副檔名)
+EXPORT_FORMATS: Dict[str, tuple] = {
+    "csv": ("text/csv; charset=utf-8", ".csv"),
+    "ndjson": ("application/x-ndjson", ".ndjson"),
+    "json": ("application/json", ".json"),
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+}
+
+# 匯出來源 → (模型, 時間欄位)
+EXPORT_SOURCES: Dict[str, tuple] = {
+    "detections": (DetectionResult, DetectionResult.frame_timestamp),
+    "line_events": (LineCrossingEvent, LineCrossingEvent.frame_timestamp),
+    "zone_events": (ZoneDwellEvent, ZoneDwellEvent.event_timestamp),
+    "speed_events": (SpeedEvent, SpeedEvent.event_timestamp),
+}
+
+
+def parse_export_time(value: Optional[str], field_name: str, end: bool = False) -> Optional[datetime]:
+    """ISO 8601 或 YYYY-MM-DD；只有日期的結束時間包含當天整天"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError as exc:
+        raise ValueError(f"{field_name} 格式錯誤，請使用 ISO8601 或 YYYY-MM-DD") from exc
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    if end and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+def _cell(value: Any) -> Any:
+    """CSV 儲存格：時間轉 ISO 8601，JSON 欄位轉字串"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+# ===== 編碼器（每批列 → bytes） =====
+
+
+class _CsvEncoder:
+    def __init__(self, columns: Sequence[str], bom: bool = False):
+        self.columns = list(columns)
+        self.bom = bom
+
+    def header(self) -> bytes:
+        return ("\ufeff" if self.bom else "").encode("utf-8") + self._rows([self.columns])
+
+    def _rows(self, rows) -> bytes:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerows(rows)
+        return buffer.getvalue().encode("utf-8")
+
+    def encode(self, rows) -> bytes:
+        return self._rows([_cell(value) for value in row] for row in rows)
+
+    def footer(self) -> bytes:
+        return b""
+
+
+class _NdjsonEncoder:
+    def __init__(self, columns: Sequence[str]):
+        self.columns = list(columns)
+
+    def header(self) -> bytes:
+        return b""
+
+    def _dumps(self, row) -> str:
+        return json.dumps(dict(zip(self.columns, row)), ensure_ascii=False, default=_json_default)
+
+    def encode(self, rows) -> bytes:
+        return "".join(self._dumps(row) + "\n" for row in rows).encode("utf-8")
+
+    def footer(self) -> bytes:
+        return b""
+
+
+class _JsonArrayEncoder(_NdjsonEncoder):
+    """與舊版 format=json 相容的 JSON 陣列"""
+
+    def __init__(self, columns: Sequence[str]):
+        super().__init__(columns)
+        self._first = True
+
+    def header(self) -> bytes:
+        return b"["
+
+    def encode(self, rows) -> bytes:
+        parts = []
+        for row in rows:
+            parts.append(("" if self._first else ",") + self._dumps(row))
+            self._first = False
+        return "\n".join(parts).encode("utf-8")
+
+    def footer(self) -> bytes:
+        return b"]"
+
+
+class _ChunkSink(io.RawIOBase):
+    """ParquetWriter 的輸出目標：寫入的資料暫存在記憶體，每批之後取走"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        chunk = bytes(data)
+        self._chunks.append(chunk)
+        self._position += len(chunk)
+        return len(chunk)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _arrow_type(column):
+    if isinstance(column.type, Boolean):
+        return pa.bool_()
+    if isinstance(column.type, Integer):
+        return pa.int64()
+    if isinstance(column.type, Float):
+        return pa.float64()
+    if isinstance(column.type, DateTime):
+        return pa.timestamp("us")
+    return pa.string()
+
+
+class _ParquetEncoder:
+    def __init__(self, columns: Sequence[Any]):
+        if pa is None:
+            raise ValueError("Parquet 匯出需要安裝 pyarrow")
+        self.names = [column.name for column in columns]
+        self.schema = pa.schema([(column.name, _arrow_type(column)) for column in columns])
+        self._sink = _ChunkSink()
+        self._writer = pq.ParquetWriter(self._sink, self.schema, compression="zstd")
+
+    def header(self) -> bytes:
+        return self._sink.drain()
+
+    def encode(self, rows) -> bytes:
+        string_columns = {
+            name for name, field in zip(self.names, self.schema) if pa.types.is_string(field.type)
+        }
+        data = {name: [] for name in self.names}
+        for row in rows:
+            for name, value in zip(self.names, row):
+                if name in string_columns and value is not None and not isinstance(value, str):
+                    value = json.dumps(value, ensure_ascii=False, default=_json_default)
+                data[name].append(value)
+        self._writer.write_table(pa.Table.from_pydict(data, schema=self.schema))
+        return self._sink.drain()
+
+    def footer(self) -> bytes:
+        self._writer.close()
+        return self._sink.drain()
+
+
+class _Gzip:
+    def __init__(self):
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) if data else b""
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+
+def _make_encoder(fmt: str, statement, bom: bool = False):
+    columns = list(statement.selected_columns)
+    names = [column.name for column in columns]
+    if fmt == "csv":
+        return _CsvEncoder(names, bom=bom)
+    if fmt == "ndjson":
+        return _NdjsonEncoder(names)
+    if fmt == "json":
+        return _JsonArrayEncoder(names)
+    if fmt == "parquet":
+        return _ParquetEncoder(columns)
+    raise ValueError(f"不支援的匯出格式: {fmt}")
+
+
+async def stream_statement(
+    statement,
+    fmt: str,
+    *,
+    gzip: bool = False,
+    bom: bool = False,
+    batch_size: Optional[int] = None,
+    on_progress=None,
+) -> AsyncIterator[bytes]:
+    """
+    以伺服器端游標執行 statement，逐批產生編碼後的 bytes
+
+    使用自己的資料庫連線（StreamingResponse 在端點函式返回後才開始讀取）；
+    on_progress(累計列數) 於每批寫出後呼叫。
+    """
+    batch_size = batch_size or max(100, settings.export_batch_size)
+    encoder = _make_encoder(fmt, statement, bom=bom)
+    compressor = _Gzip() if gzip else None
+
+    def _out(data: bytes) -> bytes:
+        return compressor.compress(data) if compressor else data
+
+    rows_written = 0
+    head = _out(encoder.header())
+    if head:
+        yield head
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(statement.execution_options(yield_per=batch_size))
+        async for rows in result.partitions(batch_size):
+            chunk = _out(encoder.encode(rows))
+            rows_written += len(rows)
+            if on_progress is not None:
+                on_progress(rows_written)
+            if chunk:
+                yield chunk
+    tail = _out(encoder.footer())
+    if compressor:
+        tail += compressor.flush()
+    if tail:
+        yield tail
+
+
+# ===== 匯出請求 =====
+
+
+@dataclass
+class ExportRequest:
+    """匯出來源、格式與篩選條件"""
+
+    source: str = "detections"
+    format: str = "csv"
+    gzip: bool = False
+    task_id: Optional[int] = None
+    start_time: Optional[datetime] = None
+    end_time: Optional[datetime] = None
+    object_type: Optional[str] = None
+    confidence_min: Optional[float] = None
+    confidence_max: Optional[float] = None
+    ids: Optional[List[int]] = None
+
+    def validate(self) -> None:
+        if self.source not in EXPORT_SOURCES:
+            raise ValueError(f"不支援的匯出資料表: {self.source}")
+        if self.format not in EXPORT_FORMATS:
+            raise ValueError(f"不支援的匯出格式: {self.format}")
+        if self.format == "parquet":
+            if pa is None:
+                raise ValueError("Parquet 匯出需要安裝 pyarrow")
+            # Parquet 已內建壓縮
+            self.gzip = False
+        if self.source != "detections" and (
+            self.object_type or self.confidence_min is not None or self.confidence_max is not None
+        ):
+            raise ValueError("物件類型與信心度篩選只適用於偵測結果")
+
+    def statement(self):
+        model, timestamp = EXPORT_SOURCES[self.source]
+        statement = select(*model.__table__.columns)
+        if self.ids:
+            statement = statement.where(model.id.in_(self.ids))
+        if self.task_id is not None:
+            statement = statement.where(model.task_id == self.task_id)
+        if self.start_time is not None:
+            statement = statement.where(timestamp >= self.start_time)
+        if self.end_time is not None:
+            statement = statement.where(timestamp < self.end_time)
+        if self.object_type:
+            statement = statement.where(model.object_type == self.object_type)
+        if self.confidence_min is not None:
+            statement = statement.where(model.confidence >= self.confidence_min)
+        if self.confidence_max is not None:
+            statement = statement.where(model.confidence <= self.confidence_max)
+        return statement.order_by(timestamp, model.id)
+
+    @property
+    def media_type(self) -> str:
+        return "application/gzip" if self.gzip else EXPORT_FORMATS[self.format][0]
+
+    def filename(self, moment: Optional[datetime] = None) -> str:
+        stamp = (moment or datetime.now()).strftime("%Y%m%d_%H%M%S")
+        name = f"{self.source}_{stamp}{EXPORT_FORMATS[self.format][1]}"
+        return f"{name}.gz" if self.gzip else name
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "source": self.source,
+            "format": self.format,
+            "gzip": self.gzip,
+            "task_id": self.task_id,
+            "start_time": self.start_time.isoformat() if self.start_time else None,
+            "end_time": self.end_time.isoformat() if self.end_time else None,
+            "object_type": self.object_type,
+            "confidence_min": self.confidence_min,
+            "confidence_max": self.confidence_max,
+            "ids": len(self.ids) if self.ids else None,
+        }
+
+    def stream(self) -> AsyncIterator[bytes]:
+        return stream_statement(self.statement(), self.format, gzip=self.gzip)
+
+
+# ===== 背景匯出工作 =====
+
+
+class ExportService:
+    """大型匯出的背景工作管理（單例）"""
+
+    _instance: Optional["ExportService"] = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+        export_dir = Path(settings.export_dir).expanduser()
+        self.export_dir = export_dir if export_dir.is_absolute() else get_base_dir() / export_dir
+        self.background_rows = settings.export_background_rows
+        self.retention = timedelta(hours=max(1.0, settings.export_retention_hours))
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._initialized = True
+
+    async def estimate_rows(self, request: ExportRequest) -> Optional[int]:
+        async with AsyncSessionLocal() as db:
+            return await estimate_count(db, request.statement())
+
+    async def should_run_in_background(self, request: ExportRequest) -> bool:
+        if self.background_rows <= 0:
+            return False
+        estimated = await self.estimate_rows(request)
+        return estimated is not None and estimated > self.background_rows
+
+    async def start_job(self, request: ExportRequest) -> Dict[str, Any]:
+        self._purge_expired()
+        self.export_dir.mkdir(parents=True, exist_ok=True)
+        job_id = uuid.uuid4().hex
+        created = datetime.now()
+        job = {
+            "job_id": job_id,
+            "status": "pending",
+            "request": request.describe(),
+            "filename": request.filename(created),
+            "media_type": request.media_type,
+            "estimated_rows": await self.estimate_rows(request),
+            "rows_written": 0,
+            "bytes_written": 0,
+            "progress": 0.0,
+            "error": None,
+            "created_at": created.isoformat(),
+            "finished_at": None,
+        }
+        self._jobs[job_id] = job
+        self._tasks[job_id] = asyncio.create_task(self._run_job(job, request))
+        api_logger.info(f"背景匯出工作已建立: {job_id} ({job['filename']}, 估計 {job['estimated_rows']} 列)")
+        return self.get_job(job_id)
+
+    def _path(self, job: Dict[str, Any]) -> Path:
+        """磁碟檔名以工作 ID 區分（同一秒建立的工作不會互相覆寫）；易讀檔名只用於下載標頭"""
+        suffixes = "".join(Path(job["filename"]).suffixes)
+        return self.export_dir / f"{job['job_id']}{suffixes}"
+
+    async def _run_job(self, job: Dict[str, Any], request: ExportRequest) -> None:
+        target = self._path(job)
+        partial = target.with_name(target.name + ".part")
+        estimated = job["estimated_rows"] or 0
+
+        def _progress(rows: int) -> None:
+            job["rows_written"] = rows
+            if estimated:
+                job["progress"] = min(0.99, rows / estimated)
+
+        job["status"] = "running"
+        try:
+            with open(partial, "wb") as handle:
+                async for chunk in stream_statement(
+                    request.statement(), request.format, gzip=request.gzip, on_progress=_progress
+                ):
+                    # 寫檔交給執行緒，避免大量資料時阻塞事件迴圈
+                    await asyncio.to_thread(handle.write, chunk)
+                    job["bytes_written"] += len(chunk)
+            partial.replace(target)
+            job["status"] = "completed"
+            job["progress"] = 1.0
+        except asyncio.CancelledError:
+            job["status"] = "cancelled"
+            partial.unlink(missing_ok=True)
+            raise
+        except Exception as exc:  # noqa: BLE001
+            job["status"] = "failed"
+            job["error"] = str(exc)
+            partial.unlink(missing_ok=True)
+            api_logger.error(f"背景匯出工作失敗 {job['job_id']}: {exc}")
+        finally:
+            job["finished_at"] = datetime.now().isoformat()
+            self._tasks.pop(job["job_id"], None)
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        return {**job, "download_ready": job["status"] == "completed"}
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        self._purge_expired()
+        return [self.get_job(job_id) for job_id in sorted(self._jobs, key=lambda key: self._jobs[key]["created_at"], reverse=True)]
+
+    def get_file(self, job_id: str) -> Optional[Path]:
+        job = self._jobs.get(job_id)
+        if job is None or job["status"] != "completed":
+            return None
+        path = self._path(job)
+        return path if path.exists() else None
+
+    def cancel_job(self, job_id: str) -> bool:
+        """取消執行中的工作或刪除已完成的檔案"""
+        job = self._jobs.pop(job_id, None)
+        if job is None:
+            return False
+        task = self._tasks.pop(job_id, None)
+        if task is not None:
+            task.cancel()
+        self._path(job).unlink(missing_ok=True)
+        return True
+
+    def _purge_expired(self) -> None:
+        cutoff = time.time() - self.retention.total_seconds()
+        for job_id, job in list(self._jobs.items()):
+            if job["finished_at"] and datetime.fromisoformat(job["finished_at"]).timestamp() < cutoff:
+                self._jobs.pop(job_id, None)
+                self._path(job).unlink(missing_ok=True)
+        if self.export_dir.exists():
+            for path in self.export_dir.iterdir():
+                if path.is_file() and path.stat().st_mtime < cutoff:
+                    path.unlink(missing_ok=True)
+
+
+def get_export_service() -> ExportService:
+    """獲取匯出服務實例"""
+    return ExportService()
+
+
+__all__ = [
+    "EXPORT_FORMATS",
+    "EXPORT_SOURCES",
+    "ExportRequest",
+    "ExportService",
+    "get_export_service",
+    "parse_export_time",
+    "stream_statement",
+]
@@ -17,6 +17,7 @@ from app.core.logger import detection_logger
 from app.core.paths import get_base_dir
 from app.services.camera_stream_manager import camera_stream_manager, StreamConsumer
 from app.services.email_notification_service import send_fall_email_alert
+from app.services.model_registry import ModelLease, get_model_registry
 from app.services.notification_settings_service import get_email_settings
 
 
@@ -42,6 +43,7 @@ class FallDetectionWorker:
         self._thread = threading.Thread(target=self._run_loop, daemon=True)
         self._running = threading.Event()
         self._model: Optional[YOLO] = None
+        self._model_lease: Optional[ModelLease] = None
         self._last_alert_time = 0.0
         self._cooldown = max(
             5.0, float(self.email_settings.get("cooldown_seconds", 30))
@@ -50,16 +52,22 @@ class FallDetectionWorker:
             get_base_dir() / "uploads" / "alerts" / "fall" / self.task_id
         )
         self._alerts_dir.mkdir(parents=True, exist_ok=True)
-        self._consumer = StreamConsumer(self.consumer_id, self._handle_frame)
+        self._consumer = StreamConsumer(
+            self.consumer_id,
+            self._handle_frame,
+            max_fps=settings.fall_detection_max_fps,
+        )
 
     def _handle_frame(self, frame_data) -> None:
         if not self._running.is_set():
             return
+        # 共享緩衝區的唯讀影格只取得引用，推論完成後由工作執行緒釋放
+        frame_data.retain()
         try:
-            self._queue.put_nowait((frame_data.frame.copy(), frame_data.timestamp))
+            self._queue.put_nowait((frame_data, frame_data.timestamp))
         except queue.Full:
             # 單純丟棄舊影格，保持最新
-            pass
+            frame_data.release()
 
     def start(self) -> None:
         self._running.set()
@@ -73,10 +81,16 @@ class FallDetectionWorker:
             pass
         if self._thread.is_alive():
             self._thread.join(timeout=2.0)
+        if self._model_lease is not None:
+            self._model_lease.release()
+            self._model_lease = None
+            self._model = None
 
     def _ensure_model(self) -> None:
         if self._model is None:
-            self._model = YOLO(self.model_path)
+            # 多個跌倒偵測任務共用同一份權重
+            self._model_lease = get_model_registry().acquire(self.model_path, task="detect")
+            self._model = self._model_lease.ensure_loaded()
             detection_logger.info(
                 "跌倒偵測模型載入完成: %s", self.model_path
             )
@@ -111,65 +125,72 @@ class FallDetectionWorker:
             except queue.Empty:
                 continue
 
-            frame, timestamp = frame_item
-            if frame is None:
+            frame_data, timestamp = frame_item
+            if frame_data is None:
                 continue
 
             try:
-                results = self._model.predict(
+                self._process_frame(frame_data.frame, timestamp, model_names)
+            finally:
+                frame_data.release()
+
+    def _process_frame(self, frame, timestamp, model_names) -> None:
+        try:
+            with self._model_lease.inference() as model:
+                results = model.predict(
                     source=frame,
                     conf=self.confidence,
                     verbose=False,
                 )
-            except Exception as exc:  # noqa: BLE001
-                detection_logger.error(f"跌倒偵測推論失敗: {exc}")
-                continue
-
-            if not results:
-                continue
+        except Exception as exc:  # noqa: BLE001
+            detection_logger.error(f"跌倒偵測推論失敗: {exc}")
+            return
 
-            boxes = results[0].boxes
-            if boxes is None or boxes.cls is None:
-                continue
+        if not results:
+            return
 
-            fall_detected = False
-            confidences = boxes.conf.tolist() if boxes.conf is not None else []
-            for idx, cls_tensor in enumerate(boxes.cls):
-                class_id = int(cls_tensor.item())
-                class_name = str(
-                    model_names.get(class_id, str(class_id))
-                    if isinstance(model_names, dict)
-                    else class_id
-                ).lower()
-                conf_value = confidences[idx] if idx < len(confidences) else None
-                if class_name == "fall" and conf_value is not None:
-                    fall_detected = True
-                    detected_conf = conf_value
-                    break
-            else:
-                detected_conf = 0.0
+        boxes = results[0].boxes
+        if boxes is None or boxes.cls is None:
+            return
 
-            if fall_detected and self._should_alert():
-                detection_logger.warning(
-                    "[FallDetection] 任務 %s 偵測到跌倒，信心值 %.2f",
-                    self.task_id,
-                    detected_conf,
+        fall_detected = False
+        confidences = boxes.conf.tolist() if boxes.conf is not None else []
+        for idx, cls_tensor in enumerate(boxes.cls):
+            class_id = int(cls_tensor.item())
+            class_name = str(
+                model_names.get(class_id, str(class_id))
+                if isinstance(model_names, dict)
+                else class_id
+            ).lower()
+            conf_value = confidences[idx] if idx < len(confidences) else None
+            if class_name == "fall" and conf_value is not None:
+                fall_detected = True
+                detected_conf = conf_value
+                break
+        else:
+            detected_conf = 0.0
+
+        if fall_detected and self._should_alert():
+            detection_logger.warning(
+                "[FallDetection] 任務 %s 偵測到跌倒，信心值 %.2f",
+                self.task_id,
+                detected_conf,
+            )
+            frame_path = self._save_frame(
+                frame,
+                timestamp if isinstance(timestamp, datetime) else datetime.utcnow(),
+            )
+            if self.email_settings.get("enabled") and self.email_settings.get("address"):
+                send_fall_email_alert(
+                    confidence_score=detected_conf,
+                    receiver_email=self.email_settings["address"],
+                    frame_path=frame_path,
                 )
-                frame_path = self._save_frame(
-                    frame,
-                    timestamp if isinstance(timestamp, datetime) else datetime.utcnow(),
+            else:
+                detection_logger.info(
+                    "郵件通知關閉或未設定收件者，僅儲存影像: %s",
+                    frame_path,
                 )
-                if self.email_settings.get("enabled") and self.email_settings.get("address"):
-                    send_fall_email_alert(
-                        confidence_score=detected_conf,
-                        receiver_email=self.email_settings["address"],
-                        frame_path=frame_path,
-                    )
-                else:
-                    detection_logger.info(
-                        "郵件通知關閉或未設定收件者，僅儲存影像: %s",
-                        frame_path,
-                    )
 
     @property
     def consumer(self) -> StreamConsumer:
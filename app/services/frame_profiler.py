@@ -0,0 +1,152 @@
+"""
+實時影格管線分段計時
+
+每個 RealtimeSession 持有一個 FrameProfiler，_process_frame 的每一段
+（任務狀態查詢、推論、縮圖裁切、資料庫提交、預覽標註、JPEG 編碼、預覽訊框封裝、推送）
+都記錄耗時；每幀的分段結果放進固定長度的環形緩衝區，
+用來計算滾動百分位數、超出幀預算次數與掉幀數。
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+from app.core.config import settings
+from app.core.metrics import get_metrics_registry
+
+# 分段名稱 → /api/v1/metrics 的 stage 標籤
+STAGE_METRIC_MAP = {
+    "status_check": "db_read",
+    "inference": "inference",
+    "thumbnail": "encode",
+    "db_submit": "db_write",
+    "annotate": "annotate",
+    "encode": "encode",
+    "pack": "encode",
+    "push": "push",
+}
+
+
+class FrameTimer:
+    """單一影格的分段計時器"""
+
+    def __init__(self, profiler: "FrameProfiler", frame_number: int):
+        self._profiler = profiler
+        self.frame_number = frame_number
+        self.stages: Dict[str, float] = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + (time.perf_counter() - start)
+
+    def finish(self) -> None:
+        self._profiler._record(self, time.perf_counter() - self._start)
+
+
+class FrameProfiler:
+    """單一會話的影格分段計時（環形緩衝區）"""
+
+    def __init__(self, window: Optional[int] = None, frame_budget: Optional[float] = None):
+        self.window = window or settings.realtime_profile_window
+        self.frame_budget = frame_budget or 1.0 / settings.realtime_profile_default_fps
+        self._records: Deque[Dict[str, Any]] = deque(maxlen=self.window)
+        self._lock = threading.Lock()
+        self._processed = 0
+        self._over_budget = 0
+        self._dropped: Counter = Counter()
+        self._last_source_frame: Optional[int] = None
+
+    def start_frame(self, source_frame_number: Optional[int] = None) -> FrameTimer:
+        """開始一幀；依來源幀號的跳號累計相機端掉幀"""
+        if source_frame_number is not None:
+            with self._lock:
+                last = self._last_source_frame
+                if last is not None and source_frame_number > last + 1:
+                    self._dropped["source_gap"] += source_frame_number - last - 1
+                self._last_source_frame = source_frame_number
+        return FrameTimer(self, source_frame_number or 0)
+
+    def record_drop(self, reason: str, count: int = 1) -> None:
+        """記錄未進入管線的影格（暫停、會話已停止、處理失敗等）"""
+        with self._lock:
+            self._dropped[reason] += count
+
+    def _record(self, timer: FrameTimer, total: float) -> None:
+        record = {"frame_number": timer.frame_number, "total": total, **timer.stages}
+        with self._lock:
+            self._records.append(record)
+            self._processed += 1
+            if self.frame_budget and total > self.frame_budget:
+                self._over_budget += 1
+
+        registry = get_metrics_registry()
+        for name, seconds in timer.stages.items():
+            registry.observe(STAGE_METRIC_MAP.get(name, name), seconds, f"realtime_{name}")
+
+    @staticmethod
+    def _summary(values: List[float]) -> Dict[str, float]:
+        ordered = sorted(values)
+        count = len(ordered)
+
+        def pick(percentile: float) -> float:
+            index = min(count - 1, int(round(percentile / 100 * (count - 1))))
+            return ordered[index] * 1000
+
+        return {
+            "count": count,
+            "mean_ms": sum(ordered) / count * 1000,
+            "p50_ms": pick(50),
+            "p95_ms": pick(95),
+            "p99_ms": pick(99),
+            "max_ms": ordered[-1] * 1000,
+        }
+
+    def get_profile(self) -> Dict[str, Any]:
+        """滾動視窗內各分段的百分位數與掉幀統計"""
+        with self._lock:
+            records = list(self._records)
+            dropped = dict(self._dropped)
+            processed = self._processed
+            over_budget = self._over_budget
+
+        stage_values: Dict[str, List[float]] = {}
+        for record in records:
+            for key, value in record.items():
+                if key == "frame_number":
+                    continue
+                stage_values.setdefault(key, []).append(value)
+
+        stages = {
+            name: self._summary(values)
+            for name, values in stage_values.items()
+            if name != "total"
+        }
+        total = self._summary(stage_values["total"]) if "total" in stage_values else None
+
+        return {
+            "window": self.window,
+            "samples": len(records),
+            "processed_frames": processed,
+            "frame_budget_ms": self.frame_budget * 1000 if self.frame_budget else None,
+            "over_budget_frames": over_budget,
+            "dropped_frames": sum(dropped.values()),
+            "dropped_by_reason": dropped,
+            "total": total,
+            "stages": stages,
+            "last_frame_ms": (
+                {key: value * 1000 for key, value in records[-1].items() if key != "frame_number"}
+                if records else None
+            ),
+        }
+
+
+__all__ = ["FrameProfiler", "FrameTimer", "STAGE_METRIC_MAP"]
@@ -0,0 +1,311 @@
+"""
+熱點圖網格彙總
+
+偵測中心點（center_x / center_y，來源影像像素座標）依任務的來源解析度正規化後，
+分箱到 HEATMAP_GRID_SIZE × HEATMAP_GRID_SIZE 的網格：
+- 每小時結束（加上遲到容許時間）後由分析彙總背景執行緒寫入 heatmap_bins（先刪後插，冪等）
+- 查詢時已完成的整小時讀 heatmap_bins，頭尾不足一小時與尚未彙總的部分直接由明細表分箱
+- 可依需求縮小網格（整數倍合併），並套用高斯平滑
+
+SQL 與 Python 使用相同的分箱公式：floor(x / width * grid)，並夾在 [0, grid - 1]。
+"""
+
+from __future__ import annotations
+
+import math
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, select, text
+
+from app.core.config import settings
+from app.core.logger import main_logger
+from app.models.database import AnalysisTask, HeatmapBin
+
+HOUR = timedelta(hours=1)
+
+# 任務未記錄來源解析度時使用 HEATMAP_DEFAULT_FRAME_WIDTH / HEIGHT；參數明確轉型，asyncpg 才不必推斷型別
+_GRID = "CAST(:grid AS INTEGER)"
+_FRAME_WIDTH = "CAST(COALESCE(NULLIF(t.source_width, 0), :default_width) AS DOUBLE PRECISION)"
+_FRAME_HEIGHT = "CAST(COALESCE(NULLIF(t.source_height, 0), :default_height) AS DOUBLE PRECISION)"
+
+_CELL_X = f"CAST(LEAST({_GRID} - 1, GREATEST(0, floor(d.center_x / {_FRAME_WIDTH} * {_GRID}))) AS INTEGER)"
+_CELL_Y = f"CAST(LEAST({_GRID} - 1, GREATEST(0, floor(d.center_y / {_FRAME_HEIGHT} * {_GRID}))) AS INTEGER)"
+
+_BIN_HOUR = f"""
+    INSERT INTO heatmap_bins (bucket_start, task_id, grid_size, cell_x, cell_y, count)
+    SELECT CAST(:start AS TIMESTAMP), d.task_id, {_GRID}, {_CELL_X}, {_CELL_Y}, count(*)
+    FROM detection_results d
+    JOIN analysis_tasks t ON t.id = d.task_id
+    WHERE d.frame_timestamp >= :start AND d.frame_timestamp < :end
+      AND d.center_x IS NOT NULL AND d.center_y IS NOT NULL
+    GROUP BY 2, 4, 5
+"""
+
+_BIN_RAW = f"""
+    SELECT {_CELL_X} AS cell_x, {_CELL_Y} AS cell_y, count(*) AS count
+    FROM detection_results d
+    JOIN analysis_tasks t ON t.id = d.task_id
+    WHERE d.frame_timestamp >= :start AND d.frame_timestamp < :end
+      AND d.center_x IS NOT NULL AND d.center_y IS NOT NULL
+      {{filters}}
+    GROUP BY 1, 2
+"""
+
+
+def _floor_hour(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _ceil_hour(moment: datetime) -> datetime:
+    floored = _floor_hour(moment)
+    return floored if floored == moment else floored + HOUR
+
+
+def _naive(moment: Optional[datetime]) -> Optional[datetime]:
+    if moment is not None and moment.tzinfo is not None:
+        return moment.astimezone().replace(tzinfo=None)
+    return moment
+
+
+def _bin_params(grid: int) -> Dict[str, Any]:
+    return {
+        "grid": grid,
+        "default_width": settings.heatmap_default_frame_width,
+        "default_height": settings.heatmap_default_frame_height,
+    }
+
+
+# ===== 網格運算（與 SQL 相同的公式） =====
+
+
+def bin_cell(value: float, extent: float, grid: int) -> int:
+    """單一座標的網格索引"""
+    return min(grid - 1, max(0, math.floor(value / extent * grid)))
+
+
+def bin_points(points: Iterable[Tuple[float, float]], width: float, height: float, grid: int) -> np.ndarray:
+    """將 (x, y) 像素座標分箱成 grid × grid 的計數矩陣（列為 y、行為 x）"""
+    counts = np.zeros((grid, grid), dtype=np.int64)
+    for x, y in points:
+        counts[bin_cell(y, height, grid), bin_cell(x, width, grid)] += 1
+    return counts
+
+
+def downsample_grid(counts: np.ndarray, grid: int) -> np.ndarray:
+    """把較細的網格合併成 grid × grid（cell * grid // 原始大小），總數不變"""
+    source = counts.shape[0]
+    if grid >= source:
+        return counts
+    index = np.arange(source) * grid // source
+    merged = np.zeros((grid, source), dtype=counts.dtype)
+    np.add.at(merged, index, counts)
+    result = np.zeros((grid, grid), dtype=counts.dtype)
+    np.add.at(result.T, index, merged.T)
+    return result
+
+
+def gaussian_smooth(counts: np.ndarray, sigma: float) -> np.ndarray:
+    """可分離高斯平滑（單位為網格）；邊界以鏡射延伸，平滑後總量不變"""
+    values = counts.astype(np.float64)
+    if sigma <= 0:
+        return values
+    radius = max(1, int(math.ceil(3 * sigma)))
+    offsets = np.arange(-radius, radius + 1)
+    kernel = np.exp(-(offsets ** 2) / (2 * sigma ** 2))
+    kernel /= kernel.sum()
+
+    def _convolve(axis_values: np.ndarray) -> np.ndarray:
+        padded = np.pad(axis_values, (radius, radius), mode="symmetric")
+        return np.convolve(padded, kernel, mode="valid")
+
+    values = np.apply_along_axis(_convolve, 1, values)
+    return np.apply_along_axis(_convolve, 0, values)
+
+
+# ===== 背景彙總（由 RollupService 呼叫） =====
+
+
+class HeatmapAggregator:
+    """把已結束的小時分箱寫入 heatmap_bins"""
+
+    def __init__(self, engine_getter, lateness: timedelta, backfill_hours: int):
+        self._engine_getter = engine_getter
+        self.grid_size = max(1, settings.heatmap_grid_size)
+        self.lateness = lateness
+        self.backfill_hours = max(1, backfill_hours)
+        self._watermark: Optional[datetime] = None
+        self.hours_binned = 0
+
+    def _initial_watermark(self, connection) -> datetime:
+        latest = _naive(
+            connection.execute(
+                text("SELECT max(bucket_start) FROM heatmap_bins WHERE grid_size = :grid"),
+                {"grid": self.grid_size},
+            ).scalar()
+        )
+        if latest is not None:
+            return latest + HOUR
+        earliest = _naive(connection.execute(text("SELECT min(frame_timestamp) FROM detection_results")).scalar())
+        return _floor_hour(earliest or min(datetime.now(), datetime.utcnow()))
+
+    def _bin_hour(self, engine, start: datetime) -> None:
+        params = {**_bin_params(self.grid_size), "start": start, "end": start + HOUR}
+        with engine.begin() as connection:
+            connection.execute(
+                text("DELETE FROM heatmap_bins WHERE bucket_start = :start AND grid_size = :grid"), params
+            )
+            connection.execute(text(_BIN_HOUR), params)
+
+    def compact(self, now: datetime) -> Dict[str, Any]:
+        """分箱已結束且超過遲到容許時間的小時（每次最多 backfill_hours 小時）"""
+        engine = self._engine_getter()
+        if self._watermark is None:
+            with engine.connect() as connection:
+                self._watermark = self._initial_watermark(connection)
+
+        binned = []
+        while len(binned) < self.backfill_hours and self._watermark + HOUR + self.lateness <= now:
+            start = self._watermark
+            self._bin_hour(engine, start)
+            binned.append(start.isoformat())
+            self._watermark = start + HOUR
+            self.hours_binned += 1
+        return {
+            "binned_hours": binned,
+            "watermark": self._watermark.isoformat(),
+        }
+
+    def rebin(self, start: datetime, end: datetime) -> List[str]:
+        """重新分箱 [start, end) 內已分箱過的小時（遲到資料寫入後由彙總器呼叫）"""
+        if self._watermark is None:
+            return []
+        hour = _floor_hour(start)
+        upper = min(_ceil_hour(end), self._watermark)
+        rebinned = []
+        engine = self._engine_getter()
+        while hour < upper:
+            self._bin_hour(engine, hour)
+            rebinned.append(hour.isoformat())
+            hour += HOUR
+        return rebinned
+
+
+# ===== 查詢 =====
+
+
+async def _heatmap_watermark(db, grid: int) -> Optional[datetime]:
+    latest = (
+        await db.execute(select(func.max(HeatmapBin.bucket_start)).where(HeatmapBin.grid_size == grid))
+    ).scalar()
+    latest = _naive(latest)
+    return latest + HOUR if latest is not None else None
+
+
+async def fetch_heatmap_counts(
+    db,
+    start: datetime,
+    end: datetime,
+    task_id: Optional[int] = None,
+    camera_id: Optional[str] = None,
+) -> np.ndarray:
+    """[start, end) 的分箱計數（HEATMAP_GRID_SIZE × HEATMAP_GRID_SIZE，列為 y、行為 x）"""
+    grid = max(1, settings.heatmap_grid_size)
+    start, end = _naive(start), _naive(end)
+    counts = np.zeros((grid, grid), dtype=np.int64)
+
+    raw_ranges = []
+    hour_lo = _ceil_hour(start)
+    watermark = await _heatmap_watermark(db, grid)
+    hour_hi = min(_floor_hour(end), watermark) if watermark is not None else hour_lo
+    if hour_lo < hour_hi:
+        statement = (
+            select(HeatmapBin.cell_x, HeatmapBin.cell_y, func.sum(HeatmapBin.count).label("count"))
+            .where(
+                HeatmapBin.grid_size == grid,
+                HeatmapBin.bucket_start >= hour_lo,
+                HeatmapBin.bucket_start < hour_hi,
+            )
+            .group_by(HeatmapBin.cell_x, HeatmapBin.cell_y)
+        )
+        if task_id is not None:
+            statement = statement.where(HeatmapBin.task_id == task_id)
+        if camera_id is not None:
+            statement = statement.where(
+                HeatmapBin.task_id.in_(select(AnalysisTask.id).where(AnalysisTask.camera_id == camera_id))
+            )
+        for row in (await db.execute(statement)).all():
+            counts[row.cell_y, row.cell_x] += int(row.count)
+        if start < hour_lo:
+            raw_ranges.append((start, hour_lo))
+        raw_ranges.append((hour_hi, end))
+    else:
+        raw_ranges.append((start, end))
+
+    filters = []
+    params = _bin_params(grid)
+    if task_id is not None:
+        filters.append("AND d.task_id = :task_id")
+        params["task_id"] = task_id
+    if camera_id is not None:
+        filters.append("AND t.camera_id = :camera_id")
+        params["camera_id"] = camera_id
+    raw_sql = text(_BIN_RAW.format(filters=" ".join(filters)))
+    for lower, upper in raw_ranges:
+        if lower >= upper:
+            continue
+        rows = (await db.execute(raw_sql, {**params, "start": lower, "end": upper})).all()
+        for row in rows:
+            counts[row.cell_y, row.cell_x] += int(row.count)
+    return counts
+
+
+async def build_heatmap(
+    db,
+    start: datetime,
+    end: datetime,
+    task_id: Optional[int] = None,
+    camera_id: Optional[str] = None,
+    grid_size: Optional[int] = None,
+    sigma: Optional[float] = None,
+) -> Dict[str, Any]:
+    """熱點圖回應：非零網格的中心點（0~1 正規化座標）與強度"""
+    started = time.perf_counter()
+    counts = await fetch_heatmap_counts(db, start, end, task_id=task_id, camera_id=camera_id)
+    grid = min(max(1, grid_size or counts.shape[0]), counts.shape[0])
+    counts = downsample_grid(counts, grid)
+    sigma = settings.heatmap_gaussian_sigma if sigma is None else sigma
+    intensity = gaussian_smooth(counts, sigma)
+
+    points = [
+        {
+            "x": (col + 0.5) / grid,
+            "y": (row + 0.5) / grid,
+            "intensity": float(intensity[row, col]),
+            "count": int(counts[row, col]),
+        }
+        for row, col in zip(*np.nonzero(intensity > 1e-9))
+    ]
+    max_intensity = float(intensity.max()) if points else 0.0
+    main_logger.debug(f"[heatmap] grid={grid} points={len(points)} {(time.perf_counter() - started) * 1000:.1f}ms")
+    return {
+        "points": points,
+        "max_intensity": max_intensity or 1,
+        "grid_size": grid,
+        "gaussian_sigma": sigma,
+        "total": int(counts.sum()),
+        "time_range": {"start": start.isoformat(), "end": end.isoformat()},
+    }
+
+
+__all__ = [
+    "HeatmapAggregator",
+    "bin_cell",
+    "bin_points",
+    "build_heatmap",
+    "downsample_grid",
+    "fetch_heatmap_counts",
+    "gaussian_smooth",
+]
@@ -0,0 +1,534 @@
+"""
+推論後端抽象層
+
+YOLOService / TaskProcessor / VideoAnalysisService 透過 InferenceBackend 執行偵測：
+- UltralyticsBackend：原本的 PyTorch eager 推論（.pt 或 ultralytics 可讀的匯出格式）
+- OnnxRuntimeBackend：以 onnxruntime 執行匯出的 .onnx，CPU 機器上的主要路徑；
+  指定 openvino 時改用 OpenVINO Execution Provider（同樣讀取 .onnx 匯出檔）
+  前後處理（letterbox、解碼、NMS）只使用 NumPy，不經過 torch
+
+另外提供 export_model()，將 uploads/models 下的 .pt 轉成快取的 ONNX 產物。
+"""
+
+from __future__ import annotations
+
+import ast
+import json
+import shutil
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.config import settings, YOLO_CLASSES
+from app.core.logger import detection_logger
+from app.core.metrics import timed
+from app.core.paths import get_models_dir, resolve_model_path
+from app.services.model_registry import ModelLease, get_model_registry, resolve_device
+from app.utils.exceptions import InferenceException
+
+try:
+    import onnxruntime as ort
+except ImportError:  # onnxruntime 為選用依賴（pip install .[onnx]）
+    ort = None
+
+ONNX_SUFFIXES = (".onnx",)
+BACKEND_CHOICES = ("auto", "ultralytics", "onnxruntime", "openvino")
+
+
+@dataclass
+class RawDetections:
+    """單張影像的原始偵測結果（原圖座標）"""
+    xyxy: np.ndarray          # (N, 4) float32
+    confidence: np.ndarray    # (N,) float32
+    class_id: np.ndarray      # (N,) int64
+
+    @classmethod
+    def empty(cls) -> "RawDetections":
+        return cls(
+            xyxy=np.zeros((0, 4), dtype=np.float32),
+            confidence=np.zeros((0,), dtype=np.float32),
+            class_id=np.zeros((0,), dtype=np.int64),
+        )
+
+    @classmethod
+    def from_ultralytics(cls, result: Any) -> "RawDetections":
+        boxes = getattr(result, "boxes", None)
+        if boxes is None or len(boxes) == 0:
+            return cls.empty()
+        boxes = boxes.cpu().numpy()
+        return cls(
+            xyxy=np.asarray(boxes.xyxy, dtype=np.float32).reshape(-1, 4),
+            confidence=np.asarray(boxes.conf, dtype=np.float32).reshape(-1),
+            class_id=np.asarray(boxes.cls, dtype=np.int64).reshape(-1),
+        )
+
+    def __len__(self) -> int:
+        return int(self.confidence.shape[0])
+
+
+# ===== NumPy 前後處理 =====
+
+def letterbox(image: np.ndarray, new_shape: Tuple[int, int] = (640, 640),
+              pad_value: int = 114) -> Tuple[np.ndarray, float, Tuple[float, float]]:
+    """等比例縮放並補邊至 new_shape（與 ultralytics 相同的 letterbox 規則）"""
+    import cv2
+
+    height, width = image.shape[:2]
+    ratio = min(new_shape[0] / height, new_shape[1] / width)
+    new_w, new_h = int(round(width * ratio)), int(round(height * ratio))
+    pad_x = (new_shape[1] - new_w) / 2
+    pad_y = (new_shape[0] - new_h) / 2
+
+    if (width, height) != (new_w, new_h):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+
+    top, left = int(round(pad_y - 0.1)), int(round(pad_x - 0.1))
+    canvas = np.full((new_shape[0], new_shape[1], 3), pad_value, dtype=np.uint8)
+    canvas[top:top + new_h, left:left + new_w] = image
+    return canvas, ratio, (left, top)
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """純 NumPy 非極大值抑制，回傳保留的索引（依分數遞減）"""
+    if boxes.shape[0] == 0:
+        return np.zeros((0,), dtype=np.int64)
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    order = scores.argsort()[::-1]
+    keep: List[int] = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(int(i))
+        rest = order[1:]
+        xx1 = np.maximum(x1[i], x1[rest])
+        yy1 = np.maximum(y1[i], y1[rest])
+        xx2 = np.minimum(x2[i], x2[rest])
+        yy2 = np.minimum(y2[i], y2[rest])
+        inter = np.clip(xx2 - xx1, 0, None) * np.clip(yy2 - yy1, 0, None)
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def postprocess_yolo_output(output: np.ndarray, conf_threshold: float, iou_threshold: float,
+                            max_detections: int, ratio: float, pad: Tuple[float, float],
+                            image_shape: Tuple[int, ...]) -> RawDetections:
+    """
+    解碼單張影像的 YOLO ONNX 輸出
+
+    支援兩種格式：
+    - 原始輸出 (4 + nc, anchors)：xywh + 各類別分數，需要 NMS
+    - 內含 NMS 的輸出 (N, 6)：x1, y1, x2, y2, conf, cls
+    """
+    if output.ndim == 2 and output.shape[1] == 6 and output.shape[0] != 6:
+        rows = output[output[:, 4] >= conf_threshold][:max_detections]
+        xyxy = rows[:, :4].astype(np.float32)
+        confidence = rows[:, 4].astype(np.float32)
+        class_id = rows[:, 5].astype(np.int64)
+    else:
+        preds = output.T  # (anchors, 4 + nc)
+        scores = preds[:, 4:]
+        class_id = scores.argmax(axis=1)
+        confidence = scores[np.arange(scores.shape[0]), class_id]
+        mask = confidence >= conf_threshold
+        if not np.any(mask):
+            return RawDetections.empty()
+        preds, class_id, confidence = preds[mask], class_id[mask], confidence[mask]
+
+        xywh = preds[:, :4]
+        xyxy = np.empty_like(xywh)
+        xyxy[:, 0] = xywh[:, 0] - xywh[:, 2] / 2
+        xyxy[:, 1] = xywh[:, 1] - xywh[:, 3] / 2
+        xyxy[:, 2] = xywh[:, 0] + xywh[:, 2] / 2
+        xyxy[:, 3] = xywh[:, 1] + xywh[:, 3] / 2
+
+        # 類別各自做 NMS：以類別位移讓不同類別的框不互相抑制
+        offsets = class_id[:, None].astype(np.float32) * 7680.0
+        keep = nms(xyxy + offsets, confidence, iou_threshold)[:max_detections]
+        xyxy = xyxy[keep].astype(np.float32)
+        confidence = confidence[keep].astype(np.float32)
+        class_id = class_id[keep].astype(np.int64)
+
+    # 反推回原圖座標
+    xyxy[:, [0, 2]] -= pad[0]
+    xyxy[:, [1, 3]] -= pad[1]
+    xyxy /= ratio
+    height, width = image_shape[:2]
+    xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, width)
+    xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, height)
+    return RawDetections(xyxy=xyxy, confidence=confidence, class_id=class_id)
+
+
+# ===== ONNX Runtime 模型 =====
+
+class OnnxModel:
+    """onnxruntime 推論工作階段（由模型註冊表快取共用）"""
+
+    def __init__(self, model_path: str, device: str = "cpu", provider: str = "onnxruntime"):
+        if ort is None:
+            raise InferenceException("onnxruntime 未安裝，無法使用 ONNX 後端")
+        self.model_path = model_path
+        self.provider = provider
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        if settings.onnx_intra_op_threads > 0:
+            options.intra_op_num_threads = settings.onnx_intra_op_threads
+        if settings.onnx_inter_op_threads > 0:
+            options.inter_op_num_threads = settings.onnx_inter_op_threads
+        options.enable_mem_pattern = True
+        options.enable_cpu_mem_arena = True
+
+        self.session = ort.InferenceSession(
+            model_path, sess_options=options, providers=self._select_providers(device, provider)
+        )
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.output_names = [output.name for output in self.session.get_outputs()]
+
+        shape = model_input.shape
+        self.dynamic_batch = not isinstance(shape[0], int)
+        self.imgsz = (
+            (int(shape[2]), int(shape[3]))
+            if isinstance(shape[2], int) and isinstance(shape[3], int)
+            else (settings.onnx_imgsz, settings.onnx_imgsz)
+        )
+        self.names = self._read_names()
+        self.fp16 = "float16" in (model_input.type or "")
+        detection_logger.info(
+            f"ONNX 模型載入: {model_path}, providers={self.session.get_providers()}, "
+            f"imgsz={self.imgsz}, dynamic_batch={self.dynamic_batch}"
+        )
+
+    @staticmethod
+    def _select_providers(device: str, provider: str) -> List[str]:
+        available = set(ort.get_available_providers())
+        preferred: List[str] = []
+        if provider == "openvino":
+            preferred.append("OpenVINOExecutionProvider")
+        if device.startswith("cuda"):
+            preferred.append("CUDAExecutionProvider")
+        preferred.append("CPUExecutionProvider")
+        selected = [p for p in preferred if p in available]
+        return selected or ["CPUExecutionProvider"]
+
+    def _read_names(self) -> Dict[int, str]:
+        try:
+            raw = self.session.get_modelmeta().custom_metadata_map.get("names")
+            if raw:
+                parsed = ast.literal_eval(raw)
+                return {int(k): str(v) for k, v in parsed.items()}
+        except Exception as e:
+            detection_logger.debug(f"讀取 ONNX 類別名稱失敗，使用 COCO 預設: {e}")
+        return dict(YOLO_CLASSES)
+
+    def _preprocess(self, frames: Sequence[np.ndarray]):
+        batch, metas = [], []
+        for frame in frames:
+            padded, ratio, pad = letterbox(frame, self.imgsz)
+            # BGR -> RGB, HWC -> CHW, 0~1
+            tensor = padded[:, :, ::-1].transpose(2, 0, 1)
+            batch.append(tensor)
+            metas.append((ratio, pad, frame.shape))
+        blob = np.ascontiguousarray(np.stack(batch), dtype=np.float32)
+        blob *= 1.0 / 255.0
+        if self.fp16:
+            blob = blob.astype(np.float16)
+        return blob, metas
+
+    def _run(self, blob: np.ndarray) -> np.ndarray:
+        # IO binding：輸入直接綁定 CPU 記憶體，避免 run() 額外複製
+        binding = self.session.io_binding()
+        binding.bind_cpu_input(self.input_name, blob)
+        binding.bind_output(self.output_names[0], "cpu")
+        self.session.run_with_iobinding(binding)
+        return binding.copy_outputs_to_cpu()[0]
+
+    def predict(self, frames: Sequence[np.ndarray], conf_threshold: float,
+                iou_threshold: float, max_detections: int) -> List[RawDetections]:
+        chunks = [list(frames)] if self.dynamic_batch else [[frame] for frame in frames]
+        results: List[RawDetections] = []
+        for chunk in chunks:
+            with timed("preprocess", "onnx_letterbox", provider=self.provider):
+                blob, metas = self._preprocess(chunk)
+            with timed("inference", "onnx_session_run", provider=self.provider):
+                output = self._run(blob).astype(np.float32, copy=False)
+            with timed("postprocess", "onnx_decode_nms", provider=self.provider):
+                for index, (ratio, pad, shape) in enumerate(metas):
+                    results.append(
+                        postprocess_yolo_output(
+                            output[index], conf_threshold, iou_threshold,
+                            max_detections, ratio, pad, shape,
+                        )
+                    )
+        return results
+
+
+# ===== 後端 =====
+
+class InferenceBackend(ABC):
+    """推論後端介面"""
+
+    name = "base"
+
+    def __init__(self, lease: ModelLease):
+        self.lease = lease
+
+    @property
+    def model_path(self) -> str:
+        return self.lease.path
+
+    @property
+    @abstractmethod
+    def names(self) -> Dict[int, str]:
+        """類別編號 -> 類別名稱"""
+
+    @abstractmethod
+    def predict(self, frames: Sequence[np.ndarray], conf_threshold: float,
+                iou_threshold: float, max_detections: int) -> List[RawDetections]:
+        """批次推論，回傳與 frames 等長的結果"""
+
+    def ensure_loaded(self) -> None:
+        self.lease.ensure_loaded()
+
+    def release(self) -> None:
+        self.lease.release()
+
+
+class UltralyticsBackend(InferenceBackend):
+    """ultralytics YOLO（PyTorch eager）"""
+
+    name = "ultralytics"
+
+    @property
+    def names(self) -> Dict[int, str]:
+        return dict(self.lease.model.names)
+
+    def predict(self, frames: Sequence[np.ndarray], conf_threshold: float,
+                iou_threshold: float, max_detections: int) -> List[RawDetections]:
+        with self.lease.inference() as model:
+            results = model.predict(
+                list(frames),
+                conf=conf_threshold,
+                iou=iou_threshold,
+                max_det=max_detections,
+                device=self.lease.device,
+                verbose=False,
+                save=False,
+                show=False,
+                stream=False,
+            )
+        return [RawDetections.from_ultralytics(result) for result in results]
+
+
+class OnnxRuntimeBackend(InferenceBackend):
+    """onnxruntime（可選 OpenVINO EP）"""
+
+    name = "onnxruntime"
+
+    @property
+    def names(self) -> Dict[int, str]:
+        return self.lease.model.names
+
+    def predict(self, frames: Sequence[np.ndarray], conf_threshold: float,
+                iou_threshold: float, max_detections: int) -> List[RawDetections]:
+        with self.lease.inference() as model:
+            return model.predict(frames, conf_threshold, iou_threshold, max_detections)
+
+
+def select_backend_name(model_path: str, backend: Optional[str] = None) -> str:
+    """依設定與檔案格式決定後端"""
+    choice = (backend or settings.inference_backend or "auto").lower()
+    if choice not in BACKEND_CHOICES:
+        detection_logger.warning(f"未知的推論後端 {choice}，改用 auto")
+        choice = "auto"
+    is_onnx = str(model_path).lower().endswith(ONNX_SUFFIXES)
+    if choice == "auto":
+        return "onnxruntime" if is_onnx and ort is not None else "ultralytics"
+    if choice in ("onnxruntime", "openvino") and not is_onnx:
+        # .pt 無法直接給 onnxruntime，退回 ultralytics
+        return "ultralytics"
+    if choice in ("onnxruntime", "openvino") and ort is None:
+        detection_logger.warning("onnxruntime 未安裝，改用 ultralytics 後端")
+        return "ultralytics"
+    return choice
+
+
+def open_backend(model_path: str, device: Optional[str] = None,
+                 backend: Optional[str] = None, warmup: bool = False) -> InferenceBackend:
+    """
+    從模型註冊表取得推論後端（不立即載入權重）
+
+    settings.onnx_prefer_exported 開啟時，.pt 若已有快取的 ONNX 匯出檔則優先使用。
+    """
+    resolved = resolve_model_path(model_path) or model_path
+    if settings.onnx_prefer_exported and str(resolved).endswith(".pt"):
+        exported = find_exported_artifact(resolved)
+        if exported is not None:
+            resolved = str(exported)
+
+    name = select_backend_name(resolved, backend)
+    registry = get_model_registry()
+    if name == "ultralytics":
+        return UltralyticsBackend(registry.acquire(resolved, device, task="detect", warmup=warmup))
+    lease = registry.acquire(resolved, device, task="detect", backend=name)
+    return OnnxRuntimeBackend(lease)
+
+
+def load_onnx_model(model_path: str, device: str, provider: str) -> OnnxModel:
+    """模型註冊表使用的 ONNX 載入函式"""
+    return OnnxModel(model_path, device=resolve_device(device), provider=provider)
+
+
+# ===== 模型匯出 =====
+
+# openvino 後端是 onnxruntime + OpenVINO EP，直接讀 .onnx，不需要獨立的 IR 匯出
+EXPORT_FORMATS = ("onnx",)
+_export_lock = threading.Lock()
+
+
+def get_export_dir(create: bool = False) -> Path:
+    export_dir = get_models_dir(create=create) / "exported"
+    if create:
+        export_dir.mkdir(parents=True, exist_ok=True)
+    return export_dir
+
+
+def _artifact_stem(model_path: Path, imgsz: int, half: bool) -> str:
+    return f"{model_path.stem}_{imgsz}{'_fp16' if half else ''}"
+
+
+def _manifest_path(export_dir: Path, stem: str, fmt: str) -> Path:
+    return export_dir / f"{stem}.{fmt}.json"
+
+
+def find_exported_artifact(model_path: str, fmt: str = "onnx",
+                           imgsz: Optional[int] = None, half: bool = False) -> Optional[Path]:
+    """尋找仍有效（來源 .pt 未變更）的快取匯出檔"""
+    source = Path(model_path)
+    if not source.exists():
+        return None
+    export_dir = get_export_dir()
+    stem = _artifact_stem(source, imgsz or settings.onnx_imgsz, half)
+    manifest = _manifest_path(export_dir, stem, fmt)
+    if not manifest.exists():
+        return None
+    try:
+        data = json.loads(manifest.read_text(encoding="utf-8"))
+        artifact = Path(data["artifact"])
+        stat = source.stat()
+        if (
+            artifact.exists()
+            and data.get("source_mtime") == stat.st_mtime
+            and data.get("source_size") == stat.st_size
+        ):
+            return artifact
+    except Exception as e:
+        detection_logger.debug(f"讀取匯出清單失敗 {manifest}: {e}")
+    return None
+
+
+def export_model(model_path: str, fmt: str = "onnx", imgsz: Optional[int] = None,
+                 half: bool = False, dynamic: bool = True, force: bool = False) -> Dict[str, Any]:
+    """
+    將 .pt 轉為最佳化推論產物並快取於 uploads/models/exported
+
+    同一來源檔（大小與修改時間相同）只匯出一次，除非 force=True。
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"不支援的匯出格式: {fmt}")
+    source = Path(resolve_model_path(model_path) or model_path)
+    if not source.exists() or source.suffix != ".pt":
+        raise FileNotFoundError(f"找不到可匯出的 .pt 模型: {model_path}")
+
+    imgsz = imgsz or settings.onnx_imgsz
+    export_dir = get_export_dir(create=True)
+    stem = _artifact_stem(source, imgsz, half)
+
+    with _export_lock:
+        if not force:
+            cached = find_exported_artifact(str(source), fmt, imgsz, half)
+            if cached is not None:
+                return {"source": str(source), "artifact": str(cached), "format": fmt, "cached": True}
+
+        from ultralytics import YOLO
+
+        detection_logger.info(f"開始匯出模型 {source} -> {fmt} (imgsz={imgsz}, half={half})")
+        exported = Path(
+            YOLO(str(source)).export(
+                format=fmt,
+                imgsz=imgsz,
+                half=half,
+                dynamic=dynamic,
+                simplify=True,
+                verbose=False,
+            )
+        )
+
+        target = export_dir / f"{stem}.onnx"
+        if target.exists():
+            target.unlink()
+        shutil.move(str(exported), str(target))
+
+        stat = source.stat()
+        _manifest_path(export_dir, stem, fmt).write_text(
+            json.dumps(
+                {
+                    "source": str(source),
+                    "source_mtime": stat.st_mtime,
+                    "source_size": stat.st_size,
+                    "artifact": str(target),
+                    "format": fmt,
+                    "imgsz": imgsz,
+                    "half": half,
+                    "dynamic": dynamic,
+                },
+                ensure_ascii=False,
+                indent=2,
+            ),
+            encoding="utf-8",
+        )
+        detection_logger.info(f"模型匯出完成: {target}")
+        return {"source": str(source), "artifact": str(target), "format": fmt, "cached": False}
+
+
+def list_exported_artifacts() -> List[Dict[str, Any]]:
+    """列出快取的匯出產物"""
+    export_dir = get_export_dir()
+    if not export_dir.exists():
+        return []
+    artifacts = []
+    for manifest in sorted(export_dir.glob("*.json")):
+        try:
+            data = json.loads(manifest.read_text(encoding="utf-8"))
+        except Exception:
+            continue
+        source = Path(data.get("source", ""))
+        data["stale"] = not (
+            source.exists()
+            and source.stat().st_mtime == data.get("source_mtime")
+            and Path(data.get("artifact", "")).exists()
+        )
+        artifacts.append(data)
+    return artifacts
+
+
+__all__ = [
+    "RawDetections",
+    "InferenceBackend",
+    "UltralyticsBackend",
+    "OnnxRuntimeBackend",
+    "OnnxModel",
+    "open_backend",
+    "select_backend_name",
+    "export_model",
+    "find_exported_artifact",
+    "list_exported_artifacts",
+    "letterbox",
+    "nms",
+]
@@ -6,7 +6,6 @@ Live Person Camera Service - 後端服務版本
 """
 
 import asyncio
-import base64
 import csv
 import queue
 import threading
@@ -15,7 +14,6 @@ from dataclasses import dataclass
 from fractions import Fraction
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Set, Tuple
-import cv2
 import numpy as np
 import supervision as sv
 import torch
@@ -27,6 +25,9 @@ import av
 from app.core.config import settings
 from app.core.logger import detection_logger
 from app.services.camera_stream_manager import camera_stream_manager, FrameData, StreamConsumer
+from app.services.model_registry import ModelLease, get_model_registry
+from app.services.preview_encoder import get_preview_encoder_service
+from app.utils.preview_codec import PreviewFrame, normalize_preview_format, send_preview
 
 
 @dataclass
@@ -95,6 +96,7 @@ class LivePersonCameraService:
 
         # 模型和檢測器
         self.model: Optional[YOLO] = None
+        self._model_lease: Optional[ModelLease] = None
         self.tracker: Optional[sv.ByteTrack] = None
 
         # 註解器
@@ -124,10 +126,12 @@ class LivePersonCameraService:
         self.fps_value = 0.0
         self.camera_id: Optional[str] = None
         self.websocket_clients: Set[WebSocket] = set()
+        # 每個 WebSocket 客戶端協商的預覽格式（json / binary）
+        self.websocket_formats: Dict[WebSocket, str] = {}
         self._ws_lock: Optional[asyncio.Lock] = None
         self.broadcast_queue: Optional[asyncio.Queue] = None
         self.broadcast_task: Optional[asyncio.Task] = None
-        self.latest_frame_payload: Optional[Dict[str, Any]] = None
+        self.latest_frame_payload: Optional[PreviewFrame] = None
         self._loop: Optional[asyncio.AbstractEventLoop] = None
         self.frame_queue: Optional["queue.Queue[FrameData]"] = None
         self.worker_thread: Optional[threading.Thread] = None
@@ -150,11 +154,15 @@ class LivePersonCameraService:
         """初始化模型和註解器"""
         detection_logger.info("初始化 Live Person Camera 組件")
 
-        # 初始化模型
-        self.model = YOLO(self.config.model_path)
+        # 初始化模型（經由模型註冊表共用權重，裝置為註冊表鍵的一部分）
         self._inference_device = self._resolve_device()
         detection_logger.info(f"Live Person Camera 使用裝置: {self._inference_device}")
-        self.model.to(self._inference_device)
+        if self._model_lease is not None:
+            self._model_lease.release()
+        self._model_lease = get_model_registry().acquire(
+            self.config.model_path, self._inference_device, task="detect"
+        )
+        self.model = self._model_lease.ensure_loaded()
 
         # 初始化 tracker
         self.tracker = sv.ByteTrack()
@@ -272,13 +280,14 @@ class LivePersonCameraService:
             self.last_frame_time = now_perf
 
             # YOLO 檢測
-            result = self.model(
-                frame,
-                imgsz=self.config.imgsz,
-                conf=self.config.conf_threshold,
-                device=self._inference_device,
-                verbose=False,
-            )[0]
+            with self._model_lease.inference() as model:
+                result = model(
+                    frame,
+                    imgsz=self.config.imgsz,
+                    conf=self.config.conf_threshold,
+                    device=self._inference_device,
+                    verbose=False,
+                )[0]
 
             detections = sv.Detections.from_ultralytics(result)
             detections = self._filter_person_detections(detections, result)
@@ -314,26 +323,35 @@ class LivePersonCameraService:
             if self.csv_writer:
                 self._log_to_csv(detections, object_types, zone_stats, person_count, avg_confidence, current_time)
 
-            # 更新最新影像供前端預覽
+            # 更新最新影像供前端預覽（標註結果本身就是新陣列，設為唯讀後直接共享）
+            contiguous_bgr.flags.writeable = False
             with self._latest_frame_lock:
-                self.latest_frame = contiguous_bgr.copy()
+                self.latest_frame = contiguous_bgr
                 self.latest_frame_timestamp = current_time
 
             # 建立廣播訊息（使用標註後影像）
             should_broadcast = current_time - self.last_broadcast_time >= self.broadcast_interval
             if should_broadcast:
                 try:
-                    ok, buffer = cv2.imencode(".jpg", contiguous_bgr)
-                    if ok:
+                    jpeg = get_preview_encoder_service().encode(
+                        f"live_person_{self.camera_id}", self.frame_index, contiguous_bgr
+                    )
+                    if jpeg:
                         detections_payload = self._build_detections_payload(detections, object_types)
-                        payload = {
-                            "type": "frame",
-                            "timestamp": current_time,
-                            "width": contiguous_bgr.shape[1],
-                            "height": contiguous_bgr.shape[0],
-                            "image": base64.b64encode(buffer).decode("ascii"),
-                            "detections": detections_payload,
-                        }
+                        payload = PreviewFrame(
+                            {
+                                "type": "frame",
+                                "camera_id": self.camera_id,
+                                "frame_number": self.frame_index,
+                                "timestamp": current_time,
+                                "width": contiguous_bgr.shape[1],
+                                "height": contiguous_bgr.shape[0],
+                                "detections": detections_payload,
+                            },
+                            jpeg,
+                        )
+                        # 只為目前客戶端使用的格式封裝，在處理執行緒完成
+                        payload.prepare(set(self.websocket_formats.values()))
                         self.latest_frame_payload = payload
                         self.last_broadcast_time = current_time
                         if self._loop and self.broadcast_queue:
@@ -804,17 +822,21 @@ class LivePersonCameraService:
                 if not self.running or not self.frame_queue:
                     return
 
+                # 排入佇列前取得引用，工作線程處理完（或被擠掉）時釋放
+                frame_data.retain()
                 try:
                     self.frame_queue.put_nowait(frame_data)
                 except queue.Full:
                     try:
-                        self.frame_queue.get_nowait()
+                        dropped = self.frame_queue.get_nowait()
+                        if dropped is not None:
+                            dropped.release()
                     except queue.Empty:
                         pass
                     try:
                         self.frame_queue.put_nowait(frame_data)
                     except queue.Full:
-                        pass
+                        frame_data.release()
             except Exception as e:
                 detection_logger.error(f"幀處理回調失敗: {e}")
         return frame_callback
@@ -836,7 +858,10 @@ class LivePersonCameraService:
                 if frame_data is None:
                     break
 
-                self._process_frame(frame_data)
+                try:
+                    self._process_frame(frame_data)
+                finally:
+                    frame_data.release()
             except Exception as e:
                 detection_logger.error(f"背景工作線程處理幀失敗: {e}")
 
@@ -862,6 +887,7 @@ class LivePersonCameraService:
 
             await self._shutdown_broadcast()
             await self._shutdown_webrtc()
+            get_preview_encoder_service().release(f"live_person_{camera_id}")
 
             # 移除消費者
             if self.consumer_id:
@@ -874,6 +900,12 @@ class LivePersonCameraService:
                 self.csv_file = None
                 self.csv_writer = None
 
+            # 歸還模型租約
+            if self._model_lease is not None:
+                self._model_lease.release()
+                self._model_lease = None
+                self.model = None
+
             # 清理狀態
             self.line_tracker_states.clear()
             self.dwell_states.clear()
@@ -890,11 +922,11 @@ class LivePersonCameraService:
             return False
 
     def get_latest_frame(self) -> Optional[Tuple[np.ndarray, float]]:
-        """取得最新註解後影像"""
+        """取得最新註解後影像（唯讀，需修改時請自行複製）"""
         with self._latest_frame_lock:
             if self.latest_frame is None:
                 return None
-            return self.latest_frame.copy(), self.latest_frame_timestamp
+            return self.latest_frame, self.latest_frame_timestamp
 
     def get_stats(self) -> Dict[str, Any]:
         """獲取服務統計"""
@@ -915,7 +947,7 @@ class LivePersonCameraService:
             }
         }
 
-    async def _enqueue_frame(self, payload: Dict[str, Any]) -> None:
+    async def _enqueue_frame(self, payload: PreviewFrame) -> None:
         """排入待廣播的影像訊息"""
         if not self.broadcast_queue:
             return
@@ -1101,26 +1133,26 @@ class LivePersonCameraService:
         self.webrtc_peers = set()
         self._peer_lock = None
 
-    async def _broadcast_payload(self, payload: Dict[str, Any]) -> None:
-        """向所有 WebSocket 客戶端推送資料"""
+    async def _broadcast_payload(self, payload: PreviewFrame) -> None:
+        """向所有 WebSocket 客戶端推送資料（依各客戶端的格式）"""
         if not self._ws_lock:
             return
 
         to_remove: List[WebSocket] = []
         async with self._ws_lock:
-            clients = list(self.websocket_clients)
+            clients = [(websocket, self.websocket_formats.get(websocket, "json")) for websocket in self.websocket_clients]
 
-        for websocket in clients:
+        for websocket, preview_format in clients:
             try:
-                await websocket.send_json(payload)
+                await send_preview(websocket, payload, preview_format)
             except Exception:
                 to_remove.append(websocket)
 
         for websocket in to_remove:
             await self.unregister_client(websocket)
 
-    async def register_client(self, websocket: WebSocket) -> None:
-        """註冊 WebSocket 客戶端"""
+    async def register_client(self, websocket: WebSocket, preview_format: str = "json") -> None:
+        """註冊 WebSocket 客戶端（preview_format 為 json 或 binary）"""
         await websocket.accept()
 
         if not self.running:
@@ -1131,12 +1163,14 @@ class LivePersonCameraService:
         if not self._ws_lock:
             self._ws_lock = asyncio.Lock()
 
+        preview_format = normalize_preview_format(preview_format)
         async with self._ws_lock:
             self.websocket_clients.add(websocket)
+            self.websocket_formats[websocket] = preview_format
 
         if self.latest_frame_payload:
             try:
-                await websocket.send_json(self.latest_frame_payload)
+                await send_preview(websocket, self.latest_frame_payload, preview_format)
             except Exception:
                 await self.unregister_client(websocket)
 
@@ -1148,6 +1182,7 @@ class LivePersonCameraService:
         async with self._ws_lock:
             if websocket in self.websocket_clients:
                 self.websocket_clients.remove(websocket)
+            self.websocket_formats.pop(websocket, None)
 
         try:
             await websocket.close()
@@ -1178,6 +1213,7 @@ class LivePersonCameraService:
             async with self._ws_lock:
                 clients = list(self.websocket_clients)
                 self.websocket_clients.clear()
+                self.websocket_formats.clear()
         else:
             clients = []
 
@@ -0,0 +1,240 @@
+"""
+記憶體整理（housekeeping）策略
+
+原本每次推論結束都執行 gc.collect() 與 torch.cuda.empty_cache()，
+完整 GC 每幀數毫秒且會暫停所有執行緒。改為背景執行緒定期檢查：
+- 行程 RSS 超過上限
+- CUDA allocator 保留但未使用的記憶體超過上限
+- 自上次整理後已推論的影格數達到間隔
+任一條件成立（且已過最短冷卻時間）才整理一次，並記錄整理耗時。
+"""
+
+from __future__ import annotations
+
+import gc
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Deque, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.logger import detection_logger
+
+try:
+    import psutil
+except ImportError:  # psutil 為選用依賴，缺少時不檢查 RSS
+    psutil = None
+
+_MB = 1024 * 1024
+
+
+class MemoryHousekeeper:
+    """依記憶體壓力觸發 GC / CUDA 快取釋放的背景整理器（單例）"""
+
+    _instance: Optional["MemoryHousekeeper"] = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+        self.enabled = settings.housekeeping_enabled
+        self.check_interval = max(0.1, settings.housekeeping_check_interval)
+        self.min_interval = max(0.0, settings.housekeeping_min_interval)
+        self.frame_interval = settings.housekeeping_frame_interval
+        self.rss_limit_mb = settings.housekeeping_rss_limit_mb
+        self.cuda_reserved_limit_mb = settings.housekeeping_cuda_reserved_limit_mb
+        self.gc_generation = min(2, max(0, settings.housekeeping_gc_generation))
+
+        self._frames_since_run = 0
+        self._frame_lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._process = psutil.Process() if psutil is not None else None
+
+        self._last_run = 0.0
+        self._run_count = 0
+        self._total_time = 0.0
+        self._reasons: Counter = Counter()
+        self._durations: Deque[float] = deque(maxlen=256)
+        self._last_report: Dict[str, Any] = {}
+        self._initialized = True
+
+    # ===== 熱路徑 =====
+
+    def record_frames(self, count: int = 1) -> None:
+        """推論路徑只累加計數（不做任何整理），首次呼叫時啟動背景執行緒"""
+        if not self.enabled:
+            return
+        with self._frame_lock:
+            self._frames_since_run += count
+        if self._thread is None:
+            self.start()
+
+    # ===== 背景執行緒 =====
+
+    def start(self) -> None:
+        if not self.enabled:
+            return
+        with self._run_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(
+                target=self._run_loop, name="memory-housekeeper", daemon=True
+            )
+            self._thread.start()
+        detection_logger.info(
+            f"記憶體整理器啟動: 每 {self.check_interval}s 檢查, "
+            f"RSS 上限 {self.rss_limit_mb}MB, CUDA 保留上限 {self.cuda_reserved_limit_mb}MB, "
+            f"影格間隔 {self.frame_interval}"
+        )
+
+    def stop(self, timeout: float = 2.0) -> None:
+        self._stop_event.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout=timeout)
+        self._thread = None
+
+    def _run_loop(self) -> None:
+        while not self._stop_event.wait(self.check_interval):
+            try:
+                reason = self._pressure_reason()
+                if reason is not None:
+                    self.collect(reason)
+            except Exception as e:
+                detection_logger.error(f"記憶體整理檢查失敗: {e}")
+
+    def _rss_mb(self) -> Optional[float]:
+        if self._process is None:
+            return None
+        try:
+            return self._process.memory_info().rss / _MB
+        except Exception:
+            return None
+
+    @staticmethod
+    def _cuda_memory_mb() -> Optional[Dict[str, float]]:
+        try:
+            import torch
+        except ImportError:
+            return None
+        if not torch.cuda.is_available():
+            return None
+        return {
+            "allocated": torch.cuda.memory_allocated() / _MB,
+            "reserved": torch.cuda.memory_reserved() / _MB,
+        }
+
+    def _pressure_reason(self) -> Optional[str]:
+        if time.time() - self._last_run < self.min_interval:
+            return None
+
+        rss = self._rss_mb()
+        if self.rss_limit_mb > 0 and rss is not None and rss >= self.rss_limit_mb:
+            return "rss"
+
+        cuda = self._cuda_memory_mb()
+        if (
+            self.cuda_reserved_limit_mb > 0
+            and cuda is not None
+            and cuda["reserved"] - cuda["allocated"] >= self.cuda_reserved_limit_mb
+        ):
+            return "cuda_reserved"
+
+        if self.frame_interval > 0 and self._frames_since_run >= self.frame_interval:
+            return "frame_interval"
+        return None
+
+    def collect(self, reason: str = "manual") -> Dict[str, Any]:
+        """執行一次整理並回傳報告（耗時、回收物件數、前後記憶體）"""
+        with self._run_lock:
+            rss_before = self._rss_mb()
+            cuda_before = self._cuda_memory_mb()
+
+            start = time.perf_counter()
+            collected = gc.collect(self.gc_generation)
+            gc_time = time.perf_counter() - start
+            if cuda_before is not None:
+                import torch
+
+                torch.cuda.empty_cache()
+            duration = time.perf_counter() - start
+
+            with self._frame_lock:
+                frames = self._frames_since_run
+                self._frames_since_run = 0
+            self._last_run = time.time()
+            self._run_count += 1
+            self._total_time += duration
+            self._reasons[reason] += 1
+            self._durations.append(duration)
+
+            report = {
+                "reason": reason,
+                "timestamp": self._last_run,
+                "duration_ms": duration * 1000,
+                "gc_ms": gc_time * 1000,
+                "collected_objects": collected,
+                "frames_since_last_run": frames,
+                "rss_before_mb": rss_before,
+                "rss_after_mb": self._rss_mb(),
+                "cuda_before_mb": cuda_before,
+                "cuda_after_mb": self._cuda_memory_mb(),
+            }
+            self._last_report = report
+
+        detection_logger.info(
+            f"記憶體整理完成 ({reason}): 耗時 {duration * 1000:.1f}ms, "
+            f"回收 {collected} 物件, 期間影格 {frames}"
+        )
+        return report
+
+    @staticmethod
+    def _percentile(values: List[float], percentile: float) -> float:
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        index = min(len(ordered) - 1, int(round(percentile / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def get_stats(self) -> Dict[str, Any]:
+        durations = list(self._durations)
+        return {
+            "enabled": self.enabled,
+            "running": self._thread is not None and self._thread.is_alive(),
+            "policy": {
+                "check_interval": self.check_interval,
+                "min_interval": self.min_interval,
+                "frame_interval": self.frame_interval,
+                "rss_limit_mb": self.rss_limit_mb,
+                "cuda_reserved_limit_mb": self.cuda_reserved_limit_mb,
+                "gc_generation": self.gc_generation,
+            },
+            "runs": self._run_count,
+            "reasons": dict(self._reasons),
+            "frames_since_last_run": self._frames_since_run,
+            "total_time_ms": self._total_time * 1000,
+            "duration_ms": {
+                "p50": self._percentile(durations, 50) * 1000,
+                "p95": self._percentile(durations, 95) * 1000,
+                "max": max(durations) * 1000 if durations else 0.0,
+            },
+            "rss_mb": self._rss_mb(),
+            "cuda_mb": self._cuda_memory_mb(),
+            "last_run": self._last_report,
+        }
+
+
+def get_memory_housekeeper() -> MemoryHousekeeper:
+    """獲取記憶體整理器實例"""
+    return MemoryHousekeeper()
@@ -0,0 +1,309 @@
+"""
+YOLO 模型共享註冊表
+
+以 (解析後路徑, 裝置, 任務) 為鍵，在整個行程內共用同一份權重：
+- 參考計數：各服務 acquire / release，計數歸零的模型進入閒置清單
+- 延遲載入：第一次真正推論時才載入權重
+- LRU 淘汰：閒置模型超過上限時釋放最久未使用者
+- 推論池：每個模型最多建立 pool_size 份副本，推論時借出、用完歸還，
+  確保 ultralytics predictor 不會被多執行緒同時使用
+
+task 區分使用方式（"detect" / "track"）：model.track 會在 predictor 上
+註冊追蹤回呼並保存追蹤狀態，不能與單純 predict 的實例混用。
+非 ultralytics 後端（onnxruntime / openvino）以 "detect@onnxruntime" 形式記錄在 task 中。
+"""
+
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.logger import detection_logger
+from app.core.paths import resolve_model_path
+
+ModelKey = Tuple[str, str, str]
+
+
+def resolve_device(device: Optional[str] = None) -> str:
+    """將 "auto" / 空值解析為實際推論裝置"""
+    requested = (device or settings.device or "auto").strip()
+    if not requested or requested.lower() == "auto":
+        try:
+            import torch
+
+            return "cuda" if torch.cuda.is_available() else "cpu"
+        except ImportError:
+            return "cpu"
+    return requested
+
+
+class _ModelEntry:
+    """單一模型（含推論副本池）"""
+
+    def __init__(self, key: ModelKey, pool_size: int, warmup: bool):
+        self.key = key
+        self.pool_size = max(1, pool_size)
+        self.warmup = warmup
+        self.ref_count = 0
+        self.last_used = time.time()
+        self.load_time: Optional[float] = None
+        self.inference_count = 0
+        self._replicas: List[Any] = []
+        self._available: "queue.Queue[Any]" = queue.Queue()
+        self._load_lock = threading.Lock()
+
+    @property
+    def path(self) -> str:
+        return self.key[0]
+
+    @property
+    def device(self) -> str:
+        return self.key[1]
+
+    @property
+    def is_loaded(self) -> bool:
+        return bool(self._replicas)
+
+    @property
+    def backend(self) -> str:
+        _, _, backend = self.key[2].partition("@")
+        return backend or "ultralytics"
+
+    def _create_replica(self) -> Any:
+        start = time.time()
+        if self.backend != "ultralytics":
+            from app.services.inference_backends import load_onnx_model
+
+            model = load_onnx_model(self.path, self.device, self.backend)
+        else:
+            from ultralytics import YOLO
+
+            model = YOLO(self.path)
+            # 匯出格式（.onnx / openvino 等）不支援 .to()
+            if self.path.endswith(".pt"):
+                model.to(self.device)
+        if self.warmup and self.backend == "ultralytics":
+            import numpy as np
+
+            model.predict(
+                np.zeros((640, 640, 3), dtype=np.uint8),
+                verbose=False,
+                save=False,
+                show=False,
+                device=self.device,
+            )
+        elapsed = time.time() - start
+        if self.load_time is None:
+            self.load_time = elapsed
+        detection_logger.info(
+            f"模型註冊表載入: {self.path} device={self.device} task={self.key[2]} "
+            f"副本 {len(self._replicas) + 1}/{self.pool_size}, 耗時 {elapsed:.2f}秒"
+        )
+        return model
+
+    def primary(self) -> Any:
+        """取得主副本（必要時載入），供讀取 names 等屬性使用"""
+        with self._load_lock:
+            if not self._replicas:
+                replica = self._create_replica()
+                self._replicas.append(replica)
+                self._available.put(replica)
+            return self._replicas[0]
+
+    def checkout(self, timeout: Optional[float] = None) -> Any:
+        """借出一個可用副本，池未滿時按需擴充"""
+        self.primary()
+        try:
+            return self._available.get_nowait()
+        except queue.Empty:
+            pass
+        with self._load_lock:
+            if len(self._replicas) < self.pool_size:
+                replica = self._create_replica()
+                self._replicas.append(replica)
+                return replica
+        return self._available.get(timeout=timeout)
+
+    def checkin(self, replica: Any) -> None:
+        self.inference_count += 1
+        self.last_used = time.time()
+        self._available.put(replica)
+
+    def unload(self) -> None:
+        with self._load_lock:
+            self._replicas.clear()
+            self._available = queue.Queue()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "device": self.device,
+            "task": self.key[2],
+            "backend": self.backend,
+            "ref_count": self.ref_count,
+            "loaded": self.is_loaded,
+            "replicas": len(self._replicas),
+            "pool_size": self.pool_size,
+            "inference_count": self.inference_count,
+            "load_time": self.load_time,
+            "last_used": self.last_used,
+        }
+
+
+class ModelLease:
+    """服務持有的模型租約；release 後不可再使用"""
+
+    def __init__(self, registry: "ModelRegistry", entry: _ModelEntry):
+        self._registry = registry
+        self._entry = entry
+        self._released = False
+
+    @property
+    def key(self) -> ModelKey:
+        return self._entry.key
+
+    @property
+    def path(self) -> str:
+        return self._entry.path
+
+    @property
+    def device(self) -> str:
+        return self._entry.device
+
+    @property
+    def model(self) -> Any:
+        """主副本；只用於讀取屬性（names 等），推論請使用 inference()"""
+        self._check()
+        return self._entry.primary()
+
+    def ensure_loaded(self) -> Any:
+        """立即載入權重（在執行器中呼叫以避免阻塞事件迴圈）"""
+        return self.model
+
+    @contextmanager
+    def inference(self, timeout: Optional[float] = None) -> Iterator[Any]:
+        """借出推論副本，離開區塊時自動歸還"""
+        self._check()
+        replica = self._entry.checkout(timeout=timeout)
+        try:
+            yield replica
+        finally:
+            self._entry.checkin(replica)
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._registry._release(self._entry)
+
+    def _check(self) -> None:
+        if self._released:
+            raise RuntimeError(f"模型租約已釋放: {self._entry.path}")
+
+    def __del__(self):
+        try:
+            self.release()
+        except Exception:
+            pass
+
+
+class ModelRegistry:
+    """行程層級的模型註冊表（單例）"""
+
+    _instance: Optional["ModelRegistry"] = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+        self._entries: Dict[ModelKey, _ModelEntry] = {}
+        self._idle: "OrderedDict[ModelKey, _ModelEntry]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.max_idle_models = settings.model_registry_max_idle
+        self.pool_size = settings.model_registry_pool_size
+        self.evictions = 0
+        self._initialized = True
+
+    @staticmethod
+    def make_key(model_path: str, device: Optional[str] = None, task: str = "detect",
+                 backend: str = "ultralytics") -> ModelKey:
+        resolved = resolve_model_path(model_path) or model_path
+        if backend and backend != "ultralytics":
+            task = f"{task}@{backend}"
+        return (resolved, resolve_device(device), task)
+
+    def acquire(
+        self,
+        model_path: str,
+        device: Optional[str] = None,
+        task: str = "detect",
+        warmup: bool = False,
+        backend: str = "ultralytics",
+    ) -> ModelLease:
+        """取得模型租約（不會立即載入權重）"""
+        key = self.make_key(model_path, device, task, backend)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = _ModelEntry(key, self.pool_size, warmup)
+                self._entries[key] = entry
+            self._idle.pop(key, None)
+            entry.ref_count += 1
+            entry.last_used = time.time()
+        return ModelLease(self, entry)
+
+    def _release(self, entry: _ModelEntry) -> None:
+        with self._lock:
+            entry.ref_count = max(0, entry.ref_count - 1)
+            entry.last_used = time.time()
+            if entry.ref_count == 0 and self._entries.get(entry.key) is entry:
+                self._idle[entry.key] = entry
+                self._idle.move_to_end(entry.key)
+                self._evict_idle_locked(self.max_idle_models)
+
+    def _evict_idle_locked(self, keep: int) -> int:
+        evicted = 0
+        while len(self._idle) > max(0, keep):
+            key, entry = self._idle.popitem(last=False)
+            self._entries.pop(key, None)
+            entry.unload()
+            evicted += 1
+            detection_logger.info(f"模型註冊表淘汰閒置模型: {key}")
+        self.evictions += evicted
+        return evicted
+
+    def evict_idle(self, keep: int = 0) -> int:
+        """主動釋放閒置模型（例如記憶體吃緊時）"""
+        with self._lock:
+            return self._evict_idle_locked(keep)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = [entry.stats() for entry in self._entries.values()]
+            idle = len(self._idle)
+        return {
+            "models": entries,
+            "model_count": len(entries),
+            "loaded_count": sum(1 for e in entries if e["loaded"]),
+            "idle_count": idle,
+            "max_idle_models": self.max_idle_models,
+            "pool_size": self.pool_size,
+            "evictions": self.evictions,
+        }
+
+
+def get_model_registry() -> ModelRegistry:
+    """獲取模型註冊表實例"""
+    return ModelRegistry()
@@ -12,6 +12,9 @@ from sqlalchemy.orm import selectinload
 
 from app.models.database import AnalysisTask, DetectionResult, DataSource, SystemConfig, TaskStatistics
 from app.core.database import AsyncSessionLocal
+from app.services.analytics_cache import notify_task_changed
+from app.services.rollup_service import late_cutoff, record_late_rows
+from app.services.task_status_cache import get_task_status_cache
 import logging
 
 db_logger = logging.getLogger(__name__)
@@ -43,6 +46,7 @@ class DatabaseService:
         session.add(task)
         await session.commit()
         await session.refresh(task)
+        notify_task_changed(task.id)
         return task
     
     async def start_analysis_task(self, session: AsyncSession, task_id: int) -> bool:
@@ -57,6 +61,8 @@ class DatabaseService:
                 )
             )
             await session.commit()
+            get_task_status_cache().set(task_id, 'running')
+            notify_task_changed(task_id)
             return result.rowcount > 0
         except Exception as e:
             db_logger.error(f"開始任務失敗: {e}")
@@ -74,6 +80,8 @@ class DatabaseService:
                 )
             )
             await session.commit()
+            get_task_status_cache().set(task_id, status)
+            notify_task_changed(task_id)
             return result.rowcount > 0
         except Exception as e:
             db_logger.error(f"完成任務失敗: {e}")
@@ -95,6 +103,8 @@ class DatabaseService:
                 .values(**values)
             )
             await db.commit()
+            get_task_status_cache().set(task_id, status)
+            notify_task_changed(task_id)
             return result.rowcount > 0
         except Exception as e:
             db_logger.error(f"更新任務狀態失敗: {e}")
@@ -283,7 +293,13 @@ class DatabaseService:
         }
     
     async def cleanup_old_detections(self, session: AsyncSession, days: int = 7) -> int:
-        """清理舊的檢測結果（用於即時攝影機資料）"""
+        """
+        清理舊的檢測結果（用於即時攝影機資料）
+        
+        分區不區分任務類型，整個分區刪除會連帶刪掉影片分析的歷史資料，
+        因此這裡仍只 DELETE 即時攝影機的資料列；全表的分區保留期由
+        PARTITION_RETENTION_DAYS 另行設定。
+        """
         cutoff_date = datetime.utcnow() - timedelta(days=days)
         
         # 只清理即時攝影機的檢測結果
@@ -504,103 +520,109 @@ class DatabaseService:
     # 同步檢測結果儲存（用於即時檢測）
     # ============================================================================
     
+    DETECTION_REQUIRED_FIELDS = (
+        'task_id', 'frame_number', 'frame_timestamp', 'object_type', 'confidence',
+        'bbox_x1', 'bbox_y1', 'bbox_x2', 'bbox_y2', 'center_x', 'center_y'
+    )
+    
     def create_detection_result_sync(self, detection_data: Dict[str, Any]) -> bool:
-        """同步儲存檢測結果（用於即時檢測）- 使用同步資料庫連接"""
+        """同步儲存單筆檢測結果（相容舊呼叫，內部走批次 API）"""
+        return self.create_detection_results_sync_bulk([detection_data]) == 1
+    
+    def create_detection_results_sync_bulk(self, detections: List[Dict[str, Any]], raise_errors: bool = False) -> int:
+        """
+        同步批次儲存檢測結果（用於即時檢測），回傳寫入筆數
+        
+        每批每個任務只驗證一次（存在且未停止），
+        以共用的 sync_engine 執行 executemany（psycopg2 下由 SQLAlchemy 合併為多列 INSERT）。
+        寫入失敗時記錄錯誤並回傳 0；raise_errors=True 時改為拋出，由呼叫端重試或保存該批。
+        時間早於彙總水位線的資料列（重放或延遲寫入）在同一交易登記遲到標記。
+        """
+        if not detections:
+            return 0
+        
+        from app.core.database import sync_engine
+        
+        rows_by_task: Dict[int, List[Dict[str, Any]]] = {}
+        for detection_data in detections:
+            missing = [field for field in self.DETECTION_REQUIRED_FIELDS if field not in detection_data]
+            if missing:
+                db_logger.error(f"檢測結果缺少必要欄位: {missing}")
+                continue
+            tracker_id = detection_data.get('tracker_id')
+            rows_by_task.setdefault(int(detection_data['task_id']), []).append({
+                'task_id': int(detection_data['task_id']),
+                'tracker_id': int(tracker_id) if tracker_id is not None else None,
+                'frame_number': int(detection_data['frame_number']),
+                'frame_timestamp': detection_data['frame_timestamp'],
+                'object_type': str(detection_data['object_type']),
+                'confidence': float(detection_data['confidence']),
+                'bbox_x1': float(detection_data['bbox_x1']),
+                'bbox_y1': float(detection_data['bbox_y1']),
+                'bbox_x2': float(detection_data['bbox_x2']),
+                'bbox_y2': float(detection_data['bbox_y2']),
+                'center_x': float(detection_data['center_x']),
+                'center_y': float(detection_data['center_y']),
+                'thumbnail_path': detection_data.get('thumbnail_path'),
+            })
+        if not rows_by_task:
+            return 0
+        
+        inserted = 0
+        stamps: List[datetime] = []
+        status_cache = get_task_status_cache()
         try:
-            # 驗證必要的資料欄位
-            required_fields = [
-                'task_id', 'frame_number', 'frame_timestamp', 'object_type', 'confidence',
-                'bbox_x1', 'bbox_y1', 'bbox_x2', 'bbox_y2', 'center_x', 'center_y'
-            ]
-            
-            for field in required_fields:
-                if field not in detection_data:
-                    db_logger.error(f"檢測結果缺少必要欄位: {field}")
-                    return False
-            
-            db_logger.debug(f"準備儲存檢測結果: task_id={detection_data['task_id']}, frame={detection_data['frame_number']}, object={detection_data['object_type']}")
-            
-            # 使用同步資料庫連接，避免 asyncio 衝突
-            from app.core.database import sync_engine, SyncSessionLocal
-            from sqlalchemy import text
-            
-            with SyncSessionLocal() as session:
-                # 🔥 修復：先驗證任務是否存在，防止外鍵約束錯誤
-                task_id = int(detection_data['task_id'])
-                task_check = session.execute(
-                    text("SELECT id, status FROM analysis_tasks WHERE id = :task_id"), 
-                    {'task_id': task_id}
-                ).fetchone()
+            with sync_engine.begin() as connection:
+                task_rows = connection.execute(
+                    select(AnalysisTask.id, AnalysisTask.status)
+                    .where(AnalysisTask.id.in_(list(rows_by_task)))
+                ).all()
+                task_status = {row.id: row.status for row in task_rows}
                 
-                if not task_check:
-                    db_logger.warning(f"任務 {task_id} 不存在，跳過檢測結果儲存")
-                    return False
-                
-                # 檢查任務狀態，如果已停止則不儲存
-                task_status = task_check[1]  # status 欄位
-                if task_status in ['completed', 'stopped', 'failed']:
-                    db_logger.warning(f"任務 {task_id} 已停止（狀態: {task_status}），跳過檢測結果儲存")
-                    return False
-                try:
-                    # 使用原始 SQL 插入，避免 ORM 的 async 問題
-                    sql = text("""
-                        INSERT INTO detection_results 
-                        (task_id, frame_number, frame_timestamp, object_type, confidence, 
-                         bbox_x1, bbox_y1, bbox_x2, bbox_y2, center_x, center_y, thumbnail_path)
-                        VALUES 
-                        (:task_id, :frame_number, :frame_timestamp, :object_type, :confidence, 
-                         :bbox_x1, :bbox_y1, :bbox_x2, :bbox_y2, :center_x, :center_y, :thumbnail_path)
-                    """)
-                    
-                    params = {
-                        'task_id': int(detection_data['task_id']),
-                        'frame_number': int(detection_data['frame_number']),
-                        'frame_timestamp': detection_data['frame_timestamp'],
-                        'object_type': str(detection_data['object_type']),
-                        'confidence': float(detection_data['confidence']),
-                        'bbox_x1': float(detection_data['bbox_x1']),
-                        'bbox_y1': float(detection_data['bbox_y1']),
-                        'bbox_x2': float(detection_data['bbox_x2']),
-                        'bbox_y2': float(detection_data['bbox_y2']),
-                        'center_x': float(detection_data['center_x']),
-                        'center_y': float(detection_data['center_y']),
-                        'thumbnail_path': detection_data.get('thumbnail_path')
-                    }
-                    
-                    session.execute(sql, params)
-                    session.commit()
-                    
-                    db_logger.debug(f"成功同步儲存檢測結果到任務 {detection_data.get('task_id')}")
-                    return True
-                    
-                except Exception as sql_error:
-                    session.rollback()
-                    db_logger.error(f"SQL 執行錯誤: {sql_error}")
-                    db_logger.error(f"檢測結果資料: {detection_data}")
-                    return False
+                for task_id, rows in rows_by_task.items():
+                    # 先驗證任務是否存在，防止外鍵約束錯誤
+                    status = task_status.get(task_id)
+                    if status is None:
+                        status_cache.invalidate(task_id)
+                        db_logger.warning(f"任務 {task_id} 不存在，跳過 {len(rows)} 筆檢測結果")
+                        continue
+                    status_cache.set(task_id, status)
+                    # 檢查任務狀態，如果已停止則不儲存
+                    if status in ['completed', 'stopped', 'failed']:
+                        db_logger.warning(f"任務 {task_id} 已停止（狀態: {status}），跳過 {len(rows)} 筆檢測結果")
+                        continue
+                    connection.execute(insert(DetectionResult.__table__), rows)
+                    inserted += len(rows)
+                    stamps.extend(row['frame_timestamp'] for row in rows if isinstance(row['frame_timestamp'], datetime))
                 
+                if stamps and min(stamps) < late_cutoff():
+                    record_late_rows(connection, min(stamps))
+            
+            db_logger.debug(f"成功批次儲存 {inserted} 筆檢測結果")
+            return inserted
         except Exception as e:
-            db_logger.error(f"同步儲存檢測結果失敗: {e}")
-            db_logger.error(f"錯誤的檢測結果資料: {detection_data}")
-            return False
+            db_logger.error(f"同步批次儲存檢測結果失敗: {e}")
+            if raise_errors:
+                raise
+            return 0
     
     def get_task_status_sync(self, task_id: str) -> Optional[str]:
-        """同步獲取任務狀態"""
+        """同步獲取任務狀態（優先使用行程內快取）"""
+        status_cache = get_task_status_cache()
+        cached = status_cache.get(task_id)
+        if cached is not None:
+            return cached
+        
         try:
-            from sqlalchemy import create_engine
-            from sqlalchemy.orm import sessionmaker
-            from app.core.config import settings
-            
-            # 創建同步引擎和會話
-            sync_engine = create_engine(settings.database_url.replace('postgresql+asyncpg://', 'postgresql://'))
-            SyncSessionLocal = sessionmaker(bind=sync_engine)
+            from app.core.database import SyncSessionLocal
             
             with SyncSessionLocal() as session:
                 result = session.execute(
                     select(AnalysisTask.status).where(AnalysisTask.id == int(task_id))
                 )
                 task_status = result.scalar_one_or_none()
-                return task_status
+            status_cache.set(task_id, task_status)
+            return task_status
                 
         except Exception as e:
             db_logger.error(f"同步獲取任務狀態失敗 [{task_id}]: {e}")
@@ -0,0 +1,474 @@
+"""
+偵測明細表的時間分區與保留期管理
+
+detection_results、line_crossing_events、zone_dwell_events、speed_events
+改為 PostgreSQL 原生 RANGE 分區（依時間欄位，每日或每週一個分區）：
+- 背景維護工作預先建立未來的分區
+- 保留期以整個分區 DROP（或 DETACH）處理，不再執行大量 DELETE
+- 既有 create_all 建立的一般資料表，改名後以 MINVALUE 起的「legacy」分區掛回新的分區表，
+  不需要複製資料；legacy 分區的資料全部超過保留期後同樣整個刪除
+- 預先建立的範圍之外的資料列先落在 DEFAULT 分區，之後建立涵蓋它們的分區時會搬進新分區
+
+用法：
+    python -m app.services.partition_manager status
+    python -m app.services.partition_manager migrate [--force]
+    python -m app.services.partition_manager maintain
+"""
+
+from __future__ import annotations
+
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.core.logger import main_logger
+
+# 分區資料表 → 分區鍵（各表既有的時間欄位）
+PARTITIONED_TABLES: Dict[str, str] = {
+    "detection_results": "frame_timestamp",
+    "line_crossing_events": "frame_timestamp",
+    "zone_dwell_events": "event_timestamp",
+    "speed_events": "event_timestamp",
+}
+
+LEGACY_SUFFIX = "_legacy"
+DEFAULT_SUFFIX = "_default"
+_MAX_IDENTIFIER = 63
+_BOUND_RE = re.compile(r"FROM \((.+?)\) TO \((.+?)\)")
+
+
+def period_start(moment: datetime, interval: str) -> datetime:
+    """分區起點：每日為當天 00:00，每週為週一 00:00"""
+    start = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if interval == "weekly":
+        start -= timedelta(days=start.weekday())
+    return start
+
+
+def next_boundary(moment: datetime, interval: str) -> datetime:
+    return period_start(moment, interval) + timedelta(days=7 if interval == "weekly" else 1)
+
+
+def partition_name(table: str, start: datetime) -> str:
+    return f"{table}_p{start:%Y%m%d}"
+
+
+def _parse_bound_value(raw: str) -> Optional[datetime]:
+    value = raw.strip().strip("'")
+    if value.upper() in ("MINVALUE", "MAXVALUE"):
+        return None
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+
+class PartitionManager:
+    """分區建立、遷移與保留期（單例，背景維護執行緒）"""
+
+    _instance: Optional["PartitionManager"] = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+        self.enabled = settings.partition_enabled
+        self.interval = settings.partition_interval if settings.partition_interval in ("daily", "weekly") else "daily"
+        self.premake = max(1, settings.partition_premake)
+        self.retention_days = settings.partition_retention_days
+        self.retention_mode = settings.partition_retention_mode
+        self.maintenance_interval = max(60.0, settings.partition_maintenance_interval)
+        self.auto_migrate = settings.partition_auto_migrate
+
+        self._engine = None
+        self._run_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_report: Dict[str, Any] = {}
+        self._initialized = True
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            from app.core.database import sync_engine
+
+            self._engine = sync_engine
+        return self._engine
+
+    # ===== 查詢 =====
+
+    @staticmethod
+    def _relkind(connection, table: str) -> Optional[str]:
+        return connection.execute(
+            text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:name)"),
+            {"name": table},
+        ).scalar()
+
+    def is_table_partitioned(self, table: str) -> bool:
+        with self.engine.connect() as connection:
+            return self._relkind(connection, table) == "p"
+
+    @staticmethod
+    def list_partitions(connection, table: str) -> List[Dict[str, Any]]:
+        rows = connection.execute(
+            text(
+                """
+                SELECT child.relname AS name,
+                       pg_get_expr(child.relpartbound, child.oid) AS bound,
+                       child.reltuples AS estimated_rows
+                FROM pg_inherits
+                JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+                JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                WHERE parent.oid = to_regclass(:name)
+                """
+            ),
+            {"name": table},
+        ).all()
+
+        partitions = []
+        for row in rows:
+            info: Dict[str, Any] = {
+                "name": row.name,
+                "is_default": row.bound == "DEFAULT",
+                "lower": None,
+                "upper": None,
+                "estimated_rows": max(0, int(row.estimated_rows or 0)),
+            }
+            match = _BOUND_RE.search(row.bound or "")
+            if match:
+                info["lower"] = _parse_bound_value(match.group(1))
+                info["upper"] = _parse_bound_value(match.group(2))
+            partitions.append(info)
+        partitions.sort(key=lambda item: (item["is_default"], item["lower"] or datetime.min))
+        return partitions
+
+    # ===== 遷移 =====
+
+    def migrate_table(self, table: str, force: bool = False) -> str:
+        """
+        將 create_all 建立的一般資料表轉為分區表
+
+        空表直接轉換；有資料的表需 force=True（或 PARTITION_AUTO_MIGRATE），
+        因為掛回 legacy 分區時要為 (id, 分區鍵) 建立主鍵索引，期間會鎖表。
+        """
+        key = PARTITIONED_TABLES[table]
+        legacy = f"{table}{LEGACY_SUFFIX}"
+        with self.engine.begin() as connection:
+            relkind = self._relkind(connection, table)
+            if relkind is None:
+                return "missing"
+            if relkind == "p":
+                return "already_partitioned"
+            if self._relkind(connection, legacy) is not None:
+                raise RuntimeError(f"{legacy} 已存在，請先確認先前的遷移狀態")
+
+            has_rows = connection.execute(text(f"SELECT EXISTS (SELECT 1 FROM {table})")).scalar()
+            if has_rows and not (force or self.auto_migrate):
+                return "skipped_not_empty"
+
+            connection.execute(text(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE"))
+            # 分區鍵會成為主鍵的一部分，必須 NOT NULL；寫入端使用 datetime.utcnow()，補值同樣採 UTC
+            connection.execute(
+                text(f"UPDATE {table} SET {key} = (now() AT TIME ZONE 'utc') WHERE {key} IS NULL")
+            )
+            connection.execute(
+                text(f"ALTER TABLE {table} ALTER COLUMN {key} SET DEFAULT (now() AT TIME ZONE 'utc')")
+            )
+            connection.execute(text(f"ALTER TABLE {table} ALTER COLUMN {key} SET NOT NULL"))
+
+            latest = connection.execute(text(f"SELECT max({key}) FROM {table}")).scalar()
+            if latest is not None and getattr(latest, "tzinfo", None) is not None:
+                latest = latest.astimezone().replace(tzinfo=None)
+            legacy_upper = next_boundary(latest or datetime.utcnow(), self.interval)
+            sequence = connection.execute(
+                text("SELECT pg_get_serial_sequence(:name, 'id')"), {"name": table}
+            ).scalar()
+
+            # 舊表與其索引改名，保留原名給新的分區表
+            connection.execute(text(f"ALTER TABLE {table} RENAME TO {legacy}"))
+            index_names = connection.execute(
+                text("SELECT indexname FROM pg_indexes WHERE tablename = :name"), {"name": legacy}
+            ).scalars().all()
+            for index_name in index_names:
+                renamed = f"{index_name[:_MAX_IDENTIFIER - len(LEGACY_SUFFIX)]}{LEGACY_SUFFIX}"
+                connection.execute(text(f'ALTER INDEX "{index_name}" RENAME TO "{renamed}"'))
+
+            # 分區的主鍵必須與父表相同（id, 分區鍵），否則 ATTACH 會因重複主鍵失敗
+            legacy_pkey = connection.execute(
+                text(
+                    "SELECT conname FROM pg_constraint "
+                    "WHERE conrelid = to_regclass(:name) AND contype = 'p'"
+                ),
+                {"name": legacy},
+            ).scalar()
+            if legacy_pkey:
+                connection.execute(text(f'ALTER TABLE {legacy} DROP CONSTRAINT "{legacy_pkey}"'))
+            connection.execute(
+                text(f"ALTER TABLE {legacy} ADD CONSTRAINT {legacy}_pkey PRIMARY KEY (id, {key})")
+            )
+
+            connection.execute(
+                text(
+                    f"CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+                    f"PARTITION BY RANGE ({key})"
+                )
+            )
+            if sequence:
+                # 序列改由新表擁有，之後刪除 legacy 分區時不會連帶刪除
+                connection.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id"))
+            connection.execute(
+                text(f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY (id, {key})")
+            )
+            connection.execute(
+                text(
+                    f"ALTER TABLE {table} ADD CONSTRAINT {table}_task_id_fkey "
+                    f"FOREIGN KEY (task_id) REFERENCES analysis_tasks(id) ON DELETE CASCADE"
+                )
+            )
+            connection.execute(
+                text(
+                    f"ALTER TABLE {table} ATTACH PARTITION {legacy} "
+                    f"FOR VALUES FROM (MINVALUE) TO ('{legacy_upper:%Y-%m-%d %H:%M:%S}')"
+                )
+            )
+            connection.execute(text(f"CREATE TABLE {table}{DEFAULT_SUFFIX} PARTITION OF {table} DEFAULT"))
+
+            # ORM 定義的索引建在父表上，既有 legacy 索引會自動掛上
+            from app.models.database import Base
+
+            for index in Base.metadata.tables[table].indexes:
+                index.create(connection, checkfirst=False)
+
+            self._ensure_table_partitions(connection, table, datetime.utcnow())
+
+        main_logger.info(f"[partition] {table} 已轉為 {self.interval} 分區表（legacy 分區上界 {legacy_upper}）")
+        return "migrated"
+
+    def migrate_all(self, force: bool = False) -> Dict[str, str]:
+        results = {}
+        for table in PARTITIONED_TABLES:
+            try:
+                results[table] = self.migrate_table(table, force=force)
+            except Exception as exc:  # noqa: BLE001
+                main_logger.error(f"[partition] {table} 遷移失敗: {exc}")
+                results[table] = f"error: {exc}"
+        return results
+
+    # ===== 維護 =====
+
+    def _ensure_table_partitions(self, connection, table: str, now: datetime) -> List[str]:
+        key = PARTITIONED_TABLES[table]
+        partitions = self.list_partitions(connection, table)
+        default = next((p["name"] for p in partitions if p["is_default"]), None)
+        uppers = [p["upper"] for p in partitions if p["upper"] is not None]
+        start = max(uppers) if uppers else period_start(now, self.interval)
+        horizon = period_start(now, self.interval)
+        for _ in range(self.premake):
+            horizon = next_boundary(horizon, self.interval)
+
+        created = []
+        while start < horizon:
+            end = next_boundary(start, self.interval)
+            name = partition_name(table, start)
+            bounds = f"FOR VALUES FROM ('{start:%Y-%m-%d %H:%M:%S}') TO ('{end:%Y-%m-%d %H:%M:%S}')"
+            if default and self._default_has_rows(connection, default, key, start, end):
+                self._split_default(connection, table, default, name, key, bounds, start, end)
+            else:
+                connection.execute(text(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} {bounds}"))
+            created.append(name)
+            start = end
+        return created
+
+    @staticmethod
+    def _default_has_rows(connection, default: str, key: str, start: datetime, end: datetime) -> bool:
+        return bool(
+            connection.execute(
+                text(f"SELECT EXISTS (SELECT 1 FROM {default} WHERE {key} >= :start AND {key} < :end)"),
+                {"start": start, "end": end},
+            ).scalar()
+        )
+
+    @staticmethod
+    def _split_default(connection, table: str, default: str, name: str, key: str, bounds: str,
+                       start: datetime, end: datetime) -> None:
+        """
+        DEFAULT 分區已有新範圍的資料時，CREATE ... PARTITION OF 會失敗；
+        先卸載 DEFAULT 分區、建立新分區並搬移資料列，再掛回 DEFAULT
+        """
+        connection.execute(text(f"ALTER TABLE {table} DETACH PARTITION {default}"))
+        connection.execute(text(f"CREATE TABLE {name} PARTITION OF {table} {bounds}"))
+        moved = connection.execute(
+            text(
+                f"WITH moved AS (DELETE FROM {default} WHERE {key} >= :start AND {key} < :end RETURNING *) "
+                f"INSERT INTO {name} SELECT * FROM moved"
+            ),
+            {"start": start, "end": end},
+        ).rowcount
+        connection.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT"))
+        main_logger.info(f"[partition] 已將 {default} 中 {moved} 筆資料列搬入新分區 {name}")
+
+    def ensure_partitions(self, now: Optional[datetime] = None) -> Dict[str, List[str]]:
+        """預先建立到 now + PARTITION_PREMAKE 個週期為止的分區"""
+        now = now or datetime.utcnow()
+        created: Dict[str, List[str]] = {}
+        for table in PARTITIONED_TABLES:
+            try:
+                with self.engine.begin() as connection:
+                    if self._relkind(connection, table) != "p":
+                        continue
+                    created[table] = self._ensure_table_partitions(connection, table, now)
+            except Exception as exc:  # noqa: BLE001
+                main_logger.error(f"[partition] 建立 {table} 分區失敗: {exc}")
+        return created
+
+    def apply_retention(self, retention_days: Optional[int] = None, mode: Optional[str] = None,
+                        now: Optional[datetime] = None) -> Dict[str, List[str]]:
+        """刪除（或卸載）上界早於保留期的整個分區；預設分區永不刪除"""
+        days = self.retention_days if retention_days is None else retention_days
+        if days <= 0:
+            return {}
+        mode = mode or self.retention_mode
+        cutoff = (now or datetime.utcnow()) - timedelta(days=days)
+
+        removed: Dict[str, List[str]] = {}
+        for table in PARTITIONED_TABLES:
+            try:
+                with self.engine.begin() as connection:
+                    if self._relkind(connection, table) != "p":
+                        continue
+                    for partition in self.list_partitions(connection, table):
+                        upper = partition["upper"]
+                        if partition["is_default"] or upper is None or upper > cutoff:
+                            continue
+                        if mode == "detach":
+                            connection.execute(
+                                text(f"ALTER TABLE {table} DETACH PARTITION {partition['name']}")
+                            )
+                        else:
+                            connection.execute(text(f"DROP TABLE {partition['name']}"))
+                        removed.setdefault(table, []).append(partition["name"])
+            except Exception as exc:  # noqa: BLE001
+                main_logger.error(f"[partition] {table} 保留期處理失敗: {exc}")
+        if removed:
+            main_logger.info(f"[partition] 保留期 {days} 天，已{'卸載' if mode == 'detach' else '刪除'}分區: {removed}")
+        return removed
+
+    def run_maintenance(self) -> Dict[str, Any]:
+        with self._run_lock:
+            start = time.perf_counter()
+            report = {
+                "timestamp": datetime.utcnow().isoformat(),
+                "created": self.ensure_partitions(),
+                "removed": self.apply_retention(),
+            }
+            report["duration_ms"] = (time.perf_counter() - start) * 1000
+            self._last_report = report
+            return report
+
+    # ===== 背景執行緒 =====
+
+    def start(self) -> None:
+        if not self.enabled:
+            return
+        with self._run_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run_loop, name="partition-maintenance", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 2.0) -> None:
+        self._stop_event.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout=timeout)
+        self._thread = None
+
+    def _run_loop(self) -> None:
+        results = self.migrate_all()
+        skipped = [table for table, status in results.items() if status == "skipped_not_empty"]
+        if skipped:
+            main_logger.warning(
+                f"[partition] {skipped} 仍為一般資料表且已有資料，"
+                f"請執行 python -m app.services.partition_manager migrate --force"
+            )
+        # 遷移完成後再補建索引，避免 CONCURRENTLY 與改名 / 轉換分區表互相等待；
+        # 失敗（例如連線中斷）時下一個週期重試，不讓維護執行緒結束
+        indexes_ready = not settings.index_auto_create
+        while True:
+            try:
+                if not indexes_ready:
+                    from app.models.indexes import ensure_indexes
+
+                    ensure_indexes(self.engine)
+                    indexes_ready = True
+                self.run_maintenance()
+            except Exception as exc:  # noqa: BLE001
+                main_logger.error(f"[partition] 維護失敗: {exc}")
+            if self._stop_event.wait(self.maintenance_interval):
+                break
+
+    def get_status(self) -> Dict[str, Any]:
+        tables = {}
+        with self.engine.connect() as connection:
+            for table, key in PARTITIONED_TABLES.items():
+                relkind = self._relkind(connection, table)
+                partitions = self.list_partitions(connection, table) if relkind == "p" else []
+                tables[table] = {
+                    "partition_key": key,
+                    "partitioned": relkind == "p",
+                    "partitions": [
+                        {
+                            **partition,
+                            "lower": partition["lower"].isoformat() if partition["lower"] else None,
+                            "upper": partition["upper"].isoformat() if partition["upper"] else None,
+                        }
+                        for partition in partitions
+                    ],
+                }
+        return {
+            "enabled": self.enabled,
+            "interval": self.interval,
+            "premake": self.premake,
+            "retention_days": self.retention_days,
+            "retention_mode": self.retention_mode,
+            "tables": tables,
+            "last_run": self._last_report,
+        }
+
+
+def get_partition_manager() -> PartitionManager:
+    """獲取分區管理器實例"""
+    return PartitionManager()
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="偵測明細表分區管理")
+    parser.add_argument("command", choices=("status", "migrate", "maintain"))
+    parser.add_argument("--force", action="store_true", help="遷移已有資料的資料表（會短暫鎖表）")
+    args = parser.parse_args()
+
+    manager = get_partition_manager()
+    if args.command == "migrate":
+        output: Any = manager.migrate_all(force=args.force)
+    elif args.command == "maintain":
+        output = manager.run_maintenance()
+    else:
+        output = manager.get_status()
+    print(json.dumps(output, ensure_ascii=False, indent=2, default=str))
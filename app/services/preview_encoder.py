@@ -0,0 +1,311 @@
+"""
+預覽影像編碼服務（每幀只編碼一次）
+
+MJPEG 串流、單張預覽、最新影格與 WebSocket 預覽原本各自呼叫 cv2.imencode，
+同一幀被每個觀看者重複編碼，CPU 成本隨觀看人數線性增加。
+改由本服務依「來源 + 畫質等級」快取最新一幀的 JPEG：
+- 快取鍵為影格識別（攝影機流為 (frame_number, timestamp)），同一幀的後續請求直接取用
+- 每個等級各自加鎖，同時到達的請求只有一個實際編碼，其餘等待後取用結果
+- 每個來源每個等級只保留最新一幀，記憶體用量與觀看人數無關
+
+畫質等級（PREVIEW_TIERS）：high = 原尺寸 q85、medium = 寬 960 q75、low = 寬 480 q60。
+編碼會阻塞，請在工作執行緒呼叫（攝影機消費者回呼、asyncio.to_thread 等）。
+
+串流端點使用 PreviewSubscription：攝影機消費者執行緒負責取得 JPEG，
+再以 call_soon_threadsafe 通知事件迴圈，async 產生器只 await 新影格，不在事件迴圈阻塞或編碼。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Hashable, Optional
+
+import cv2
+import numpy as np
+
+from app.core.logger import detection_logger
+from app.services.camera_stream_manager import FrameData, StreamConsumer, camera_stream_manager
+
+
+@dataclass(frozen=True)
+class PreviewTier:
+    name: str
+    quality: int
+    max_width: Optional[int] = None
+
+
+PREVIEW_TIERS: Dict[str, PreviewTier] = {
+    "high": PreviewTier("high", 85),
+    "medium": PreviewTier("medium", 75, 960),
+    "low": PreviewTier("low", 60, 480),
+}
+DEFAULT_TIER = "high"
+
+
+def resolve_tier(name: Optional[str]) -> PreviewTier:
+    """畫質等級名稱 → PreviewTier；未知名稱拋出 ValueError"""
+    tier = PREVIEW_TIERS.get((name or DEFAULT_TIER).strip().lower())
+    if tier is None:
+        raise ValueError(f"不支援的畫質等級: {name}（可用: {', '.join(PREVIEW_TIERS)}）")
+    return tier
+
+
+@dataclass(frozen=True)
+class EncodedPreview:
+    """單一來源、單一等級的最新編碼結果"""
+    key: Hashable
+    jpeg: bytes
+    width: int
+    height: int
+    encoded_at: float
+
+
+def encode_jpeg(frame: np.ndarray, tier: PreviewTier) -> Optional[EncodedPreview]:
+    height, width = frame.shape[:2]
+    if tier.max_width and width > tier.max_width:
+        height = max(1, round(height * tier.max_width / width))
+        width = tier.max_width
+        frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+    ok, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, tier.quality])
+    if not ok:
+        return None
+    return EncodedPreview(None, buffer.tobytes(), width, height, time.time())
+
+
+class SourcePreviewEncoder:
+    """單一來源（攝影機 / 任務）的各等級 JPEG 快取"""
+
+    def __init__(self, source_id: str):
+        self.source_id = source_id
+        self._latest: Dict[str, EncodedPreview] = {}
+        self._locks: Dict[str, threading.Lock] = {name: threading.Lock() for name in PREVIEW_TIERS}
+
+        self.encodes = 0
+        self.hits = 0
+        self.failures = 0
+        self.encode_seconds = 0.0
+
+    def get(self, key: Hashable, frame: np.ndarray, tier: PreviewTier) -> Optional[EncodedPreview]:
+        """取得 key 這一幀的 JPEG；快取未命中時編碼（同時間只有一個執行緒編碼）"""
+        cached = self._latest.get(tier.name)
+        if cached is not None and cached.key == key:
+            self.hits += 1
+            return cached
+        with self._locks[tier.name]:
+            cached = self._latest.get(tier.name)
+            if cached is not None and cached.key == key:
+                self.hits += 1
+                return cached
+            started = time.perf_counter()
+            encoded = encode_jpeg(frame, tier)
+            self.encode_seconds += time.perf_counter() - started
+            if encoded is None:
+                self.failures += 1
+                return None
+            encoded = EncodedPreview(key, encoded.jpeg, encoded.width, encoded.height, encoded.encoded_at)
+            self.encodes += 1
+            self._latest[tier.name] = encoded
+            return encoded
+
+    def peek(self, tier: PreviewTier) -> Optional[EncodedPreview]:
+        """不編碼，直接取得該等級最後一次的編碼結果"""
+        return self._latest.get(tier.name)
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.encodes + self.hits
+        return {
+            "encodes": self.encodes,
+            "hits": self.hits,
+            "failures": self.failures,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "avg_encode_ms": self.encode_seconds * 1000 / self.encodes if self.encodes else 0.0,
+            "cached_tiers": {
+                name: {"bytes": len(entry.jpeg), "width": entry.width, "height": entry.height}
+                for name, entry in self._latest.items()
+            },
+        }
+
+
+class PreviewEncoderService:
+    """預覽影像編碼服務（單例）"""
+
+    _instance: Optional["PreviewEncoderService"] = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+        self._sources: Dict[str, SourcePreviewEncoder] = {}
+        self._lock = threading.Lock()
+        self._initialized = True
+
+    def source(self, source_id: str) -> SourcePreviewEncoder:
+        encoder = self._sources.get(source_id)
+        if encoder is None:
+            with self._lock:
+                encoder = self._sources.setdefault(source_id, SourcePreviewEncoder(source_id))
+        return encoder
+
+    def encode(self, source_id: str, key: Hashable, frame: np.ndarray, tier: str = DEFAULT_TIER) -> Optional[bytes]:
+        """以 (source_id, key) 識別影格並取得 JPEG；同一幀同一等級只編碼一次"""
+        encoded = self.source(source_id).get(key, frame, resolve_tier(tier))
+        return encoded.jpeg if encoded else None
+
+    def encode_frame(self, frame_data: FrameData, tier: str = DEFAULT_TIER) -> Optional[bytes]:
+        """攝影機流影格（以 frame_number + timestamp 識別，流重啟後不會誤用舊快取）"""
+        return self.encode(
+            frame_data.camera_id,
+            (frame_data.frame_number, frame_data.timestamp),
+            frame_data.frame,
+            tier,
+        )
+
+    def latest_camera_jpeg(self, camera_id: str, tier: str = DEFAULT_TIER) -> Optional[bytes]:
+        """攝影機流最新一幀的 JPEG"""
+        frame_data = camera_stream_manager.retain_latest_frame(camera_id)
+        if frame_data is None:
+            return None
+        try:
+            return self.encode_frame(frame_data, tier)
+        finally:
+            frame_data.release()
+
+    def release(self, source_id: str) -> None:
+        """來源結束（任務停止、攝影機關閉）時移除快取"""
+        with self._lock:
+            if self._sources.pop(source_id, None) is not None:
+                detection_logger.debug(f"移除預覽編碼快取: {source_id}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sources = dict(self._sources)
+        return {
+            "tiers": {
+                name: {"quality": tier.quality, "max_width": tier.max_width}
+                for name, tier in PREVIEW_TIERS.items()
+            },
+            "sources": {source_id: encoder.get_stats() for source_id, encoder in sources.items()},
+        }
+
+
+def get_preview_encoder_service() -> PreviewEncoderService:
+    """獲取預覽影像編碼服務實例"""
+    return PreviewEncoderService()
+
+
+class PreviewSubscription:
+    """
+    攝影機預覽的 asyncio 訂閱
+
+    在攝影機流註冊一個只保留最新一幀的消費者；消費者執行緒透過預覽編碼服務取得 JPEG，
+    再通知事件迴圈。觀看者跟不上時只會略過中間影格，永遠拿到最新一幀。
+
+        subscription = PreviewSubscription("camera_0", "high")
+        if subscription.start():
+            try:
+                async for jpeg in subscription:
+                    ...
+            finally:
+                subscription.close()
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(
+        self,
+        camera_id: str,
+        tier: str = DEFAULT_TIER,
+        max_fps: Optional[float] = None,
+        name: str = "preview",
+    ):
+        resolve_tier(tier)
+        self.camera_id = camera_id
+        self.tier = tier
+        self.consumer_id = f"{name}_{camera_id}_{next(self._ids)}"
+        self._loop = asyncio.get_running_loop()
+        self._event = asyncio.Event()
+        self._latest: Optional[bytes] = None
+        self._closed = False
+        self._consumer = StreamConsumer(self.consumer_id, self._on_frame, max_fps=max_fps)
+
+        self.published = 0
+        self.delivered = 0
+
+    def start(self) -> bool:
+        """註冊到攝影機流；流不存在時回傳 False"""
+        return camera_stream_manager.add_consumer(self.camera_id, self._consumer)
+
+    def _on_frame(self, frame_data: FrameData) -> None:
+        # 消費者執行緒：編碼（或取用快取）後交給事件迴圈
+        if self._closed:
+            return
+        jpeg = get_preview_encoder_service().encode_frame(frame_data, self.tier)
+        if jpeg is None:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._publish, jpeg)
+        except RuntimeError:
+            # 事件迴圈已關閉
+            self._closed = True
+
+    def _publish(self, jpeg: bytes) -> None:
+        self._latest = jpeg
+        self.published += 1
+        self._event.set()
+
+    async def next(self, timeout: Optional[float] = None) -> Optional[bytes]:
+        """等待下一幀；逾時或已關閉回傳 None"""
+        if self._closed:
+            return None
+        try:
+            if timeout is None:
+                await self._event.wait()
+            else:
+                await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        self._event.clear()
+        jpeg, self._latest = self._latest, None
+        if jpeg is not None:
+            self.delivered += 1
+        return jpeg
+
+    def __aiter__(self) -> AsyncIterator[bytes]:
+        return self._iterate()
+
+    async def _iterate(self) -> AsyncIterator[bytes]:
+        while not self._closed:
+            jpeg = await self.next()
+            if jpeg is not None:
+                yield jpeg
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._event.set()
+        camera_stream_manager.remove_consumer(self.camera_id, self.consumer_id)
+
+
+__all__ = [
+    "DEFAULT_TIER",
+    "EncodedPreview",
+    "PREVIEW_TIERS",
+    "PreviewEncoderService",
+    "PreviewSubscription",
+    "PreviewTier",
+    "get_preview_encoder_service",
+    "resolve_tier",
+]
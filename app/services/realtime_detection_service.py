@@ -7,10 +7,10 @@
 import asyncio
 import threading
 import time
-import base64
+import json
 from datetime import datetime
 from typing import Optional, Dict, Any, List, Set
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
 import numpy as np
 from concurrent.futures import ThreadPoolExecutor
@@ -22,8 +22,12 @@ from app.services.camera_stream_manager import camera_stream_manager, StreamCons
 from app.services.new_database_service import DatabaseService
 from app.websocket.push_service import push_yolo_detection
 from app.core.logger import detection_logger
+from app.core.metrics import instrument
 from app.core.config import settings
 from app.core.paths import get_base_dir
+from app.services.frame_profiler import FrameProfiler
+from app.services.preview_encoder import get_preview_encoder_service
+from app.utils.preview_codec import PreviewFrame, header_encoding, normalize_preview_format, send_preview
 
 
 @dataclass
@@ -41,6 +45,7 @@ class RealtimeSession:
     iou_threshold: float = 0.45
     external_source: bool = False
     db_service: Optional[DatabaseService] = None
+    profiler: FrameProfiler = field(default_factory=FrameProfiler)
 
 
 class RealtimeDetectionService:
@@ -52,7 +57,10 @@ class RealtimeDetectionService:
         self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="RealTimeDetection")
         self.queue_manager = queue_manager
         self.preview_clients: Dict[str, Set[WebSocket]] = {}
-        self.preview_payloads: Dict[str, Dict[str, Any]] = {}
+        # 每個預覽連線協商的格式（json / binary），以及每個任務目前有人訂閱的格式
+        self.preview_client_formats: Dict[WebSocket, str] = {}
+        self.preview_task_formats: Dict[str, Set[str]] = {}
+        self.preview_payloads: Dict[str, PreviewFrame] = {}
         self.preview_payload_lock = threading.Lock()
         self.preview_last_sent: Dict[str, float] = {}
         self.preview_interval = 1.0 / 10.0
@@ -123,6 +131,11 @@ class RealtimeDetectionService:
                     detection_logger.error(f"攝影機流啟動失敗: {camera_id}")
                     return False
             
+            # 幀預算 = 攝影機幀間隔，用於統計超時影格
+            stream = camera_stream_manager.streams.get(camera_id)
+            if stream is not None and stream.fps > 0:
+                session.profiler.frame_budget = 1.0 / stream.fps
+            
             consumer = StreamConsumer(
                 consumer_id=session.consumer_id,
                 callback=self._create_frame_callback(session, db_service)
@@ -158,6 +171,7 @@ class RealtimeDetectionService:
             self._process_frame(session, frame_data, db_service)
         return frame_callback
 
+    @instrument("push", "realtime_detection_push")
     def _push_detection_async(self, detection_data: dict):
         """異步推送檢測結果"""
         try:
@@ -182,8 +196,20 @@ class RealtimeDetectionService:
         except Exception as e:
             detection_logger.error(f"WebSocket 推送執行失敗: {e}")
 
-    async def register_preview_client(self, task_id: str, websocket: WebSocket) -> None:
-        """註冊即時預覽 WebSocket 客戶端"""
+    def _refresh_preview_formats(self, task_id: str) -> None:
+        """重新計算任務訂閱的格式（需持有 preview_clients_lock）"""
+        formats = {
+            self.preview_client_formats.get(websocket, "json")
+            for websocket in self.preview_clients.get(task_id, ())
+        }
+        with self.preview_payload_lock:
+            if formats:
+                self.preview_task_formats[task_id] = formats
+            else:
+                self.preview_task_formats.pop(task_id, None)
+
+    async def register_preview_client(self, task_id: str, websocket: WebSocket, preview_format: str = "json") -> None:
+        """註冊即時預覽 WebSocket 客戶端（preview_format 為 json 或 binary）"""
         if self.preview_clients_lock is None:
             self.preview_clients_lock = asyncio.Lock()
 
@@ -195,19 +221,52 @@ class RealtimeDetectionService:
             except RuntimeError:
                 self.loop = None
 
+        preview_format = normalize_preview_format(preview_format)
         async with self.preview_clients_lock:
             clients = self.preview_clients.setdefault(task_id, set())
             clients.add(websocket)
+            self.preview_client_formats[websocket] = preview_format
+            self._refresh_preview_formats(task_id)
+
+        if preview_format != "json":
+            await self._send_format_ack(websocket, preview_format)
 
         with self.preview_payload_lock:
             payload = self.preview_payloads.get(task_id)
 
         if payload:
             try:
-                await websocket.send_json(payload)
+                await send_preview(websocket, payload, preview_format)
             except Exception as e:
                 detection_logger.debug(f"推送歷史預覽給客戶端失敗: {e}")
 
+    @staticmethod
+    async def _send_format_ack(websocket: WebSocket, preview_format: str) -> None:
+        await websocket.send_json({
+            "type": "format",
+            "format": preview_format,
+            "header": header_encoding() if preview_format == "binary" else None,
+        })
+
+    async def handle_preview_message(self, task_id: str, websocket: WebSocket, message: str) -> None:
+        """處理預覽連線送來的文字訊息；目前支援 {"type": "set_format", "format": "binary" | "json"}"""
+        try:
+            data = json.loads(message)
+        except ValueError:
+            return
+        if not isinstance(data, dict) or data.get("type") != "set_format":
+            return
+
+        preview_format = normalize_preview_format(data.get("format"))
+        if self.preview_clients_lock is None:
+            return
+        async with self.preview_clients_lock:
+            if websocket not in self.preview_clients.get(task_id, ()):
+                return
+            self.preview_client_formats[websocket] = preview_format
+            self._refresh_preview_formats(task_id)
+        await self._send_format_ack(websocket, preview_format)
+
     async def unregister_preview_client(self, task_id: str, websocket: WebSocket) -> None:
         """移除即時預覽 WebSocket 客戶端"""
         if self.preview_clients_lock is None:
@@ -215,11 +274,13 @@ class RealtimeDetectionService:
 
         async with self.preview_clients_lock:
             clients = self.preview_clients.get(task_id)
+            self.preview_client_formats.pop(websocket, None)
             if clients and websocket in clients:
                 clients.discard(websocket)
                 if not clients:
                     self.preview_clients.pop(task_id, None)
                     self.preview_last_sent.pop(task_id, None)
+            self._refresh_preview_formats(task_id)
 
     async def _close_preview_clients(self, task_id: str) -> None:
         if self.preview_clients_lock is None:
@@ -228,6 +289,9 @@ class RealtimeDetectionService:
         async with self.preview_clients_lock:
             clients = list(self.preview_clients.pop(task_id, set()))
             self.preview_last_sent.pop(task_id, None)
+            for websocket in clients:
+                self.preview_client_formats.pop(websocket, None)
+            self._refresh_preview_formats(task_id)
 
         for websocket in clients:
             try:
@@ -237,21 +301,25 @@ class RealtimeDetectionService:
 
         with self.preview_payload_lock:
             self.preview_payloads.pop(task_id, None)
+        get_preview_encoder_service().release(f"task_{task_id}")
 
-    async def _broadcast_preview(self, task_id: str, payload: Dict[str, Any]) -> None:
+    async def _broadcast_preview(self, task_id: str, payload: PreviewFrame) -> None:
         if self.preview_clients_lock is None:
             return
 
         async with self.preview_clients_lock:
-            clients = list(self.preview_clients.get(task_id, set()))
+            clients = [
+                (websocket, self.preview_client_formats.get(websocket, "json"))
+                for websocket in self.preview_clients.get(task_id, set())
+            ]
 
         if not clients:
             return
 
         stale_clients: List[WebSocket] = []
-        for websocket in clients:
+        for websocket, preview_format in clients:
             try:
-                await websocket.send_json(payload)
+                await send_preview(websocket, payload, preview_format)
             except Exception as e:
                 detection_logger.debug(f"推送即時預覽失敗: {e}")
                 stale_clients.append(websocket)
@@ -262,10 +330,12 @@ class RealtimeDetectionService:
                 if client_set:
                     for websocket in stale_clients:
                         client_set.discard(websocket)
+                        self.preview_client_formats.pop(websocket, None)
                     if not client_set:
                         self.preview_clients.pop(task_id, None)
+                    self._refresh_preview_formats(task_id)
 
-    def _schedule_preview_broadcast(self, task_id: str, payload: Dict[str, Any]) -> None:
+    def _schedule_preview_broadcast(self, task_id: str, payload: PreviewFrame) -> None:
         if not self.loop:
             return
         try:
@@ -322,40 +392,49 @@ class RealtimeDetectionService:
             return False
 
     def _process_frame(self, session: RealtimeSession, frame_data: FrameData, db_service: DatabaseService = None):
-        """處理單一幀數據"""
+        """處理單一幀數據（各分段耗時記錄於 session.profiler）"""
+        profiler = session.profiler
         try:
             # 檢查會話狀態
             if not session.running:
+                profiler.record_drop("session_stopped")
                 return
             
+            timer = profiler.start_frame(frame_data.frame_number)
+            
             # 檢查任務的資料庫狀態（每30幀檢查一次，避免頻繁查詢）
             if session.frame_count % 30 == 0:
-                if db_service:
-                    try:
-                        task_status = db_service.get_task_status_sync(session.task_id)
-                        
-                        # 🔥 修復：如果任務不存在或已停止，立即停止檢測
-                        if task_status is None:
-                            detection_logger.warning(f"任務 {session.task_id} 不存在，停止檢測處理")
-                            session.running = False
-                            return
+                with timer.stage("status_check"):
+                    if db_service:
+                        try:
+                            task_status = db_service.get_task_status_sync(session.task_id)
                         
-                        if task_status in ['paused', 'completed', 'failed', 'stopped']:
-                            detection_logger.info(f"任務 {session.task_id} 狀態為 {task_status}，停止處理幀")
-                            if task_status == 'paused':
-                                # 暫停狀態：停止處理但不清理會話，等待恢復
-                                detection_logger.info(f"任務 {session.task_id} 已暫停，跳過幀處理")
-                                return
-                            else:
-                                # 其他狀態：停止會話
+                            # 🔥 修復：如果任務不存在或已停止，立即停止檢測
+                            if task_status is None:
+                                detection_logger.warning(f"任務 {session.task_id} 不存在，停止檢測處理")
                                 session.running = False
+                                profiler.record_drop("task_missing")
                                 return
-                    except Exception as e:
-                        detection_logger.error(f"檢查任務狀態失敗: {e}")
-                        # 出現異常時，為安全起見，停止處理
-                        detection_logger.warning(f"由於無法檢查任務狀態，停止任務 {session.task_id} 的處理")
-                        session.running = False
-                        return
+                        
+                            if task_status in ['paused', 'completed', 'failed', 'stopped']:
+                                detection_logger.info(f"任務 {session.task_id} 狀態為 {task_status}，停止處理幀")
+                                if task_status == 'paused':
+                                    # 暫停狀態：停止處理但不清理會話，等待恢復
+                                    detection_logger.info(f"任務 {session.task_id} 已暫停，跳過幀處理")
+                                    profiler.record_drop("paused")
+                                    return
+                                else:
+                                    # 其他狀態：停止會話
+                                    session.running = False
+                                    profiler.record_drop("session_stopped")
+                                    return
+                        except Exception as e:
+                            detection_logger.error(f"檢查任務狀態失敗: {e}")
+                            # 出現異常時，為安全起見，停止處理
+                            detection_logger.warning(f"由於無法檢查任務狀態，停止任務 {session.task_id} 的處理")
+                            session.running = False
+                            profiler.record_drop("status_error")
+                            return
             
             frame = frame_data.frame
             timestamp = frame_data.timestamp
@@ -372,14 +451,16 @@ class RealtimeDetectionService:
                 )
             
             # 執行 YOLO 推理 - 使用會話中的信心度閾值
-            predictions = self.yolo_service.predict_frame(
-                frame, 
-                conf_threshold=session.confidence_threshold,
-                iou_threshold=session.iou_threshold
-            )
+            # 欄位式結果：只有推送 WebSocket 時才建立逐框 dict
+            with timer.stage("inference"):
+                predictions = self.yolo_service.detect_frame(
+                    frame, 
+                    conf_threshold=session.confidence_threshold,
+                    iou_threshold=session.iou_threshold
+                )
             if session.frame_count <= 5 or session.frame_count % 30 == 0:
                 detection_logger.debug(
-                    f"[_process_frame] task_id={session.task_id} 預測完成 幀={session.frame_count} 預測數={len(predictions) if predictions else 0}"
+                    f"[_process_frame] task_id={session.task_id} 預測完成 幀={session.frame_count} 預測數={len(predictions)}"
                 )
             
             should_send_preview = False
@@ -389,7 +470,7 @@ class RealtimeDetectionService:
             if now_monotonic - last_sent >= self.preview_interval:
                 should_send_preview = True
             
-            if predictions and len(predictions) > 0:
+            if len(predictions) > 0:
                 session.detection_count += len(predictions)
                 session.last_detection_time = timestamp
                 
@@ -398,14 +479,15 @@ class RealtimeDetectionService:
                     'task_id': session.task_id,
                     'timestamp': timestamp.isoformat(),
                     'frame_number': session.frame_count,
-                    'detections': predictions,
+                    'detections': predictions.to_dicts(),
                     'frame_shape': frame.shape
                 }
                 
                 # WebSocket 推送（使用線程池處理）
                 try:
                     # 使用執行器來處理異步操作
-                    self.executor.submit(self._push_detection_async, detection_data)
+                    with timer.stage("push"):
+                        self.executor.submit(self._push_detection_async, detection_data)
                 except Exception as e:
                     detection_logger.error(f"WebSocket 推送提交失敗: {e}")
                 
@@ -414,28 +496,39 @@ class RealtimeDetectionService:
                     try:
                         # 準備檢測結果數據
                         detection_results = []
-                        for detection in predictions:
-                            bbox = detection.get('bbox', [0, 0, 0, 0])
-                            tracker_id = detection.get('tracker_id')
-                            thumbnail_path = self._save_detection_thumbnail(
-                                session.task_id,
-                                frame,
-                                bbox,
-                                tracker_id,
-                                session.frame_count
-                            )
+                        boxes = predictions.xyxy.tolist()
+                        centers = predictions.center.tolist()
+                        confidences = predictions.confidence.tolist()
+                        class_names = predictions.class_names()
+                        track_ids = (
+                            predictions.track_id.tolist()
+                            if predictions.track_id is not None
+                            else [None] * len(boxes)
+                        )
+                        for index, bbox in enumerate(boxes):
+                            tracker_id = track_ids[index]
+                            if tracker_id is not None and tracker_id < 0:
+                                tracker_id = None
+                            with timer.stage("thumbnail"):
+                                thumbnail_path = self._save_detection_thumbnail(
+                                    session.task_id,
+                                    frame,
+                                    bbox,
+                                    tracker_id,
+                                    session.frame_count
+                                )
                             detection_payload = {
                                 'task_id': session.task_id,
                                 'frame_number': session.frame_count,
                                 'frame_timestamp': timestamp,
-                                'object_type': detection.get('class', 'unknown'),
-                                'confidence': detection.get('confidence', 0.0),
+                                'object_type': class_names[index],
+                                'confidence': confidences[index],
                                 'bbox_x1': bbox[0],
                                 'bbox_y1': bbox[1],
                                 'bbox_x2': bbox[2],
                                 'bbox_y2': bbox[3],
-                                'center_x': (bbox[0] + bbox[2]) / 2,
-                                'center_y': (bbox[1] + bbox[3]) / 2,
+                                'center_x': centers[index][0],
+                                'center_y': centers[index][1],
                                 'tracker_id': tracker_id,
                                 'thumbnail_path': thumbnail_path
                             }
@@ -451,15 +544,17 @@ class RealtimeDetectionService:
                         # 使用執行器避免阻塞主循環
                         try:
                             # 在線程池中執行資料庫操作
+                            @instrument("db_write", "realtime_detection_results")
                             def save_detections():
                                 try:
-                                    # 使用新的同步儲存方法
+                                    # 整幀一次批次寫入（每批只驗證一次任務）
                                     local_db = DatabaseService()
-                                    for detection_result in detection_results:
-                                        success = local_db.create_detection_result_sync(detection_result)
-                                        if not success:
-                                            detection_logger.error(f"儲存檢測結果失敗: {detection_result}")
-                                    detection_logger.debug(f"成功提交儲存 {len(detection_results)} 個檢測結果")
+                                    saved = local_db.create_detection_results_sync_bulk(detection_results)
+                                    if saved != len(detection_results):
+                                        detection_logger.error(
+                                            f"儲存檢測結果不完整: {saved}/{len(detection_results)} task_id={session.task_id}"
+                                        )
+                                    detection_logger.debug(f"成功提交儲存 {saved} 個檢測結果")
                                     if len(detection_results) > 0 and (session.frame_count <=5 or session.frame_count % 30 == 0):
                                         detection_logger.debug(
                                             f"[save_detections] 插入完成 樣本 task_id={session.task_id} frame={session.frame_count}"
@@ -468,7 +563,8 @@ class RealtimeDetectionService:
                                     detection_logger.error(f"線程中儲存檢測結果失敗: {e}")
                             
                             # 在執行器中非同步執行
-                            self.executor.submit(save_detections)
+                            with timer.stage("db_submit"):
+                                self.executor.submit(save_detections)
                             
                         except Exception as e:
                             detection_logger.error(f"提交資料庫儲存任務失敗: {e}")
@@ -489,90 +585,106 @@ class RealtimeDetectionService:
                     frame_height = 0
                     frame_width = 0
 
-                prediction_list = predictions or []
-                preview_detections: List[Dict[str, Any]] = []
-                for detection in prediction_list:
-                    bbox = detection.get("bbox") or detection.get("bbox_detailed")
-                    if not bbox or len(bbox) != 4:
-                        continue
-                    x1, y1, x2, y2 = bbox
-                    preview_detections.append(
-                        {
-                            "bbox": [
-                                float(max(0, min(frame_width, x1))),
-                                float(max(0, min(frame_height, y1))),
-                                float(max(0, min(frame_width, x2))),
-                                float(max(0, min(frame_height, y2))),
-                            ],
-                            "label": detection.get("class") or detection.get("class_name"),
-                            "confidence": detection.get("confidence"),
-                            "class_id": detection.get("class_id"),
-                            "tracker_id": detection.get("tracker_id"),
-                        }
+                # 一次裁切所有框到畫面範圍內
+                clipped = predictions.xyxy.copy()
+                clipped[:, [0, 2]] = clipped[:, [0, 2]].clip(0, frame_width)
+                clipped[:, [1, 3]] = clipped[:, [1, 3]].clip(0, frame_height)
+                preview_track_ids = (
+                    predictions.track_id.tolist()
+                    if predictions.track_id is not None
+                    else [None] * len(predictions)
+                )
+                preview_detections: List[Dict[str, Any]] = [
+                    {
+                        "bbox": bbox,
+                        "label": label,
+                        "confidence": confidence,
+                        "class_id": class_id,
+                        "tracker_id": tracker_id if tracker_id is None or tracker_id >= 0 else None,
+                    }
+                    for bbox, label, confidence, class_id, tracker_id in zip(
+                        clipped.tolist(),
+                        predictions.class_names(),
+                        predictions.confidence.tolist(),
+                        predictions.class_id.tolist(),
+                        preview_track_ids,
                     )
+                ]
 
-                encoded_image: Optional[str] = None
+                encoded_image: Optional[bytes] = None
                 if not session.external_source:
                     try:
-                        frame_to_draw = frame.copy()
-                        for detection in preview_detections:
-                            bbox = detection.get("bbox", [0.0, 0.0, 0.0, 0.0])
-                            x1, y1, x2, y2 = map(int, bbox)
-                            cv2.rectangle(frame_to_draw, (x1, y1), (x2, y2), (34, 211, 238), 2)
-
-                            label_parts = []
-                            label_text = detection.get("label")
-                            if label_text:
-                                label_parts.append(str(label_text))
-                            confidence = detection.get("confidence")
-                            if isinstance(confidence, (int, float)):
-                                label_parts.append(f"{confidence * 100:.0f}%")
-                            label_str = " • ".join(label_parts)
-                            if label_str:
-                                cv2.rectangle(
-                                    frame_to_draw,
-                                    (x1, max(0, y1 - 24)),
-                                    (x1 + max(60, int(len(label_str) * 9)), y1),
-                                    (15, 23, 42),
-                                    cv2.FILLED,
-                                )
-                                cv2.putText(
-                                    frame_to_draw,
-                                    label_str,
-                                    (x1 + 4, y1 - 6),
-                                    cv2.FONT_HERSHEY_SIMPLEX,
-                                    0.45,
-                                    (248, 250, 252),
-                                    1,
-                                    cv2.LINE_AA,
-                                )
-
-                        success, buffer = cv2.imencode(".jpg", frame_to_draw, [cv2.IMWRITE_JPEG_QUALITY, 85])
-                        if success:
-                            encoded_image = base64.b64encode(buffer).decode("ascii")
+                        with timer.stage("annotate"):
+                            frame_to_draw = frame.copy()
+                            for detection in preview_detections:
+                                bbox = detection.get("bbox", [0.0, 0.0, 0.0, 0.0])
+                                x1, y1, x2, y2 = map(int, bbox)
+                                cv2.rectangle(frame_to_draw, (x1, y1), (x2, y2), (34, 211, 238), 2)
+
+                                label_parts = []
+                                label_text = detection.get("label")
+                                if label_text:
+                                    label_parts.append(str(label_text))
+                                confidence = detection.get("confidence")
+                                if isinstance(confidence, (int, float)):
+                                    label_parts.append(f"{confidence * 100:.0f}%")
+                                label_str = " • ".join(label_parts)
+                                if label_str:
+                                    cv2.rectangle(
+                                        frame_to_draw,
+                                        (x1, max(0, y1 - 24)),
+                                        (x1 + max(60, int(len(label_str) * 9)), y1),
+                                        (15, 23, 42),
+                                        cv2.FILLED,
+                                    )
+                                    cv2.putText(
+                                        frame_to_draw,
+                                        label_str,
+                                        (x1 + 4, y1 - 6),
+                                        cv2.FONT_HERSHEY_SIMPLEX,
+                                        0.45,
+                                        (248, 250, 252),
+                                        1,
+                                        cv2.LINE_AA,
+                                    )
+
+                        with timer.stage("encode"):
+                            encoded_image = get_preview_encoder_service().encode(
+                                f"task_{session.task_id}", session.frame_count, frame_to_draw
+                            )
                     except Exception as encode_error:
                         detection_logger.debug(f"預覽影像編碼失敗: {encode_error}")
 
-                preview_payload = {
-                    "type": "frame",
-                    "task_id": session.task_id,
-                    "frame_number": session.frame_count,
-                    "timestamp": timestamp_seconds,
-                    "width": frame_width,
-                    "height": frame_height,
-                    "detections": preview_detections,
-                }
-
-                if encoded_image:
-                    preview_payload["image"] = encoded_image
+                preview_payload = PreviewFrame(
+                    {
+                        "type": "frame",
+                        "task_id": session.task_id,
+                        "camera_id": session.camera_id,
+                        "frame_number": session.frame_count,
+                        "timestamp": timestamp_seconds,
+                        "width": frame_width,
+                        "height": frame_height,
+                        "detections": preview_detections,
+                    },
+                    encoded_image,
+                )
 
                 with self.preview_payload_lock:
+                    formats = set(self.preview_task_formats.get(session.task_id, ()))
                     self.preview_payloads[session.task_id] = preview_payload
                     self.preview_last_sent[session.task_id] = now_monotonic
 
-                self._schedule_preview_broadcast(session.task_id, preview_payload)
+                # 只為有人訂閱的格式封裝（JSON 需 base64，二進位只需組標頭），在工作執行緒完成
+                with timer.stage("pack"):
+                    preview_payload.prepare(formats)
+
+                with timer.stage("push"):
+                    self._schedule_preview_broadcast(session.task_id, preview_payload)
+            
+            timer.finish()
                 
         except Exception as e:
+            profiler.record_drop("error")
             detection_logger.error(f"幀處理失敗 [{session.task_id}]: {e}")
     
     async def stop_realtime_detection(self, task_id: str) -> bool:
@@ -620,7 +732,21 @@ class RealtimeDetectionService:
             'runtime_seconds': runtime,
             'frame_count': session.frame_count,
             'detection_count': session.detection_count,
-            'last_detection_time': session.last_detection_time.isoformat() if session.last_detection_time else None
+            'last_detection_time': session.last_detection_time.isoformat() if session.last_detection_time else None,
+            'profile': session.profiler.get_profile(),
+        }
+    
+    def get_session_profile(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """獲取會話的分段耗時剖析（滾動百分位數與掉幀數）"""
+        session = self.active_sessions.get(task_id)
+        if not session:
+            return None
+        return {
+            'task_id': task_id,
+            'camera_id': session.camera_id,
+            'running': session.running,
+            'frame_count': session.frame_count,
+            **session.profiler.get_profile(),
         }
     
     def list_active_sessions(self) -> List[Dict[str, Any]]:
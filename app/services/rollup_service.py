@@ -0,0 +1,555 @@
+"""
+分析彙總表（rollup）維護與查詢
+
+儀表板與分析端點原本每次輪詢都對 detection_results 做多次全表 COUNT / GROUP BY。
+改為由背景彙總器維護每分鐘與每小時的彙總表：
+- 每 ROLLUP_INTERVAL 秒把 [水位線 - ROLLUP_LATENESS, 目前分鐘起點) 的明細重新彙總成分鐘列
+  （先刪後插，重算結果冪等；容許時間內的遲到資料直接補上）
+- 超過容許時間才寫入的資料（日誌重放、資料庫中斷後才送出的批次）由寫入端在同一交易內
+  記錄到 analytics_rollup_dirty（record_late_rows），彙總器取出後從該小時起重新彙總
+- 受影響的小時列由分鐘列再彙總
+- 首次啟用時依 ROLLUP_BACKFILL_HOURS 分段回補歷史資料
+- 分鐘列保留 ROLLUP_MINUTE_RETENTION_DAYS 天，小時列長期保留（明細分區刪除後統計仍在）
+- 同一執行緒也負責熱點圖網格分箱（app/services/heatmap_service.py）
+
+查詢端 fetch_detection_summary() 以分鐘彙總表的最新分鐘作為水位線：
+水位線之前的完整小時讀小時表、頭尾不足一小時的部分讀分鐘表，
+水位線之後（尚未彙總的目前分鐘）直接讀明細表。
+
+用法：
+    python -m app.services.rollup_service status
+    python -m app.services.rollup_service run
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, func, literal_column, or_, select, text
+
+from app.core.config import settings
+from app.core.logger import main_logger
+from app.models.database import (
+    AnalyticsRollupHour,
+    AnalyticsRollupMinute,
+    DetectionResult,
+)
+from app.services.heatmap_service import HeatmapAggregator
+
+# 快速統計的「高信心度」與分析頁的「警報」門檻
+HIGH_CONFIDENCE_THRESHOLD = 0.8
+ALERT_CONFIDENCE_THRESHOLD = 0.9
+
+MINUTE = timedelta(minutes=1)
+HOUR = timedelta(hours=1)
+
+SUMMARY_GROUP_KEYS = ("hour", "hour_of_day", "task_id", "object_type")
+# 分組運算式不能含綁定參數（asyncpg 會把 SELECT 與 GROUP BY 的同值參數視為不同運算式）
+_HOUR_UNIT = literal_column("'hour'")
+
+_ROLLUP_COLUMNS = (
+    "bucket_start, task_id, metric, dimension, direction, camera_id, event_count, "
+    "confidence_sum, confidence_max, high_confidence_count, alert_count, value_sum, value_max, last_seen"
+)
+
+# 各明細表 → 分鐘彙總列（:start / :end 為半開區間）
+_MINUTE_SOURCES: Dict[str, str] = {
+    "detection": """
+        SELECT date_trunc('minute', d.frame_timestamp), d.task_id, 'detection',
+               COALESCE(d.object_type, ''), '', max(t.camera_id), count(*),
+               sum(d.confidence), max(d.confidence),
+               count(*) FILTER (WHERE d.confidence >= :high),
+               count(*) FILTER (WHERE d.confidence > :alert),
+               NULL, NULL, max(d.frame_timestamp)
+        FROM detection_results d
+        JOIN analysis_tasks t ON t.id = d.task_id
+        WHERE d.frame_timestamp >= :start AND d.frame_timestamp < :end
+        GROUP BY 1, 2, 4
+    """,
+    "line_crossing": """
+        SELECT date_trunc('minute', e.frame_timestamp), e.task_id, 'line_crossing',
+               COALESCE(e.line_id, ''), COALESCE(e.direction, ''), max(t.camera_id), count(*),
+               NULL, NULL, NULL, NULL, NULL, NULL, max(e.frame_timestamp)
+        FROM line_crossing_events e
+        JOIN analysis_tasks t ON t.id = e.task_id
+        WHERE e.frame_timestamp >= :start AND e.frame_timestamp < :end
+        GROUP BY 1, 2, 4, 5
+    """,
+    "zone_dwell": """
+        SELECT date_trunc('minute', e.event_timestamp), e.task_id, 'zone_dwell',
+               COALESCE(e.zone_id, ''), '', max(t.camera_id), count(*),
+               NULL, NULL, NULL, NULL, sum(e.dwell_seconds), max(e.dwell_seconds), max(e.event_timestamp)
+        FROM zone_dwell_events e
+        JOIN analysis_tasks t ON t.id = e.task_id
+        WHERE e.event_timestamp >= :start AND e.event_timestamp < :end
+        GROUP BY 1, 2, 4
+    """,
+    "speed": """
+        SELECT date_trunc('minute', e.event_timestamp), e.task_id, 'speed',
+               '', '', max(t.camera_id), count(*),
+               NULL, NULL, NULL, NULL, sum(e.speed_avg), max(e.speed_max), max(e.event_timestamp)
+        FROM speed_events e
+        JOIN analysis_tasks t ON t.id = e.task_id
+        WHERE e.event_timestamp >= :start AND e.event_timestamp < :end
+        GROUP BY 1, 2
+    """,
+}
+
+_HOUR_FROM_MINUTES = f"""
+    INSERT INTO analytics_rollup_hour ({_ROLLUP_COLUMNS})
+    SELECT date_trunc('hour', bucket_start), task_id, metric, dimension, direction, max(camera_id),
+           sum(event_count), sum(confidence_sum), max(confidence_max),
+           sum(high_confidence_count), sum(alert_count), sum(value_sum), max(value_max), max(last_seen)
+    FROM analytics_rollup_minute
+    WHERE bucket_start >= :start AND bucket_start < :end
+    GROUP BY 1, 2, 3, 4, 5
+"""
+
+_TAKE_DIRTY = """
+    WITH taken AS (DELETE FROM analytics_rollup_dirty RETURNING earliest)
+    SELECT min(earliest) FROM taken
+"""
+
+_EARLIEST_RAW = """
+    SELECT min(ts) FROM (
+        SELECT min(frame_timestamp) AS ts FROM detection_results
+        UNION ALL SELECT min(frame_timestamp) FROM line_crossing_events
+        UNION ALL SELECT min(event_timestamp) FROM zone_dwell_events
+        UNION ALL SELECT min(event_timestamp) FROM speed_events
+    ) AS earliest
+"""
+
+
+def floor_minute(moment: datetime) -> datetime:
+    return moment.replace(second=0, microsecond=0)
+
+
+def ceil_minute(moment: datetime) -> datetime:
+    floored = floor_minute(moment)
+    return floored if floored == moment else floored + MINUTE
+
+
+def floor_hour(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def ceil_hour(moment: datetime) -> datetime:
+    floored = floor_hour(moment)
+    return floored if floored == moment else floored + HOUR
+
+
+def _naive(moment: Optional[datetime]) -> Optional[datetime]:
+    if moment is not None and moment.tzinfo is not None:
+        return moment.astimezone().replace(tzinfo=None)
+    return moment
+
+
+def rollup_clock() -> datetime:
+    """
+    彙總使用的目前時間
+
+    明細時間欄位有的寫入 utcnow、有的寫入本地時間：以較早的時鐘為準，
+    避免另一個時鐘寫入的資料落在已彙總的分鐘（較晚時鐘的資料只是晚一點彙總，查詢端由明細尾段補上）
+    """
+    return min(datetime.now(), datetime.utcnow())
+
+
+def late_cutoff() -> datetime:
+    """早於此時間的資料列可能已不在彙總範圍內，寫入時需呼叫 record_late_rows"""
+    return floor_minute(rollup_clock()) - timedelta(seconds=max(0.0, settings.rollup_lateness))
+
+
+def record_late_rows(connection, earliest: datetime) -> None:
+    """在寫入明細的同一交易內登記遲到資料（跨行程有效，交易回滾時一併取消）"""
+    connection.execute(
+        text("INSERT INTO analytics_rollup_dirty (earliest, recorded_at) VALUES (:earliest, :now)"),
+        {"earliest": _naive(earliest), "now": datetime.utcnow()},
+    )
+
+
+class RollupService:
+    """分析彙總表背景彙總器（單例）"""
+
+    _instance: Optional["RollupService"] = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+        self.enabled = settings.rollup_enabled
+        self.interval = max(5.0, settings.rollup_interval)
+        self.lateness = timedelta(seconds=max(0.0, settings.rollup_lateness))
+        self.backfill_span = timedelta(hours=max(1, settings.rollup_backfill_hours))
+        self.minute_retention_days = settings.rollup_minute_retention_days
+
+        self._engine = None
+        self._watermark: Optional[datetime] = None
+        self._run_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_report: Dict[str, Any] = {}
+        self.heatmap = HeatmapAggregator(lambda: self.engine, self.lateness, settings.rollup_backfill_hours)
+        self.runs = 0
+        self.failures = 0
+        self.rerolled_ranges = 0
+        self._initialized = True
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            from app.core.database import sync_engine
+
+            self._engine = sync_engine
+        return self._engine
+
+    # ===== 彙總 =====
+
+    def _initial_watermark(self, connection) -> datetime:
+        latest = _naive(connection.execute(text("SELECT max(bucket_start) FROM analytics_rollup_minute")).scalar())
+        if latest is not None:
+            return latest + MINUTE
+        earliest = _naive(connection.execute(text(_EARLIEST_RAW)).scalar())
+        return floor_minute(earliest) if earliest is not None else floor_minute(datetime.now())
+
+    @staticmethod
+    def _rollup_range(connection, start: datetime, end: datetime) -> int:
+        """重算 [start, end) 的分鐘列與涉及的整小時列，回傳分鐘列數"""
+        params = {
+            "start": start,
+            "end": end,
+            "high": HIGH_CONFIDENCE_THRESHOLD,
+            "alert": ALERT_CONFIDENCE_THRESHOLD,
+        }
+        connection.execute(
+            text("DELETE FROM analytics_rollup_minute WHERE bucket_start >= :start AND bucket_start < :end"),
+            params,
+        )
+        minute_rows = 0
+        for source in _MINUTE_SOURCES.values():
+            result = connection.execute(
+                text(f"INSERT INTO analytics_rollup_minute ({_ROLLUP_COLUMNS}) {source}"), params
+            )
+            minute_rows += max(0, result.rowcount or 0)
+
+        # 小時列由整小時的分鐘列重算（end 之後尚未彙總的分鐘不存在，不會重複計入）
+        hour_params = {"start": floor_hour(start), "end": ceil_hour(end)}
+        connection.execute(
+            text("DELETE FROM analytics_rollup_hour WHERE bucket_start >= :start AND bucket_start < :end"),
+            hour_params,
+        )
+        connection.execute(text(_HOUR_FROM_MINUTES), hour_params)
+        return minute_rows
+
+    def _reroll_late_rows(self, connection, watermark: datetime) -> Optional[Tuple[datetime, datetime]]:
+        """
+        取出遲到資料標記，從最早那筆所在的小時起重算到容許時間窗口之前
+
+        整小時重算，小時列才會包含同一小時內所有分鐘；
+        範圍超過 ROLLUP_BACKFILL_HOURS 時剩餘部分重新登記，下一段繼續。
+        """
+        dirty = _naive(connection.execute(text(_TAKE_DIRTY)).scalar())
+        limit = watermark - self.lateness
+        if dirty is None or dirty >= limit:
+            return None
+        start = floor_hour(dirty)
+        end = min(limit, start + self.backfill_span)
+        self._rollup_range(connection, start, end)
+        if end < limit:
+            record_late_rows(connection, end)
+        return start, end
+
+    def compact(self, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """彙總一段時間（追趕中每次最多 ROLLUP_BACKFILL_HOURS 小時），回傳處理範圍"""
+        with self._run_lock:
+            current = floor_minute(now or rollup_clock())
+            with self.engine.begin() as connection:
+                if self._watermark is None:
+                    self._watermark = self._initial_watermark(connection)
+                watermark = self._watermark
+                rerolled = self._reroll_late_rows(connection, watermark)
+                if rerolled is not None:
+                    self.rerolled_ranges += 1
+                    main_logger.info(f"[rollup] 遲到資料重算 {rerolled[0]} ~ {rerolled[1]}")
+                if watermark >= current:
+                    return {
+                        "start": None,
+                        "end": None,
+                        "watermark": watermark.isoformat(),
+                        "rerolled": [moment.isoformat() for moment in rerolled] if rerolled else None,
+                    }
+
+                start = watermark - self.lateness
+                end = min(current, watermark + self.backfill_span)
+                minute_rows = self._rollup_range(connection, start, end)
+
+                if self.minute_retention_days > 0:
+                    connection.execute(
+                        text("DELETE FROM analytics_rollup_minute WHERE bucket_start < :cutoff"),
+                        {"cutoff": floor_hour(current - timedelta(days=self.minute_retention_days))},
+                    )
+
+            self._watermark = end
+            self.runs += 1
+            return {
+                "start": start.isoformat(),
+                "end": end.isoformat(),
+                "minute_rows": minute_rows,
+                "watermark": end.isoformat(),
+                "caught_up": end >= current,
+                "rerolled": [moment.isoformat() for moment in rerolled] if rerolled else None,
+            }
+
+    def run_once(self) -> Dict[str, Any]:
+        """彙總到目前分鐘為止（回補時分段執行）"""
+        started = time.perf_counter()
+        report: Dict[str, Any] = {"timestamp": datetime.now().isoformat(), "segments": 0}
+        rerolled: List[Tuple[datetime, datetime]] = []
+        while True:
+            segment = self.compact()
+            if segment["rerolled"]:
+                rerolled.append(tuple(datetime.fromisoformat(moment) for moment in segment["rerolled"]))
+            if segment["end"] is None:
+                break
+            report["segments"] += 1
+            report["last_segment"] = segment
+            if segment["caught_up"] or self._stop_event.is_set():
+                break
+        # 熱點圖網格只在小時結束後分箱；遲到資料涉及的已分箱小時重新分箱
+        report["heatmap"] = self.heatmap.compact(rollup_clock())
+        for start, end in rerolled:
+            self.heatmap.rebin(start, end)
+        report["duration_ms"] = (time.perf_counter() - started) * 1000
+        self._last_report = report
+        return report
+
+    # ===== 背景執行緒 =====
+
+    def start(self) -> None:
+        if not self.enabled:
+            return
+        with self._run_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run_loop, name="analytics-rollup", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 2.0) -> None:
+        self._stop_event.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout=timeout)
+        self._thread = None
+
+    def _run_loop(self) -> None:
+        while True:
+            try:
+                self.run_once()
+            except Exception as exc:  # noqa: BLE001
+                self.failures += 1
+                main_logger.error(f"[rollup] 彙總失敗: {exc}")
+            if self._stop_event.wait(self.interval):
+                break
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "interval": self.interval,
+            "lateness_seconds": self.lateness.total_seconds(),
+            "watermark": self._watermark.isoformat() if self._watermark else None,
+            "runs": self.runs,
+            "failures": self.failures,
+            "rerolled_ranges": self.rerolled_ranges,
+            "last_run": self._last_report,
+        }
+
+
+def get_rollup_service() -> RollupService:
+    """獲取分析彙總服務實例"""
+    return RollupService()
+
+
+# ===== 查詢（彙總表 + 明細表尾段） =====
+
+
+async def _rollup_watermark(db) -> Optional[datetime]:
+    """分鐘彙總表已涵蓋到的時間點（最新分鐘的結束）；尚無彙總資料時為 None"""
+    latest = (await db.execute(select(func.max(AnalyticsRollupMinute.bucket_start)))).scalar()
+    latest = _naive(latest)
+    return latest + MINUTE if latest is not None else None
+
+
+def _group_columns(group_by: Sequence[str], hour_expr, task_col, object_col) -> List[Any]:
+    columns = []
+    for key in group_by:
+        if key == "hour":
+            columns.append(hour_expr.label("hour"))
+        elif key == "hour_of_day":
+            columns.append(func.extract("hour", hour_expr).label("hour_of_day"))
+        elif key == "task_id":
+            columns.append(task_col.label("task_id"))
+        elif key == "object_type":
+            columns.append(object_col.label("object_type"))
+        else:
+            raise ValueError(f"不支援的分組欄位: {key}")
+    return columns
+
+
+def _rollup_statement(model, group_by: Sequence[str], condition, hourly: bool):
+    hour_expr = model.bucket_start if hourly else func.date_trunc(_HOUR_UNIT, model.bucket_start)
+    columns = _group_columns(group_by, hour_expr, model.task_id, model.dimension)
+    return (
+        select(
+            *columns,
+            func.sum(model.event_count).label("count"),
+            func.sum(model.confidence_sum).label("confidence_sum"),
+            func.max(model.confidence_max).label("confidence_max"),
+            func.sum(model.high_confidence_count).label("high_confidence_count"),
+            func.sum(model.alert_count).label("alert_count"),
+            func.max(model.last_seen).label("last_seen"),
+        )
+        .where(model.metric == "detection", condition)
+        .group_by(*[column.element for column in columns])
+    )
+
+
+def _raw_statement(group_by: Sequence[str], condition):
+    hour_expr = func.date_trunc(_HOUR_UNIT, DetectionResult.frame_timestamp)
+    columns = _group_columns(
+        group_by, hour_expr, DetectionResult.task_id, func.coalesce(DetectionResult.object_type, literal_column("''"))
+    )
+    return (
+        select(
+            *columns,
+            func.count().label("count"),
+            func.sum(DetectionResult.confidence).label("confidence_sum"),
+            func.max(DetectionResult.confidence).label("confidence_max"),
+            func.count().filter(DetectionResult.confidence >= HIGH_CONFIDENCE_THRESHOLD).label("high_confidence_count"),
+            func.count().filter(DetectionResult.confidence > ALERT_CONFIDENCE_THRESHOLD).label("alert_count"),
+            func.max(DetectionResult.frame_timestamp).label("last_seen"),
+        )
+        .where(condition)
+        .group_by(*[column.element for column in columns])
+    )
+
+
+def _merge_rows(merged: Dict[Tuple[Any, ...], Dict[str, Any]], rows, group_by: Sequence[str]) -> None:
+    for row in rows:
+        mapping = row._mapping
+        key = tuple(mapping[name] for name in group_by)
+        entry = merged.get(key)
+        if entry is None:
+            entry = {name: mapping[name] for name in group_by}
+            entry.update(count=0, confidence_sum=0.0, confidence_max=None,
+                         high_confidence_count=0, alert_count=0, last_seen=None)
+            merged[key] = entry
+        entry["count"] += int(mapping["count"] or 0)
+        entry["confidence_sum"] += float(mapping["confidence_sum"] or 0.0)
+        entry["high_confidence_count"] += int(mapping["high_confidence_count"] or 0)
+        entry["alert_count"] += int(mapping["alert_count"] or 0)
+        for name in ("confidence_max", "last_seen"):
+            value = mapping[name]
+            if value is not None and (entry[name] is None or value > entry[name]):
+                entry[name] = value
+
+
+async def fetch_detection_summary(
+    db,
+    start: Optional[datetime],
+    end: datetime,
+    group_by: Sequence[str] = (),
+) -> List[Dict[str, Any]]:
+    """
+    [start, end) 內偵測數量的彙總（分組欄位見 SUMMARY_GROUP_KEYS）
+
+    每列含 count / confidence_sum / confidence_max / high_confidence_count / alert_count / last_seen；
+    start 以分鐘向上對齊，None 表示不限起點。
+    """
+    end = _naive(end)
+    start = ceil_minute(_naive(start)) if start is not None else None
+    merged: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+
+    watermark = await _rollup_watermark(db)
+    rolled_end = min(end, watermark) if watermark is not None else None
+    if rolled_end is not None and (start is None or start < rolled_end):
+        minute_floor = None
+        if settings.rollup_minute_retention_days > 0:
+            minute_floor = floor_hour(datetime.now() - timedelta(days=settings.rollup_minute_retention_days))
+        if start is not None and minute_floor is not None and start < minute_floor:
+            # 分鐘列已清除的區段只能以整小時計算
+            start = floor_hour(start)
+
+        hour_lo = ceil_hour(start) if start is not None else None
+        hour_hi = floor_hour(rolled_end)
+        minute_ranges: List[Tuple[Optional[datetime], datetime]] = []
+        if hour_lo is None or hour_lo < hour_hi:
+            hour_model = AnalyticsRollupHour
+            condition = hour_model.bucket_start < hour_hi
+            if hour_lo is not None:
+                condition = and_(hour_model.bucket_start >= hour_lo, condition)
+            rows = (await db.execute(_rollup_statement(hour_model, group_by, condition, hourly=True))).all()
+            _merge_rows(merged, rows, group_by)
+            if hour_lo is not None and start < hour_lo:
+                minute_ranges.append((start, hour_lo))
+            if hour_hi < rolled_end:
+                minute_ranges.append((hour_hi, rolled_end))
+        else:
+            minute_ranges.append((start, rolled_end))
+
+        if minute_ranges:
+            minute_model = AnalyticsRollupMinute
+            conditions = []
+            for lower, upper in minute_ranges:
+                condition = minute_model.bucket_start < upper
+                if lower is not None:
+                    condition = and_(minute_model.bucket_start >= lower, condition)
+                conditions.append(condition)
+            rows = (
+                await db.execute(_rollup_statement(minute_model, group_by, or_(*conditions), hourly=False))
+            ).all()
+            _merge_rows(merged, rows, group_by)
+
+    raw_start = rolled_end if rolled_end is not None and (start is None or rolled_end > start) else start
+    if raw_start is None or raw_start < end:
+        condition = DetectionResult.frame_timestamp < end
+        if raw_start is not None:
+            condition = and_(DetectionResult.frame_timestamp >= raw_start, condition)
+        rows = (await db.execute(_raw_statement(group_by, condition))).all()
+        _merge_rows(merged, rows, group_by)
+
+    return list(merged.values())
+
+
+__all__ = [
+    "ALERT_CONFIDENCE_THRESHOLD",
+    "HIGH_CONFIDENCE_THRESHOLD",
+    "RollupService",
+    "fetch_detection_summary",
+    "get_rollup_service",
+    "late_cutoff",
+    "record_late_rows",
+]
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="分析彙總表維護")
+    parser.add_argument("command", choices=("status", "run"))
+    args = parser.parse_args()
+
+    service = get_rollup_service()
+    output: Any = service.run_once() if args.command == "run" else service.get_status()
+    print(json.dumps(output, ensure_ascii=False, indent=2, default=str))
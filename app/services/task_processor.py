@@ -8,10 +8,10 @@ from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Dict, List, Optional, Any
 import json
-from ultralytics import YOLO
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.logger import main_logger as logger
+from app.services.inference_backends import InferenceBackend, open_backend
 from app.services.new_database_service import DatabaseService
 from app.models.database import AnalysisTask, DetectionResult
 
@@ -23,6 +23,7 @@ class TaskProcessor:
         # 初始化YOLO模型
         self.model_path = "yolo11n.pt"
         self.model = None
+        self._backend: Optional[InferenceBackend] = None
         self._load_model()
         
         # 資料庫服務
@@ -34,7 +35,10 @@ class TaskProcessor:
         """載入YOLO模型"""
         try:
             if Path(self.model_path).exists():
-                self.model = YOLO(self.model_path)
+                # 經由模型註冊表共用權重，後端依 INFERENCE_BACKEND 決定
+                self._backend = open_backend(self.model_path)
+                self._backend.ensure_loaded()
+                self.model = self._backend.lease.model
                 logger.info(f"✅ YOLO模型載入成功: {self.model_path}")
             else:
                 logger.error(f"❌ YOLO模型檔案不存在: {self.model_path}")
@@ -163,63 +167,59 @@ class TaskProcessor:
         """
         try:
             # 使用YOLO進行檢測
-            results = self.model(frame, verbose=False)
+            # iou / max_det 沿用 ultralytics 預設值
+            result = self._backend.predict([frame], confidence_threshold, 0.7, 300)[0]
+            names = self._backend.names
             
             detections = []
             
-            if results and len(results) > 0:
-                result = results[0]  # 取第一個結果
-                
-                if result.boxes is not None and len(result.boxes) > 0:
-                    boxes = result.boxes
+            if len(result) > 0:
+                for i in range(len(result)):
+                    # 獲取檢測資訊
+                    confidence = float(result.confidence[i])
+                    
+                    # 過濾低信心度檢測
+                    if confidence < confidence_threshold:
+                        continue
+                    
+                    # 獲取邊界框座標（YOLO格式：x1, y1, x2, y2）
+                    x1, y1, x2, y2 = result.xyxy[i]
+                    
+                    # 轉換為Unity座標系統（左下角為(0,0)）
+                    # OpenCV/YOLO座標系：左上角為(0,0)，Y軸向下
+                    # Unity座標系：左下角為(0,0)，Y軸向上
+                    unity_y1 = frame_height - y2  # 原來的y2變成新的y1（左下角Y）
+                    unity_y2 = frame_height - y1  # 原來的y1變成新的y2（右上角Y）
+                    
+                    # 計算中心點（Unity座標系）
+                    center_x = (x1 + x2) / 2
+                    center_y = (unity_y1 + unity_y2) / 2
+                    
+                    # 獲取物件類別
+                    class_id = int(result.class_id[i])
+                    object_type = names.get(class_id, f"class_{class_id}")
+                    
+                    # 計算時間戳（相對於影片開始時間）
+                    timestamp = datetime.now() + timedelta(seconds=frame_number / fps)
+                    
+                    # 創建檢測記錄
+                    detection_data = {
+                        'task_id': task_id,
+                        'frame_number': frame_number,
+                        'timestamp': timestamp,
+                        'object_type': object_type,
+                        'confidence': confidence,
+                        'bbox_x1': float(x1),           # Unity座標：左下角X（與OpenCV相同）
+                        'bbox_y1': float(unity_y1),     # Unity座標：左下角Y（轉換後）
+                        'bbox_x2': float(x2),           # Unity座標：右上角X（與OpenCV相同）
+                        'bbox_y2': float(unity_y2),     # Unity座標：右上角Y（轉換後）
+                        'center_x': float(center_x),    # Unity座標：中心X
+                        'center_y': float(center_y)     # Unity座標：中心Y
+                    }
                     
-                    for i in range(len(boxes)):
-                        # 獲取檢測資訊
-                        confidence = float(boxes.conf[i])
-                        
-                        # 過濾低信心度檢測
-                        if confidence < confidence_threshold:
-                            continue
-                        
-                        # 獲取邊界框座標（YOLO格式：x1, y1, x2, y2）
-                        bbox = boxes.xyxy[i].cpu().numpy()
-                        x1, y1, x2, y2 = bbox
-                        
-                        # 轉換為Unity座標系統（左下角為(0,0)）
-                        # OpenCV/YOLO座標系：左上角為(0,0)，Y軸向下
-                        # Unity座標系：左下角為(0,0)，Y軸向上
-                        unity_y1 = frame_height - y2  # 原來的y2變成新的y1（左下角Y）
-                        unity_y2 = frame_height - y1  # 原來的y1變成新的y2（右上角Y）
-                        
-                        # 計算中心點（Unity座標系）
-                        center_x = (x1 + x2) / 2
-                        center_y = (unity_y1 + unity_y2) / 2
-                        
-                        # 獲取物件類別
-                        class_id = int(boxes.cls[i])
-                        object_type = self.model.names[class_id]
-                        
-                        # 計算時間戳（相對於影片開始時間）
-                        timestamp = datetime.now() + timedelta(seconds=frame_number / fps)
-                        
-                        # 創建檢測記錄
-                        detection_data = {
-                            'task_id': task_id,
-                            'frame_number': frame_number,
-                            'timestamp': timestamp,
-                            'object_type': object_type,
-                            'confidence': confidence,
-                            'bbox_x1': float(x1),           # Unity座標：左下角X（與OpenCV相同）
-                            'bbox_y1': float(unity_y1),     # Unity座標：左下角Y（轉換後）
-                            'bbox_x2': float(x2),           # Unity座標：右上角X（與OpenCV相同）
-                            'bbox_y2': float(unity_y2),     # Unity座標：右上角Y（轉換後）
-                            'center_x': float(center_x),    # Unity座標：中心X
-                            'center_y': float(center_y)     # Unity座標：中心Y
-                        }
-                        
-                        # 保存到資料庫
-                        detection_record = await self.db_service.save_detection_result(db, detection_data)
-                        detections.append(detection_record)
+                    # 保存到資料庫
+                    detection_record = await self.db_service.save_detection_result(db, detection_data)
+                    detections.append(detection_record)
             
             return detections
             
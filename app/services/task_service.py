@@ -13,6 +13,8 @@ from sqlalchemy import func, and_, or_
 
 from app.core.logger import api_logger
 from app.models.database import AnalysisTask, DetectionResult
+from app.services.task_status_cache import get_task_status_cache
+from app.services.analytics_cache import notify_task_changed
 
 class TaskService:
     """任務管理服務"""
@@ -80,6 +82,7 @@ class TaskService:
                 await db.commit()
                 await db.refresh(analysis_task)
                 task_id = str(analysis_task.id)
+                notify_task_changed(task_id)
                 print(f"🔧 資料庫保存成功，新 task_id: {task_id}")
             
             # 在記憶體中追踪任務
@@ -158,6 +161,8 @@ class TaskService:
                         db_task.status = 'running'
                         db_task.start_time = datetime.utcnow()
                         await db.commit()
+                        get_task_status_cache().set(task_id, 'running')
+                        notify_task_changed(task_id)
                 except Exception as e:
                     api_logger.error(f"更新資料庫任務狀態失敗: {e}")
             
@@ -242,6 +247,8 @@ class TaskService:
                     db_task.status = 'completed'
                     db_task.end_time = datetime.utcnow()
                     await db.commit()
+                    get_task_status_cache().set(task_id, 'completed')
+                    notify_task_changed(task_id)
                     api_logger.info(f"已更新資料庫中任務 {task_id} 的狀態為 completed")
                 except Exception as e:
                     api_logger.error(f"更新資料庫任務狀態失敗: {e}")
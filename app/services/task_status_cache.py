@@ -0,0 +1,81 @@
+"""
+任務狀態快取
+
+即時檢測每隔數十幀就要確認任務是否被暫停或停止；
+狀態改由行程內快取提供，停止 / 暫停 / 恢復等端點更新狀態時直接寫入快取，
+只有快取未命中或超過 TTL（其他行程修改狀態時的保險）才查詢資料庫。
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from app.core.config import settings
+
+
+class TaskStatusCache:
+    """任務狀態快取（單例）"""
+
+    _instance: Optional["TaskStatusCache"] = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+        self.ttl = settings.task_status_cache_ttl
+        self._entries: Dict[int, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._initialized = True
+
+    def get(self, task_id: Any) -> Optional[str]:
+        """回傳快取中的狀態；未命中或已過期回傳 None"""
+        key = int(task_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (self.ttl <= 0 or time.monotonic() - entry[1] < self.ttl):
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            return None
+
+    def set(self, task_id: Any, status: Optional[str]) -> None:
+        """狀態變更時寫入快取（None 等同失效）"""
+        if status is None:
+            self.invalidate(task_id)
+            return
+        with self._lock:
+            self._entries[int(task_id)] = (status, time.monotonic())
+
+    def invalidate(self, task_id: Any = None) -> None:
+        """使單一任務（或全部）的快取失效"""
+        with self._lock:
+            if task_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(int(task_id), None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "ttl": self.ttl,
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def get_task_status_cache() -> TaskStatusCache:
+    """獲取任務狀態快取實例"""
+    return TaskStatusCache()
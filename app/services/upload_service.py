@@ -0,0 +1,428 @@
+"""
+可續傳的分段影片上傳
+
+原本的上傳端點把整個檔案 read() 進記憶體再寫檔，並在事件迴圈中以 cv2 量測影片。
+改為三段式協定：
+1. initiate：宣告檔名、大小（可附整檔 SHA-256），取得 upload_id 與分段大小
+2. 上傳分段：每段以請求本文串流寫入暫存檔的對應位置（寫檔在工作執行緒），
+   並以 X-Content-SHA256 驗證；分段可亂序、並行或重傳
+3. complete：所有分段到齊後在背景搬移檔案、量測影片資訊並建立資料來源，以狀態查詢取得結果
+
+上傳狀態（manifest.json）存在 UPLOAD_TEMP_DIR/<upload_id>/，伺服器重啟後仍可查詢缺少的分段並續傳；
+超過 UPLOAD_SESSION_TTL_HOURS 未更新的上傳會被清除。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import shutil
+import threading
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.logger import api_logger
+from app.core.paths import get_base_dir, get_videos_dir
+from app.services.new_database_service import DatabaseService
+from app.utils.media_info import probe_video
+
+ALLOWED_VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv", ".wmv", ".flv", ".webm")
+
+_MB = 1024 * 1024
+_MIN_PART_SIZE = 1 * _MB
+_MAX_PART_SIZE = 64 * _MB
+# 分段本文累積到此大小才交給執行緒寫檔
+_WRITE_BUFFER = 1 * _MB
+_MANIFEST = "manifest.json"
+_DATA = "data.part"
+
+
+class UploadError(Exception):
+    """上傳協定錯誤（status_code 對應 HTTP 狀態碼）"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _write_at(path: Path, offset: int, data: bytes) -> None:
+    with open(path, "r+b") as handle:
+        handle.seek(offset)
+        handle.write(data)
+
+
+def _file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(_WRITE_BUFFER * 4), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _allocate(path: Path, size: int) -> None:
+    with open(path, "wb") as handle:
+        handle.truncate(size)
+
+
+async def register_video_source(file_path: Path, original_name: str, video_info: Dict[str, Any]) -> Any:
+    """為已存放到影片目錄的檔案建立 video_file 資料來源"""
+    video_config = {
+        "path": str(file_path),  # 使用 "path" 符合模型期望
+        "file_path": str(file_path),  # 保留向後相容性
+        "original_name": original_name,
+        "file_size": file_path.stat().st_size,
+        "duration": video_info["duration"],
+        "fps": video_info["fps"],
+        "resolution": f"{video_info['width']}x{video_info['height']}",
+        "frame_count": video_info["frame_count"],
+        "upload_time": datetime.now().isoformat(),
+    }
+    async with AsyncSessionLocal() as db:
+        return await DatabaseService().create_data_source(
+            db,
+            {
+                "source_type": "video_file",  # 使用 "video_file" 符合資料庫約束
+                "name": original_name,
+                "config": video_config,
+                "status": "active",
+            },
+        )
+
+
+def video_target_path(original_name: str) -> Path:
+    """影片目錄中的唯一檔名（時間戳 + 原始檔名，去除路徑）"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return get_videos_dir(create=True) / f"{timestamp}_{Path(original_name).name}"
+
+
+class UploadService:
+    """分段上傳管理（單例）"""
+
+    _instance: Optional["UploadService"] = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+        temp_dir = Path(settings.upload_temp_dir).expanduser()
+        self.temp_dir = temp_dir if temp_dir.is_absolute() else get_base_dir() / temp_dir
+        self.default_part_size = min(_MAX_PART_SIZE, max(_MIN_PART_SIZE, settings.upload_part_size_mb * _MB))
+        self.max_size = settings.upload_max_size_mb * _MB
+        self.session_ttl = timedelta(hours=max(1.0, settings.upload_session_ttl_hours))
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._finalizers: Dict[str, asyncio.Task] = {}
+        self._initialized = True
+
+    # ===== manifest =====
+
+    def _dir(self, upload_id: str) -> Path:
+        if not upload_id or not upload_id.isalnum():
+            raise UploadError("上傳 ID 格式錯誤", 404)
+        return self.temp_dir / upload_id
+
+    def _load(self, upload_id: str) -> Dict[str, Any]:
+        path = self._dir(upload_id) / _MANIFEST
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            raise UploadError("上傳不存在或已過期", 404) from None
+
+    def _save(self, manifest: Dict[str, Any]) -> None:
+        manifest["updated_at"] = datetime.now().isoformat()
+        directory = self._dir(manifest["upload_id"])
+        temporary = directory / f"{_MANIFEST}.tmp"
+        temporary.write_text(json.dumps(manifest, ensure_ascii=False), encoding="utf-8")
+        temporary.replace(directory / _MANIFEST)
+
+    def _lock(self, upload_id: str) -> asyncio.Lock:
+        lock = self._locks.get(upload_id)
+        if lock is None:
+            lock = self._locks[upload_id] = asyncio.Lock()
+        return lock
+
+    @staticmethod
+    def _part_length(manifest: Dict[str, Any], part_number: int) -> int:
+        if part_number < manifest["total_parts"]:
+            return manifest["part_size"]
+        return manifest["size"] - manifest["part_size"] * (manifest["total_parts"] - 1)
+
+    def _retryable(self, manifest: Dict[str, Any]) -> bool:
+        """再次 complete 可繼續處理：檔案已搬移但後續失敗，或 processing 但背景工作已不存在"""
+        if manifest["status"] == "failed":
+            return bool(manifest.get("stored_path"))
+        if manifest["status"] == "processing":
+            finalizer = self._finalizers.get(manifest["upload_id"])
+            return finalizer is None or finalizer.done()
+        return False
+
+    def describe(self, manifest: Dict[str, Any]) -> Dict[str, Any]:
+        received = sorted(int(number) for number in manifest["parts"])
+        received_set = set(received)
+        return {
+            "upload_id": manifest["upload_id"],
+            "filename": manifest["filename"],
+            "size": manifest["size"],
+            "part_size": manifest["part_size"],
+            "total_parts": manifest["total_parts"],
+            "received_parts": received,
+            "missing_parts": [n for n in range(1, manifest["total_parts"] + 1) if n not in received_set],
+            "bytes_received": sum(part["size"] for part in manifest["parts"].values()),
+            "status": manifest["status"],
+            "error": manifest.get("error"),
+            "retryable": self._retryable(manifest),
+            "result": manifest.get("result"),
+            "created_at": manifest["created_at"],
+            "updated_at": manifest.get("updated_at"),
+        }
+
+    # ===== 協定 =====
+
+    async def initiate(
+        self,
+        filename: str,
+        size: int,
+        part_size: Optional[int] = None,
+        sha256: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        name = Path(filename or "").name
+        if Path(name).suffix.lower() not in ALLOWED_VIDEO_EXTENSIONS:
+            raise UploadError(f"不支援的檔案格式。支援的格式: {', '.join(ALLOWED_VIDEO_EXTENSIONS)}")
+        if size <= 0:
+            raise UploadError("檔案大小必須大於 0")
+        if size > self.max_size:
+            raise UploadError(
+                f"檔案太大。最大支援 {self.max_size / _MB:.0f}MB，您的檔案為 {size / _MB:.1f}MB", 413
+            )
+        part_size = min(_MAX_PART_SIZE, max(_MIN_PART_SIZE, part_size or self.default_part_size))
+
+        await asyncio.to_thread(self.purge_expired)
+        upload_id = uuid.uuid4().hex
+        directory = self._dir(upload_id)
+        directory.mkdir(parents=True, exist_ok=True)
+        await asyncio.to_thread(_allocate, directory / _DATA, size)
+
+        manifest = {
+            "upload_id": upload_id,
+            "filename": name,
+            "size": size,
+            "part_size": part_size,
+            "total_parts": -(-size // part_size),
+            "sha256": sha256.lower() if sha256 else None,
+            "parts": {},
+            "status": "uploading",
+            "created_at": datetime.now().isoformat(),
+        }
+        self._save(manifest)
+        api_logger.info(f"分段上傳已建立: {upload_id} {name} ({size / _MB:.1f}MB, {manifest['total_parts']} 段)")
+        return self.describe(manifest)
+
+    async def write_part(
+        self,
+        upload_id: str,
+        part_number: int,
+        chunks: AsyncIterator[bytes],
+        checksum: Optional[str],
+    ) -> Dict[str, Any]:
+        """串流寫入一個分段（1 起算），驗證大小與 SHA-256 後記錄到 manifest"""
+        if not checksum:
+            raise UploadError("缺少分段 SHA-256（X-Content-SHA256）")
+        async with self._lock(upload_id):
+            manifest = self._load(upload_id)
+            if manifest["status"] != "uploading":
+                raise UploadError(f"上傳狀態為 {manifest['status']}，無法再寫入分段", 409)
+            if not 1 <= part_number <= manifest["total_parts"]:
+                raise UploadError(f"分段編號超出範圍 (1-{manifest['total_parts']})")
+            # 重傳時先取消舊紀錄，避免寫到一半失敗後仍被視為已收到
+            if manifest["parts"].pop(str(part_number), None) is not None:
+                self._save(manifest)
+
+        expected = self._part_length(manifest, part_number)
+        data_path = self._dir(upload_id) / _DATA
+        offset = (part_number - 1) * manifest["part_size"]
+        digest = hashlib.sha256()
+        received = 0
+        buffer = bytearray()
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            received += len(chunk)
+            if received > expected:
+                raise UploadError(f"分段 {part_number} 超過預期大小 {expected} bytes", 413)
+            digest.update(chunk)
+            buffer += chunk
+            if len(buffer) >= _WRITE_BUFFER:
+                await asyncio.to_thread(_write_at, data_path, offset, bytes(buffer))
+                offset += len(buffer)
+                buffer.clear()
+        if buffer:
+            await asyncio.to_thread(_write_at, data_path, offset, bytes(buffer))
+
+        if received != expected:
+            raise UploadError(f"分段 {part_number} 大小不符：預期 {expected} bytes，收到 {received} bytes")
+        actual = digest.hexdigest()
+        if actual != checksum.strip().lower():
+            raise UploadError(f"分段 {part_number} SHA-256 不符", 422)
+
+        async with self._lock(upload_id):
+            manifest = self._load(upload_id)
+            manifest["parts"][str(part_number)] = {"size": received, "sha256": actual}
+            self._save(manifest)
+        return {
+            "upload_id": upload_id,
+            "part_number": part_number,
+            "size": received,
+            "sha256": actual,
+            "parts_received": len(manifest["parts"]),
+            "total_parts": manifest["total_parts"],
+        }
+
+    async def complete(self, upload_id: str, sha256: Optional[str] = None) -> Dict[str, Any]:
+        """
+        所有分段到齊後轉為 processing，由背景工作搬移、量測並建立資料來源
+
+        檔案已搬移但後續步驟失敗（retryable）時，再次呼叫會重試量測與建立資料來源；
+        狀態為 processing 但沒有執行中的背景工作（處理途中伺服器重啟）時重新啟動背景工作。
+        """
+        async with self._lock(upload_id):
+            manifest = self._load(upload_id)
+            if self._retryable(manifest):
+                # 已記錄 stored_path 時不會重新搬移，只重試量測與建立資料來源
+                api_logger.info(f"分段上傳重新處理: {upload_id}（狀態 {manifest['status']}）")
+                manifest["error"] = None
+            elif manifest["status"] != "uploading":
+                return self.describe(manifest)
+            else:
+                missing = self.describe(manifest)["missing_parts"]
+                if missing:
+                    raise UploadError(f"尚有 {len(missing)} 個分段未上傳", 409)
+                if sha256:
+                    manifest["sha256"] = sha256.lower()
+            manifest["status"] = "processing"
+            self._save(manifest)
+        self._finalizers[upload_id] = asyncio.create_task(self._finalize(upload_id))
+        return self.describe(manifest)
+
+    async def _finalize(self, upload_id: str) -> None:
+        directory = self._dir(upload_id)
+        data_path = directory / _DATA
+        manifest: Optional[Dict[str, Any]] = None
+        try:
+            manifest = self._load(upload_id)
+            target = Path(manifest["stored_path"]) if manifest.get("stored_path") else None
+            if target is None:
+                if manifest.get("sha256"):
+                    actual = await asyncio.to_thread(_file_sha256, data_path)
+                    if actual != manifest["sha256"]:
+                        raise UploadError("整檔 SHA-256 不符")
+
+                target = video_target_path(manifest["filename"])
+                try:
+                    await asyncio.to_thread(shutil.move, str(data_path), str(target))
+                except Exception:
+                    # 搬移失敗：暫存檔仍在上傳目錄，只移除寫了一半的目標檔
+                    if data_path.exists():
+                        target.unlink(missing_ok=True)
+                    raise
+                # 之後量測或建立資料來源失敗時保留檔案，重新 complete 即可重試
+                manifest["stored_path"] = str(target)
+                self._save(manifest)
+
+            video_info = await asyncio.to_thread(probe_video, str(target))
+            if video_info is None:
+                raise UploadError("無效的影片檔案")
+
+            source = await register_video_source(target, manifest["filename"], video_info)
+            manifest["status"] = "completed"
+            manifest["error"] = None
+            manifest["result"] = {
+                "source_id": source.id,
+                "file_path": str(target),
+                "original_name": manifest["filename"],
+                "size": manifest["size"],
+                "video_info": {
+                    "duration": video_info["duration"],
+                    "fps": video_info["fps"],
+                    "resolution": f"{video_info['width']}x{video_info['height']}",
+                    "frame_count": video_info["frame_count"],
+                },
+            }
+            api_logger.info(f"分段上傳完成: {upload_id} → {target}")
+        except Exception as exc:  # noqa: BLE001
+            api_logger.error(f"分段上傳處理失敗 {upload_id}: {exc}")
+            # 上傳已取消（目錄被刪除）時不再寫回狀態
+            if manifest is None or not (directory / _MANIFEST).exists():
+                return
+            manifest["status"] = "failed"
+            manifest["error"] = str(exc)
+        finally:
+            self._finalizers.pop(upload_id, None)
+        self._save(manifest)
+
+    def status(self, upload_id: str) -> Dict[str, Any]:
+        return self.describe(self._load(upload_id))
+
+    async def abort(self, upload_id: str) -> None:
+        directory = self._dir(upload_id)
+        if not directory.exists():
+            raise UploadError("上傳不存在或已過期", 404)
+        task = self._finalizers.pop(upload_id, None)
+        if task is not None:
+            task.cancel()
+        await asyncio.to_thread(self._discard, directory)
+        self._locks.pop(upload_id, None)
+
+    @staticmethod
+    def _discard(directory: Path) -> None:
+        """刪除上傳目錄；已搬到影片目錄但未建立資料來源的檔案一併刪除"""
+        try:
+            manifest = json.loads((directory / _MANIFEST).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            manifest = {}
+        if manifest.get("stored_path") and manifest.get("status") != "completed":
+            Path(manifest["stored_path"]).unlink(missing_ok=True)
+        shutil.rmtree(directory, ignore_errors=True)
+
+    def purge_expired(self) -> List[str]:
+        """清除超過保留時間未更新的上傳（含已完成的狀態紀錄）"""
+        if not self.temp_dir.exists():
+            return []
+        cutoff = datetime.now().timestamp() - self.session_ttl.total_seconds()
+        removed = []
+        for directory in self.temp_dir.iterdir():
+            manifest = directory / _MANIFEST
+            if not directory.is_dir() or directory.name in self._finalizers:
+                continue
+            updated = manifest.stat().st_mtime if manifest.exists() else directory.stat().st_mtime
+            if updated < cutoff:
+                self._discard(directory)
+                self._locks.pop(directory.name, None)
+                removed.append(directory.name)
+        return removed
+
+
+def get_upload_service() -> UploadService:
+    """獲取分段上傳服務實例"""
+    return UploadService()
+
+
+__all__ = [
+    "ALLOWED_VIDEO_EXTENSIONS",
+    "UploadError",
+    "UploadService",
+    "get_upload_service",
+    "register_video_source",
+    "video_target_path",
+]
@@ -5,18 +5,16 @@
 
 import cv2
 import numpy as np
-import pandas as pd
-from datetime import datetime, timedelta
+import csv
+from datetime import datetime
 from pathlib import Path
 from typing import Dict, List, Tuple, Optional, Any
 from collections import defaultdict, deque
 from dataclasses import dataclass, asdict
-import threading
-import queue
 import json
-import uuid
-from ultralytics import YOLO
+import supervision as sv
 from app.core.paths import resolve_model_path
+from app.services.inference_backends import InferenceBackend, open_backend
 
 from app.core.logger import main_logger as logger
 from app.utils.coordinate_system import get_coordinate_converter
@@ -388,10 +386,14 @@ class BehaviorAnalyzer:
 class VideoAnalysisService:
     """主要的影片分析服務（支援動態模型載入）"""
     
-    def __init__(self, model_path: str | None = None):
-        # 延遲載入：首次使用或切換時才載入模型
-        self.model: YOLO | None = None
+    def __init__(self, model_path: str | None = None, device: str | None = None):
+        # 延遲載入：首次使用或切換時才載入模型（權重由模型註冊表共用）
+        self.model: Any = None
         self.model_path: str | None = None
+        self.device = device
+        self._backend: InferenceBackend | None = None
+        # 追蹤狀態保存在服務本身，模型只做 predict，才能與其他服務共用權重
+        self.tracker = sv.ByteTrack()
         if model_path:
             self.set_model(model_path)
         
@@ -417,8 +419,18 @@ class VideoAnalysisService:
                 logger.debug(f"沿用已載入影片分析模型: {resolved}")
                 return
             logger.info(f"載入影片分析模型: {model_path} (resolved={resolved})")
-            self.model = YOLO(resolved)
+            backend = open_backend(resolved, self.device)
+            try:
+                backend.ensure_loaded()
+            except Exception:
+                backend.release()
+                raise
+            if self._backend is not None:
+                self._backend.release()
+            self._backend = backend
+            self.model = backend.lease.model
             self.model_path = resolved
+            self.tracker = sv.ByteTrack()
         except Exception as e:
             logger.error(f"載入影片分析模型失敗: {model_path} (resolved={resolved}) -> {e}")
             raise
@@ -540,25 +552,29 @@ class VideoAnalysisService:
     def _process_frame(self, frame, frame_number: int, source: str):
         """處理單一幀"""
         try:
-            # YOLO 檢測
-            results = self.model.track(frame, persist=True, verbose=False)
+            # YOLO 檢測（共用模型推論，追蹤由本服務的 ByteTrack 處理）
+            result = self._backend.predict([frame], 0.25, 0.7, 300)[0]
+            names = self._backend.names
             
-            if not results or len(results) == 0:
-                return
-                
             # 解析檢測結果
             detections = []
-            for result in results:
-                if result.boxes is not None:
-                    boxes = result.boxes
-                    for i in range(len(boxes)):
-                        detection = {
-                            'bbox': boxes.xyxy[i].cpu().numpy().tolist(),
-                            'confidence': float(boxes.conf[i].cpu().numpy()),
-                            'class': self.model.names[int(boxes.cls[i].cpu().numpy())],
-                            'track_id': int(boxes.id[i].cpu().numpy()) if boxes.id is not None else None
-                        }
-                        detections.append(detection)
+            tracked = self.tracker.update_with_detections(
+                sv.Detections(
+                    xyxy=result.xyxy,
+                    confidence=result.confidence,
+                    class_id=result.class_id.astype(int),
+                )
+            )
+            for i in range(len(tracked)):
+                tracker_id = tracked.tracker_id[i] if tracked.tracker_id is not None else None
+                class_id = int(tracked.class_id[i])
+                detection = {
+                    'bbox': tracked.xyxy[i].tolist(),
+                    'confidence': float(tracked.confidence[i]),
+                    'class': names.get(class_id, f"class_{class_id}"),
+                    'track_id': int(tracker_id) if tracker_id is not None else None
+                }
+                detections.append(detection)
                         
             # 更新追蹤
             detection_records = self.object_tracker.update_tracks(detections, frame_number, source)
@@ -611,17 +627,27 @@ class VideoAnalysisService:
         
         # 儲存檢測記錄
         if self.detection_records:
-            detection_df = pd.DataFrame([asdict(record) for record in self.detection_records])
             detection_file = output_dir / f"detections_{timestamp}.csv"
-            detection_df.to_csv(detection_file, index=False, encoding='utf-8-sig')
+            self._write_records_csv(detection_file, self.detection_records)
             logger.info(f"檢測記錄已儲存至: {detection_file}")
             
         # 儲存行為事件
         if self.behavior_events:
-            behavior_df = pd.DataFrame([asdict(event) for event in self.behavior_events])
             behavior_file = output_dir / f"behaviors_{timestamp}.csv"
-            behavior_df.to_csv(behavior_file, index=False, encoding='utf-8-sig')
+            self._write_records_csv(behavior_file, self.behavior_events)
             logger.info(f"行為事件已儲存至: {behavior_file}")
+
+    @staticmethod
+    def _write_records_csv(path: Path, records) -> None:
+        """逐筆寫入 CSV（不先建立整份 DataFrame 複本）"""
+        with open(path, "w", newline="", encoding="utf-8-sig") as handle:
+            writer = None
+            for record in records:
+                row = asdict(record)
+                if writer is None:
+                    writer = csv.DictWriter(handle, fieldnames=list(row))
+                    writer.writeheader()
+                writer.writerow(row)
             
     def stop_processing(self):
         """停止處理"""
@@ -20,6 +20,7 @@ except ImportError:
 try:
     from ultralytics import YOLO
     from app.core.paths import resolve_model_path
+    from app.services.model_registry import get_model_registry
 except ImportError:
     logger.error("YOLO import failed")
     YOLO = None
@@ -51,7 +52,8 @@ class VideoAnnotationService:
                     logger.warning(f"Model file not found: {model_path}, will download automatically")
             
             logger.info(f"Loading YOLO model: {model_path}")
-            self.model = YOLO(model_path)
+            self._model_lease = get_model_registry().acquire(model_path, task="detect")
+            self.model = self._model_lease.ensure_loaded()
             logger.info(f"YOLO model loaded successfully: {model_path}")
             
         except Exception as e:
@@ -129,7 +131,8 @@ class VideoAnnotationService:
                 
                 try:
                     # 進行物件檢測 (不使用tracking避免lap問題)
-                    results = self.model(frame, verbose=False)
+                    with self._model_lease.inference() as model:
+                        results = model(frame, verbose=False)
                     
                     # 標註影片幀
                     annotated_frame = self._annotate_frame(frame, results, frame_count)
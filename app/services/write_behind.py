@@ -0,0 +1,468 @@
+"""
+延後寫入（write-behind）批次寫入器
+
+推論執行緒只把資料列放進記憶體緩衝區，不做任何資料庫 I/O；
+背景寫入執行緒依列數或時間門檻整批送出：
+- 明細資料表以 PostgreSQL COPY FROM STDIN（psycopg2 copy_expert）寫入
+- 統計資料表每批只做一次彙總後的 upsert（INSERT ... ON CONFLICT DO UPDATE）
+資料庫無法寫入時，該批 COPY 內容寫入磁碟日誌（spill journal），
+之後每次成功連線先依序重放日誌，不遺失資料也不阻塞推論。
+只有連線類錯誤（OperationalError / InterfaceError）視為暫時性；
+違反約束等永久性錯誤的日誌檔改名為 .bad 隔離，不會卡住後續重放。
+寫入時間早於彙總容許窗口的資料列（重放或延遲送出），在同一交易內登記給彙總器重算。
+"""
+
+from __future__ import annotations
+
+import io
+import json
+import os
+import threading
+import time
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import DBAPIError
+
+from app.core.config import settings
+from app.core.logger import detection_logger
+from app.core.paths import get_base_dir
+from app.services.rollup_service import late_cutoff, record_late_rows
+
+JOURNAL_SUFFIX = ".copy"
+POISONED_SUFFIX = ".bad"
+_TRANSIENT_ERROR_NAMES = ("OperationalError", "InterfaceError")
+# 明細表的時間欄位（分析彙總依此分桶）
+TIME_COLUMNS = ("frame_timestamp", "event_timestamp")
+
+
+def _time_column(columns: Sequence[str]) -> Optional[str]:
+    return next((column for column in TIME_COLUMNS if column in columns), None)
+
+
+def _earliest_in_payload(columns: Sequence[str], payload: str) -> Optional[datetime]:
+    """COPY text 內容中時間欄位的最小值（日誌重放時使用）"""
+    column = _time_column(columns)
+    if column is None:
+        return None
+    index = list(columns).index(column)
+    earliest: Optional[datetime] = None
+    for line in payload.splitlines():
+        fields = line.split("\t")
+        if index >= len(fields) or fields[index] == r"\N":
+            continue
+        try:
+            value = datetime.fromisoformat(fields[index])
+        except ValueError:
+            continue
+        if earliest is None or value < earliest:
+            earliest = value
+    return earliest
+
+
+def is_transient_error(exc: BaseException) -> bool:
+    """
+    判斷寫入錯誤是否值得稍後重試
+
+    SQLAlchemy 包裝的錯誤與 copy_expert 直接拋出的 DBAPI 錯誤（psycopg2）
+    都依 PEP 249 的 OperationalError / InterfaceError 判斷；網路層 OSError 亦視為暫時性。
+    """
+    if isinstance(exc, DBAPIError):
+        if exc.connection_invalidated:
+            return True
+        exc = exc.orig if exc.orig is not None else exc
+    if isinstance(exc, OSError):
+        return True
+    return any(cls.__name__ in _TRANSIENT_ERROR_NAMES for cls in type(exc).__mro__)
+
+
+def _copy_value(value: Any) -> str:
+    """轉成 COPY text 格式的欄位值（NULL 為 \\N，跳脫反斜線、Tab 與換行）"""
+    if value is None:
+        return r"\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (datetime, date)):
+        text = value.isoformat()
+    elif isinstance(value, (dict, list, tuple)):
+        text = json.dumps(value, ensure_ascii=False, default=str)
+    else:
+        text = str(value)
+    return (
+        text.replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def format_copy_rows(columns: Sequence[str], rows: Iterable[Mapping[str, Any]]) -> str:
+    """將資料列轉成 COPY FROM STDIN 的 text 格式內容"""
+    lines = ["\t".join(_copy_value(row.get(column)) for column in columns) for row in rows]
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+def copy_into(connection: Any, table: str, columns: Sequence[str], payload: str) -> None:
+    """在 SQLAlchemy Connection 的交易內以 COPY FROM STDIN 寫入"""
+    raw = connection.connection.driver_connection
+    with raw.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {table} ({', '.join(columns)}) FROM STDIN",
+            io.StringIO(payload),
+        )
+
+
+class CopyTable:
+    """以 COPY 寫入的資料表：欄位順序與 Python 端預設值（COPY 不經過 ORM）"""
+
+    def __init__(self, model: Any):
+        table = model.__table__
+        self.model = model
+        self.name = table.name
+        autoincrement = table.autoincrement_column
+        self.columns = [column.name for column in table.columns if column is not autoincrement]
+        self.time_column = _time_column(self.columns)
+        self._defaults: Dict[str, Callable[[], Any]] = {}
+        for column in table.columns:
+            default = column.default
+            if default is None or column is autoincrement:
+                continue
+            if default.is_scalar:
+                self._defaults[column.name] = lambda value=default.arg: value
+            elif default.is_callable:
+                self._defaults[column.name] = lambda fn=default.arg: fn(None)
+
+    def earliest(self, rows: Sequence[Mapping[str, Any]]) -> Optional[datetime]:
+        if self.time_column is None:
+            return None
+        values = [row.get(self.time_column) for row in rows]
+        values = [value for value in values if isinstance(value, datetime)]
+        return min(values) if values else None
+
+    def format(self, rows: Sequence[Mapping[str, Any]]) -> str:
+        if self._defaults:
+            rows = [self._with_defaults(row) for row in rows]
+        return format_copy_rows(self.columns, rows)
+
+    def _with_defaults(self, row: Mapping[str, Any]) -> Mapping[str, Any]:
+        missing = [name for name in self._defaults if row.get(name) is None]
+        if not missing:
+            return row
+        filled = dict(row)
+        for name in missing:
+            filled[name] = self._defaults[name]()
+        return filled
+
+
+class WriteBehindWriter:
+    """背景批次寫入器（COPY + 彙總 upsert + 磁碟日誌）"""
+
+    def __init__(
+        self,
+        name: str,
+        engine: Any = None,
+        batch_rows: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+        journal_dir: Optional[os.PathLike] = None,
+    ):
+        self.name = name
+        self._engine = engine
+        self.batch_rows = max(1, batch_rows or settings.write_behind_batch_rows)
+        self.flush_interval = max(0.05, flush_interval or settings.write_behind_flush_interval)
+        self.retry_interval = max(0.5, settings.write_behind_retry_interval)
+        base_dir = journal_dir or settings.write_behind_journal_dir or (get_base_dir() / "data" / "write_behind")
+        self.journal_dir = Path(base_dir) / name
+
+        self._tables: Dict[str, CopyTable] = {}
+        self._buffers: Dict[str, List[Mapping[str, Any]]] = {}
+        self._upserts: Dict[Tuple[str, Tuple[Any, ...]], Tuple[Any, Dict[str, Any]]] = {}
+        self._buffered_rows = 0
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self._retry_at = 0.0
+        self._journal_seq = 0
+
+        self.flushed_rows = 0
+        self.flush_count = 0
+        self.spilled_batches = 0
+        self.replayed_batches = 0
+        self.poisoned_batches = 0
+        self.dropped_upserts = 0
+        self.failures = 0
+        self.last_flush_ms = 0.0
+        self.last_error: Optional[str] = None
+
+    @property
+    def engine(self) -> Any:
+        if self._engine is None:
+            from app.core.database import sync_engine
+
+            self._engine = sync_engine
+        return self._engine
+
+    # ===== 熱路徑（只操作記憶體） =====
+
+    def add_rows(self, model: Any, rows: Sequence[Mapping[str, Any]]) -> None:
+        """加入待寫入的資料列（欄位名稱與 ORM 欄位相同）"""
+        if not rows:
+            return
+        table = self._table(model)
+        with self._cond:
+            self._buffers.setdefault(table.name, []).extend(rows)
+            self._buffered_rows += len(rows)
+            if self._buffered_rows >= self.batch_rows:
+                self._cond.notify_all()
+        self._ensure_started()
+
+    def upsert(self, model: Any, values: Mapping[str, Any]) -> None:
+        """登記一筆 upsert；同一主鍵在一批之內只保留最後一次的值"""
+        table = model.__table__
+        key = (table.name, tuple(values[column.name] for column in table.primary_key.columns))
+        with self._cond:
+            self._upserts[key] = (model, dict(values))
+        self._ensure_started()
+
+    # ===== 背景執行緒 =====
+
+    def _table(self, model: Any) -> CopyTable:
+        name = model.__table__.name
+        table = self._tables.get(name)
+        if table is None:
+            table = self._tables.setdefault(name, CopyTable(model))
+        return table
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._cond:
+            if self._thread is not None or self._stopping:
+                return
+            self._thread = threading.Thread(
+                target=self._run, name=f"write-behind-{self.name}", daemon=True
+            )
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._stopping or self._buffered_rows >= self.batch_rows,
+                    timeout=self.flush_interval,
+                )
+                stopping = self._stopping
+            try:
+                self.flush()
+            except Exception as exc:  # noqa: BLE001
+                detection_logger.error(f"[write-behind:{self.name}] 批次寫入失敗: {exc}")
+            if stopping:
+                break
+
+    def flush(self) -> bool:
+        """立即送出緩衝區；資料庫不可用時寫入日誌並回傳 False"""
+        with self._flush_lock:
+            with self._cond:
+                buffers, self._buffers = self._buffers, {}
+                upserts, self._upserts = self._upserts, {}
+                self._buffered_rows = 0
+
+            payloads = [
+                (self._tables[name], self._tables[name].format(rows))
+                for name, rows in buffers.items()
+                if rows
+            ]
+            if not payloads and not upserts and not self._journal_files():
+                return True
+
+            if time.monotonic() < self._retry_at or not self._replay_journal():
+                self._spill(payloads)
+                self._restore_upserts(upserts)
+                return False
+
+            earliest = min(
+                (
+                    value
+                    for value in (self._tables[name].earliest(rows) for name, rows in buffers.items())
+                    if value is not None
+                ),
+                default=None,
+            )
+            start = time.perf_counter()
+            try:
+                with self.engine.begin() as connection:
+                    for table, payload in payloads:
+                        copy_into(connection, table.name, table.columns, payload)
+                    self._record_late_rows(connection, earliest)
+                    for model, values in upserts.values():
+                        connection.execute(self._upsert_statement(model, values))
+            except Exception as exc:  # noqa: BLE001
+                self._spill(payloads)
+                if is_transient_error(exc):
+                    self._mark_failure(exc)
+                    self._restore_upserts(upserts)
+                    return False
+                # 永久性錯誤：明細已寫入日誌，下次重放會逐檔隔離出錯的那一批；
+                # upsert 逐筆重送，丟棄無法寫入的項目
+                self._record_error(exc)
+                self._apply_upserts_individually(upserts)
+                return False
+
+            self.last_flush_ms = (time.perf_counter() - start) * 1000
+            self.flush_count += 1
+            self.flushed_rows += sum(len(rows) for rows in buffers.values())
+            return True
+
+    @staticmethod
+    def _upsert_statement(model: Any, values: Dict[str, Any]) -> Any:
+        table = model.__table__
+        keys = [column.name for column in table.primary_key.columns]
+        statement = pg_insert(table).values(**values)
+        return statement.on_conflict_do_update(
+            index_elements=keys,
+            set_={name: statement.excluded[name] for name in values if name not in keys},
+        )
+
+    def _restore_upserts(self, upserts: Dict[Tuple[str, Tuple[Any, ...]], Tuple[Any, Dict[str, Any]]]) -> None:
+        # 統計值只需最新一筆：失敗的 upsert 留到下一批，期間若有更新的值則以新值為準
+        with self._cond:
+            for key, item in upserts.items():
+                self._upserts.setdefault(key, item)
+
+    @staticmethod
+    def _record_late_rows(connection: Any, earliest: Optional[datetime]) -> None:
+        # 資料列早於彙總容許窗口時，已彙總的分鐘 / 小時需要重算
+        if earliest is not None and earliest < late_cutoff():
+            record_late_rows(connection, earliest)
+
+    def _apply_upserts_individually(self, upserts: Dict[Tuple[str, Tuple[Any, ...]], Tuple[Any, Dict[str, Any]]]) -> None:
+        remaining = dict(upserts)
+        for key, (model, values) in upserts.items():
+            try:
+                with self.engine.begin() as connection:
+                    connection.execute(self._upsert_statement(model, values))
+            except Exception as exc:  # noqa: BLE001
+                if is_transient_error(exc):
+                    self._mark_failure(exc)
+                    self._restore_upserts(remaining)
+                    return
+                self.dropped_upserts += 1
+                detection_logger.error(
+                    f"[write-behind:{self.name}] 丟棄無法寫入的 upsert {key}: {exc}"
+                )
+            remaining.pop(key, None)
+
+    def _record_error(self, exc: Exception) -> None:
+        self.failures += 1
+        self.last_error = str(exc)
+        detection_logger.error(f"[write-behind:{self.name}] 資料庫寫入失敗（永久性錯誤）: {exc}")
+
+    def _mark_failure(self, exc: Exception) -> None:
+        self.failures += 1
+        self.last_error = str(exc)
+        self._retry_at = time.monotonic() + self.retry_interval
+        detection_logger.error(
+            f"[write-behind:{self.name}] 資料庫寫入失敗，{self.retry_interval:.0f}s 內改寫入磁碟日誌: {exc}"
+        )
+
+    # ===== 磁碟日誌 =====
+
+    def _journal_files(self) -> List[Path]:
+        if not self.journal_dir.exists():
+            return []
+        return sorted(self.journal_dir.glob(f"*{JOURNAL_SUFFIX}"))
+
+    def _spill(self, payloads: Sequence[Tuple[CopyTable, str]]) -> None:
+        if not payloads:
+            return
+        self.journal_dir.mkdir(parents=True, exist_ok=True)
+        for table, payload in payloads:
+            self._journal_seq += 1
+            path = self.journal_dir / f"{time.time_ns():020d}-{self._journal_seq:06d}-{table.name}{JOURNAL_SUFFIX}"
+            tmp_path = path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8", newline="\n") as handle:
+                handle.write("\t".join([table.name, *table.columns]) + "\n")
+                handle.write(payload)
+            os.replace(tmp_path, path)
+            self.spilled_batches += 1
+
+    def _replay_journal(self) -> bool:
+        """
+        依序重放日誌；遇到暫時性錯誤即停止並回傳 False
+
+        永久性錯誤的檔案改名為 .bad 後繼續重放其餘日誌。
+        """
+        for path in self._journal_files():
+            try:
+                with open(path, "r", encoding="utf-8", newline="\n") as handle:
+                    header = handle.readline().rstrip("\n").split("\t")
+                    payload = handle.read()
+                table, columns = header[0], header[1:]
+                with self.engine.begin() as connection:
+                    copy_into(connection, table, columns, payload)
+                    self._record_late_rows(connection, _earliest_in_payload(columns, payload))
+            except Exception as exc:  # noqa: BLE001
+                if is_transient_error(exc):
+                    self._mark_failure(exc)
+                    return False
+                self._quarantine(path, exc)
+                continue
+            path.unlink(missing_ok=True)
+            self.replayed_batches += 1
+            detection_logger.info(f"[write-behind:{self.name}] 已重放日誌 {path.name}")
+        return True
+
+    def _quarantine(self, path: Path, exc: Exception) -> None:
+        bad_path = path.with_suffix(POISONED_SUFFIX)
+        os.replace(path, bad_path)
+        self.poisoned_batches += 1
+        self.failures += 1
+        self.last_error = str(exc)
+        detection_logger.error(
+            f"[write-behind:{self.name}] 日誌 {path.name} 無法寫入（永久性錯誤），已隔離為 {bad_path.name}: {exc}"
+        )
+
+    # ===== 生命週期 =====
+
+    def close(self, timeout: float = 5.0) -> None:
+        """停止背景執行緒並送出剩餘資料（失敗時寫入日誌）"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout=timeout)
+        else:
+            self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            buffered = self._buffered_rows
+            pending_upserts = len(self._upserts)
+        return {
+            "name": self.name,
+            "buffered_rows": buffered,
+            "pending_upserts": pending_upserts,
+            "flushed_rows": self.flushed_rows,
+            "flush_count": self.flush_count,
+            "last_flush_ms": self.last_flush_ms,
+            "failures": self.failures,
+            "spilled_batches": self.spilled_batches,
+            "replayed_batches": self.replayed_batches,
+            "poisoned_batches": self.poisoned_batches,
+            "dropped_upserts": self.dropped_upserts,
+            "journal_files": len(self._journal_files()),
+            "db_available": time.monotonic() >= self._retry_at,
+            "last_error": self.last_error,
+        }
+
+
+__all__ = [
+    "CopyTable",
+    "WriteBehindWriter",
+    "copy_into",
+    "format_copy_rows",
+    "is_transient_error",
+]
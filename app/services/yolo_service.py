@@ -4,16 +4,17 @@ YOLOv11 數位雙生分析系統 - YOLOv11 服務層
 """
 
 import asyncio
-import gc
+import queue
 import time
 import threading
-from typing import Optional, List, Dict, Any, Union
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Optional, List, Dict, Any, Union, Tuple
 from pathlib import Path
 from contextlib import contextmanager
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, Future, TimeoutError as FutureTimeoutError
 import uuid
 
-import torch
 import numpy as np
 from ultralytics import YOLO
 from PIL import Image
@@ -21,19 +22,250 @@ import cv2
 
 from app.core.config import settings, YOLO_CLASSES
 from app.core.paths import resolve_model_path
-from app.core.logger import detection_logger, performance_logger, log_performance
+from app.core.logger import detection_logger, performance_logger
+from app.core.metrics import instrument, timed
 from app.utils.exceptions import ModelNotLoadedException, InferenceException
+from app.services.model_registry import ModelLease, get_model_registry
+from app.services.inference_backends import InferenceBackend, RawDetections, open_backend
+from app.services.detection_result import DetectionResult
+from app.services.memory_housekeeping import get_memory_housekeeper
 
 
-@contextmanager
-def gpu_memory_manager():
-    """GPU 記憶體管理上下文管理器"""
-    try:
-        yield
-    finally:
-        if torch.cuda.is_available():
-            torch.cuda.empty_cache()
-        gc.collect()
+@dataclass
+class _BatchRequest:
+    """排入批次佇列的單一推論請求"""
+    frame: np.ndarray
+    conf_threshold: float
+    iou_threshold: float
+    max_detections: int
+    future: Future
+    enqueued_at: float = field(default_factory=time.perf_counter)
+    expires_at: Optional[float] = None
+
+    def claim(self) -> bool:
+        """標記為執行中；已取消或已逾時的請求回傳 False，不應再送進模型"""
+        if self.expires_at is not None and time.perf_counter() >= self.expires_at:
+            if self.future.set_running_or_notify_cancel():
+                self.future.set_exception(InferenceException("批次推論請求已逾時"))
+            return False
+        return self.future.set_running_or_notify_cancel()
+
+
+class BatchInferenceScheduler:
+    """
+    批次推論排程器
+
+    收集多個 StreamConsumer 在短時間窗口內送來的影格，
+    以一次 model.predict 完成多攝影機推論，再把結果送回各自的 Future。
+    窗口由 max_batch_size（最多幾張）與 max_wait_ms（第一張進來後最多等多久）控制。
+    """
+
+    def __init__(self, service: 'YOLOService', max_batch_size: int, max_wait_ms: float,
+                 history_size: int = 512):
+        self._service = service
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue: "queue.Queue[Optional[_BatchRequest]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._running = threading.Event()
+        self._start_lock = threading.Lock()
+
+        # 統計資訊
+        self._stats_lock = threading.Lock()
+        self._batch_count = 0
+        self._frame_count = 0
+        self._failed_batches = 0
+        self._dropped_requests = 0
+        self._occupancy_history: deque = deque(maxlen=history_size)
+        self._queue_wait_history: deque = deque(maxlen=history_size)
+        self._inference_history: deque = deque(maxlen=history_size)
+
+    @property
+    def is_running(self) -> bool:
+        return self._running.is_set()
+
+    def start(self) -> None:
+        """啟動排程執行緒（重複呼叫無副作用）"""
+        with self._start_lock:
+            if self._running.is_set():
+                return
+            self._running.set()
+            self._thread = threading.Thread(
+                target=self._run_loop, name="YOLOBatchScheduler", daemon=True
+            )
+            self._thread.start()
+            detection_logger.info(
+                f"批次推論排程器啟動: max_batch_size={self.max_batch_size}, "
+                f"max_wait={self.max_wait * 1000:.1f}ms"
+            )
+
+    def stop(self, timeout: float = 2.0) -> None:
+        """停止排程並讓尚未處理的請求失敗"""
+        with self._start_lock:
+            if not self._running.is_set():
+                return
+            self._running.clear()
+            self._queue.put(None)
+            if self._thread and self._thread.is_alive():
+                self._thread.join(timeout=timeout)
+            self._thread = None
+
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is not None and not request.future.done():
+                request.future.set_exception(InferenceException("批次推論排程器已停止"))
+
+    def submit(self, frame: np.ndarray, conf_threshold: float, iou_threshold: float,
+               max_detections: int, timeout: Optional[float] = None) -> Future:
+        """
+        排入一張影格，回傳可等待結果的 Future
+
+        timeout 為呼叫端願意等待的秒數；超過後請求在組批時直接丟棄。
+        呼叫端放棄等待時應 future.cancel()，排程器同樣會略過。
+        """
+        if not self._running.is_set():
+            self.start()
+        request = _BatchRequest(
+            frame=frame,
+            conf_threshold=conf_threshold,
+            iou_threshold=iou_threshold,
+            max_detections=max_detections,
+            future=Future(),
+        )
+        if timeout is not None:
+            request.expires_at = request.enqueued_at + timeout
+        self._queue.put(request)
+        return request.future
+
+    def _collect_batch(self) -> List[_BatchRequest]:
+        """阻塞取得第一個請求後，在等待窗口內盡量湊滿批次"""
+        try:
+            first = self._queue.get(timeout=0.5)
+        except queue.Empty:
+            return []
+        if first is None:
+            return []
+
+        batch: List[_BatchRequest] = []
+        dropped = 0
+        if first.claim():
+            batch.append(first)
+        else:
+            dropped += 1
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining <= 0:
+                    request = self._queue.get_nowait()
+                else:
+                    request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                # 停止訊號：處理完手上批次即結束
+                self._running.clear()
+                break
+            if request.claim():
+                batch.append(request)
+            else:
+                # 呼叫端已取消或等待逾時，不浪費推論時間
+                dropped += 1
+        if dropped:
+            with self._stats_lock:
+                self._dropped_requests += dropped
+        return batch
+
+    def _run_loop(self) -> None:
+        while self._running.is_set():
+            batch = self._collect_batch()
+            if batch:
+                self._run_batch(batch)
+
+    def _run_batch(self, batch: List[_BatchRequest]) -> None:
+        dispatched_at = time.perf_counter()
+        waits = [dispatched_at - request.enqueued_at for request in batch]
+
+        # model.predict 的 conf/iou/max_det 為整批共用參數，依參數分組
+        groups: Dict[Tuple[float, float, int], List[_BatchRequest]] = {}
+        for request in batch:
+            key = (request.conf_threshold, request.iou_threshold, request.max_detections)
+            groups.setdefault(key, []).append(request)
+
+        failed = False
+        inference_time = 0.0
+        for (conf, iou, max_det), requests in groups.items():
+            try:
+                results, elapsed = self._service._predict_batch_sync(
+                    [request.frame for request in requests], conf, iou, max_det
+                )
+                inference_time += elapsed
+                for request, result in zip(requests, results):
+                    if not request.future.done():
+                        request.future.set_result(result)
+            except Exception as e:
+                failed = True
+                detection_logger.error(f"批次推論失敗 (batch={len(requests)}): {e}")
+                for request in requests:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+
+        with self._stats_lock:
+            self._batch_count += 1
+            self._frame_count += len(batch)
+            if failed:
+                self._failed_batches += 1
+            self._occupancy_history.append(len(batch) / self.max_batch_size)
+            self._queue_wait_history.extend(waits)
+            self._inference_history.append(inference_time)
+
+    @staticmethod
+    def _percentile(values: List[float], percentile: float) -> float:
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        index = min(len(ordered) - 1, int(round(percentile / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """回傳批次佔用率與排隊等待時間，用於調整窗口大小"""
+        with self._stats_lock:
+            occupancy = list(self._occupancy_history)
+            waits_ms = [w * 1000.0 for w in self._queue_wait_history]
+            inference_ms = [t * 1000.0 for t in self._inference_history]
+            batch_count = self._batch_count
+            frame_count = self._frame_count
+            failed = self._failed_batches
+            dropped = self._dropped_requests
+
+        return {
+            "running": self.is_running,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "pending": self._queue.qsize(),
+            "batch_count": batch_count,
+            "frame_count": frame_count,
+            "failed_batches": failed,
+            "dropped_requests": dropped,
+            "avg_batch_size": (frame_count / batch_count) if batch_count else 0.0,
+            "occupancy": {
+                "avg": (sum(occupancy) / len(occupancy)) if occupancy else 0.0,
+                "last": occupancy[-1] if occupancy else 0.0,
+            },
+            "queue_wait_ms": {
+                "avg": (sum(waits_ms) / len(waits_ms)) if waits_ms else 0.0,
+                "p50": self._percentile(waits_ms, 50),
+                "p95": self._percentile(waits_ms, 95),
+                "max": max(waits_ms) if waits_ms else 0.0,
+            },
+            "batch_inference_ms": {
+                "avg": (sum(inference_ms) / len(inference_ms)) if inference_ms else 0.0,
+                "p95": self._percentile(inference_ms, 95),
+            },
+        }
 
 
 class YOLOService:
@@ -74,8 +306,23 @@ class YOLOService:
         # 線程池執行器，用於同步推論操作
         self.executor = ThreadPoolExecutor(max_workers=settings.workers)
         
-        # 線程本地儲存，為每個線程建立獨立模型實例
-        self._local = threading.local()
+        # 透過共享註冊表取得模型，避免每個執行緒各自載入一份權重
+        self._registry = get_model_registry()
+        self._backend: Optional[InferenceBackend] = None
+        self._lease: Optional[ModelLease] = None
+        self._track_lease: Optional[ModelLease] = None
+        
+        # GC / CUDA 快取釋放交給背景整理器，推論路徑只回報影格數
+        self._housekeeper = get_memory_housekeeper()
+        
+        # 多攝影機批次推論排程器（首次提交時啟動）
+        self.batch_scheduler: Optional[BatchInferenceScheduler] = None
+        if settings.batch_inference_enabled:
+            self.batch_scheduler = BatchInferenceScheduler(
+                self,
+                max_batch_size=settings.batch_max_size,
+                max_wait_ms=settings.batch_max_wait_ms,
+            )
         
         detection_logger.info("YOLOService 初始化完成")
     
@@ -105,16 +352,21 @@ class YOLOService:
                 detection_logger.info(f"模型已載入: {model_path}")
                 return True
                 
+            backend = None
             try:
                 detection_logger.info(f"開始載入模型: {model_path}")
                 start_time = time.time()
                 
-                # 在執行器中載入模型避免阻塞
+                # 依檔案格式選擇推論後端（.onnx 走 onnxruntime），權重由共享註冊表管理，
+                # 並在執行器中載入避免阻塞
+                backend = open_backend(model_path, self._device, warmup=True)
                 loop = asyncio.get_event_loop()
-                self._model = await loop.run_in_executor(
-                    self.executor, self._load_model_sync, model_path
-                )
+                await loop.run_in_executor(self.executor, backend.ensure_loaded)
                 
+                self._release_leases()
+                self._backend = backend
+                self._lease = backend.lease
+                self._model = backend.lease.model
                 self._model_path = model_path
                 load_time = time.time() - start_time
                 
@@ -125,53 +377,43 @@ class YOLOService:
                 return True
                 
             except Exception as e:
+                if backend is not None:
+                    backend.release()
                 detection_logger.log_error(e, {"model_path": model_path})
                 return False
     
-    def _load_model_sync(self, model_path: str) -> YOLO:
-        """同步載入模型（在執行器中運行）"""
-        with gpu_memory_manager():
-            model = YOLO(model_path)
-            
-            # 設定設備
-            if self._device == "auto":
-                device = "cuda" if torch.cuda.is_available() else "cpu"
-            else:
-                device = self._device
-                
-            model.to(device)
-            
-            # 預熱模型（執行一次虛擬推論）
-            dummy_input = np.zeros((640, 640, 3), dtype=np.uint8)
-            model.predict(
-                dummy_input, 
-                verbose=False, 
-                save=False, 
-                show=False,
-                stream=False,
-                plots=False,
-                visualize=False
-            )
-            
-            return model
+    def _release_leases(self) -> None:
+        """歸還目前持有的模型租約"""
+        for attr in ("_lease", "_track_lease"):
+            lease = getattr(self, attr, None)
+            if lease is not None:
+                lease.release()
+                setattr(self, attr, None)
+        self._backend = None
     
-    def get_thread_local_model(self) -> YOLO:
-        """為每個線程取得獨立的模型實例"""
-        if not hasattr(self._local, 'model') or self._local.model is None:
-            if self._model_path is None:
-                raise ModelNotLoadedException("主模型尚未載入")
-                
-            with gpu_memory_manager():
-                self._local.model = YOLO(self._model_path)
-                if self._device == "auto":
-                    device = "cuda" if torch.cuda.is_available() else "cpu"
-                else:
-                    device = self._device
-                self._local.model.to(device)
-                
-        return self._local.model
+    @property
+    def backend_name(self) -> Optional[str]:
+        """目前使用的推論後端名稱"""
+        return self._backend.name if self._backend is not None else None
+    
+    def _get_backend(self) -> InferenceBackend:
+        if self._backend is None or self._model_path is None:
+            raise ModelNotLoadedException("主模型尚未載入")
+        return self._backend
+    
+    @contextmanager
+    def _tracking_model(self):
+        """借出追蹤用的 ultralytics 模型（追蹤會在 predictor 保存狀態，使用獨立的 track 實例）"""
+        if self._lease is None or self._model_path is None:
+            raise ModelNotLoadedException("主模型尚未載入")
+        if self._track_lease is None or self._track_lease.path != self._lease.path:
+            if self._track_lease is not None:
+                self._track_lease.release()
+            self._track_lease = self._registry.acquire(self._model_path, self._device, task="track")
+        with self._track_lease.inference() as model:
+            yield model
     
-    @log_performance("yolo_predict")
+    @instrument("inference", "yolo_predict", log=True)
     async def predict(self, 
                      image_data: Union[bytes, np.ndarray, str], 
                      conf_threshold: float = None,
@@ -200,7 +442,7 @@ class YOLOService:
         try:
             # 在執行器中執行推論
             loop = asyncio.get_event_loop()
-            results = await loop.run_in_executor(
+            result = await loop.run_in_executor(
                 self.executor, 
                 self._predict_sync, 
                 image_data, 
@@ -208,6 +450,8 @@ class YOLOService:
                 iou_threshold,
                 max_detections
             )
+            # API 回應需要 JSON，此時才建立逐框 dict
+            results = result.to_response()
             
             # 生成唯一圖片 ID
             image_id = str(uuid.uuid4())
@@ -244,6 +488,14 @@ class YOLOService:
         Returns:
             List[Dict]: 檢測結果列表
         """
+        return self.detect_frame(frame, conf_threshold, iou_threshold).to_dicts()
+    
+    def detect_frame(self, frame: np.ndarray, conf_threshold: float = None, iou_threshold: float = None) -> DetectionResult:
+        """
+        同步預測單一幀，回傳欄位式結果（不建立逐框 dict）
+        
+        失敗時回傳空結果，與 predict_frame 回傳空列表的行為一致。
+        """
         try:
             if self._model is None:
                 raise ModelNotLoadedException("模型尚未載入")
@@ -252,120 +504,142 @@ class YOLOService:
             conf = conf_threshold if conf_threshold is not None else 0.5
             iou = iou_threshold if iou_threshold is not None else 0.45
             
+            if self.batch_scheduler is not None:
+                # 交由排程器與其他攝影機的影格合併成一次推論
+                timeout = settings.batch_result_timeout
+                future = self.batch_scheduler.submit(frame, conf, iou, 100, timeout=timeout)
+                try:
+                    return future.result(timeout=timeout)
+                except FutureTimeoutError:
+                    # 放棄等待後撤回請求，避免排程器在過載時仍替它推論
+                    future.cancel()
+                    raise
+            
             # 調用同步預測
-            results = self._predict_sync(
+            return self._predict_sync(
                 image_data=frame,
                 conf_threshold=conf,
                 iou_threshold=iou,
                 max_detections=100  # 預設最大檢測數量
             )
             
-            # 返回檢測結果
-            return results.get("detections", [])
-            
         except Exception as e:
             print(f"❌ 幀預測失敗: {e}")
-            return []
+            return DetectionResult.empty(image_shape=getattr(frame, "shape", ()))
+    
+    def submit_frame(self,
+                     frame: np.ndarray,
+                     conf_threshold: float,
+                     iou_threshold: float,
+                     max_detections: int = 100) -> Future:
+        """
+        將影格送入批次排程器，回傳 Future（結果為 DetectionResult）
+        
+        未啟用批次推論時直接在呼叫端執行並回傳已完成的 Future。
+        """
+        if self._model is None:
+            raise ModelNotLoadedException("模型尚未載入")
+        if self.batch_scheduler is None:
+            future: Future = Future()
+            try:
+                future.set_result(
+                    self._predict_sync(frame, conf_threshold, iou_threshold, max_detections)
+                )
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        return self.batch_scheduler.submit(frame, conf_threshold, iou_threshold, max_detections)
+    
+    def get_batch_stats(self) -> Dict[str, Any]:
+        """取得批次推論排程器統計"""
+        if self.batch_scheduler is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.batch_scheduler.get_stats()}
+    
+    def _predict_batch_sync(self,
+                            frames: List[np.ndarray],
+                            conf_threshold: float,
+                            iou_threshold: float,
+                            max_detections: int) -> Tuple[List[DetectionResult], float]:
+        """以單次 forward 推論多張影格（由排程執行緒呼叫）"""
+        start_time = time.time()
+        
+        backend = self._get_backend()
+        with timed("inference", "backend_predict_batch", backend=backend.name):
+            results = backend.predict(
+                frames, conf_threshold, iou_threshold, max_detections
+            )
+        self._housekeeper.record_frames(len(frames))
+        
+        inference_time = time.time() - start_time
+        with timed("postprocess", "format_results"):
+            formatted = [
+                self._format_results(result, inference_time, frame.shape)
+                for frame, result in zip(frames, results)
+            ]
+        return formatted, inference_time
     
     def _predict_sync(self, 
                      image_data: Union[bytes, np.ndarray, str],
                      conf_threshold: float,
                      iou_threshold: float,
-                     max_detections: int) -> Dict[str, Any]:
+                     max_detections: int) -> DetectionResult:
         """同步推論（在執行器中運行）"""
         start_time = time.time()
         
-        # 開始推論
-        with gpu_memory_manager():
-            model = self.get_thread_local_model()
-            
-            # 處理輸入圖片
-            if isinstance(image_data, bytes):
-                # 從 bytes 載入圖片
-                nparr = np.frombuffer(image_data, np.uint8)
-                image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            elif isinstance(image_data, np.ndarray):
-                image = image_data
-            elif isinstance(image_data, str):
-                # 從檔案路徑載入
-                image = cv2.imread(image_data)
-            else:
-                raise ValueError("不支援的圖片格式")
-            
-            if image is None:
-                raise ValueError("無法載入圖片")
-            
-            # 執行推論
-            results = model.predict(
-                image,
-                conf=conf_threshold,
-                iou=iou_threshold,
-                verbose=False,
-                save=False,
-                show=False,
-                stream=False,
-                plots=False,
-                visualize=False,
-                max_det=max_detections
-            )
-            
-            inference_time = time.time() - start_time
-            
-            # 格式化結果
-            formatted_result = self._format_results(results, inference_time, image.shape)
-            return formatted_result
+        # 處理輸入圖片
+        image = self._decode_image(image_data)
+        
+        # 執行推論
+        backend = self._get_backend()
+        with timed("inference", "backend_predict", backend=backend.name):
+            result = backend.predict(
+                [image], conf_threshold, iou_threshold, max_detections
+            )[0]
+        self._housekeeper.record_frames()
+        
+        inference_time = time.time() - start_time
+        
+        # 格式化結果
+        with timed("postprocess", "format_results"):
+            formatted_result = self._format_results(result, inference_time, image.shape)
+        return formatted_result
+    
+    @staticmethod
+    @instrument("decode", "image_decode")
+    def _decode_image(image_data: Union[bytes, np.ndarray, str]) -> np.ndarray:
+        """將 bytes / 檔案路徑 / ndarray 轉為 BGR 影像"""
+        if isinstance(image_data, bytes):
+            # 從 bytes 載入圖片
+            nparr = np.frombuffer(image_data, np.uint8)
+            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        elif isinstance(image_data, np.ndarray):
+            image = image_data
+        elif isinstance(image_data, str):
+            # 從檔案路徑載入
+            image = cv2.imread(image_data)
+        else:
+            raise ValueError("不支援的圖片格式")
+        
+        if image is None:
+            raise ValueError("無法載入圖片")
+        return image
     
     def _format_results(self, 
-                       results, 
+                       result: RawDetections, 
                        inference_time: float,
-                       image_shape: tuple) -> Dict[str, Any]:
-        """格式化偵測結果"""
-        detections = []
-        
-        if results and len(results) > 0:
-            result = results[0]  # 取第一個結果
-            
-            if result.boxes is not None:
-                boxes = result.boxes.cpu().numpy()
-                
-                for i in range(len(boxes)):
-                    # 邊界框座標
-                    xyxy = boxes.xyxy[i]
-                    conf = float(boxes.conf[i])
-                    cls = int(boxes.cls[i])
-                    
-                    detection = {
-                        "class_id": cls,
-                        "class": YOLO_CLASSES.get(cls, f"class_{cls}"),  # 使用 'class' 鍵名保持一致
-                        "class_name": YOLO_CLASSES.get(cls, f"class_{cls}"),
-                        "confidence": conf,
-                        "bbox": [float(xyxy[0]), float(xyxy[1]), float(xyxy[2]), float(xyxy[3])],  # 簡化格式
-                        "bbox_detailed": {
-                            "x1": float(xyxy[0]),
-                            "y1": float(xyxy[1]),
-                            "x2": float(xyxy[2]),
-                            "y2": float(xyxy[3])
-                        },
-                        "center": {
-                            "x": float((xyxy[0] + xyxy[2]) / 2),
-                            "y": float((xyxy[1] + xyxy[3]) / 2)
-                        },
-                        "area": float((xyxy[2] - xyxy[0]) * (xyxy[3] - xyxy[1]))
-                    }
-                    
-                    detections.append(detection)
-        
-        return {
-            "detections": detections,
-            "objects": detections,  # 為向後兼容性添加
-            "inference_time": inference_time,
-            "image_shape": image_shape,
-            "image_size": list(image_shape),  # 為向後兼容性添加
-            "detection_count": len(detections),
-            "timestamp": time.time()
-        }
+                       image_shape: tuple) -> DetectionResult:
+        """將後端輸出包裝成欄位式結果（中心點/面積向量化計算，dict 延遲建立）"""
+        if result is None:
+            return DetectionResult.empty(image_shape=image_shape, inference_time=inference_time)
+        return DetectionResult.from_raw(
+            result,
+            YOLO_CLASSES,
+            image_shape=image_shape,
+            inference_time=inference_time,
+        )
     
-    @log_performance("yolo_track")
+    @instrument("tracking", "yolo_track", log=True)
     async def track(self, 
                    image_data: Union[bytes, np.ndarray, str],
                    tracker: str = None,
@@ -393,7 +667,7 @@ class YOLOService:
         try:
             # 在執行器中執行追蹤
             loop = asyncio.get_event_loop()
-            results = await loop.run_in_executor(
+            result = await loop.run_in_executor(
                 self.executor,
                 self._track_sync,
                 image_data,
@@ -401,6 +675,7 @@ class YOLOService:
                 conf_threshold,
                 iou_threshold
             )
+            results = result.to_tracking_response()
             
             # 生成唯一圖片 ID
             image_id = str(uuid.uuid4())
@@ -418,28 +693,15 @@ class YOLOService:
                    image_data: Union[bytes, np.ndarray, str],
                    tracker: str,
                    conf_threshold: float,
-                   iou_threshold: float) -> Dict[str, Any]:
+                   iou_threshold: float) -> DetectionResult:
         """同步追蹤（在執行器中運行）"""
         start_time = time.time()
         
-        with gpu_memory_manager():
-            model = self.get_thread_local_model()
-            
-            # 處理輸入圖片（同 _predict_sync）
-            if isinstance(image_data, bytes):
-                nparr = np.frombuffer(image_data, np.uint8)
-                image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            elif isinstance(image_data, np.ndarray):
-                image = image_data
-            elif isinstance(image_data, str):
-                image = cv2.imread(image_data)
-            else:
-                raise ValueError("不支援的圖片格式")
-            
-            if image is None:
-                raise ValueError("無法載入圖片")
-            
-            # 執行追蹤
+        # 處理輸入圖片（同 _predict_sync）
+        image = self._decode_image(image_data)
+        
+        # 執行追蹤
+        with self._tracking_model() as model, timed("tracking", "ultralytics_track"):
             results = model.track(
                 image,
                 conf=conf_threshold,
@@ -449,81 +711,34 @@ class YOLOService:
                 save=False,
                 show=False
             )
-            
-            inference_time = time.time() - start_time
-            
-            # 格式化追蹤結果
+        self._housekeeper.record_frames()
+        
+        inference_time = time.time() - start_time
+        
+        # 格式化追蹤結果
+        with timed("postprocess", "format_tracking_results"):
             return self._format_tracking_results(results, inference_time, image.shape)
     
     def _format_tracking_results(self, 
                                results, 
                                inference_time: float,
-                               image_shape: tuple) -> Dict[str, Any]:
-        """格式化追蹤結果"""
-        detections = []
-        tracks = []
-        
-        if results and len(results) > 0:
-            result = results[0]
-            
-            if result.boxes is not None:
-                boxes = result.boxes.cpu().numpy()
-                
-                for i in range(len(boxes)):
-                    xyxy = boxes.xyxy[i]
-                    conf = float(boxes.conf[i])
-                    cls = int(boxes.cls[i])
-                    
-                    # 基本偵測資訊
-                    detection = {
-                        "class_id": cls,
-                        "class_name": YOLO_CLASSES.get(cls, f"class_{cls}"),
-                        "confidence": conf,
-                        "bbox": {
-                            "x1": float(xyxy[0]),
-                            "y1": float(xyxy[1]),
-                            "x2": float(xyxy[2]),
-                            "y2": float(xyxy[3])
-                        },
-                        "center": {
-                            "x": float((xyxy[0] + xyxy[2]) / 2),
-                            "y": float((xyxy[1] + xyxy[3]) / 2)
-                        },
-                        "area": float((xyxy[2] - xyxy[0]) * (xyxy[3] - xyxy[1]))
-                    }
-                    
-                    # 追蹤資訊
-                    if hasattr(boxes, 'id') and boxes.id is not None:
-                        track_id = int(boxes.id[i]) if i < len(boxes.id) else None
-                        if track_id is not None:
-                            detection["track_id"] = track_id
-                            
-                            # 建立追蹤記錄
-                            track = {
-                                "track_id": track_id,
-                                "class_id": cls,
-                                "class_name": detection["class_name"],
-                                "bbox": detection["bbox"],
-                                "center": detection["center"],
-                                "confidence": conf,
-                                "timestamp": time.time()
-                            }
-                            tracks.append(track)
-                    
-                    detections.append(detection)
-        
-        return {
-            "detections": detections,
-            "tracks": tracks,
-            "inference_time": inference_time,
-            "image_shape": image_shape,
-            "detection_count": len(detections),
-            "track_count": len(tracks),
-            "timestamp": time.time()
-        }
+                               image_shape: tuple) -> DetectionResult:
+        """將 ultralytics 追蹤結果轉為欄位式結果（track_id 取自 boxes.id）"""
+        if not results:
+            return DetectionResult.empty(image_shape=image_shape, inference_time=inference_time)
+        return DetectionResult.from_ultralytics(
+            results[0],
+            YOLO_CLASSES,
+            image_shape=image_shape,
+            inference_time=inference_time,
+        )
     
     def __del__(self):
         """清理資源"""
+        if getattr(self, 'batch_scheduler', None) is not None:
+            self.batch_scheduler.stop()
+        if hasattr(self, '_registry'):
+            self._release_leases()
         if hasattr(self, 'executor'):
             self.executor.shutdown(wait=True)
 
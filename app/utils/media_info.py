@@ -11,7 +11,7 @@
     - 失敗時回傳 (None, None)。
 """
 
-from typing import Optional, Tuple
+from typing import Any, Dict, Optional, Tuple
 import cv2
 
 
@@ -79,3 +79,27 @@ def probe_resolution(source: str, timeout_ms: int = 3000) -> Tuple[Optional[int]
         except Exception:
             pass
         return None, None
+
+
+def probe_video(path: str) -> Optional[Dict[str, Any]]:
+    """
+    量測影片檔的長度、FPS、解析度與影格數（會阻塞，請在工作執行緒中呼叫）。
+
+    回傳：
+        {"duration", "fps", "width", "height", "frame_count"}；無法開啟時回傳 None
+    """
+    cap = cv2.VideoCapture(path)
+    try:
+        if not cap.isOpened():
+            return None
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        return {
+            "duration": round(frame_count / fps, 2) if fps > 0 else 0,
+            "fps": round(fps, 2),
+            "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            "frame_count": frame_count,
+        }
+    finally:
+        cap.release()
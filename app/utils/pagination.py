@@ -0,0 +1,199 @@
+"""
+列表查詢分頁工具：OFFSET 分頁與 keyset（游標）分頁
+
+OFFSET 分頁在深頁時必須先掃過前面所有列，且每頁都重算一次精確 COUNT。
+keyset 分頁以上一頁最後一列的排序鍵（例如 (frame_timestamp, id)）作為下一頁的起點：
+- 排序欄位一律遞減，最後一欄必須唯一（通常是 id），排序鍵為 NULL 的列不列出
+- 續頁標記（next_cursor）為 base64 編碼的排序鍵，對用戶端而言不透明；
+  標記綁定列表範圍（scope），不能拿到其他端點使用
+- 總筆數可選擇 exact（COUNT）、estimated（EXPLAIN 的規劃器估計列數，
+  來源為 pg_class.reltuples 與欄位統計）或 none
+
+用法：
+    page = await paginate(db, select(LineCrossingEvent).where(...),
+                          (LineCrossingEvent.frame_timestamp, LineCrossingEvent.id),
+                          scope="line_events", limit=100, cursor=cursor, mode="cursor")
+    page.items, page.pagination
+"""
+
+from __future__ import annotations
+
+import base64
+import binascii
+import json
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy import and_, func, select, tuple_
+
+from app.core.logger import api_logger
+
+PAGINATION_MODES = ("offset", "cursor")
+TOTAL_MODES = ("exact", "estimated", "none")
+
+
+class InvalidCursorError(ValueError):
+    """續頁標記格式錯誤或不屬於此列表"""
+
+
+# ===== 續頁標記 =====
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, date):
+        return {"d": value.isoformat()}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "dt" in value:
+            return datetime.fromisoformat(value["dt"])
+        if "d" in value:
+            return date.fromisoformat(value["d"])
+        raise InvalidCursorError("無法辨識的續頁標記內容")
+    return value
+
+
+def encode_cursor(scope: str, values: Sequence[Any]) -> str:
+    payload = json.dumps({"s": scope, "v": [_encode_value(value) for value in values]}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str, scope: str, size: int) -> List[Any]:
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        values = [_decode_value(value) for value in payload["v"]]
+    except (binascii.Error, UnicodeError, ValueError, KeyError, TypeError) as exc:
+        raise InvalidCursorError("續頁標記格式錯誤") from exc
+    if payload.get("s") != scope or len(values) != size:
+        raise InvalidCursorError("續頁標記不屬於此列表")
+    return values
+
+
+def keyset_before(columns: Sequence[Any], values: Sequence[Any]):
+    """遞減排序時「排在 values 之後」的條件；額外的首欄上界讓單欄索引也能做範圍掃描"""
+    return and_(columns[0] <= values[0], tuple_(*columns) < tuple_(*values))
+
+
+# ===== 總筆數 =====
+
+
+async def estimate_count(db, statement) -> Optional[int]:
+    """以 EXPLAIN 取得規劃器估計的結果列數（不執行查詢）；無法估計時回傳 None"""
+    try:
+        connection = await db.connection()
+        compiled = statement.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True})
+        result = await connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}")
+        plan = result.scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+    except Exception as exc:  # noqa: BLE001
+        api_logger.warning(f"估計查詢筆數失敗: {exc}")
+        return None
+
+
+async def count_rows(db, statement, total: str) -> Optional[int]:
+    """依 total 模式計算未分頁查詢的總筆數"""
+    if total == "exact":
+        counted = select(func.count()).select_from(statement.order_by(None).subquery())
+        return (await db.execute(counted)).scalar() or 0
+    if total == "estimated":
+        return await estimate_count(db, statement.order_by(None))
+    return None
+
+
+# ===== 分頁 =====
+
+
+@dataclass
+class Page:
+    items: List[Any]
+    pagination: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def next_cursor(self) -> Optional[str]:
+        return self.pagination.get("next_cursor")
+
+
+async def paginate(
+    db,
+    statement,
+    order_by: Sequence[Any],
+    *,
+    scope: str,
+    limit: int,
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    mode: str = "offset",
+    total: Optional[str] = None,
+    scalars: bool = True,
+) -> Page:
+    """
+    執行分頁查詢
+
+    statement 為已套用篩選條件、尚未排序的 select；order_by 為遞減排序欄位（最後一欄唯一）。
+    帶有 cursor 時一律使用 keyset 分頁；total 未指定時 offset 分頁為 exact、keyset 分頁為 estimated。
+    續頁標記錯誤時拋出 InvalidCursorError。
+    """
+    if cursor:
+        mode = "cursor"
+    if mode not in PAGINATION_MODES:
+        raise ValueError(f"不支援的分頁模式: {mode}")
+    if total is None:
+        total = "estimated" if mode == "cursor" else "exact"
+    if total not in TOTAL_MODES:
+        raise ValueError(f"不支援的總筆數模式: {total}")
+
+    page_stmt = statement.order_by(*[column.desc() for column in order_by])
+    if mode == "cursor":
+        page_stmt = page_stmt.where(*[column.isnot(None) for column in order_by])
+        if cursor:
+            page_stmt = page_stmt.where(keyset_before(order_by, decode_cursor(cursor, scope, len(order_by))))
+    else:
+        page_stmt = page_stmt.offset(offset)
+
+    # 多取一列判斷是否還有下一頁，不必依賴總筆數
+    result = await db.execute(page_stmt.limit(limit + 1))
+    rows = list(result.scalars().all() if scalars else result.all())
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+
+    total_count = await count_rows(db, statement, total)
+    pagination: Dict[str, Any] = {
+        "mode": mode,
+        "total": total_count,
+        "total_is_estimate": total == "estimated",
+        "limit": limit,
+        "has_next": has_next,
+    }
+    if mode == "cursor":
+        pagination["next_cursor"] = (
+            encode_cursor(scope, [getattr(rows[-1], column.key) for column in order_by])
+            if has_next and rows
+            else None
+        )
+        pagination["has_prev"] = bool(cursor)
+    else:
+        pagination["offset"] = offset
+        pagination["has_prev"] = offset > 0
+    return Page(items=rows, pagination=pagination)
+
+
+__all__ = [
+    "InvalidCursorError",
+    "PAGINATION_MODES",
+    "Page",
+    "TOTAL_MODES",
+    "count_rows",
+    "decode_cursor",
+    "encode_cursor",
+    "estimate_count",
+    "keyset_before",
+    "paginate",
+]
@@ -0,0 +1,134 @@
+"""
+即時預覽訊框編碼：JSON（base64 影像）與二進位訊框
+
+JSON 模式沿用既有的文字訊息 {"type": "frame", ..., "image": <base64 JPEG>}；
+二進位模式把 JPEG 原始位元組直接放進 WebSocket 二進位訊息，省去 base64（大小 +33%）與 JSON 字串處理：
+
+    | "YPV1" (4) | 標頭編碼 (1) | 標頭長度 N (uint32 BE, 4) | 標頭 (N) | JPEG 位元組 |
+
+標頭編碼 1 = MessagePack（需安裝 msgpack），2 = JSON（UTF-8，未安裝 msgpack 時使用）。
+標頭內容與 JSON 模式相同（camera_id、frame_number、timestamp、width、height、detections 等），但不含 image。
+
+每個連線各自協商格式：連線時帶 ?format=binary，或連線後送出 {"type": "set_format", "format": "binary"}；
+未協商的連線維持 JSON。同一幀的每種格式只編碼一次，由所有同格式的連線共用。
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+import struct
+import threading
+from typing import Any, Dict, Iterable, Optional, Tuple, Union
+
+try:
+    import msgpack
+except ImportError:  # msgpack 列在專案依賴中；未安裝時退回 JSON 標頭
+    msgpack = None
+
+PREVIEW_FORMATS = ("json", "binary")
+FRAME_MAGIC = b"YPV1"
+HEADER_MSGPACK = 1
+HEADER_JSON = 2
+
+_PREFIX = struct.Struct(">4sBI")
+
+
+def normalize_preview_format(value: Optional[str]) -> str:
+    """用戶端要求的格式；無法辨識時使用 JSON"""
+    value = (value or "").strip().lower()
+    return value if value in PREVIEW_FORMATS else "json"
+
+
+def header_encoding() -> str:
+    """二進位訊框目前使用的標頭編碼名稱"""
+    return "msgpack" if msgpack is not None else "json"
+
+
+def encode_binary_frame(header: Dict[str, Any], image: bytes = b"") -> bytes:
+    if msgpack is not None:
+        kind, packed = HEADER_MSGPACK, msgpack.packb(header, use_bin_type=True)
+    else:
+        kind, packed = HEADER_JSON, json.dumps(header, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return b"".join((_PREFIX.pack(FRAME_MAGIC, kind, len(packed)), packed, image))
+
+
+def decode_binary_frame(data: bytes) -> Tuple[Dict[str, Any], bytes]:
+    """解析二進位訊框，回傳 (標頭, JPEG 位元組)"""
+    magic, kind, length = _PREFIX.unpack_from(data)
+    if magic != FRAME_MAGIC:
+        raise ValueError("不是預覽訊框")
+    start = _PREFIX.size
+    raw = bytes(data[start:start + length])
+    if kind == HEADER_MSGPACK:
+        if msgpack is None:
+            raise ValueError("標頭為 MessagePack，但未安裝 msgpack")
+        header = msgpack.unpackb(raw, raw=False)
+    elif kind == HEADER_JSON:
+        header = json.loads(raw.decode("utf-8"))
+    else:
+        raise ValueError(f"未知的標頭編碼: {kind}")
+    return header, bytes(data[start + length:])
+
+
+def encode_json_frame(header: Dict[str, Any], image: Optional[bytes] = None) -> str:
+    payload = dict(header)
+    if image:
+        payload["image"] = base64.b64encode(image).decode("ascii")
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+
+class PreviewFrame:
+    """單一預覽幀（中繼資料 + JPEG 位元組），每種傳輸格式最多編碼一次"""
+
+    __slots__ = ("header", "image", "_encoded", "_lock")
+
+    def __init__(self, header: Dict[str, Any], image: Optional[bytes] = None):
+        self.header = header
+        self.image = image
+        self._encoded: Dict[str, Union[str, bytes]] = {}
+        self._lock = threading.Lock()
+
+    def encode(self, preview_format: str) -> Union[str, bytes]:
+        """JSON 格式回傳 str（送 text 訊息），binary 格式回傳 bytes（送 binary 訊息）"""
+        cached = self._encoded.get(preview_format)
+        if cached is not None:
+            return cached
+        with self._lock:
+            cached = self._encoded.get(preview_format)
+            if cached is None:
+                if preview_format == "binary":
+                    header = dict(self.header)
+                    if self.image:
+                        header["mime"] = "image/jpeg"
+                    cached = encode_binary_frame(header, self.image or b"")
+                else:
+                    cached = encode_json_frame(self.header, self.image)
+                self._encoded[preview_format] = cached
+        return cached
+
+    def prepare(self, formats: Iterable[str]) -> None:
+        """預先編碼目前有連線訂閱的格式（在工作執行緒呼叫，避免占用事件迴圈）"""
+        for preview_format in formats:
+            self.encode(preview_format)
+
+
+async def send_preview(websocket, frame: PreviewFrame, preview_format: str) -> None:
+    data = frame.encode(preview_format)
+    if isinstance(data, bytes):
+        await websocket.send_bytes(data)
+    else:
+        await websocket.send_text(data)
+
+
+__all__ = [
+    "FRAME_MAGIC",
+    "PREVIEW_FORMATS",
+    "PreviewFrame",
+    "decode_binary_frame",
+    "encode_binary_frame",
+    "encode_json_frame",
+    "header_encoding",
+    "normalize_preview_format",
+    "send_preview",
+]
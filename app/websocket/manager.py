@@ -1,17 +1,140 @@
 """
 WebSocket 連線管理器
 管理多用戶連線、分組廣播、即時資料推送
+
+廣播只序列化一次，再放入每個連線各自的有界送出佇列，由該連線的送出工作依序傳送；
+慢速用戶端只會塞滿自己的佇列，不會拖慢同群組的其他連線。佇列滿時依 WS_SLOW_CONSUMER_POLICY：
+- drop_oldest：丟棄最舊的一則
+- coalesce：丟棄佇列中同一鍵（type + 任務 / 攝影機，見 coalesce_key）的舊訊息，只保留最新一則；
+  沒有同鍵訊息時丟棄最舊的一則。不同任務的訊息不會互相合併
+- disconnect：中斷該連線（close code 1013）
 """
 import json
 import asyncio
-from typing import Dict, List, Set, Optional, Any
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, List, Set, Optional, Any, Tuple, Union
 from fastapi import WebSocket, WebSocketDisconnect
 from datetime import datetime
 import logging
 
+from app.core.config import settings
+
 # 設定日誌
 logger = logging.getLogger(__name__)
 
+SLOW_CONSUMER_POLICIES = ("drop_oldest", "coalesce", "disconnect")
+
+# 已序列化的訊息：文字（JSON）或二進位訊框
+Payload = Union[str, bytes]
+
+# 訊息所屬實體的欄位（依序取第一個有值的），與 type 組成 coalesce 鍵
+COALESCE_ENTITY_FIELDS = ("task_id", "camera_id", "source_id")
+
+
+def coalesce_key(message: Dict[str, Any]) -> Optional[str]:
+    """coalesce 策略的合併鍵：type 加上所屬任務 / 攝影機；沒有 type 時不合併"""
+    message_type = message.get("type")
+    if message_type is None:
+        return None
+    for field in COALESCE_ENTITY_FIELDS:
+        value = message.get(field)
+        if value is not None:
+            return f"{message_type}:{value}"
+    return str(message_type)
+
+
+class OutboundQueue:
+    """單一連線的有界送出佇列與送出工作"""
+
+    def __init__(
+        self,
+        connection_id: str,
+        websocket: WebSocket,
+        on_failure: Callable[[str], None],
+        max_size: int,
+        policy: str,
+        send_timeout: float,
+    ):
+        self.connection_id = connection_id
+        self.websocket = websocket
+        self.max_size = max(1, max_size)
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self._on_failure = on_failure
+        self._queue: Deque[Tuple[Optional[str], Payload]] = deque()
+        self._ready = asyncio.Event()
+
+        self.enqueued = 0
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth = 0
+        self.bytes_sent = 0
+
+        self._task = asyncio.create_task(self._run())
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def put(self, payload: Payload, key: Optional[str] = None) -> bool:
+        """放入佇列；依 disconnect 策略應中斷連線時回傳 False"""
+        if len(self._queue) >= self.max_size:
+            if self.policy == "disconnect":
+                return False
+            if self.policy == "coalesce" and key is not None:
+                kept = deque(item for item in self._queue if item[0] != key)
+                self.coalesced += len(self._queue) - len(kept)
+                self._queue = kept
+            if len(self._queue) >= self.max_size:
+                self._queue.popleft()
+                self.dropped += 1
+        self._queue.append((key, payload))
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, len(self._queue))
+        self._ready.set()
+        return True
+
+    async def _run(self):
+        try:
+            while True:
+                if not self._queue:
+                    self._ready.clear()
+                    await self._ready.wait()
+                    continue
+                _, payload = self._queue.popleft()
+                if isinstance(payload, bytes):
+                    send = self.websocket.send_bytes(payload)
+                else:
+                    send = self.websocket.send_text(payload)
+                if self.send_timeout > 0:
+                    await asyncio.wait_for(send, self.send_timeout)
+                else:
+                    await send
+                self.sent += 1
+                self.bytes_sent += len(payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"發送訊息失敗 {self.connection_id}: {e!r}")
+            self._on_failure(self.connection_id)
+
+    def close(self):
+        self._task.cancel()
+        self._queue.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "depth": len(self._queue),
+            "max_depth": self.max_depth,
+            "enqueued": self.enqueued,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "bytes_sent": self.bytes_sent,
+        }
+
+
 class ConnectionManager:
     """WebSocket 連線管理器"""
     
@@ -19,6 +142,17 @@ class ConnectionManager:
         # 儲存所有活躍連線
         self.active_connections: Dict[str, WebSocket] = {}
         
+        # 每個連線的送出佇列
+        self.outbound: Dict[str, OutboundQueue] = {}
+        self.queue_size = settings.ws_send_queue_size
+        self.send_timeout = settings.ws_send_timeout
+        policy = settings.ws_slow_consumer_policy
+        if policy not in SLOW_CONSUMER_POLICIES:
+            logger.warning(f"未知的慢速用戶端策略 {policy}，改用 drop_oldest")
+            policy = "drop_oldest"
+        self.slow_consumer_policy = policy
+        self.slow_disconnects = 0
+        
         # 分組管理 - 按功能分組
         self.groups: Dict[str, Set[str]] = {
             "detection": set(),      # 即時辨識結果
@@ -46,6 +180,14 @@ class ConnectionManager:
         
         # 儲存連線
         self.active_connections[connection_id] = websocket
+        self.outbound[connection_id] = OutboundQueue(
+            connection_id,
+            websocket,
+            self.disconnect,
+            self.queue_size,
+            self.slow_consumer_policy,
+            self.send_timeout,
+        )
         
         # 加入指定群組
         if group in self.groups:
@@ -85,81 +227,92 @@ class ConnectionManager:
             # 移除連線資料
             del self.active_connections[connection_id]
             del self.connection_meta[connection_id]
+            outbound = self.outbound.pop(connection_id, None)
+            if outbound is not None:
+                outbound.close()
             
             logger.info(f"❌ 連線已斷開: {connection_id}")
     
-    async def send_personal_message(self, message: dict, connection_id: str):
-        """發送個人訊息"""
+    def _drop_slow_consumer(self, connection_id: str):
+        """disconnect 策略：佇列已滿時中斷連線"""
+        websocket = self.active_connections.get(connection_id)
+        self.slow_disconnects += 1
+        logger.warning(f"🐢 用戶端送出佇列已滿，中斷連線: {connection_id}")
+        self.disconnect(connection_id)
+        if websocket is not None:
+            asyncio.create_task(self._close_quietly(websocket, 1013))
+    
+    @staticmethod
+    async def _close_quietly(websocket: WebSocket, code: int):
+        try:
+            await websocket.close(code=code)
+        except Exception:
+            pass
+    
+    def _enqueue(self, connection_ids: Iterable[str], payload: Payload, key: Optional[str]) -> int:
+        """把已序列化的訊息放入各連線的送出佇列，回傳放入的連線數"""
+        delivered = 0
+        for connection_id in list(connection_ids):
+            outbound = self.outbound.get(connection_id)
+            if outbound is None:
+                continue
+            if outbound.put(payload, key):
+                delivered += 1
+            else:
+                self._drop_slow_consumer(connection_id)
+        return delivered
+    
+    async def send_personal_message(self, message: dict, connection_id: str, key: Optional[str] = None):
+        """發送個人訊息（key 為 coalesce 合併鍵，未指定時依 coalesce_key 推得）"""
         if connection_id in self.active_connections:
-            try:
-                websocket = self.active_connections[connection_id]
-                await websocket.send_text(json.dumps(message, ensure_ascii=False))
-            except Exception as e:
-                logger.error(f"發送個人訊息失敗 {connection_id}: {e}")
-                self.disconnect(connection_id)
-    
-    async def broadcast_to_group(self, message: dict, group: str):
-        """廣播訊息到指定群組"""
-        if group not in self.groups:
-            logger.warning(f"群組不存在: {group}")
+            self._enqueue(
+                [connection_id], json.dumps(message, ensure_ascii=False), key or coalesce_key(message)
+            )
+    
+    async def broadcast_to_groups(self, message: dict, groups: List[str], key: Optional[str] = None):
+        """廣播訊息到多個群組：只序列化一次，同時屬於多個群組的連線只收到一次"""
+        targets: Set[str] = set()
+        valid_groups = []
+        for group in groups:
+            if group not in self.groups:
+                logger.warning(f"群組不存在: {group}")
+                continue
+            valid_groups.append(group)
+            targets |= self.groups[group]
+        if not valid_groups:
             return
         
         # 添加廣播元資料
         message.update({
-            "broadcast_to": group,
+            "broadcast_to": valid_groups[0] if len(valid_groups) == 1 else valid_groups,
             "broadcast_time": datetime.now().isoformat()
         })
         
-        message_text = json.dumps(message, ensure_ascii=False)
-        
-        # 記錄要移除的無效連線
-        invalid_connections = []
-        
-        for connection_id in self.groups[group].copy():
-            if connection_id in self.active_connections:
-                try:
-                    websocket = self.active_connections[connection_id]
-                    await websocket.send_text(message_text)
-                except Exception as e:
-                    logger.error(f"廣播失敗 {connection_id}: {e}")
-                    invalid_connections.append(connection_id)
-        
-        # 清理無效連線
-        for connection_id in invalid_connections:
-            self.disconnect(connection_id)
-        
-        active_count = len(self.groups[group])
-        logger.info(f"📡 群組 {group} 廣播完成，活躍連線: {active_count}")
+        delivered = self._enqueue(targets, json.dumps(message, ensure_ascii=False), key or coalesce_key(message))
+        logger.debug(f"📡 群組 {', '.join(valid_groups)} 廣播已排入 {delivered} 個連線")
+    
+    async def broadcast_to_group(self, message: dict, group: str, key: Optional[str] = None):
+        """廣播訊息到指定群組"""
+        await self.broadcast_to_groups(message, [group], key)
     
-    async def broadcast_to_all(self, message: dict):
+    async def broadcast_to_all(self, message: dict, key: Optional[str] = None):
         """廣播訊息到所有連線"""
         message.update({
             "broadcast_to": "all",
             "broadcast_time": datetime.now().isoformat()
         })
         
-        message_text = json.dumps(message, ensure_ascii=False)
-        invalid_connections = []
-        
-        # 創建字典的副本以避免在遍歷時修改
-        connections_copy = dict(self.active_connections)
-        
-        for connection_id, websocket in connections_copy.items():
-            try:
-                await websocket.send_text(message_text)
-            except Exception as e:
-                logger.error(f"全域廣播失敗 {connection_id}: {e}")
-                invalid_connections.append(connection_id)
-        
-        # 清理無效連線
-        for connection_id in invalid_connections:
-            self.disconnect(connection_id)
-        
-        active_count = len(self.active_connections)
-        logger.info(f"📡 全域廣播完成，活躍連線: {active_count}")
+        delivered = self._enqueue(
+            self.active_connections.keys(), json.dumps(message, ensure_ascii=False), key or coalesce_key(message)
+        )
+        logger.debug(f"📡 全域廣播已排入 {delivered} 個連線")
     
     def get_stats(self) -> dict:
-        """取得連線統計"""
+        """取得連線統計（含每個連線的送出佇列深度與丟棄數）"""
+        outbound = {
+            connection_id: queue.get_stats()
+            for connection_id, queue in self.outbound.items()
+        }
         return {
             "total_connections": len(self.active_connections),
             "groups": {
@@ -167,9 +320,18 @@ class ConnectionManager:
                 for group, connections in self.groups.items()
             },
             "connections": {
-                connection_id: meta 
+                connection_id: {**meta, "outbound": outbound.get(connection_id)}
                 for connection_id, meta in self.connection_meta.items()
-            }
+            },
+            "outbound": {
+                "queue_size": self.queue_size,
+                "slow_consumer_policy": self.slow_consumer_policy,
+                "send_timeout": self.send_timeout,
+                "queued": sum(stats["depth"] for stats in outbound.values()),
+                "dropped": sum(stats["dropped"] for stats in outbound.values()),
+                "coalesced": sum(stats["coalesced"] for stats in outbound.values()),
+                "slow_disconnects": self.slow_disconnects,
+            },
         }
     
     async def send_heartbeat(self):
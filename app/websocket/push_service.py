@@ -76,11 +76,8 @@ class RealtimePushService:
             "processing_time": detection_data.get("processing_time")
         }
         
-        # 推送到檢測群組
-        await websocket_manager.broadcast_to_group(formatted_data, "detection")
-        
-        # 推送到分析群組
-        await websocket_manager.broadcast_to_group(formatted_data, "analytics")
+        # 推送到檢測與分析群組（只序列化一次）
+        await websocket_manager.broadcast_to_groups(formatted_data, ["detection", "analytics"])
         
         logger.debug(f"已推送檢測結果: Task {formatted_data['task_id']}, Frame {formatted_data['frame_number']}")
     
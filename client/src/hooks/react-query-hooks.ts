@@ -1086,14 +1086,19 @@ export interface DetectionRecord {
 export interface DetectionRecordsResponse {
   results: DetectionRecord[];
   total: number;
+  total_is_estimate?: boolean;
   page: number;
   limit: number;
   total_pages: number;
+  has_next?: boolean;
+  next_cursor?: string | null;
 }
 
 export interface DetectionRecordsQuery {
   page?: number;
   limit?: number;
+  /** keyset 分頁：上一頁回傳的 next_cursor */
+  cursor?: string;
   search?: string;
   cameraName?: string;
   cameraId?: string;
@@ -1112,6 +1117,7 @@ const fetchDetectionResults = async (
 
   if (params.page !== undefined) queryParams.page = params.page;
   if (params.limit !== undefined) queryParams.limit = params.limit;
+  if (params.cursor) queryParams.cursor = params.cursor;
   if (params.search) queryParams.search = params.search;
   if (params.cameraName) queryParams.camera_name = params.cameraName;
   if (params.cameraId) queryParams.camera_id = params.cameraId;
@@ -1134,6 +1140,7 @@ export const useDetectionResults = (params: DetectionRecordsQuery = {}) => {
       'detectionResults',
       params.page,
       params.limit,
+      params.cursor,
       params.search,
       params.cameraName,
       params.cameraId,
@@ -69,6 +69,10 @@ CREATE TABLE IF NOT EXISTS detection_results (
 CREATE INDEX IF NOT EXISTS idx_detection_results_task ON detection_results(task_id);
 CREATE INDEX IF NOT EXISTS idx_detection_results_tracker ON detection_results(tracker_id);
 CREATE INDEX IF NOT EXISTS idx_detection_results_timestamp ON detection_results(frame_timestamp);
+CREATE INDEX IF NOT EXISTS idx_detection_results_task_track_group_ts ON detection_results(task_id, COALESCE(tracker_id, id), frame_timestamp DESC);
+CREATE INDEX IF NOT EXISTS idx_detection_results_task_tracker_ts ON detection_results(task_id, tracker_id, frame_timestamp DESC) WHERE tracker_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_detection_results_task_ts ON detection_results(task_id, frame_timestamp);
+CREATE INDEX IF NOT EXISTS idx_detection_results_ts_brin ON detection_results USING brin (frame_timestamp);
 
 ------------------------------------------------------------------------------
 -- 4. line_crossing_events (穿越線事件表)
@@ -86,6 +90,9 @@ CREATE TABLE IF NOT EXISTS line_crossing_events (
 );
 CREATE INDEX IF NOT EXISTS idx_line_events_task_line ON line_crossing_events(task_id, line_id);
 CREATE INDEX IF NOT EXISTS idx_line_events_tracker ON line_crossing_events(tracker_id);
+CREATE INDEX IF NOT EXISTS idx_line_events_task_ts ON line_crossing_events(task_id, frame_timestamp);
+CREATE INDEX IF NOT EXISTS idx_line_events_task_tracker_ts ON line_crossing_events(task_id, tracker_id, frame_timestamp DESC) WHERE tracker_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_line_events_ts_brin ON line_crossing_events USING brin (frame_timestamp);
 
 ------------------------------------------------------------------------------
 -- 5. zone_dwell_events (區域停留事件表)
@@ -105,6 +112,9 @@ CREATE TABLE IF NOT EXISTS zone_dwell_events (
 );
 CREATE INDEX IF NOT EXISTS idx_zone_events_task_zone ON zone_dwell_events(task_id, zone_id);
 CREATE INDEX IF NOT EXISTS idx_zone_events_tracker ON zone_dwell_events(tracker_id);
+CREATE INDEX IF NOT EXISTS idx_zone_events_task_ts ON zone_dwell_events(task_id, event_timestamp);
+CREATE INDEX IF NOT EXISTS idx_zone_events_task_tracker_ts ON zone_dwell_events(task_id, tracker_id, event_timestamp DESC) WHERE tracker_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_zone_events_ts_brin ON zone_dwell_events USING brin (event_timestamp);
 
 ------------------------------------------------------------------------------
 -- 6. speed_events (速度事件表)
@@ -123,6 +133,9 @@ CREATE TABLE IF NOT EXISTS speed_events (
 );
 CREATE INDEX IF NOT EXISTS idx_speed_events_task ON speed_events(task_id);
 CREATE INDEX IF NOT EXISTS idx_speed_events_tracker ON speed_events(tracker_id);
+CREATE INDEX IF NOT EXISTS idx_speed_events_task_ts ON speed_events(task_id, event_timestamp);
+CREATE INDEX IF NOT EXISTS idx_speed_events_task_tracker_ts ON speed_events(task_id, tracker_id, event_timestamp DESC) WHERE tracker_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_speed_events_ts_brin ON speed_events USING brin (event_timestamp);
 
 ------------------------------------------------------------------------------
 -- 7. users (使用者表)  - 規劃中，可視需要啟用
@@ -174,3 +187,63 @@ CREATE TABLE IF NOT EXISTS task_statistics (
 );
 CREATE INDEX IF NOT EXISTS idx_task_statistics_updated_at ON task_statistics(updated_at);
 
+------------------------------------------------------------------------------
+-- 10. analytics_rollup_minute / analytics_rollup_hour (分析彙總表)
+--     由 app/services/rollup_service.py 背景彙總器維護
+------------------------------------------------------------------------------
+CREATE TABLE IF NOT EXISTS analytics_rollup_minute (
+    bucket_start          TIMESTAMP NOT NULL,
+    task_id               BIGINT NOT NULL REFERENCES analysis_tasks(id) ON DELETE CASCADE,
+    metric                VARCHAR(20) NOT NULL,
+    dimension             VARCHAR(100) NOT NULL DEFAULT '',
+    direction             VARCHAR(20) NOT NULL DEFAULT '',
+    camera_id             VARCHAR(100),
+    event_count           INTEGER NOT NULL DEFAULT 0,
+    confidence_sum        FLOAT,
+    confidence_max        FLOAT,
+    high_confidence_count INTEGER,
+    alert_count           INTEGER,
+    value_sum             FLOAT,
+    value_max             FLOAT,
+    last_seen             TIMESTAMP,
+    PRIMARY KEY (bucket_start, task_id, metric, dimension, direction)
+);
+CREATE INDEX IF NOT EXISTS idx_rollup_minute_task ON analytics_rollup_minute(task_id, bucket_start);
+CREATE TABLE IF NOT EXISTS analytics_rollup_hour (
+    bucket_start          TIMESTAMP NOT NULL,
+    task_id               BIGINT NOT NULL REFERENCES analysis_tasks(id) ON DELETE CASCADE,
+    metric                VARCHAR(20) NOT NULL,
+    dimension             VARCHAR(100) NOT NULL DEFAULT '',
+    direction             VARCHAR(20) NOT NULL DEFAULT '',
+    camera_id             VARCHAR(100),
+    event_count           INTEGER NOT NULL DEFAULT 0,
+    confidence_sum        FLOAT,
+    confidence_max        FLOAT,
+    high_confidence_count INTEGER,
+    alert_count           INTEGER,
+    value_sum             FLOAT,
+    value_max             FLOAT,
+    last_seen             TIMESTAMP,
+    PRIMARY KEY (bucket_start, task_id, metric, dimension, direction)
+);
+CREATE INDEX IF NOT EXISTS idx_rollup_hour_task ON analytics_rollup_hour(task_id, bucket_start);
+-- 遲到資料標記（日誌重放等寫入早於水位線的明細），彙總器取出後重算對應小時
+CREATE TABLE IF NOT EXISTS analytics_rollup_dirty (
+    id          BIGSERIAL PRIMARY KEY,
+    earliest    TIMESTAMP NOT NULL,
+    recorded_at TIMESTAMP DEFAULT NOW()
+);
+
+------------------------------------------------------------------------------
+-- 11. heatmap_bins (熱點圖網格計數，每小時 / 每任務)
+------------------------------------------------------------------------------
+CREATE TABLE IF NOT EXISTS heatmap_bins (
+    bucket_start TIMESTAMP NOT NULL,
+    task_id      BIGINT NOT NULL REFERENCES analysis_tasks(id) ON DELETE CASCADE,
+    grid_size    INTEGER NOT NULL,
+    cell_x       INTEGER NOT NULL,
+    cell_y       INTEGER NOT NULL,
+    count        INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket_start, task_id, grid_size, cell_x, cell_y)
+);
+CREATE INDEX IF NOT EXISTS idx_heatmap_bins_task ON heatmap_bins(task_id, bucket_start);
@@ -83,6 +83,19 @@ async def lifespan(app: FastAPI):
         
         main_logger.info("✅ 資料庫初始化完成")
         
+        # 偵測明細表分區：轉換空表、預建未來分區、套用保留期（背景執行）
+        from app.services.partition_manager import get_partition_manager
+        get_partition_manager().start()
+        if settings.index_auto_create and not settings.partition_enabled:
+            # 分區維護啟用時由其背景執行緒在遷移後補建；否則單獨於背景補建
+            import threading
+            from app.models.indexes import ensure_indexes
+            threading.Thread(target=ensure_indexes, name="index-strategy", daemon=True).start()
+
+        # 分析彙總表背景彙總器
+        from app.services.rollup_service import get_rollup_service
+        get_rollup_service().start()
+        
         # 啟動 WebSocket 推送服務
         await realtime_push_service.start()
         main_logger.info("🚀 WebSocket 推送服務已啟動")
@@ -142,6 +155,18 @@ async def lifespan(app: FastAPI):
         except asyncio.CancelledError:
             pass
     
+    # 停止記憶體整理背景執行緒
+    from app.services.memory_housekeeping import get_memory_housekeeper
+    get_memory_housekeeper().stop()
+    
+    # 停止分區維護背景執行緒
+    from app.services.partition_manager import get_partition_manager
+    get_partition_manager().stop()
+
+    # 停止分析彙總背景執行緒
+    from app.services.rollup_service import get_rollup_service
+    get_rollup_service().stop()
+    
     # 停止 WebSocket 推送服務
     await realtime_push_service.stop()
     main_logger.info("⏹️ WebSocket 推送服務已停止")
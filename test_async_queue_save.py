@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+非同步佇列資料庫寫入測試：寫入失敗的批次不會被丟棄
+
+以假的 DatabaseService 取代資料庫，確認：
+- 暫時性錯誤先退避重試，成功後照常寫入
+- 重試用盡時整批寫回磁碟分段，依入隊順序重放；重新建立佇列後也會接續處理
+- 永久性錯誤只隔離有問題的訊息（.bad 檔），其餘照常寫入
+"""
+
+from datetime import datetime
+
+import pytest
+
+from app.services.async_queue_manager import AsyncQueueManager, BoundedMessageQueue, SPILL_SUFFIX
+from app.services.write_behind import POISONED_SUFFIX
+
+
+class OperationalError(Exception):
+    """模擬 psycopg2.OperationalError（連線中斷）"""
+
+
+class DataError(Exception):
+    """模擬 psycopg2.DataError（資料值錯誤）"""
+
+
+class FakeDatabaseService:
+    def __init__(self):
+        self.saved = []
+        self.failures = []
+
+    def create_detection_results_sync_bulk(self, rows, raise_errors=False):
+        if self.failures:
+            raise self.failures.pop(0)
+        if any(row["object_type"] == "poison" for row in rows):
+            raise DataError("invalid input value")
+        self.saved.extend(row["frame_number"] for row in rows)
+        return len(rows)
+
+
+def _message(frame_number, object_type="person"):
+    return {
+        "task_id": "1",
+        "frame_number": frame_number,
+        "objects": [{"class": object_type, "confidence": 0.9, "bbox": [0, 0, 1, 1]}],
+        "timestamp": datetime(2025, 1, 1, 0, 0, frame_number).isoformat(),
+    }
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = AsyncQueueManager(batch_size=10, batch_wait_ms=0)
+    manager.database_queue = BoundedMessageQueue("database", maxsize=10, policy="spill", spill_dir=tmp_path)
+    manager.save_backoff = 0
+    manager.running = True
+    return manager
+
+
+def _drain(manager, db):
+    while True:
+        entries = manager.database_queue.get_batch(manager.batch_size, 0, timeout=0)
+        if not entries:
+            return
+        manager._save_entries(db, entries)
+
+
+def test_transient_error_is_retried(manager):
+    db = FakeDatabaseService()
+    db.failures = [OperationalError("server closed the connection")] * 2
+    for frame in range(3):
+        manager.database_queue.put(_message(frame))
+
+    _drain(manager, db)
+    assert db.saved == [0, 1, 2]
+    assert manager.save_retries_used == 2
+    assert manager.database_queue.requeued == 0
+
+
+def test_exhausted_retries_requeue_batch_in_order(manager, tmp_path):
+    db = FakeDatabaseService()
+    manager.save_retries = 1
+    db.failures = [OperationalError("database is down")] * 2
+    for frame in range(3):
+        manager.database_queue.put(_message(frame))
+    entries = manager.database_queue.get_batch(2, 0, timeout=0)
+    manager._save_entries(db, entries)
+
+    assert db.saved == []
+    assert manager.database_queue.requeued == 2
+    assert len(manager.database_queue) == 3
+
+    # 寫回的批次比記憶體中的訊息舊：記憶體清空後才讀回，但仍在後續溢出分段之前
+    _drain(manager, db)
+    assert db.saved == [2, 0, 1]
+
+    # 停止中失敗的批次留在磁碟，重新建立佇列後接續處理
+    db.failures = [OperationalError("database is down")]
+    manager.running = False
+    manager.database_queue.put(_message(5))
+    manager._save_entries(db, manager.database_queue.get_batch(10, 0, timeout=0))
+    manager.database_queue.close()
+    assert len(list((tmp_path / "database").glob(f"*{SPILL_SUFFIX}"))) == 1
+
+    manager.database_queue = BoundedMessageQueue("database", maxsize=10, policy="drop_oldest", spill_dir=tmp_path)
+    _drain(manager, db)
+    assert db.saved == [2, 0, 1, 5]
+
+
+def test_permanent_error_isolates_bad_message(manager, tmp_path):
+    db = FakeDatabaseService()
+    for frame, object_type in ((0, "person"), (1, "poison"), (2, "car")):
+        manager.database_queue.put(_message(frame, object_type))
+
+    _drain(manager, db)
+    assert db.saved == [0, 2]
+    assert manager.database_queue.quarantined == 1
+    assert manager.save_retries_used == 0
+    assert len(list((tmp_path / "database").glob(f"*{POISONED_SUFFIX}"))) == 1
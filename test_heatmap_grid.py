@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+熱點圖網格彙總測試：以合成資料確認分箱計數正確
+
+- 網格運算（分箱、縮小網格、高斯平滑）不需要資料庫
+- 資料庫測試在本機 PostgreSQL 建立測試 schema、灌入合成偵測資料，
+  確認 heatmap_bins（已結束的小時）加上明細尾段的計數與 Python 分箱完全一致；
+  連線字串取自 TEST_DATABASE_URL；未設定時略過（不在應用程式資料庫上建立測試資料），無法連線時同樣略過
+"""
+
+import asyncio
+import os
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine, text
+
+from app.core.config import settings
+from app.models.database import Base
+from app.services.heatmap_service import (
+    HeatmapAggregator,
+    bin_points,
+    downsample_grid,
+    fetch_heatmap_counts,
+    gaussian_smooth,
+)
+
+WIDTH, HEIGHT = 640, 480
+BASE_TIME = datetime(2025, 1, 1)
+
+
+def _synthetic_detections(count=5000, seed=7):
+    """(center_x, center_y, 時間) 的合成資料，涵蓋 3 小時 20 分鐘，含少量落在畫面外的座標"""
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(count):
+        x = rng.uniform(-10, WIDTH + 10) if rng.random() < 0.02 else rng.gauss(WIDTH * 0.3, 60)
+        y = rng.gauss(HEIGHT * 0.6, 40)
+        timestamp = BASE_TIME + timedelta(seconds=rng.uniform(0, 200 * 60))
+        rows.append((x, y, timestamp))
+    return rows
+
+
+def test_bin_points_matches_known_cells():
+    grid = 16
+    expected = np.zeros((grid, grid), dtype=np.int64)
+    points = []
+    rng = random.Random(3)
+    for row in range(grid):
+        for col in range(grid):
+            repeats = (row * grid + col) % 5
+            expected[row, col] = repeats
+            for _ in range(repeats):
+                # 每格內的隨機位置
+                points.append((
+                    (col + rng.uniform(0.05, 0.95)) * WIDTH / grid,
+                    (row + rng.uniform(0.05, 0.95)) * HEIGHT / grid,
+                ))
+    assert np.array_equal(bin_points(points, WIDTH, HEIGHT, grid), expected)
+
+
+def test_out_of_frame_points_are_clamped_to_edges():
+    counts = bin_points([(-5, -5), (WIDTH + 5, HEIGHT + 5), (WIDTH, 0)], WIDTH, HEIGHT, 8)
+    assert counts[0, 0] == 1
+    assert counts[7, 7] == 1
+    assert counts[0, 7] == 1
+    assert counts.sum() == 3
+
+
+def test_downsample_matches_direct_binning():
+    points = [(x, y) for x, y, _ in _synthetic_detections()]
+    fine = bin_points(points, WIDTH, HEIGHT, 64)
+    for grid in (32, 16, 8):
+        assert np.array_equal(downsample_grid(fine, grid), bin_points(points, WIDTH, HEIGHT, grid))
+
+
+def test_gaussian_smoothing_preserves_total():
+    points = [(x, y) for x, y, _ in _synthetic_detections()]
+    counts = bin_points(points, WIDTH, HEIGHT, 32)
+    smoothed = gaussian_smooth(counts, 2.0)
+    assert smoothed.sum() == pytest.approx(counts.sum())
+    assert smoothed.max() < counts.max()
+    assert np.array_equal(gaussian_smooth(counts, 0), counts)
+
+
+# ===== 資料庫：heatmap_bins + 明細尾段 =====
+
+SCHEMA = f"heatmap_test_{os.getpid()}"
+
+
+@pytest.fixture(scope="module")
+def seeded_engine():
+    url = os.getenv("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("未設定 TEST_DATABASE_URL")
+    admin = create_engine(url)
+    try:
+        with admin.begin() as connection:
+            connection.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    except Exception as exc:  # noqa: BLE001
+        pytest.skip(f"無法連線 PostgreSQL: {exc}")
+
+    engine = create_engine(url, connect_args={"options": f"-csearch_path={SCHEMA}"})
+    detections = _synthetic_detections()
+    with engine.begin() as connection:
+        Base.metadata.create_all(connection)
+        task_id = connection.execute(
+            text(
+                "INSERT INTO analysis_tasks (task_type, status, created_at, camera_id, source_width, source_height) "
+                "VALUES ('realtime_camera', 'running', now(), 'cam-1', :w, :h) RETURNING id"
+            ),
+            {"w": WIDTH, "h": HEIGHT},
+        ).scalar()
+        connection.execute(
+            text(
+                "INSERT INTO detection_results (task_id, object_type, confidence, center_x, center_y, frame_timestamp) "
+                "VALUES (:task_id, 'person', 0.9, :x, :y, :ts)"
+            ),
+            [{"task_id": task_id, "x": x, "y": y, "ts": ts} for x, y, ts in detections],
+        )
+
+    yield engine, task_id, detections
+
+    engine.dispose()
+    with admin.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+    admin.dispose()
+
+
+def _fetch(start, end, **filters):
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+    async def _run():
+        engine = create_async_engine(
+            os.environ["TEST_DATABASE_URL"].replace("postgresql://", "postgresql+asyncpg://"),
+            connect_args={"server_settings": {"search_path": SCHEMA}},
+        )
+        try:
+            async with AsyncSession(engine) as session:
+                return await fetch_heatmap_counts(session, start, end, **filters)
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(_run())
+
+
+def test_database_counts_match_synthetic_dataset(seeded_engine):
+    engine, task_id, detections = seeded_engine
+    grid = settings.heatmap_grid_size
+
+    aggregator = HeatmapAggregator(lambda: engine, timedelta(0), backfill_hours=24)
+    report = aggregator.compact(BASE_TIME + timedelta(hours=3, minutes=30))
+    assert len(report["binned_hours"]) == 3
+
+    with engine.connect() as connection:
+        stored = connection.execute(text("SELECT coalesce(sum(count), 0) FROM heatmap_bins")).scalar()
+    assert stored == sum(1 for _, _, ts in detections if ts < BASE_TIME + timedelta(hours=3))
+
+    # 整段（3 個已彙總小時 + 20 分鐘明細尾段）與從中間開始的區間（頭段也讀明細表）
+    for start in (BASE_TIME, BASE_TIME + timedelta(minutes=30)):
+        end = BASE_TIME + timedelta(hours=4)
+        expected = bin_points(
+            [(x, y) for x, y, ts in detections if start <= ts < end], WIDTH, HEIGHT, grid
+        )
+        counts = _fetch(start, end, task_id=task_id)
+        assert np.array_equal(counts, expected)
+        assert np.array_equal(_fetch(start, end, camera_id="cam-1"), expected)
+
+    assert _fetch(BASE_TIME, BASE_TIME + timedelta(hours=4), camera_id="other").sum() == 0
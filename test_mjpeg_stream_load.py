@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+MJPEG 串流負載測試：N 個 MJPEG 觀看者連線時，無關端點的延遲維持不變
+
+- 以合成攝影機（取代 cv2.VideoCapture，30 fps 產生 720p 影像）啟動真正的 CameraStream
+- 在背景執行緒以 uvicorn 啟動掛載 frontend router 的應用，另加一個無關的 /ping 端點
+- 先量測沒有觀看者時 /ping 的延遲，再開 N 個 /cameras/{idx}/stream 連線持續讀取，同時量測 /ping
+- 斷言有觀看者時的 p95 延遲與基準相差不超過 LATENCY_BUDGET_MS，且每個觀看者都收到影格；
+  同一幀只編碼一次，因此編碼次數不隨觀看者數增加
+
+執行 `python -m pytest -s test_mjpeg_stream_load.py` 可看到延遲表。
+"""
+
+import asyncio
+import socket
+import statistics
+import threading
+import time
+
+import cv2
+import httpx
+import numpy as np
+import pytest
+import uvicorn
+from fastapi import FastAPI
+
+from app.api.v1.frontend import router as frontend_router
+from app.services import camera_stream_manager as stream_module
+from app.services.camera_stream_manager import camera_stream_manager
+from app.services.preview_encoder import get_preview_encoder_service
+
+DEVICE_INDEX = 97
+VIEWERS = (1, 5, 10)
+PINGS = 60
+LATENCY_BUDGET_MS = 25.0
+WIDTH, HEIGHT, FPS = 1280, 720, 30.0
+
+
+class SyntheticCapture:
+    """cv2.VideoCapture 的替身：以固定幀率產生帶雜訊的影像"""
+
+    def __init__(self, index, *args):
+        self.index = index
+        self.opened = index == DEVICE_INDEX
+        self.frame_number = 0
+        self.rng = np.random.default_rng(index)
+        self.next_frame = time.perf_counter()
+
+    def isOpened(self):
+        return self.opened
+
+    def set(self, prop, value):
+        return True
+
+    def get(self, prop):
+        return {cv2.CAP_PROP_FRAME_WIDTH: WIDTH, cv2.CAP_PROP_FRAME_HEIGHT: HEIGHT, cv2.CAP_PROP_FPS: FPS}.get(prop, 0)
+
+    def grab(self):
+        # 像真實攝影機一樣阻塞到下一幀
+        self.next_frame += 1.0 / FPS
+        delay = self.next_frame - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        self.frame_number += 1
+        return self.opened
+
+    def retrieve(self, image=None):
+        if image is None or image.shape != (HEIGHT, WIDTH, 3):
+            image = np.empty((HEIGHT, WIDTH, 3), dtype=np.uint8)
+        image[:] = self.rng.integers(0, 255, size=(HEIGHT // 8, WIDTH // 8, 3), dtype=np.uint8).repeat(8, 0).repeat(8, 1)
+        cv2.putText(image, str(self.frame_number), (40, 80), cv2.FONT_HERSHEY_SIMPLEX, 2, (255, 255, 255), 3)
+        return True, image
+
+    def release(self):
+        self.opened = False
+
+
+class _ThreadedServer(uvicorn.Server):
+    def install_signal_handlers(self):  # 在背景執行緒執行，不接管訊號
+        pass
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope="module")
+def server():
+    patcher = pytest.MonkeyPatch()
+    patcher.setattr(stream_module.cv2, "VideoCapture", SyntheticCapture)
+
+    app = FastAPI()
+    app.include_router(frontend_router, prefix="/api/v1")  # 與 main.py 相同；router 自帶 /frontend
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    port = _free_port()
+    instance = _ThreadedServer(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=instance.run, daemon=True)
+    thread.start()
+    deadline = time.time() + 10
+    while not instance.started:
+        if time.time() > deadline:
+            pytest.fail("uvicorn 未能啟動")
+        time.sleep(0.05)
+
+    yield f"http://127.0.0.1:{port}"
+
+    instance.should_exit = True
+    thread.join(timeout=5)
+    camera_stream_manager.stop_all_streams()
+    patcher.undo()
+
+
+async def _ping_latencies(client, count=PINGS):
+    latencies = []
+    for _ in range(count):
+        started = time.perf_counter()
+        response = await client.get("/ping")
+        latencies.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 200
+        await asyncio.sleep(0.01)
+    return latencies
+
+
+def _p95(values):
+    return statistics.quantiles(values, n=20)[-1]
+
+
+async def _watch(client, frames, stop):
+    url = f"/api/v1/frontend/cameras/{DEVICE_INDEX}/stream"
+    async with client.stream("GET", url) as response:
+        assert response.status_code == 200
+        async for chunk in response.aiter_bytes():
+            frames[0] += chunk.count(b"--frame\r\n")
+            if stop.is_set():
+                break
+
+
+async def _run_load(base_url, viewers):
+    limits = httpx.Limits(max_connections=viewers + 4)
+    async with httpx.AsyncClient(base_url=base_url, timeout=10, limits=limits) as client:
+        await _ping_latencies(client, 10)  # 暖機
+        baseline = await _ping_latencies(client)
+
+        stop = asyncio.Event()
+        counters = [[0] for _ in range(viewers)]
+        watchers = [asyncio.create_task(_watch(client, counters[i], stop)) for i in range(viewers)]
+        await asyncio.sleep(1.0)  # 等待攝影機流與觀看者穩定
+        encodes_before = get_preview_encoder_service().source(f"camera_{DEVICE_INDEX}").encodes
+        loaded = await _ping_latencies(client)
+        encodes = get_preview_encoder_service().source(f"camera_{DEVICE_INDEX}").encodes - encodes_before
+
+        stop.set()
+        for watcher in watchers:
+            watcher.cancel()
+        results = await asyncio.gather(*watchers, return_exceptions=True)
+    # 取消造成的 CancelledError 不是 Exception；其餘錯誤（例如路由錯誤的 404）直接讓測試失敗
+    failures = [result for result in results if isinstance(result, Exception)]
+    if failures:
+        raise failures[0]
+    return baseline, loaded, [counter[0] for counter in counters], encodes
+
+
+@pytest.mark.parametrize("viewers", VIEWERS)
+def test_unrelated_endpoint_latency_stays_flat(server, viewers):
+    baseline, loaded, frames, encodes = asyncio.run(_run_load(server, viewers))
+    elapsed_frames = max(frames)
+
+    print()
+    print(f"觀看者 {viewers:>2}: /ping p50 {statistics.median(baseline):6.2f} → {statistics.median(loaded):6.2f} ms，"
+          f"p95 {_p95(baseline):6.2f} → {_p95(loaded):6.2f} ms，"
+          f"每位觀看者影格 {min(frames)}-{elapsed_frames}，量測期間編碼 {encodes} 次")
+
+    assert all(count > 0 for count in frames)
+    assert _p95(loaded) - _p95(baseline) < LATENCY_BUDGET_MS
+    # 同一幀只編碼一次：編碼次數與觀看者數無關（不會是 viewers × 影格數）
+    assert encodes <= elapsed_frames * 1.5 + 5
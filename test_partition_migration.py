@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+分區遷移測試：把 create_all 建立的一般資料表轉成分區表
+
+在 TEST_DATABASE_URL 指向的暫存 PostgreSQL 建立測試 schema，確認：
+- 空表與已有資料的表都能轉成分區表，舊資料以 legacy 分區掛回，主鍵為 (id, 分區鍵)
+- 遷移前時間欄位為 NULL 的資料列以 UTC 時間補值
+- 落在預設分區、但屬於新分區範圍的資料列，建立分區時會被搬進新分區
+未設定 TEST_DATABASE_URL 時略過（不在應用程式資料庫上執行 DDL）
+"""
+
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from app.models.database import Base
+from app.services.partition_manager import (
+    DEFAULT_SUFFIX,
+    LEGACY_SUFFIX,
+    PARTITIONED_TABLES,
+    PartitionManager,
+    partition_name,
+    period_start,
+)
+
+SCHEMA = f"partition_test_{os.getpid()}"
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="未設定 TEST_DATABASE_URL")
+
+
+@pytest.fixture
+def engine():
+    admin = create_engine(TEST_DATABASE_URL)
+    try:
+        with admin.begin() as connection:
+            connection.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    except Exception as exc:  # noqa: BLE001
+        pytest.skip(f"無法連線 PostgreSQL: {exc}")
+
+    # 刻意使用非 UTC 的連線時區，確認補值不受伺服器 / 連線時區影響
+    engine = create_engine(
+        TEST_DATABASE_URL,
+        connect_args={"options": f"-csearch_path={SCHEMA} -ctimezone=Asia/Taipei"},
+    )
+    with engine.begin() as connection:
+        Base.metadata.create_all(connection)
+
+    yield engine
+
+    engine.dispose()
+    with admin.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+    admin.dispose()
+
+
+@pytest.fixture
+def manager(engine):
+    manager = PartitionManager()
+    saved = dict(manager.__dict__)
+    manager._engine = engine
+    manager.interval = "daily"
+    manager.premake = 2
+    manager.auto_migrate = False
+    yield manager
+    manager.__dict__.clear()
+    manager.__dict__.update(saved)
+
+
+def _create_task(connection):
+    return connection.execute(
+        text(
+            "INSERT INTO analysis_tasks (task_type, status, created_at) "
+            "VALUES ('video_file', 'completed', now()) RETURNING id"
+        )
+    ).scalar()
+
+
+def _primary_key_columns(connection, table):
+    return connection.execute(
+        text(
+            """
+            SELECT a.attname
+            FROM pg_index i
+            JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+            WHERE i.indrelid = to_regclass(:name) AND i.indisprimary
+            ORDER BY a.attname
+            """
+        ),
+        {"name": table},
+    ).scalars().all()
+
+
+def test_migrate_empty_tables(manager, engine):
+    results = manager.migrate_all()
+    assert results == {table: "migrated" for table in PARTITIONED_TABLES}
+
+    with engine.connect() as connection:
+        for table, key in PARTITIONED_TABLES.items():
+            assert manager._relkind(connection, table) == "p"
+            assert sorted(_primary_key_columns(connection, table)) == sorted(["id", key])
+            names = {p["name"] for p in manager.list_partitions(connection, table)}
+            assert f"{table}{LEGACY_SUFFIX}" in names
+            assert f"{table}{DEFAULT_SUFFIX}" in names
+
+    assert manager.migrate_all() == {table: "already_partitioned" for table in PARTITIONED_TABLES}
+
+
+def test_migrate_table_with_rows_keeps_data(manager, engine):
+    old = datetime.utcnow() - timedelta(days=3)
+    with engine.begin() as connection:
+        task_id = _create_task(connection)
+        connection.execute(
+            text(
+                "INSERT INTO detection_results (task_id, object_type, frame_timestamp) "
+                "VALUES (:task_id, 'person', :ts), (:task_id, 'person', NULL)"
+            ),
+            {"task_id": task_id, "ts": old},
+        )
+
+    assert manager.migrate_table("detection_results") == "skipped_not_empty"
+    before = datetime.utcnow()
+    assert manager.migrate_table("detection_results", force=True) == "migrated"
+    after = datetime.utcnow()
+
+    with engine.begin() as connection:
+        rows = connection.execute(
+            text("SELECT tableoid::regclass::text AS part, frame_timestamp FROM detection_results ORDER BY id")
+        ).all()
+        assert [row.part for row in rows] == [f"detection_results{LEGACY_SUFFIX}"] * 2
+        assert rows[0].frame_timestamp == old
+        # NULL 補值採 UTC，與寫入端 datetime.utcnow() 一致
+        assert before - timedelta(seconds=5) <= rows[1].frame_timestamp <= after + timedelta(seconds=5)
+
+        # 序列改由新表擁有，id 接續遷移前的值
+        connection.execute(
+            text("INSERT INTO detection_results (task_id, object_type) VALUES (:task_id, 'car')"),
+            {"task_id": task_id},
+        )
+        latest = connection.execute(
+            text("SELECT id, tableoid::regclass::text AS part FROM detection_results ORDER BY id DESC LIMIT 1")
+        ).one()
+        assert latest.id == 3
+        # legacy 分區的上界是最新資料所在週期的結束，當日資料仍寫入 legacy
+        assert latest.part == f"detection_results{LEGACY_SUFFIX}"
+
+
+def test_rows_in_default_partition_move_to_new_partition(manager, engine):
+    assert manager.migrate_table("detection_results") == "migrated"
+    now = datetime.utcnow()
+    future = period_start(now, "daily") + timedelta(days=5, hours=1)
+
+    with engine.begin() as connection:
+        task_id = _create_task(connection)
+        connection.execute(
+            text(
+                "INSERT INTO detection_results (task_id, object_type, frame_timestamp) "
+                "VALUES (:task_id, 'person', :ts)"
+            ),
+            {"task_id": task_id, "ts": future},
+        )
+        part = connection.execute(text("SELECT tableoid::regclass::text FROM detection_results")).scalar()
+        assert part == f"detection_results{DEFAULT_SUFFIX}"
+
+    # 維護時間推進到該日之後，需要建立的新分區與預設分區中的資料重疊
+    created = manager.ensure_partitions(now=future)
+    expected = partition_name("detection_results", period_start(future, "daily"))
+    assert expected in created["detection_results"]
+
+    with engine.connect() as connection:
+        part = connection.execute(text("SELECT tableoid::regclass::text FROM detection_results")).scalar()
+        assert part == expected
+        assert connection.execute(
+            text(f"SELECT count(*) FROM detection_results{DEFAULT_SUFFIX}")
+        ).scalar() == 0
+
+    # 再跑一次不會重複建立或出錯
+    assert manager.ensure_partitions(now=future)["detection_results"] == []
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+即時預覽傳輸基準測試：JSON/base64 與二進位訊框
+
+以合成的 720p 標註影像比較兩種模式：
+- 線上位元組數（WebSocket 訊息本文大小）
+- 伺服器每幀 CPU 時間（JPEG 編碼兩者共用，另外列出；封裝成本分開計算）
+
+執行 `python -m pytest -s test_preview_transport_benchmark.py` 可看到比較表；
+斷言只檢查穩定的性質（二進位訊框較小、可還原），不對 CPU 時間設門檻。
+"""
+
+import base64
+import json
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from app.utils import preview_codec
+from app.utils.preview_codec import PreviewFrame, decode_binary_frame
+
+WIDTH, HEIGHT = 1280, 720
+FRAMES = 60
+
+
+def _synthetic_frames(count=FRAMES, seed=11):
+    """帶漸層、雜訊與框線的影像，壓縮後大小接近實際攝影機畫面"""
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(0, 255, WIDTH, dtype=np.float32)[None, :, None]
+    base = np.broadcast_to(gradient, (HEIGHT, WIDTH, 3)).astype(np.uint8)
+    frames = []
+    for index in range(count):
+        noise = rng.integers(0, 40, size=(HEIGHT, WIDTH, 3), dtype=np.uint8)
+        frame = cv2.add(base, noise)
+        for box in range(6):
+            x1 = int((index * 7 + box * 190) % (WIDTH - 200))
+            y1 = 80 + box * 90
+            cv2.rectangle(frame, (x1, y1), (x1 + 160, y1 + 220), (34, 211, 238), 2)
+            cv2.putText(frame, f"person {90 - box}%", (x1 + 4, y1 - 6), cv2.FONT_HERSHEY_SIMPLEX, 0.45,
+                        (248, 250, 252), 1, cv2.LINE_AA)
+        frames.append(frame)
+    return frames
+
+
+def _header(index):
+    return {
+        "type": "frame",
+        "task_id": "42",
+        "camera_id": "cam-1",
+        "frame_number": index,
+        "timestamp": 1735689600.0 + index / 10,
+        "width": WIDTH,
+        "height": HEIGHT,
+        "detections": [
+            {
+                "bbox": [float(box * 190), 80.0 + box * 90, float(box * 190 + 160), 300.0 + box * 90],
+                "label": "person",
+                "confidence": 0.9 - box * 0.01,
+                "class_id": 0,
+                "tracker_id": box + 1,
+            }
+            for box in range(6)
+        ],
+    }
+
+
+@pytest.fixture(scope="module")
+def encoded_frames():
+    frames = _synthetic_frames()
+    started = time.process_time()
+    jpegs = [cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes() for frame in frames]
+    encode_cpu = (time.process_time() - started) / len(frames)
+    return jpegs, encode_cpu
+
+
+def _measure(jpegs, preview_format):
+    sizes = []
+    started = time.process_time()
+    for index, jpeg in enumerate(jpegs):
+        data = PreviewFrame(_header(index), jpeg).encode(preview_format)
+        sizes.append(len(data.encode("utf-8")) if isinstance(data, str) else len(data))
+    return sum(sizes) / len(sizes), (time.process_time() - started) / len(jpegs)
+
+
+def test_binary_frames_are_smaller_than_base64_json(encoded_frames):
+    jpegs, encode_cpu = encoded_frames
+    json_bytes, json_cpu = _measure(jpegs, "json")
+    binary_bytes, binary_cpu = _measure(jpegs, "binary")
+    jpeg_bytes = sum(len(jpeg) for jpeg in jpegs) / len(jpegs)
+
+    print()
+    print(f"標頭編碼: {preview_codec.header_encoding()}，JPEG 平均 {jpeg_bytes / 1024:.1f} KiB，"
+          f"JPEG 編碼 {encode_cpu * 1000:.2f} ms/幀（兩種模式共用）")
+    print(f"{'模式':<8}{'位元組/幀':>14}{'相對 JPEG':>12}{'封裝 CPU ms/幀':>18}{'含編碼 ms/幀':>16}")
+    for name, size, cpu in (("json", json_bytes, json_cpu), ("binary", binary_bytes, binary_cpu)):
+        print(f"{name:<8}{size:>14,.0f}{size / jpeg_bytes:>11.1%}{cpu * 1000:>18.3f}{(cpu + encode_cpu) * 1000:>16.2f}")
+    print(f"10 fps 每台攝影機每個客戶端節省 {(json_bytes - binary_bytes) * 10 / 1024:.0f} KiB/s")
+
+    # base64 讓影像變大約 4/3；二進位訊框只多一個小標頭
+    assert json_bytes > jpeg_bytes * 1.3
+    assert binary_bytes < jpeg_bytes * 1.02
+    assert binary_bytes < json_bytes
+
+
+def test_binary_frame_round_trip(encoded_frames):
+    jpeg = encoded_frames[0][0]
+    header = _header(3)
+    decoded_header, image = decode_binary_frame(PreviewFrame(header, jpeg).encode("binary"))
+    assert image == jpeg
+    assert decoded_header["mime"] == "image/jpeg"
+    assert {key: decoded_header[key] for key in header} == header
+
+    payload = json.loads(PreviewFrame(header, jpeg).encode("json"))
+    assert base64.b64decode(payload.pop("image")) == jpeg
+    assert payload == header
+
+
+def test_binary_header_uses_msgpack(encoded_frames):
+    pytest.importorskip("msgpack")
+    data = PreviewFrame(_header(1), encoded_frames[0][0]).encode("binary")
+    assert preview_codec.header_encoding() == "msgpack"
+    assert data[4] == preview_codec.HEADER_MSGPACK
+
+
+def test_json_header_fallback_without_msgpack(monkeypatch, encoded_frames):
+    monkeypatch.setattr(preview_codec, "msgpack", None)
+    jpeg = encoded_frames[0][0]
+    data = PreviewFrame(_header(1), jpeg).encode("binary")
+    assert data[4] == preview_codec.HEADER_JSON
+    decoded_header, image = decode_binary_frame(data)
+    assert image == jpeg
+    assert decoded_header["frame_number"] == 1
+
+
+def test_each_format_is_encoded_once():
+    frame = PreviewFrame(_header(0), b"\xff\xd8jpeg\xff\xd9")
+    assert frame.encode("binary") is frame.encode("binary")
+    assert frame.encode("json") is frame.encode("json")
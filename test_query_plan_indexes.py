@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+查詢計畫回歸測試：在本機 PostgreSQL 建立測試 schema、灌入資料並 ANALYZE，
+以 EXPLAIN 確認偵測明細查詢使用 app/models/indexes.py 宣告的索引
+
+連線字串取自 TEST_DATABASE_URL；未設定時略過（不在應用程式資料庫上建立測試資料），無法連線時同樣略過
+"""
+
+import json
+import os
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, desc, func, select, text
+
+from app.models.database import Base, DetectionResult, LineCrossingEvent
+
+SCHEMA = f"plan_test_{os.getpid()}"
+TASKS = 50
+DETECTIONS = 200_000
+LINE_EVENTS = 100_000
+
+
+@pytest.fixture(scope="module")
+def connection():
+    url = os.getenv("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("未設定 TEST_DATABASE_URL")
+    engine = create_engine(url)
+    try:
+        conn = engine.connect()
+    except Exception as exc:  # noqa: BLE001
+        pytest.skip(f"無法連線 PostgreSQL: {exc}")
+
+    conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    conn.execute(text(f"SET search_path TO {SCHEMA}"))
+    Base.metadata.create_all(conn)
+    conn.execute(
+        text(
+            """
+            INSERT INTO analysis_tasks (task_type, status, created_at, task_name)
+            SELECT 'realtime_camera', 'completed', now(), 'task ' || i
+            FROM generate_series(1, :tasks) AS i
+            """
+        ),
+        {"tasks": TASKS},
+    )
+    # 依寫入順序遞增的時間戳（與實際只追加寫入相同），約 2% 未追蹤
+    conn.execute(
+        text(
+            """
+            INSERT INTO detection_results
+                (task_id, tracker_id, object_type, frame_number, frame_timestamp, confidence)
+            SELECT (i % :tasks) + 1,
+                   CASE WHEN i % 50 = 0 THEN NULL ELSE (i / 300) % 1000 END,
+                   'person',
+                   i / :tasks,
+                   timestamp '2025-01-01' + i * interval '1 second',
+                   0.5 + (i % 50) / 100.0
+            FROM generate_series(1, :rows) AS i
+            """
+        ),
+        {"tasks": TASKS, "rows": DETECTIONS},
+    )
+    conn.execute(
+        text(
+            """
+            INSERT INTO line_crossing_events
+                (is_enabled, task_id, tracker_id, line_id, direction, frame_number, frame_timestamp)
+            SELECT true, (i % :tasks) + 1, (i / 300) % 1000, 'line_1', 'in', i,
+                   timestamp '2025-01-01' + i * interval '2 seconds'
+            FROM generate_series(1, :rows) AS i
+            """
+        ),
+        {"tasks": TASKS, "rows": LINE_EVENTS},
+    )
+    # 取樣涵蓋全部資料列，統計值固定，查詢計畫不隨 ANALYZE 抽樣而變動
+    conn.execute(text("SET default_statistics_target = 1000"))
+    conn.execute(text("ANALYZE"))
+    conn.commit()
+
+    yield conn
+
+    conn.rollback()
+    conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+    conn.commit()
+    conn.close()
+    engine.dispose()
+
+
+def _plan(connection, statement, **planner_settings):
+    for name, value in planner_settings.items():
+        connection.execute(text(f"SET LOCAL {name} = {value}"))
+    compiled = statement.compile(connection, compile_kwargs={"literal_binds": True})
+    rows = connection.execute(text(f"EXPLAIN (FORMAT JSON) {compiled}")).scalar()
+    connection.rollback()
+    return rows if isinstance(rows, str) else json.dumps(rows)
+
+
+def test_detection_list_window_uses_track_group_index(connection):
+    """偵測記錄列表：視窗函數的分組與排序直接由運算式索引提供"""
+    tracker_group = func.coalesce(DetectionResult.tracker_id, DetectionResult.id)
+    row_rank = func.row_number().over(
+        partition_by=(DetectionResult.task_id, tracker_group),
+        order_by=DetectionResult.frame_timestamp.desc(),
+    ).label("row_rank")
+    ranked = (
+        select(DetectionResult.id, DetectionResult.frame_timestamp, row_rank)
+        .where(DetectionResult.task_id == 7)
+        .cte("ranked_detections")
+    )
+    statement = select(ranked).where(ranked.c.row_rank == 1).order_by(desc(ranked.c.frame_timestamp)).limit(20)
+
+    # 單一任務只有數千筆時排序成本很低，關閉排序以確認索引能直接提供視窗函數所需的順序
+    plan = _plan(connection, statement, enable_sort="off")
+    assert "idx_detection_results_task_track_group_ts" in plan
+
+
+def test_tracker_lookup_uses_partial_composite_index(connection):
+    """單一追蹤目標的最後出現時間：部分複合索引，免排序直接取第一筆"""
+    statement = (
+        select(DetectionResult.frame_timestamp)
+        .where(DetectionResult.task_id == 7, DetectionResult.tracker_id == 42)
+        .order_by(DetectionResult.frame_timestamp.desc())
+        .limit(1)
+    )
+    plan = _plan(connection, statement)
+    assert "idx_detection_results_task_tracker_ts" in plan
+    assert '"Node Type": "Sort"' not in plan
+
+
+def test_task_time_range_uses_composite_index(connection):
+    """單一任務的時間區間查詢（半天的統計區間）"""
+    statement = select(func.count()).select_from(DetectionResult).where(
+        DetectionResult.task_id == 7,
+        DetectionResult.frame_timestamp >= datetime(2025, 1, 2, 0, 0),
+        DetectionResult.frame_timestamp < datetime(2025, 1, 2, 12, 0),
+    )
+    plan = _plan(connection, statement)
+    assert "idx_detection_results_task_ts" in plan
+
+
+def test_event_time_window_uses_brin(connection):
+    """跨任務的事件時間區間掃描使用 BRIN"""
+    statement = select(func.count()).select_from(LineCrossingEvent).where(
+        LineCrossingEvent.frame_timestamp >= datetime(2025, 1, 2, 0, 0),
+        LineCrossingEvent.frame_timestamp < datetime(2025, 1, 2, 6, 0),
+    )
+    plan = _plan(connection, statement, enable_seqscan="off")
+    assert "idx_line_events_ts_brin" in plan
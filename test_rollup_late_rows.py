@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+彙總表遲到資料測試：超過 ROLLUP_LATENESS 才寫入的明細仍會計入彙總
+
+在 TEST_DATABASE_URL 指向的暫存 PostgreSQL 建立測試 schema，確認：
+- 延後寫入器重放日誌時登記遲到標記，彙總器取出後重算對應小時的分鐘 / 小時列
+- 未登記的遲到資料不會被重算（說明標記是必要的）
+未設定 TEST_DATABASE_URL 時略過
+"""
+
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from app.models.database import Base, DetectionResult
+from app.services.rollup_service import RollupService, floor_hour, rollup_clock
+from app.services.write_behind import WriteBehindWriter
+
+SCHEMA = f"rollup_test_{os.getpid()}"
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="未設定 TEST_DATABASE_URL")
+
+
+@pytest.fixture
+def engine():
+    admin = create_engine(TEST_DATABASE_URL)
+    try:
+        with admin.begin() as connection:
+            connection.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    except Exception as exc:  # noqa: BLE001
+        pytest.skip(f"無法連線 PostgreSQL: {exc}")
+
+    engine = create_engine(TEST_DATABASE_URL, connect_args={"options": f"-csearch_path={SCHEMA}"})
+    with engine.begin() as connection:
+        Base.metadata.create_all(connection)
+
+    yield engine
+
+    engine.dispose()
+    with admin.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+    admin.dispose()
+
+
+@pytest.fixture
+def rollup(engine):
+    service = RollupService()
+    saved = dict(service.__dict__)
+    service._engine = engine
+    service._watermark = None
+    service.lateness = timedelta(seconds=120)
+    service.backfill_span = timedelta(hours=24)
+    service.minute_retention_days = 0
+    yield service
+    service.__dict__.clear()
+    service.__dict__.update(saved)
+
+
+def _rolled_count(engine, table):
+    with engine.connect() as connection:
+        return connection.execute(
+            text(f"SELECT COALESCE(sum(event_count), 0) FROM {table} WHERE metric = 'detection'")
+        ).scalar()
+
+
+def _seed(engine, timestamps):
+    with engine.begin() as connection:
+        task_id = connection.execute(
+            text(
+                "INSERT INTO analysis_tasks (task_type, status, created_at) "
+                "VALUES ('realtime_camera', 'running', now()) RETURNING id"
+            )
+        ).scalar()
+        connection.execute(
+            text(
+                "INSERT INTO detection_results (task_id, object_type, confidence, frame_timestamp) "
+                "VALUES (:task_id, 'person', 0.9, :ts)"
+            ),
+            [{"task_id": task_id, "ts": ts} for ts in timestamps],
+        )
+    return task_id
+
+
+def test_replayed_rows_are_rerolled(engine, rollup, tmp_path):
+    base = floor_hour(rollup_clock()) - timedelta(hours=3)
+    task_id = _seed(engine, [base + timedelta(minutes=m) for m in range(10)])
+    rollup.run_once()
+    assert _rolled_count(engine, "analytics_rollup_minute") == 10
+    assert _rolled_count(engine, "analytics_rollup_hour") == 10
+
+    # 資料庫中斷期間寫入日誌的批次，恢復後才重放（時間早於水位線）
+    writer = WriteBehindWriter("rollup-test", engine=engine, journal_dir=tmp_path)
+    writer._thread = object()
+    late = [
+        {"task_id": task_id, "object_type": "person", "confidence": 0.95,
+         "frame_timestamp": base + timedelta(minutes=30, seconds=s)}
+        for s in range(5)
+    ]
+    table = writer._table(DetectionResult)
+    writer._spill([(table, table.format(late))])
+    assert writer.flush() is True
+    assert writer.replayed_batches == 1
+
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT count(*) FROM analytics_rollup_dirty")).scalar() == 1
+
+    rollup.run_once()
+    assert rollup.rerolled_ranges == 1
+    assert _rolled_count(engine, "analytics_rollup_minute") == 15
+    assert _rolled_count(engine, "analytics_rollup_hour") == 15
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT count(*) FROM analytics_rollup_dirty")).scalar() == 0
+
+
+def test_unmarked_late_rows_are_not_counted(engine, rollup):
+    base = floor_hour(rollup_clock()) - timedelta(hours=3)
+    task_id = _seed(engine, [base])
+    rollup.run_once()
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                "INSERT INTO detection_results (task_id, object_type, confidence, frame_timestamp) "
+                "VALUES (:task_id, 'person', 0.9, :ts)"
+            ),
+            {"task_id": task_id, "ts": base + timedelta(minutes=1)},
+        )
+    rollup.run_once()
+    assert _rolled_count(engine, "analytics_rollup_hour") == 1
+    assert datetime.fromisoformat(rollup.get_status()["watermark"]) > base
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+WebSocket 送出佇列 coalesce 策略測試
+
+以不會送出的假 WebSocket 填滿連線佇列，確認：
+- 合併鍵包含任務 / 攝影機，不同任務的同類型訊息不會互相合併
+- 同一任務只保留最新一則；呼叫端可指定合併鍵
+"""
+
+import asyncio
+import json
+
+from app.websocket.manager import OutboundQueue, coalesce_key
+
+
+class StalledWebSocket:
+    """送出永遠不會完成，模擬慢速用戶端"""
+
+    async def send_text(self, payload):
+        await asyncio.Event().wait()
+
+    async def send_bytes(self, payload):
+        await asyncio.Event().wait()
+
+
+def test_coalesce_key_includes_entity():
+    assert coalesce_key({"type": "task_status", "task_id": 1}) == "task_status:1"
+    assert coalesce_key({"type": "detection", "camera_id": "cam-1"}) == "detection:cam-1"
+    assert coalesce_key({"type": "heartbeat"}) == "heartbeat"
+    assert coalesce_key({"data": 1}) is None
+
+
+def test_coalesce_keeps_latest_status_per_task():
+    async def _run():
+        queue = OutboundQueue("c1", StalledWebSocket(), lambda _: None, max_size=3, policy="coalesce", send_timeout=0)
+        await asyncio.sleep(0)  # 送出工作開始等待，佇列中的訊息都不會被取走
+        messages = [
+            {"type": "task_status", "task_id": "A", "status": "running"},
+            {"type": "task_status", "task_id": "A", "status": "completed"},
+            {"type": "task_status", "task_id": "B", "status": "running"},
+            {"type": "task_status", "task_id": "B", "status": "completed"},
+        ]
+        for message in messages:
+            assert queue.put(json.dumps(message), coalesce_key(message))
+        queued = [json.loads(payload) for _, payload in queue._queue]
+        queue.close()
+        return queue, queued
+
+    queue, queued = asyncio.run(_run())
+    # 合併鍵包含任務：B 的新狀態只取代 B 的舊狀態，A 的 completed 保留
+    assert [(m["task_id"], m["status"]) for m in queued] == [
+        ("A", "running"),
+        ("A", "completed"),
+        ("B", "completed"),
+    ]
+    assert queue.coalesced == 1
+    assert queue.dropped == 0
+
+
+def test_explicit_key_overrides_default():
+    async def _run():
+        queue = OutboundQueue("c1", StalledWebSocket(), lambda _: None, max_size=2, policy="coalesce", send_timeout=0)
+        await asyncio.sleep(0)
+        for payload, key in (("first", "x"), ("pinned", "y"), ("blocker", None), ("second", "x")):
+            queue.put(payload, key)
+        queued = [payload for _, payload in queue._queue]
+        queue.close()
+        return queued
+
+    assert asyncio.run(_run()) == ["blocker", "second"]
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+延後寫入器測試：COPY 跳脫、磁碟日誌與重放順序
+
+以假的 engine 取代 PostgreSQL（記錄 copy_expert 收到的 SQL 與內容），
+不需要資料庫即可確認：
+- _copy_value / format_copy_rows 產生的 text 格式可被 COPY 正確還原
+- 資料庫不可用時整批寫入日誌，恢復後依寫入順序重放
+- 永久性錯誤的日誌檔改名為 .bad，其餘日誌照常重放
+"""
+
+from contextlib import contextmanager
+from datetime import datetime
+
+import pytest
+
+from app.services.write_behind import (
+    JOURNAL_SUFFIX,
+    POISONED_SUFFIX,
+    WriteBehindWriter,
+    _copy_value,
+    format_copy_rows,
+    is_transient_error,
+)
+
+
+class OperationalError(Exception):
+    """模擬 psycopg2.OperationalError（連線中斷）"""
+
+
+class IntegrityError(Exception):
+    """模擬 psycopg2.IntegrityError（外鍵或約束違反）"""
+
+
+class FakeCursor:
+    def __init__(self, engine):
+        self.engine = engine
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def copy_expert(self, sql, handle):
+        payload = handle.read()
+        if self.engine.fail_with is not None:
+            raise self.engine.fail_with
+        if self.engine.poison and self.engine.poison in payload:
+            raise IntegrityError("insert or update violates foreign key constraint")
+        self.engine.pending.append((sql, payload))
+
+
+class FakeConnection:
+    def __init__(self, engine):
+        self.connection = self
+        self.driver_connection = self
+        self.engine = engine
+
+    def cursor(self):
+        return FakeCursor(self.engine)
+
+    def execute(self, statement):
+        self.engine.pending.append(("upsert", statement))
+
+
+class FakeEngine:
+    """只支援 begin() 與 copy_expert 的 engine 替身；交易成功才寫入 committed"""
+
+    def __init__(self):
+        self.committed = []
+        self.pending = []
+        self.fail_with = None
+        self.poison = None
+
+    @contextmanager
+    def begin(self):
+        self.pending = []
+        yield FakeConnection(self)
+        self.committed.extend(self.pending)
+
+
+def _model(name, columns):
+    from sqlalchemy import Column, Integer, MetaData, String, Table
+
+    table = Table(
+        name,
+        MetaData(),
+        Column("id", Integer, primary_key=True),
+        *[Column(column, String) for column in columns],
+    )
+    return type(name, (), {"__table__": table})
+
+
+def _parse_copy_text(payload):
+    """依 PostgreSQL COPY text 格式還原欄位值"""
+    rows = []
+    for line in payload.rstrip("\n").split("\n"):
+        values = []
+        for field in line.split("\t"):
+            if field == r"\N":
+                values.append(None)
+                continue
+            out, index = [], 0
+            while index < len(field):
+                char = field[index]
+                if char == "\\":
+                    index += 1
+                    out.append({"t": "\t", "n": "\n", "r": "\r", "\\": "\\"}[field[index]])
+                else:
+                    out.append(char)
+                index += 1
+            values.append("".join(out))
+        rows.append(values)
+    return rows
+
+
+@pytest.fixture
+def writer(tmp_path):
+    engine = FakeEngine()
+    writer = WriteBehindWriter("test", engine=engine, journal_dir=tmp_path)
+    # 測試直接呼叫 flush，不啟動背景執行緒
+    writer._thread = object()
+    writer.retry_interval = 0
+    return writer, engine
+
+
+def test_copy_value_escapes_special_characters():
+    assert _copy_value(None) == r"\N"
+    assert _copy_value(True) == "t"
+    assert _copy_value(False) == "f"
+    assert _copy_value("a\tb\nc\rd\\e") == r"a\tb\nc\rd\\e"
+    assert _copy_value(datetime(2025, 1, 2, 3, 4, 5, 6)) == "2025-01-02T03:04:05.000006"
+    # JSON 先把 Tab 轉成 \t，COPY 再跳脫反斜線
+    assert _copy_value({"k": "值\t"}) == r'{"k": "值\\t"}'
+    assert _copy_value(r"\N") == r"\\N"
+
+
+def test_format_copy_rows_round_trips():
+    rows = [
+        {"a": "tab\there", "b": None, "c": 1.5},
+        {"a": "back\\slash\nnewline", "b": "\\N", "c": 0},
+    ]
+    payload = format_copy_rows(["a", "b", "c"], rows)
+    assert payload.count("\n") == 2
+    assert _parse_copy_text(payload) == [
+        ["tab\there", None, "1.5"],
+        ["back\\slash\nnewline", "\\N", "0"],
+    ]
+    assert format_copy_rows(["a"], []) == ""
+
+
+def test_transient_error_classification():
+    assert is_transient_error(OperationalError("server closed the connection"))
+    assert is_transient_error(ConnectionResetError())
+    assert not is_transient_error(IntegrityError("fk"))
+    assert not is_transient_error(ValueError("bad value"))
+
+
+def test_spill_then_replay_in_order(writer):
+    writer, engine = writer
+    model = _model("detections", ["label"])
+
+    engine.fail_with = OperationalError("database is down")
+    for batch in range(3):
+        writer.add_rows(model, [{"label": f"batch-{batch}"}])
+        assert writer.flush() is False
+    assert engine.committed == []
+    assert len(list(writer.journal_dir.glob(f"*{JOURNAL_SUFFIX}"))) == 3
+    assert writer.spilled_batches == 3
+
+    engine.fail_with = None
+    writer.add_rows(model, [{"label": "live"}])
+    assert writer.flush() is True
+
+    labels = [_parse_copy_text(payload)[0][0] for _, payload in engine.committed]
+    assert labels == ["batch-0", "batch-1", "batch-2", "live"]
+    assert writer.replayed_batches == 3
+    assert list(writer.journal_dir.glob(f"*{JOURNAL_SUFFIX}")) == []
+
+
+def test_poisoned_journal_is_quarantined(writer):
+    writer, engine = writer
+    model = _model("detections", ["label"])
+
+    engine.fail_with = OperationalError("database is down")
+    for label in ("ok-1", "poison", "ok-2"):
+        writer.add_rows(model, [{"label": label}])
+        writer.flush()
+
+    engine.fail_with = None
+    engine.poison = "poison"
+    assert writer.flush() is True
+
+    labels = [_parse_copy_text(payload)[0][0] for _, payload in engine.committed]
+    assert labels == ["ok-1", "ok-2"]
+    assert writer.poisoned_batches == 1
+    assert list(writer.journal_dir.glob(f"*{JOURNAL_SUFFIX}")) == []
+    assert len(list(writer.journal_dir.glob(f"*{POISONED_SUFFIX}"))) == 1
+
+    # 隔離後不再重試，後續寫入直接成功
+    writer.add_rows(model, [{"label": "after"}])
+    assert writer.flush() is True
+    assert writer.poisoned_batches == 1
+
+
+def test_permanent_error_on_live_flush_isolates_bad_batch(writer):
+    writer, engine = writer
+    good = _model("good_rows", ["label"])
+    bad = _model("bad_rows", ["label"])
+
+    engine.poison = "poison"
+    writer.add_rows(good, [{"label": "fine"}])
+    writer.add_rows(bad, [{"label": "poison"}])
+    assert writer.flush() is False
+    # 永久性錯誤不觸發退避，下一次 flush 立即重放並隔離壞批次
+    assert writer.get_stats()["db_available"]
+
+    assert writer.flush() is True
+    assert [_parse_copy_text(payload)[0][0] for _, payload in engine.committed] == ["fine"]
+    assert writer.poisoned_batches == 1
+
+
+def test_copy_sql_lists_columns(writer):
+    writer, engine = writer
+    model = _model("detections", ["label", "note"])
+    writer.add_rows(model, [{"label": "x", "note": None}])
+    assert writer.flush() is True
+    sql, payload = engine.committed[0]
+    assert sql == "COPY detections (label, note) FROM STDIN"
+    assert payload == "x\t\\N\n"